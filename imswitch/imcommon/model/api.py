@@ -1,6 +1,9 @@
+import asyncio
 import inspect
+from concurrent.futures import Future
 
-from imswitch.imcommon.framework import Mutex, Signal, SignalInterface
+from imswitch.imcommon.framework import Signal, SignalInterface
+from .logging import initLogger
 
 
 class APIExport:
@@ -48,10 +51,22 @@ def generateAPI(objs, *, missingAttributeErrorMsg=None):
                                      missingAttributeErrorMsg=missingAttributeErrorMsg)
 
 
+class APIFuture(Future):
+    """ Result of a call to an API function that runs on the UI thread. It
+    can be waited on with result(), polled with done(), or awaited from
+    asyncio code. """
+
+    def __await__(self):
+        return asyncio.wrap_future(self).__await__()
+
+
 class _UIThreadExecWrapper(SignalInterface):
-    """ Wrapper for executing the specified function on the UI thread. """
+    """ Wrapper for executing the specified function on the UI thread. Calls
+    return an APIFuture immediately. Each call carries its own arguments and
+    future, so calls from several threads are simply queued in the UI thread's
+    event loop, without any lock. """
 
-    wrappingSignal = Signal()
+    wrappingSignal = Signal(object)  # (APIFuture, args, kwargs)
 
     def __init__(self, apiFunc):
         super().__init__()
@@ -60,21 +75,29 @@ class _UIThreadExecWrapper(SignalInterface):
         self.__signature__ = inspect.signature(apiFunc)
         self.__doc__ = apiFunc.__doc__
 
+        self.__logger = initLogger(self, instanceName=apiFunc.__name__)
         self._apiFunc = apiFunc
-        self._execMutex = Mutex()
+        self._APIRunOnUIThread = True  # Calls only queue the function, see APIExport
         self.wrappingSignal.connect(self._apiCall)
 
-    def __call__(self, *args, **kwargs):
-        self._execMutex.lock()
-        self._args = args
-        self._kwargs = kwargs
-        self.wrappingSignal.emit()
+    def __call__(self, *args, **kwargs) -> APIFuture:
+        future = APIFuture()
+        self.wrappingSignal.emit((future, args, kwargs))
+        return future
+
+    def _apiCall(self, call):
+        future, args, kwargs = call
+        if not future.set_running_or_notify_cancel():
+            return  # Cancelled before it got to run
 
-    def _apiCall(self):
         try:
-            self._apiFunc(*self._args, **self._kwargs)
-        finally:
-            self._execMutex.unlock()
+            result = self._apiFunc(*args, **kwargs)
+        except Exception as e:
+            # Also log it, as callers that don't look at the future would never know
+            self.__logger.error(f'API call failed: {e!r}')
+            future.set_exception(e)
+        else:
+            future.set_result(result)
 
 
 # Copyright (C) 2020-2021 ImSwitch developers
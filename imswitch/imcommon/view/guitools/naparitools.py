@@ -113,7 +113,10 @@ class NapariBaseWidget(QtWidgets.QWidget):
 
 class NapariUpdateLevelsWidget(NapariBaseWidget):
     """ Napari widget for auto-levelling the currently selected layer with a
-    single click. """
+    single click, and for turning continuous auto-levelling of the live view
+    on and off. """
+
+    sigContinuousToggled = QtCore.Signal(bool)  # (enabled)
 
     @property
     def name(self):
@@ -126,9 +129,16 @@ class NapariUpdateLevelsWidget(NapariBaseWidget):
         self.updateLevelsButton = QtWidgets.QPushButton('Update levels')
         self.updateLevelsButton.clicked.connect(self._on_update_levels)
 
+        # Continuous update check box
+        self.continuousCheck = QtWidgets.QCheckBox('Continuously')
+        self.continuousCheck.setToolTip('Keep updating the levels of the live view as new frames'
+                                        ' arrive')
+        self.continuousCheck.toggled.connect(self.sigContinuousToggled)
+
         # Layout
-        self.setLayout(QtWidgets.QVBoxLayout())
-        self.layout().addWidget(self.updateLevelsButton)
+        self.setLayout(QtWidgets.QHBoxLayout())
+        self.layout().addWidget(self.updateLevelsButton, 1)
+        self.layout().addWidget(self.continuousCheck)
 
         # Make sure widget isn't too big
         self.setSizePolicy(QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Expanding,
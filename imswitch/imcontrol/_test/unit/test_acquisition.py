@@ -1,7 +1,11 @@
+import threading
+import time
+
 import numpy as np
 import pytest
 
-from imswitch.imcontrol.model import DetectorsManager
+from imswitch.imcontrol.model import DetectorsManager, MultiManagerError
+from imswitch.imcontrol.model.managers.DetectorsManager import binImage
 from . import detectorInfosBasic, detectorInfosMulti, detectorInfosNonSquare
 
 
@@ -55,6 +59,114 @@ def test_acquisition_liveview_multi(qtbot, currentDetector):
     assert not np.all(receivedImage == receivedImage[0, 0])  # Assert that not all pixels are same
 
 
+def test_liveview_subscription(qtbot):
+    detectorsManager = DetectorsManager(detectorInfosBasic, updatePeriod=100)
+    liveView = detectorsManager.subscribeLiveView(maxRate=1000, roi=(10, 20, 100, 50),
+                                                  decimation=2)
+    with qtbot.waitSignal(liveView.sigImageUpdated, timeout=30000) as blocker:
+        handle = detectorsManager.startAcquisition(liveView=True)
+    detectorsManager.stopAcquisition(handle, liveView=True)
+    detectorsManager.unsubscribeLiveView(liveView)
+
+    assert blocker.args[1].shape == (25, 50)
+
+
+def test_liveview_subscription_binning(qtbot):
+    detectorsManager = DetectorsManager(detectorInfosBasic, updatePeriod=100)
+    liveView = detectorsManager.subscribeLiveView(maxRate=1000, roi=(10, 20, 100, 50),
+                                                  binning=4)
+    with qtbot.waitSignal(liveView.sigImageUpdated, timeout=30000) as blocker:
+        handle = detectorsManager.startAcquisition(liveView=True)
+    detectorsManager.stopAcquisition(handle, liveView=True)
+    detectorsManager.unsubscribeLiveView(liveView)
+
+    assert blocker.args[1].shape == (12, 25)
+    geometry = liveView.getFrameGeometry(blocker.args[0])
+    assert (geometry.x, geometry.y, geometry.step) == (11.5, 21.5, 4)
+    assert geometry.roi == (10, 20, 100, 50)
+
+
+def test_bin_image():
+    image = np.arange(5 * 6, dtype=np.uint16).reshape(5, 6)
+    binned = binImage(image, 2)
+    assert binned.dtype == np.uint16
+    assert np.array_equal(binned, np.rint(
+        image[:4].reshape(2, 2, 3, 2).mean(axis=(1, 3))
+    ).astype(np.uint16))
+
+
+def test_liveview_coalesces_frames(qtbot):
+    detectorsManager = DetectorsManager(detectorInfosBasic, updatePeriod=100)
+    received = []
+    detectorsManager.sigImageUpdated.connect(lambda name, img, *_: received.append(img[0, 0]))
+
+    # Frames posted from another thread while the GUI thread is busy are coalesced
+    poster = threading.Thread(target=lambda: [
+        detectorsManager._dispatcher.post('CAM', np.full((4, 4), i), True) for i in range(5)
+    ])
+    poster.start()
+    poster.join()
+    qtbot.waitUntil(lambda: len(received) > 0)
+    qtbot.wait(50)
+
+    assert received == [4]
+
+
+def test_exec_on_all_parallel():
+    detectorsManager = DetectorsManager(detectorInfosMulti, updatePeriod=100)
+    names = detectorsManager.getAllDeviceNames()
+
+    def slowFunc(detector):
+        time.sleep(0.5)
+        return detector.name
+
+    start = time.perf_counter()
+    results = detectorsManager.execOnAll(slowFunc, parallel=True)
+    assert time.perf_counter() - start < 0.5 * len(names)
+    assert results == {name: name for name in names}
+
+    def failingFunc(detector):
+        if detector.name == names[0]:
+            raise ValueError('Failed')
+        if detector.name == names[1]:
+            time.sleep(1)
+        return detector.name
+
+    with pytest.raises(MultiManagerError) as excInfo:
+        detectorsManager.execOnAll(failingFunc, parallel=True, timeout=0.2)
+    assert isinstance(excInfo.value.errors[names[0]], ValueError)
+    assert isinstance(excInfo.value.errors[names[1]], TimeoutError)
+    assert set(excInfo.value.results) == set(names[2:])
+
+
+def test_liveview_poll_skips_hung_detector(monkeypatch):
+    detectorsManager = DetectorsManager(detectorInfosMulti, updatePeriod=100)
+    monkeypatch.setattr(detectorsManager, 'liveViewPollTimeout', 0.2)
+    hungName, *names = detectorsManager.getAllDeviceNames()
+    release = threading.Event()
+    numCalls = 0
+
+    def hungPoll(force=False):
+        nonlocal numCalls
+        numCalls += 1
+        release.wait()
+
+    monkeypatch.setattr(detectorsManager[hungName], 'getNewLiveViewFrame', hungPoll)
+    posted = []
+    monkeypatch.setattr(detectorsManager._dispatcher, 'post',
+                        lambda name, image, init: posted.append(name))
+    for name in names:
+        monkeypatch.setattr(detectorsManager[name], 'getNewLiveViewFrame',
+                            lambda force=False: np.zeros((4, 4)))
+
+    for _ in range(3):
+        start = time.perf_counter()
+        detectorsManager._pollLiveView(True)
+        assert time.perf_counter() - start < 1
+    assert numCalls == 1  # Not polled again while the previous poll is pending
+    assert posted == names * 3
+    release.set()
+
 # Copyright (C) 2020-2021 ImSwitch developers
 # This file is part of ImSwitch.
 #
@@ -0,0 +1,191 @@
+import asyncio
+import threading
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from imswitch.imcommon.model import APIExport, APIFuture, generateAPI
+from imswitch.imcontrol.controller.server import ImSwitchServer
+from imswitch.imcontrol.controller.server.ImSwitchServer import app
+
+
+class Functions:
+    def __init__(self):
+        self.release = threading.Event()
+        self.threads = []
+
+    @APIExport()
+    def add(self, a, b=0):
+        self.threads.append(threading.current_thread())
+        return a + b
+
+    @APIExport()
+    def waitForRelease(self):
+        self.threads.append(threading.current_thread())
+        self.release.wait(5)
+        return 'released'
+
+    @APIExport()
+    def fail(self):
+        raise ValueError('failed')
+
+    @APIExport(runOnUIThread=True)
+    def addOnUIThread(self, a, b=0):
+        self.threads.append(threading.current_thread())
+        return a + b
+
+    @APIExport(runOnUIThread=True)
+    def failOnUIThread(self):
+        raise ValueError('failed on the UI thread')
+
+
+@pytest.fixture
+def functions():
+    functions = Functions()
+    yield functions
+    functions.release.set()
+
+
+@pytest.fixture
+def api(functions):
+    return generateAPI([functions])
+
+
+@pytest.fixture
+def server(api):
+    # The routes are added to the app of the module, so they are dropped again afterwards
+    routes = list(app.router.routes)
+    server = ImSwitchServer(api, types.SimpleNamespace(
+        pyroServerInfo=types.SimpleNamespace(name='ImSwitchServer', host='127.0.0.1', port=0)
+    ))
+    server.createAPI()
+    yield server
+    server.stop()
+    app.router.routes[:] = routes
+
+
+def pollUntilDone(qtbot, server, callId):
+    """ Polls a call, processing the events of the UI thread meanwhile, and
+    returns the outcome once it is done. """
+    outcomes = []
+
+    def poll():
+        outcomes.append(server.pollCall(callId))
+        return outcomes[-1]['done']
+
+    qtbot.waitUntil(poll)
+    return outcomes[-1]
+
+
+def test_api_future_can_be_awaited():
+    future = APIFuture()
+
+    async def waitForFuture():
+        threading.Timer(0.05, future.set_result, args=(42,)).start()
+        return await future
+
+    assert asyncio.run(waitForFuture()) == 42
+
+
+def test_ui_thread_function_runs_on_ui_thread(qtbot, api, functions):
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(api.addOnUIThread, 1, b=2).result()
+    assert isinstance(future, APIFuture)
+    qtbot.waitUntil(future.done)
+    assert future.result() == 3
+    assert functions.threads == [threading.main_thread()]
+
+
+def test_ui_thread_function_errors(qtbot, api):
+    future = api.failOnUIThread()
+    qtbot.waitUntil(future.done)
+    with pytest.raises(ValueError):
+        future.result()
+
+
+def test_cancelled_ui_thread_call_does_not_run(qtbot, api, functions):
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        cancelled = executor.submit(api.addOnUIThread, 1).result()
+        cancelled.cancel()
+        last = executor.submit(api.addOnUIThread, 2).result()
+    qtbot.waitUntil(last.done)
+    assert last.result() == 2
+    assert len(functions.threads) == 1
+
+
+def test_submit_call_does_not_wait(qtbot, server, functions):
+    callId = server.submitCall('waitForRelease')
+    assert server.pollCall(callId) == {'done': False}
+
+    functions.release.set()
+    assert pollUntilDone(qtbot, server, callId) == {'done': True, 'result': 'released'}
+    assert functions.threads[0] is not threading.main_thread()
+    with pytest.raises(KeyError):
+        server.pollCall(callId)  # Forgotten once the result has been returned
+
+
+def test_poll_call_results_and_errors(qtbot, server):
+    calls = {
+        server.submitCall('add', [1], {'b': 2}): {'done': True, 'result': 3},
+        server.submitCall('addOnUIThread', [3, 4]): {'done': True, 'result': 7},
+        server.submitCall('fail'): {'done': True, 'error': 'ValueError: failed'},
+        server.submitCall('missing'): {'done': True,
+                                       'error': 'AttributeError: No API function "missing"'}
+    }
+    for callId, outcome in calls.items():
+        assert pollUntilDone(qtbot, server, callId) == outcome
+    with pytest.raises(KeyError):
+        server.pollCall('unknown')
+
+
+def test_call_batch(server):
+    calls = [{'function': 'add', 'args': [1, 2]},
+             {'function': 'fail'},
+             {'function': 'add', 'kwargs': {'a': 5}},
+             {'function': 'missing'}]
+    assert server.callBatch(calls) == [
+        {'result': 3},
+        {'error': 'ValueError: failed'},
+        {'result': 5},
+        {'error': 'AttributeError: No API function "missing"'}
+    ]
+
+
+def test_call_batch_with_ui_thread_calls(qtbot, server):
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        batch = executor.submit(server.callBatch, [
+            {'function': 'addOnUIThread', 'args': [1, 1]},
+            {'function': 'add', 'args': [2, 2]},
+            {'function': 'failOnUIThread'}
+        ])
+        qtbot.waitUntil(batch.done)
+    assert batch.result() == [{'result': 2}, {'result': 4},
+                              {'error': 'ValueError: failed on the UI thread'}]
+
+
+def test_oldest_calls_are_forgotten(qtbot, server):
+    server.maxStoredCalls = 3
+    callIds = [server.submitCall('add', [i]) for i in range(5)]
+    for callId in callIds[:2]:
+        with pytest.raises(KeyError):
+            server.pollCall(callId)
+    for i, callId in enumerate(callIds[2:], start=2):
+        assert pollUntilDone(qtbot, server, callId) == {'done': True, 'result': i}
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
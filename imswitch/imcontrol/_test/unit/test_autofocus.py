@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+import scipy.ndimage as ndi
+
+from imswitch.imcontrol.model import AutofocusAborted, AutofocusEngine, focusMetrics
+
+focusPosition = 37.0
+sample = np.random.default_rng(0).integers(0, 1000, size=(128, 128)).astype(np.float32)
+
+
+class SimulatedStage:
+    """ A focus stage with a camera whose frames blur with the distance from
+    focusPosition. """
+
+    def __init__(self, position=0.0):
+        self.position = position
+
+    def moveTo(self, position):
+        self.position = position
+
+    def grabFrame(self):
+        return ndi.gaussian_filter(sample, 0.5 + abs(self.position - focusPosition) / 10) + 100
+
+
+@pytest.mark.parametrize('metric', list(focusMetrics.keys()))
+def test_focus_metrics_decrease_with_blur(metric):
+    stage = SimulatedStage()
+    engine = AutofocusEngine(stage.moveTo, stage.grabFrame, metric=metric, decimation=1)
+    values = [engine.measure(focusPosition + offset) for offset in [0, 5, 10, 20, 40]]
+    assert all(np.diff(values) < 0)
+
+
+@pytest.mark.parametrize('search', ['coarseToFine', 'goldenSection', 'hillClimb'])
+def test_autofocus_finds_focus(search):
+    stage = SimulatedStage()
+    engine = AutofocusEngine(stage.moveTo, stage.grabFrame, metric='tenengrad',
+                             cropFraction=0.5, historyLength=10)
+    if search == 'coarseToFine':
+        result = engine.coarseToFine(-100, 100, 1)
+    elif search == 'goldenSection':
+        result = engine.goldenSection(-100, 100, 1)
+    else:
+        result = engine.hillClimb(0, 25, 1, -100, 100)
+
+    assert result.bestPosition == pytest.approx(focusPosition, abs=1)
+    assert result.bestValue == max(result.values)
+    assert len(result.positions) < 200 / 1  # Fewer measurements than a linear scan
+    assert len(engine.history[0]) == min(len(result.positions), 10)
+
+
+def test_continuous_scan():
+    stage = SimulatedStage()
+    target = [0.0]
+
+    def moveTo(position):
+        stage.moveTo(position)
+        target[0] = position
+
+    def grabFrame():
+        # The stage moves 3 units during each frame
+        stage.position = min(stage.position + 1.5, target[0])
+        frame = stage.grabFrame()
+        stage.position = min(stage.position + 1.5, target[0])
+        return frame
+
+    engine = AutofocusEngine(moveTo, grabFrame, startMove=lambda p: target.__setitem__(0, p),
+                             getPosition=lambda: stage.position)
+    result = engine.continuousScan(-100, 100, 1)
+    assert result.bestPosition == pytest.approx(focusPosition, abs=1)
+    assert len(result.positions) < 100
+
+
+def test_autofocus_abort():
+    stage = SimulatedStage()
+    engine = AutofocusEngine(stage.moveTo, stage.grabFrame,
+                             onMeasured=lambda position, value: engine.abort())
+    with pytest.raises(AutofocusAborted):
+        engine.linearScan(-100, 100, 20)
+    assert len(engine.history[0]) == 1
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
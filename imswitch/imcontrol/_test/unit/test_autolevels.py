@@ -0,0 +1,50 @@
+import numpy as np
+
+from imswitch.imcontrol.model import AutoLevelEngine, subsampledPercentiles
+
+
+def test_subsampled_percentiles_match_full_frame():
+    image = np.random.default_rng(0).normal(1000, 100, size=(2048, 2048)).astype(np.uint16)
+    low, high = subsampledPercentiles(image, [1, 99], maxSamples=65536)
+    fullLow, fullHigh = np.percentile(image, [1, 99])
+    assert abs(low - fullLow) < 5 and abs(high - fullHigh) < 5
+
+
+def test_levels_are_smoothed_and_small_changes_skipped():
+    engine = AutoLevelEngine(lowPercentile=0, highPercentile=100, smoothing=0.5, threshold=0.05)
+    frame = np.zeros((64, 64), dtype=np.uint16)
+    frame[0, 0] = 1000
+
+    assert engine.update(frame) == (0, 1000)
+    frame[0, 0] = 1020  # Less than 5 % of the level range
+    assert engine.update(frame) is None
+    assert engine.levels == (0, 1000)
+
+    frame[0, 0] = 2000
+    low, high = engine.update(frame)
+    assert low == 0 and 1000 < high < 2000  # Moves towards the new level, but not all the way
+
+    engine.reset()
+    assert engine.update(frame) == (0, 2000)
+
+
+def test_flat_frame_gives_valid_levels():
+    low, high = AutoLevelEngine().computeLevels(np.full((16, 16), 7, dtype=np.uint8))
+    assert high > low
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,122 @@
+import threading
+from concurrent.futures import CancelledError
+
+import pytest
+
+from imswitch.imcontrol.model import CommandScheduler
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = CommandScheduler()
+    yield scheduler
+    scheduler.close()
+
+
+def holdIOThread(scheduler):
+    """ Submits a command that blocks the I/O thread until the returned event
+    is set, so that the following commands stay queued. """
+    started, release = threading.Event(), threading.Event()
+    scheduler.submit(lambda: (started.set(), release.wait()))
+    started.wait()
+    return release
+
+
+def test_commands_run_in_order_and_return_responses(scheduler):
+    sent = []
+    futures = [scheduler.submit(lambda i: sent.append(i) or i * 2, i) for i in range(5)]
+    assert [future.result(5) for future in futures] == [0, 2, 4, 6, 8]
+    assert sent == [0, 1, 2, 3, 4]
+
+
+def test_queued_commands_are_coalesced(scheduler):
+    sent = []
+
+    def setValue(channel, value):
+        sent.append((channel, value))
+        return value
+
+    def move(steps):
+        sent.append(('move', steps))
+
+    release = holdIOThread(scheduler)
+    first = scheduler.submit(setValue, 1, 10, coalesceKey=1)
+    second = scheduler.submit(setValue, 1, 20, coalesceKey=1)
+    scheduler.submit(setValue, 2, 5, coalesceKey=2)
+    scheduler.submit(move, 3, coalesceKey='move',
+                     merge=lambda previous, new: ((previous[0][0] + new[0][0],), {}))
+    last = scheduler.submit(move, 4, coalesceKey='move',
+                            merge=lambda previous, new: ((previous[0][0] + new[0][0],), {}))
+    release.set()
+    last.result(5)
+
+    assert first.result() == second.result() == 20
+    assert sent == [(1, 20), (2, 5), ('move', 7)]
+    assert scheduler.numCoalesced == 2
+
+
+def test_cancel_and_errors(scheduler):
+    release = holdIOThread(scheduler)
+    cancelled = scheduler.submit(print, coalesceKey='move')
+    failing = scheduler.submit(lambda: 1 / 0)
+    assert scheduler.cancel('move') == 1
+    release.set()
+
+    with pytest.raises(CancelledError):
+        cancelled.result(5)
+    with pytest.raises(ZeroDivisionError):
+        failing.result(5)
+    assert scheduler.call(lambda: 'ok', timeout=5) == 'ok'
+
+
+def test_commands_submitted_by_running_command_run_immediately(scheduler):
+    sent = []
+
+    def callback():
+        # Would deadlock if it were queued behind the running command
+        scheduler.call(sent.append, 'nested', timeout=5)
+        sent.append('callback')
+
+    scheduler.call(callback, timeout=5)
+    assert sent == ['nested', 'callback']
+
+
+def test_futures_cancelled_by_callers(scheduler):
+    sent = []
+    release = holdIOThread(scheduler)
+    cancelled = scheduler.submit(sent.append, 'cancelled')
+    first = scheduler.submit(sent.append, 1, coalesceKey='value')
+    second = scheduler.submit(sent.append, 2, coalesceKey='value')
+    assert cancelled.cancel() and first.cancel()
+    release.set()
+
+    assert second.result(5) is None
+    assert sent == [2]  # The command was skipped, and the coalesced one still ran
+    assert first.cancelled()
+
+    # A future that is running can't be cancelled anymore, so its result is still set
+    started, release = threading.Event(), threading.Event()
+    running = scheduler.submit(lambda: (started.set(), release.wait(), 'done')[-1])
+    started.wait()
+    assert not running.cancel()
+    release.set()
+    assert running.result(5) == 'done'
+    assert scheduler.call(lambda: 'ok', timeout=5) == 'ok'
+
+
+def test_lock_is_released_while_a_command_waits():
+    lock = threading.Condition(threading.RLock())
+    scheduler = CommandScheduler(lock=lock)
+    waiting, done = threading.Event(), threading.Event()
+
+    def blockingMove():
+        waiting.set()
+        while not done.is_set():
+            lock.wait(0.01)  # Like a move waiting for the stage to arrive
+
+    future = scheduler.submit(blockingMove)
+    waiting.wait()
+    with lock:  # A status query doesn't wait for the move
+        done.set()
+    future.result(5)
+    scheduler.close()
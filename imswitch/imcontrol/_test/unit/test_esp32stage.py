@@ -0,0 +1,122 @@
+import importlib.util
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+from imswitch.imcontrol.model import PositionerInfo
+from imswitch.imcontrol.model.SetupInfo import RS232Info
+
+
+class FakeMotor:
+    """ Motor of a board that starts moving startDelay seconds after a move
+    is sent and then moves at speed units per second. """
+
+    def __init__(self, startDelay=0.0):
+        self.startDelay = startDelay
+        self._lock = threading.Lock()
+        self._positions = [0.0, 0.0, 0.0, 0.0]
+        self._move = None
+
+    def setup_motor(self, **kwargs):
+        pass
+
+    def set_position(self, axis, position):
+        with self._lock:
+            self._positions[' XYZ'.index(axis)] = position or 0.0
+
+    def move_x(self, value, speed, is_absolute=False, **kwargs):
+        with self._lock:
+            self._updatePositions()
+            start = self._positions[1]
+            self._move = (time.monotonic() + self.startDelay, 1, start,
+                          value if is_absolute else start + value, speed)
+
+    def get_position(self):
+        with self._lock:
+            self._updatePositions()
+            return list(self._positions)
+
+    def stop(self, axis=None):
+        with self._lock:
+            self._updatePositions()
+            self._move = None
+
+    def _updatePositions(self):
+        if self._move is None:
+            return
+        startTime, index, start, target, speed = self._move
+        elapsed = max(time.monotonic() - startTime, 0)
+        distance = min(elapsed * speed, abs(target - start))
+        self._positions[index] = start + distance * (1 if target >= start else -1)
+
+
+@pytest.fixture
+def motor():
+    return FakeMotor()
+
+
+@pytest.fixture
+def stage(monkeypatch, motor):
+    if importlib.util.find_spec('uc2rest') is None:
+        monkeypatch.setitem(sys.modules, 'uc2rest', types.ModuleType('uc2rest'))
+    from imswitch.imcontrol.model.managers.rs232 import ESP32Manager as esp32Module
+    from imswitch.imcontrol.model.managers.positioners.ESP32StageManager import (
+        ESP32StageManager
+    )
+
+    monkeypatch.setattr(esp32Module.espdriver, 'ESP32Driver',
+                        lambda port: types.SimpleNamespace(motor=motor, home=None))
+    rs232Manager = esp32Module.ESP32Manager(
+        RS232Info(managerName='ESP32Manager', managerProperties={'serialport': 'fake'}), 'ESP32'
+    )
+    stage = ESP32StageManager(
+        PositionerInfo(analogChannel=None, digitalLine=None, managerName='ESP32StageManager',
+                       managerProperties={'rs232device': 'ESP32'}, axes=['X', 'Y', 'Z'],
+                       forPositioning=True),
+        'ESP32Stage', rs232sManager={'ESP32': rs232Manager}
+    )
+    yield stage
+    rs232Manager.finalize()
+
+
+def test_blocking_move_waits_for_delayed_start(stage, motor):
+    motor.startDelay = 0.2
+    stage.move(50, axis='X', speed=1000, is_blocking=True, timeout=5)
+    assert stage.getPosition()['X'] == 50
+
+
+def test_blocking_move_times_out(stage, motor):
+    with pytest.raises(TimeoutError):
+        stage.move(5000, axis='X', speed=1000, is_blocking=True, timeout=0.5)
+
+
+def test_stop_ends_blocking_move(stage, motor):
+    thread = threading.Thread(
+        target=lambda: stage.move(5000, axis='X', speed=1000, is_blocking=True, timeout=10)
+    )
+    thread.start()
+    time.sleep(0.2)
+    stage.forceStop('X')
+    thread.join(1)
+    assert not thread.is_alive()
+    assert 0 < stage.getPosition()['X'] < 5000
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,99 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from imswitch.imcontrol.model import BeamTracker, FocusLockEngine
+
+
+def spotFrame(spots, shape=(200, 300), sigma=4, background=20):
+    rows, columns = np.mgrid[:shape[0], :shape[1]]
+    frame = np.full(shape, background, dtype=np.float64)
+    for row, column, amplitude in spots:
+        frame += amplitude * np.exp(-((rows - row) ** 2 + (columns - column) ** 2) / (2 * sigma ** 2))
+    return frame.astype(np.uint16)
+
+
+@pytest.mark.parametrize('subpixelFit', [False, True])
+def test_beam_tracker(subpixelFit):
+    tracker = BeamTracker(roiSize=40, subpixelFit=subpixelFit)
+    for column in [150.3, 152.8, 160.1, 175.6]:  # The ROI follows the beam
+        row, found = tracker.locate(spotFrame([(80.5, column, 1000)]))
+        assert row == pytest.approx(80.5, abs=0.1)
+        assert found == pytest.approx(column, abs=0.1)
+        assert tracker.roi[2:] == (40, 40)
+
+    assert tracker.locate(spotFrame([])) is None
+    assert tracker.roi is None
+    assert tracker.locate(spotFrame([(30, 40, 1000)]))[1] == pytest.approx(40, abs=0.1)
+
+
+def test_beam_tracker_two_foci():
+    frame = spotFrame([(100, 200, 1000), (100, 80, 800)])
+    assert BeamTracker(twoFoci=False).locate(frame)[1] == pytest.approx(200, abs=0.1)
+    assert BeamTracker(twoFoci=True).locate(frame)[1] == pytest.approx(80, abs=0.1)
+
+
+def test_focus_lock_loop():
+    state = {'z': 0.0, 'drift': 0.0}
+    lock = threading.Lock()
+
+    def waitForFrame(timeout):
+        time.sleep(0.002)  # Camera frame period
+        with lock:
+            # The beam moves 20 px per unit of defocus
+            column = 150 + 20 * (state['z'] + state['drift'])
+        return spotFrame([(100, column, 1000)]), time.time()
+
+    def moveBy(distance):
+        with lock:
+            state['z'] += distance
+
+    engine = FocusLockEngine(waitForFrame, moveBy, lambda: state['z'], loopRate=200,
+                             tracker=BeamTracker(roiSize=40))
+    engine.start()
+    try:
+        deadline = time.monotonic() + 5
+        while np.isnan(engine.focusSignal) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        engine.lock(kp=50, ki=20)
+        assert engine.getSetPoint() == pytest.approx(150, abs=0.1)
+
+        with lock:
+            state['drift'] = 0.5  # 10 px
+        deadline = time.monotonic() + 5
+        while abs(state['z'] + 0.5) > 0.05 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.1)
+        assert engine.focusSignal == pytest.approx(150, abs=0.5)
+        assert state['z'] == pytest.approx(-0.5, abs=0.05)
+    finally:
+        engine.stop()
+
+    assert not engine.running
+    statistics = engine.getStatistics()
+    assert 0 < statistics.loopRate <= 220
+    assert statistics.meanLatency < 0.1
+    assert statistics.numFrames > 0 and statistics.numLostFrames == 0
+    times, signals, errors = engine.getHistory()
+    assert len(times) == len(signals) == statistics.numFrames
+    assert np.all(np.diff(times) > 0)
+    assert not np.isnan(statistics.lockError)
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from imswitch.imcontrol.model import FrameRingBuffer
+
+
+def test_chunks_are_views():
+    buffer = FrameRingBuffer(8)
+    for i in range(3):
+        buffer.add(np.full((4, 5), i, dtype=np.uint16), frameId=i)
+
+    chunk = buffer.getChunk()
+    assert chunk.shape == (3, 4, 5)
+    assert chunk.dtype == np.uint16
+    assert chunk.base is not None  # No copy was made
+    assert [frame[0, 0] for frame in chunk] == [0, 1, 2]
+    assert len(buffer.getChunk()) == 0
+
+
+def test_wraparound_and_overrun():
+    buffer = FrameRingBuffer(4)
+    for i in range(3):
+        buffer.add(np.full((2, 2), i))
+    buffer.getChunk()
+
+    for i in range(3, 6):
+        buffer.add(np.full((2, 2), i))
+    # Unread frames wrap around the end, so they are returned in two parts
+    assert [frame[0, 0] for frame in buffer.getChunk()] == [3]
+    assert [frame[0, 0] for frame in buffer.getChunk()] == [4, 5]
+
+    for i in range(6, 12):
+        buffer.add(np.full((2, 2), i))
+    chunks = [buffer.getChunk(), buffer.getChunk()]
+    assert [frame[0, 0] for chunk in chunks for frame in chunk] == [8, 9, 10, 11]
+    assert buffer.numOverrunFrames == 2
+
+
+def test_flush_and_reshape():
+    buffer = FrameRingBuffer(4)
+    buffer.add(np.zeros((2, 2)))
+    buffer.flush()
+    assert len(buffer.getChunk()) == 0
+
+    buffer.add(np.zeros((2, 2)))
+    buffer.add(np.ones((3, 3), dtype=np.uint8))  # e.g. after a ROI change
+    chunk = buffer.getChunk()
+    assert chunk.shape == (1, 3, 3)
+    assert buffer.getLatest().dtype == np.uint8
+
+
+def test_chunk_metadata():
+    buffer = FrameRingBuffer(8)
+    buffer.add(np.zeros((2, 2)), frameId=10, cameraTimestamp=1000)
+    buffer.add(np.zeros((2, 2)), frameId=12)
+
+    frames, metadata = buffer.getChunkWithMetadata()
+    assert len(metadata) == len(frames) == 2
+    assert metadata.frameIds.tolist() == [10, 12]
+    assert metadata.cameraTimestamps[0] == 1000
+    assert np.isnan(metadata.cameraTimestamps[1])
+    assert metadata.hostTimestamps[1] >= metadata.hostTimestamps[0] > 0
+
+    buffer.add(np.zeros((2, 2)))
+    assert buffer.getChunkWithMetadata()[1].frameIds.tolist() == [2]  # Sequence number
+
+    frame, metadata = buffer.getLatestWithMetadata()
+    assert np.shares_memory(frame, buffer.getLatest())
+    assert metadata.frameIds.tolist() == [2]
+    assert FrameRingBuffer(2).getLatestWithMetadata() == (None, None)
+
+
+def test_readers_are_independent():
+    buffer = FrameRingBuffer(8)
+    buffer.add(np.full((2, 2), 0))
+    reader = buffer.openReader()  # Starts at the next frame
+    for i in range(1, 4):
+        buffer.add(np.full((2, 2), i))
+
+    assert [frame[0, 0] for frame in reader.getChunk()] == [1, 2, 3]
+    reader.flush()
+    assert [frame[0, 0] for frame in buffer.getChunk()] == [0, 1, 2, 3]  # Nothing taken away
+
+    buffer.add(np.full((3, 3), 4))  # Reallocates the buffer
+    assert reader.numUnread == 1
+    assert [frame[0, 0] for frame in reader.getChunk()] == [4]
+
+
+def test_invalid_capacity():
+    with pytest.raises(ValueError):
+        FrameRingBuffer(0)
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from imswitch.imcontrol.model import HolographyEngine
+
+
+def propagate(hologram, dz, wavelength, pixelsize, NA):
+    fy = np.fft.fftfreq(hologram.shape[0], d=pixelsize)[:, np.newaxis]
+    fx = np.fft.fftfreq(hologram.shape[1], d=pixelsize)[np.newaxis, :]
+    frequencySquared = fy ** 2 + fx ** 2
+    kz = 2 * np.pi * np.sqrt(np.maximum(1 / wavelength ** 2 - frequencySquared, 0))
+    kernel = np.where(frequencySquared <= (NA / wavelength) ** 2, np.exp(1j * kz * dz), 0)
+    return np.fft.ifft2(np.fft.fft2(np.sqrt(hologram)) * kernel)
+
+
+@pytest.mark.parametrize('shape', [(64, 64), (63, 65), (48, 33)])
+def test_holography_matches_angular_spectrum(shape):
+    hologram = np.random.default_rng(0).integers(0, 4096, size=shape, dtype=np.uint16)
+    engine = HolographyEngine(wavelength=0.488, pixelsize=3.45, NA=0.3)
+
+    for dz in [0, 500, -2000]:
+        expected = propagate(hologram, dz, 0.488, 3.45, 0.3)
+        scale = abs(expected).max()
+        assert np.allclose(engine.propagate(hologram, dz), expected, atol=1e-5 * scale)
+        image = engine.reconstruct(hologram, dz)
+        assert image.dtype == np.float32
+        assert np.allclose(image, abs(expected), atol=1e-5 * scale)
+
+
+def test_holography_stack_and_cache():
+    hologram = np.random.default_rng(1).integers(0, 4096, size=(50, 70), dtype=np.uint16)
+    engine = HolographyEngine(wavelength=0.488, pixelsize=3.45, NA=0.3, roiSize=40)
+
+    dzs = [0, 1000, 2000]
+    stack = engine.reconstructStack(hologram, dzs)
+    assert stack.shape == (3, 40, 40)
+    for plane, dz in zip(stack, dzs):
+        assert np.allclose(plane, engine.reconstruct(hologram, dz), rtol=1e-4, atol=1e-3)
+    assert len(engine._kernels) == 3
+
+    # Changing a parameter invalidates the transfer functions
+    engine.NA = 0.1
+    cropped = hologram[5:45, 15:55]
+    assert np.allclose(engine.reconstruct(hologram, 1000),
+                       abs(propagate(cropped, 1000, 0.488, 3.45, 0.1)), rtol=1e-4, atol=1e-3)
+    assert len(engine._kernels) == 4
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
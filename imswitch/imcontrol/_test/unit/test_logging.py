@@ -0,0 +1,30 @@
+from imswitch.imcommon.model import initLogger
+
+
+class Unreferenceable:
+    __slots__ = ()  # Can't be weakly referenced
+
+    def createLogger(self):
+        return initLogger('child', tryInheritParent=True)
+
+
+def test_inherit_parent_skips_unreferenceable_callers():
+    logger = Unreferenceable().createLogger()
+    assert logger.prefixes == ['child']
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
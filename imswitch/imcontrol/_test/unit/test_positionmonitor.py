@@ -0,0 +1,60 @@
+import time
+
+from imswitch.imcontrol.model import PositionMonitor
+
+
+class FakeStage:
+    name = 'Stage'
+
+    def __init__(self):
+        self.position = {'X': 0.0, 'Z': 0.0}
+        self.hardwarePosition = {'X': 0.0, 'Z': 0.0}
+        self.numReads = 0
+
+    def getPosition(self):
+        self.numReads += 1
+        return dict(self.hardwarePosition)
+
+
+def test_polled_position_is_cached_and_notified(qtbot):
+    stage = FakeStage()
+    monitor = PositionMonitor(stage, rate=200)
+    changes = []
+    monitor.sigPositionChanged.connect(lambda name, position: changes.append(position['Z']))
+    try:
+        stage.hardwarePosition['Z'] = 5.0
+        assert monitor.waitSettled(0.01, settleTime=0.05, timeout=5, target={'Z': 5.0})
+        assert monitor.position['Z'] == 5.0
+        qtbot.waitUntil(lambda: changes == [5.0])  # Delivered through the event loop
+
+        numReads = stage.numReads
+        for _ in range(1000):
+            monitor.position
+        assert stage.numReads - numReads < 100  # Reads come from the cache
+    finally:
+        monitor.stop()
+
+
+def test_wait_settled_times_out_while_moving():
+    stage = FakeStage()
+    stage.getPosition = lambda: {'X': time.time() * 1000, 'Z': 0.0}
+    monitor = PositionMonitor(stage, rate=200)
+    try:
+        assert not monitor.waitSettled(0.1, settleTime=0.05, timeout=0.3)
+    finally:
+        monitor.stop()
+
+
+def test_commanded_position_without_polling():
+    stage = FakeStage()
+    monitor = PositionMonitor(stage)
+    changes = []
+    monitor.sigPositionChanged.connect(lambda name, position: changes.append(position['X']))
+
+    assert not monitor.isPolling
+    stage.position['X'] = 3.0
+    assert monitor.position['X'] == 3.0
+    monitor.recordCommanded()
+    monitor.recordCommanded()
+    assert changes == [3.0]
+    assert stage.numReads == 0
@@ -1,8 +1,18 @@
+import threading
+
+import numpy as np
 import pytest
 
 import h5py
 
-from imswitch.imcontrol.model import DetectorsManager, RecordingManager, RecMode, SaveMode
+from imswitch.imcontrol.model import (
+    DetectorsManager, FrameMetadata, FrameRingBuffer, RecordingManager, RecMode, SaveMode
+)
+from imswitch.imcontrol.model.managers.RecordingManager import (
+    HDF5_COMPRESSIONS, FrameQueueWriter, FrameStatistics, PreallocatedHDF5Dataset,
+    getHDF5CompressionArgs
+)
+from imswitch.imreconstruct.model import DataObj
 from . import detectorInfosBasic, detectorInfosMulti, detectorInfosNonSquare
 
 
@@ -32,7 +42,7 @@ def record(qtbot, detectorInfos, *args, **kwargs):
 
 @pytest.mark.parametrize('detectorInfos,numFrames',
                          [(detectorInfosBasic, 10), (detectorInfosNonSquare, 53)])
-def test_recording_spec_frames(qtbot, detectorInfos, numFrames):
+def test_recording_spec_frames(qtbot, tmp_path, detectorInfos, numFrames):
     filePerDetector, savedToDiskPerDetector = record(
         qtbot,
         detectorInfos,
@@ -54,8 +64,21 @@ def test_recording_spec_frames(qtbot, detectorInfos, numFrames):
         h5pyFile = h5py.File(file)
         dataset = h5pyFile.get(detectorName)
         assert dataset.shape[0] == numFrames
+        metadata = h5pyFile[f'frame_metadata/{detectorName}']
+        assert metadata['frame_ids'].shape == (numFrames,)
+        assert metadata['host_timestamps'].shape == (numFrames,)
         h5pyFile.close()  # Otherwise we can get segfaults
+
+        # The frame metadata isn't offered as a dataset when the recording is opened
+        path = tmp_path / f'{detectorName}.hdf5'
+        path.write_bytes(file.getvalue())
         file.close()  # Otherwise we can get segfaults
+        assert DataObj.getDatasetNames(str(path)) == [detectorName]
+        dataObj = DataObj('test', None, path=str(path))
+        dataObj.checkAndLoadData()
+        assert dataObj.datasetName == detectorName
+        assert dataObj.numFrames == numFrames
+        dataObj.checkAndUnloadData()
     for savedToDisk in savedToDiskPerDetector.values():
         assert savedToDisk is False
 
@@ -90,6 +113,158 @@ def test_recording_spec_time(qtbot, detectorInfos):
         assert savedToDisk is False
 
 
+def test_frame_queue_writer_backpressure():
+    written = []
+    release = threading.Event()
+
+    def write(it, frames, metadata):
+        release.wait()
+        written.append((it, len(frames)))
+
+    frames = np.zeros((2, 16, 16), dtype=np.uint16)
+    writer = FrameQueueWriter('CAM', write, maxQueueBytes=frames.nbytes, timeout=0.05)
+    writer.start()
+
+    assert writer.put(0, frames)  # Picked up by the (blocked) writer
+    assert writer.queueDepth == 2
+    assert not writer.put(2, frames)  # Queue full, dropped after the timeout
+    assert writer.droppedFrames == 2
+
+    release.set()
+    assert writer.put(2, frames)
+    writer.finish()
+
+    assert written == [(0, 2), (2, 2)]
+    assert writer.queueDepth == 0
+
+
+def test_frame_queue_writer_detaches_buffer_chunks():
+    written = []
+    release = threading.Event()
+
+    def write(it, frames, metadata):
+        release.wait()
+        written.append(np.array(frames))
+
+    buffer = FrameRingBuffer(4)
+    writer = FrameQueueWriter('CAM', write)
+    writer.start()
+
+    for i in range(2):
+        buffer.add(np.full((8, 8), i, dtype=np.uint16))
+    assert writer.put(0, buffer.getChunk())  # Empty queue, held by the slow writer
+
+    # The camera keeps going and wraps around the slots of the queued chunk
+    for i in range(2, 8):
+        buffer.add(np.full((8, 8), i, dtype=np.uint16))
+    release.set()
+    writer.finish()
+
+    assert [frame[0, 0] for frame in written[0]] == [0, 1]
+
+
+def test_frame_statistics():
+    stats = FrameStatistics(window=10)
+    stats.update(FrameMetadata(np.array([0, 1, 2]), np.array([0.0, 0.1, 0.2]),
+                               np.full(3, np.nan)))
+    stats.update(FrameMetadata(np.array([5, 6, 8]), np.array([0.3, 0.4, 0.5]),
+                               np.full(3, np.nan)))
+
+    assert stats.numGaps == 2
+    assert stats.numMissingFrames == 3
+    assert stats.fps == pytest.approx(10)
+
+
+@pytest.fixture
+def hdf5File():
+    file = h5py.File('test.hdf5', 'w', driver='core', backing_store=False)
+    yield file
+    file.close()
+
+
+def writeInPieces(dataset, frames, pieceSizes):
+    it = 0
+    for pieceSize in pieceSizes:
+        dataset.write(it, frames[it:it + pieceSize])
+        it += pieceSize
+
+
+@pytest.mark.parametrize('dtype,frameShape', [(np.uint8, (6, 8)), (np.uint16, (6, 8)),
+                                              (np.float32, (6, 8)), (np.uint8, (6, 8, 3))])
+def test_preallocated_hdf5_keeps_native_dtype(hdf5File, dtype, frameShape):
+    frames = (np.arange(10 * np.prod(frameShape)) % 251).astype(dtype).reshape(10, *frameShape)
+    dataset = PreallocatedHDF5Dataset(hdf5File, 'CAM', 10, {'detector_name': 'CAM'})
+    writeInPieces(dataset, frames, [3, 7])
+    dataset.close((6, 8), np.uint16)
+
+    assert hdf5File['CAM'].dtype == dtype
+    np.testing.assert_array_equal(hdf5File['CAM'][:], frames)
+    assert hdf5File['CAM'].attrs['detector_name'] == 'CAM'
+
+
+@pytest.mark.parametrize('compression', HDF5_COMPRESSIONS)
+def test_preallocated_hdf5_compression(hdf5File, compression):
+    frames = np.tile(np.arange(8, dtype=np.uint16), (10, 6, 1))
+    dataset = PreallocatedHDF5Dataset(hdf5File, 'CAM', 10, {}, compression=compression,
+                                      chunkBytes=4 * frames[0].nbytes)
+    writeInPieces(dataset, frames, [1, 4, 5])
+    dataset.close((6, 8), np.uint16)
+
+    np.testing.assert_array_equal(hdf5File['CAM'][:], frames)
+    assert hdf5File['CAM'].chunks == (4, 6, 8)
+    assert hdf5File['CAM'].id.get_create_plist().get_nfilters() > 0
+
+
+def test_hdf5_compression_args():
+    assert getHDF5CompressionArgs(None) == {}
+    assert getHDF5CompressionArgs('gzip') == {'compression': 'gzip'}
+    assert getHDF5CompressionArgs('lzf') == {'compression': 'lzf'}
+    with pytest.raises(ValueError):
+        getHDF5CompressionArgs('zip')
+
+
+def test_preallocated_hdf5_writes_whole_chunks(hdf5File, monkeypatch):
+    chunkSizes = []
+    writeChunk = PreallocatedHDF5Dataset._writeChunk
+
+    def recordChunk(self, data, numFrames):
+        chunkSizes.append(numFrames)
+        writeChunk(self, data, numFrames)
+
+    monkeypatch.setattr(PreallocatedHDF5Dataset, '_writeChunk', recordChunk)
+    frames = np.random.default_rng(0).integers(0, 1000, (13, 6, 8)).astype(np.uint16)
+    dataset = PreallocatedHDF5Dataset(hdf5File, 'CAM', 13, {}, chunkBytes=4 * frames[0].nbytes)
+    writeInPieces(dataset, frames, [1, 2, 9, 1])  # Staged, direct, staged and the remainder
+
+    with pytest.raises(ValueError):
+        dataset.write(5, frames[:1])  # Out of order
+    dataset.close((6, 8), np.uint16)
+
+    assert chunkSizes == [4, 4, 4, 1]
+    np.testing.assert_array_equal(hdf5File['CAM'][:], frames)
+
+
+def test_preallocated_hdf5_is_trimmed_on_early_stop(hdf5File):
+    frames = np.ones((6, 6, 8), dtype=np.uint16)
+    dataset = PreallocatedHDF5Dataset(hdf5File, 'CAM', 10, {}, chunkBytes=4 * frames[0].nbytes)
+    writeInPieces(dataset, frames, [6])
+    dataset.close((6, 8), np.uint16)
+    assert hdf5File['CAM'].shape == (6, 6, 8)
+
+    dataset = PreallocatedHDF5Dataset(hdf5File, 'CAM2', 3, {})
+    writeInPieces(dataset, frames, [6])  # Frames beyond the allocated ones are dropped
+    dataset.close((6, 8), np.uint16)
+    assert hdf5File['CAM2'].shape == (3, 6, 8)
+
+
+@pytest.mark.parametrize('dtype,frameShape', [(np.uint8, (6, 8)), (np.uint16, (6, 8, 3))])
+def test_preallocated_hdf5_without_frames(hdf5File, dtype, frameShape):
+    dataset = PreallocatedHDF5Dataset(hdf5File, 'CAM', 10, {})
+    dataset.close(frameShape, dtype)
+    assert hdf5File['CAM'].shape == (0, *frameShape)
+    assert hdf5File['CAM'].dtype == dtype
+
+
 # Copyright (C) 2020-2021 ImSwitch developers
 # This file is part of ImSwitch.
 #
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from imswitch.imcontrol.controller.server._serialize import (
+    SharedFrameOverwrittenError, SharedFrameRing, read_shared_frame
+)
+
+
+@pytest.fixture
+def ring():
+    ring = SharedFrameRing("test", num_slots=4)
+    yield ring
+    ring.close()
+
+
+def test_response_does_not_overwrite_itself(ring):
+    refs = [ring.put(np.full((2, 2), i), response="call") for i in range(10)]
+    # The ring grew instead of reusing slots, and the replaced segments are still readable
+    assert [read_shared_frame(ref)[0, 0] for ref in refs] == list(range(10))
+
+
+def test_overwritten_frame_is_detected(ring):
+    first = ring.put(np.zeros((2, 2)))
+    for _ in range(4):
+        ring.put(np.ones((2, 2)))
+    with pytest.raises(SharedFrameOverwrittenError):
+        read_shared_frame(first)
+
+
+def test_larger_frame_keeps_old_segment(ring):
+    small = ring.put(np.full((2, 2), 1))
+    large = ring.put(np.full((8, 8), 2))
+    assert small["shm"] != large["shm"]
+    assert read_shared_frame(small)[0, 0] == 1
+    assert read_shared_frame(large)[0, 0] == 2
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,219 @@
+import asyncio
+import os
+import threading
+import types
+
+import cv2
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from imswitch.imcommon.model import generateAPI
+from imswitch.imcontrol.controller.server import ImSwitchServer
+from imswitch.imcontrol.controller.server.ImSwitchServer import app, encodeFrame, parseRoi
+
+
+class FakeSubscription:
+    """ Delivers the same frame every 10 ms from a thread of its own, like
+    the live view thread, until unsubscribed. """
+
+    def __init__(self, frame):
+        self._frame = frame
+        self._stopped = threading.Event()
+
+    def addCallback(self, callback):
+        def deliver():
+            while not self._stopped.wait(0.01):
+                callback('CAM', self._frame, False, True)
+
+        threading.Thread(target=deliver, daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+
+
+class FakeDetectorsManager:
+    def __init__(self, frame):
+        self.frame = frame
+        self.subscriptions = []
+        self.subscriptionSettings = []
+
+    def getAllDeviceNames(self):
+        return ['CAM']
+
+    def subscribeLiveView(self, maxRate=None, roi=None, decimation=1, binning=1):
+        subscription = FakeSubscription(self.frame)
+        self.subscriptions.append(subscription)
+        self.subscriptionSettings.append(dict(maxRate=maxRate, roi=roi, decimation=decimation))
+        return subscription
+
+    def unsubscribeLiveView(self, subscription):
+        subscription.stop()
+        self.subscriptions.remove(subscription)
+
+
+@pytest.fixture
+def frame():
+    return np.arange(24 * 32, dtype=np.uint16).reshape(24, 32) * 50
+
+
+@pytest.fixture
+def detectorsManager(frame):
+    return FakeDetectorsManager(frame)
+
+
+@pytest.fixture
+def recordingFolder(tmp_path):
+    folder = tmp_path / 'recordings'
+    (folder / 'day').mkdir(parents=True)
+    (folder / 'day' / 'rec.hdf5').write_bytes(b'recording')
+    (tmp_path / 'secret.txt').write_bytes(b'secret')
+    return folder
+
+
+@pytest.fixture
+def server(detectorsManager, recordingFolder):
+    # The routes are added to the app of the module, so they are dropped again afterwards
+    routes = list(app.router.routes)
+    server = ImSwitchServer(
+        generateAPI([]),
+        types.SimpleNamespace(
+            pyroServerInfo=types.SimpleNamespace(name='ImSwitchServer', host='127.0.0.1', port=0)
+        ),
+        detectorsManager=detectorsManager, recordingFolder=str(recordingFolder)
+    )
+    server.createAPI()
+    yield server
+    server.stop()
+    app.router.routes[:] = routes
+
+
+@pytest.fixture
+def client(server):
+    with TestClient(app) as client:
+        yield client
+
+
+def test_parse_roi():
+    assert parseRoi(None) is None
+    assert parseRoi('') is None
+    assert parseRoi('1,2,30,40') == (1, 2, 30, 40)
+    for roi in ['1,2,3', '1,2,3,4,5', 'a,b,c,d', '1,-2,3,4', '1.5,2,3,4']:
+        with pytest.raises(ValueError):
+            parseRoi(roi)
+
+
+def test_encode_raw(frame):
+    payload = encodeFrame(frame, 'raw')
+    np.testing.assert_array_equal(np.frombuffer(payload, dtype=frame.dtype).reshape(frame.shape),
+                                  frame)
+
+
+@pytest.mark.parametrize('dtype', [np.uint8, np.uint16])
+def test_encode_png_is_lossless(dtype):
+    image = (np.arange(24 * 32).reshape(24, 32) % 200).astype(dtype)
+    decoded = cv2.imdecode(np.frombuffer(encodeFrame(image, 'png'), dtype=np.uint8),
+                           cv2.IMREAD_UNCHANGED)
+    assert decoded.dtype == dtype
+    np.testing.assert_array_equal(decoded, image)
+
+
+def test_encode_png_of_float_frame():
+    image = np.linspace(-1, 1, 24 * 32).reshape(24, 32)
+    decoded = cv2.imdecode(np.frombuffer(encodeFrame(image, 'png'), dtype=np.uint8),
+                           cv2.IMREAD_UNCHANGED)
+    assert decoded.dtype == np.uint16
+    assert decoded.min() == 0 and decoded.max() == 65535
+
+
+def test_encode_jpeg(frame):
+    decoded = cv2.imdecode(np.frombuffer(encodeFrame(frame, 'jpeg'), dtype=np.uint8),
+                           cv2.IMREAD_UNCHANGED)
+    assert decoded.dtype == np.uint8
+    assert decoded.shape == frame.shape
+    # Scaled to 8 bit, so the gradient is kept
+    assert decoded[0, 0] < decoded[-1, -1]
+
+
+@pytest.mark.parametrize('imageFormat', ['raw', 'png', 'jpeg'])
+def test_stream(client, detectorsManager, frame, imageFormat):
+    with client.websocket_connect(f'/detectors/CAM/stream?format={imageFormat}'
+                                  f'&maxRate=5&decimation=2&roi=0,0,32,24') as websocket:
+        header = websocket.receive_json()
+        payload = websocket.receive_bytes()
+    assert header == {'detectorName': 'CAM', 'shape': list(frame.shape), 'dtype': 'uint16',
+                      'format': imageFormat}
+    assert payload == encodeFrame(frame, imageFormat)
+    assert detectorsManager.subscriptionSettings == [dict(maxRate=5, roi=(0, 0, 32, 24),
+                                                          decimation=2)]
+
+
+@pytest.mark.parametrize('query', ['', '?format=gif', '?roi=1,2,3'])
+def test_stream_rejects_bad_arguments(client, detectorsManager, query):
+    path = '/detectors/CAM/stream' if query else '/detectors/OTHER/stream'
+    with client.websocket_connect(path + query) as websocket:
+        message = websocket.receive()
+    assert message['type'] == 'websocket.close'
+    assert message['code'] == 1008
+    assert not detectorsManager.subscriptionSettings
+
+
+@pytest.mark.parametrize('query', ['?format=raw', '?roi=a,b,c,d'])
+def test_mjpeg_rejects_bad_arguments(client, query):
+    assert client.get('/detectors/CAM/mjpeg' + query).status_code == 400
+    assert client.get('/detectors/OTHER/mjpeg').status_code == 400
+
+
+def test_mjpeg(server, detectorsManager, frame):
+    # The stream doesn't end, so the first part is read from the response itself rather than
+    # through the test client
+    endpoint = next(route.endpoint for route in app.router.routes
+                    if getattr(route, 'path', None) == '/detectors/{detectorName}/mjpeg')
+
+    async def firstPart():
+        response = await endpoint('CAM', format='png', maxRate=10, decimation=1, roi=None)
+        try:
+            return response.media_type, await response.body_iterator.__anext__()
+        finally:
+            await response.body_iterator.aclose()
+
+    mediaType, part = asyncio.run(firstPart())
+    assert mediaType == 'multipart/x-mixed-replace; boundary=frame'
+    assert part == (b'--frame\r\nContent-Type: image/png\r\n\r\n' + encodeFrame(frame, 'png') +
+                    b'\r\n')
+    assert not detectorsManager.subscriptions  # Unsubscribed once the stream is closed
+
+
+def test_list_recordings(client):
+    assert client.get('/recordings').json() == [{'path': 'day/rec.hdf5', 'size': 9}]
+
+
+def test_download_recording(client):
+    response = client.get('/recordings/download', params={'path': 'day/rec.hdf5'})
+    assert response.status_code == 200
+    assert response.content == b'recording'
+
+
+def test_download_rejects_paths_outside_recordings(client, recordingFolder, tmp_path):
+    os.symlink(tmp_path / 'secret.txt', recordingFolder / 'link.txt')
+    for path in ['../secret.txt', 'day/../../secret.txt', str(tmp_path / 'secret.txt'),
+                 'link.txt', 'day', 'missing.hdf5']:
+        response = client.get('/recordings/download', params={'path': path})
+        assert response.status_code == 404, path
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
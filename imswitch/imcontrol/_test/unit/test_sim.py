@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from imswitch.imcontrol.model import (
+    SIMCalibration, SIMCalibrationCache, SIMParameters, SIMReconstructionService
+)
+from imswitch.imcontrol.model.SIMReconstructionService import (
+    reconstructSIMStack, simulateSIMStack
+)
+
+parameters = SIMParameters(wavelength=0.57, NA=1.05, n=1.33, magnification=60, pixelsize=6.5)
+
+
+def calibrate(stack):
+    convSimProcessor = pytest.importorskip('napari_sim_processor.processors.convSimProcessor')
+    processor = convSimProcessor.ConvSimProcessor()
+    processor.debug = False
+    for name in ['wavelength', 'NA', 'n', 'magnification', 'pixelsize', 'alpha', 'beta', 'w',
+                 'eta', 'usePhases']:
+        setattr(processor, name, getattr(parameters, name))
+    processor.calibrate(stack, True)
+    return processor
+
+
+def test_reconstruction_matches_napari(tmp_path):
+    stack = simulateSIMStack(128, 128, seed=0)
+    processor = calibrate(stack)
+
+    cache = SIMCalibrationCache(str(tmp_path))
+    cache.save(SIMCalibration.fromProcessor(processor, parameters))
+    calibration = cache.load(parameters, (128, 128))
+    assert calibration.parameters == parameters
+    assert cache.load(parameters, (64, 64)) is None
+
+    expected = processor.reconstruct_rfftw(stack)
+    assert np.allclose(reconstructSIMStack(stack, calibration), expected,
+                       atol=1e-5 * np.abs(expected).max())
+
+
+def test_reconstruction_service(qtbot, tmp_path):
+    rng = np.random.default_rng(0)
+    calibration = SIMCalibration(
+        parameters=parameters, kx=np.zeros(3), ky=np.zeros(3), p=np.zeros(3), ampl=np.ones(3),
+        prefilter=rng.random((32, 32), dtype=np.float32),
+        postfilter=rng.random((64, 64), dtype=np.float32),
+        reconfactor=rng.random((9, 64, 64), dtype=np.float32)
+    )
+    service = SIMReconstructionService(str(tmp_path), numWorkers=1, useProcesses=False)
+
+    with qtbot.waitSignal(service.sigStackSkipped) as blocker:
+        service.submit(rng.random((9, 32, 32)))
+    assert blocker.args == [0, 'not calibrated']
+
+    service.setCalibration(calibration)
+    with qtbot.waitSignal(service.sigStackSkipped) as blocker:
+        service.submit(rng.random((5, 32, 32)))
+    assert blocker.args[0] == 1 and 'incomplete' in blocker.args[1]
+
+    stack = rng.random((9, 32, 32))
+    with qtbot.waitSignal(service.sigStackReconstructed) as blocker:
+        service.submit(stack)
+    assert blocker.args[0] == 2
+    assert np.allclose(blocker.args[1], reconstructSIMStack(stack, calibration))
+    assert service.numSkippedStacks == 2
+
+    # A new service picks up the calibration from the cache
+    otherService = SIMReconstructionService(str(tmp_path), useProcesses=False)
+    assert otherService.loadCalibration(parameters, (32, 32))
+    assert np.array_equal(otherService.calibration.reconfactor, calibration.reconfactor)
+    service.shutdown()
+    otherService.shutdown()
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,84 @@
+import numpy as np
+
+from imswitch.imcontrol.model.managers.SLMManager import (
+    Mask, ZernikeBasisCache, nollToZernike
+)
+
+
+def test_noll_indices():
+    assert [nollToZernike(j) for j in range(1, 12)] == [
+        (0, 0), (1, 1), (1, -1), (2, 0), (2, -2), (2, 2), (3, -1), (3, 1), (3, -3), (3, 3), (4, 0)
+    ]
+
+
+def test_zernike_basis():
+    cache = ZernikeBasisCache(maxSize=2)
+    basis = cache.getBasis((201, 201), (100, 100), 100, 15)
+    assert basis.shape == (15, 201, 201)
+
+    # Orthonormal over the unit disc
+    x, y = np.ogrid[-100:101, -100:101]
+    disc = x ** 2 + y ** 2 <= 100 ** 2
+    modes = basis[:, disc]
+    gram = modes @ modes.T / disc.sum()
+    assert np.allclose(gram, np.eye(15), atol=0.02)
+
+    # Closed forms of defocus and spherical aberration
+    rho2 = (x ** 2 + y ** 2) / 100 ** 2
+    assert np.allclose(basis[3], np.sqrt(3) * (2 * rho2 - 1), atol=1e-5)
+    assert np.allclose(basis[10], np.sqrt(5) * (6 * rho2 ** 2 - 6 * rho2 + 1), atol=1e-4)
+
+    # Bases are reused, and extended when more modes are requested
+    assert cache.getBasis((201, 201), (100, 100), 100, 8).base is basis.base
+    assert np.array_equal(cache.getBasis((201, 201), (100, 100), 100, 21)[:15], basis)
+    cache.getBasis((201, 201), (90, 100), 100, 4)
+    cache.getBasis((201, 201), (80, 100), 100, 4)
+    assert len(cache._bases) == 2
+
+
+def test_aberration_mask():
+    mask = Mask(120, 100, 561)
+    mask.setRadius(40)
+    named = {'tip': 0, 'tilt': 0, 'defocus': 0.5, 'spherical': 0, 'verticalComa': 0,
+             'horizontalComa': 0, 'verticalAstigmatism': 0.2, 'obliqueAstigmatism': 0}
+    mask.setAberrations(named)
+    expected = mask.image().copy()
+
+    mask.setAberrations({4: 0.5, 6: 0.2})  # The same aberrations by Noll index
+    assert np.array_equal(mask.image(), expected)
+    mask.setAberrations({'defocus': 0.5, 6: 0.2, 22: 0.0})
+    assert np.array_equal(mask.image(), expected)
+
+
+def test_concat_regenerates_changed_masks_only(monkeypatch):
+    left, right = Mask(60, 50, 561), Mask(60, 50, 561)
+    left.setDonut()
+    right.setTophat()
+    left.concat(right)
+
+    updated = []
+    monkeypatch.setattr(Mask, 'updateImage', lambda self: updated.append(self))
+    left.concat(right)
+    assert updated == []
+
+    right.setRadius(20)
+    combined = left.concat(right)
+    assert updated == [right]
+    assert combined.image().shape == (60, 100)
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
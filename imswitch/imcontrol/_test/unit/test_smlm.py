@@ -0,0 +1,79 @@
+import h5py
+import numpy as np
+import pytest
+
+from imswitch.imcontrol.model import LocalizationTable, SMLMLocalizationEngine
+from imswitch.imcontrol.model.SMLMLocalizationEngine import LOCALIZATION_DTYPE
+
+
+class BrightestPixelLocalizer:
+    """ Localizes the brightest pixel of each frame. """
+
+    def localize(self, frame, frameIndex):
+        y, x = np.unravel_index(np.argmax(frame), frame.shape)
+        localizations = np.zeros(1, dtype=LOCALIZATION_DTYPE)
+        localizations['frame'] = frameIndex
+        localizations['x'] = x + 0.5
+        localizations['y'] = y + 0.5
+        localizations['intensity'] = frame[y, x]
+        return localizations
+
+
+@pytest.mark.parametrize('useProcesses', [False, True])
+def test_localization_engine(qtbot, tmp_path, useProcesses):
+    numFrames = 50
+    rng = np.random.default_rng(0)
+    frames = rng.integers(0, 100, size=(numFrames, 16, 24), dtype=np.uint16)
+    positions = np.stack([rng.integers(0, 16, numFrames), rng.integers(0, 24, numFrames)], 1)
+    frames[np.arange(numFrames), positions[:, 0], positions[:, 1]] = 1000
+
+    table = LocalizationTable(str(tmp_path / 'localizations.hdf5'))
+    engine = SMLMLocalizationEngine(BrightestPixelLocalizer(), table, (16, 24),
+                                    renderMagnification=2, batchSize=8, numWorkers=2,
+                                    useProcesses=useProcesses, maxQueuedBatches=2)
+    for start in range(0, numFrames, 7):  # Chunks that don't line up with the batches
+        engine.addFrames(frames[start:start + 7])
+    with qtbot.waitSignal(engine.sigRenderUpdated, timeout=60000):
+        engine.finish()
+
+    assert engine.numFramesLocalized == numFrames
+    render = engine.render
+    assert render.shape == (32, 48) and render.sum() == numFrames
+
+    with h5py.File(tmp_path / 'localizations.hdf5', 'r') as file:
+        localizations = file['localizations']
+        assert localizations.attrs['numLocalizations'] == numFrames
+        order = np.argsort(localizations['frame'][:])
+        assert np.array_equal(localizations['frame'][:][order], np.arange(numFrames))
+        assert np.array_equal(localizations['y'][:][order].astype(int), positions[:, 0])
+        assert np.array_equal(localizations['x'][:][order].astype(int), positions[:, 1])
+
+
+def test_localization_table_read(tmp_path):
+    table = LocalizationTable(str(tmp_path / 'localizations.hdf5'), chunkSize=4)
+    localizations = np.zeros(10, dtype=LOCALIZATION_DTYPE)
+    localizations['frame'] = np.arange(10)
+    localizations['x'] = np.linspace(0, 1, 10)
+    table.append(localizations[:3])
+    table.append(localizations[3:])
+    assert len(table) == 10
+    assert np.array_equal(table.read(), localizations)
+    assert np.array_equal(table.read(2, 5), localizations[2:5])
+    table.close()
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from imswitch.imcontrol.model import SpectrumEngine
+
+
+@pytest.mark.parametrize('shape', [(64, 64), (63, 65), (48, 33)])
+def test_spectrum_matches_fft2(shape):
+    image = np.random.default_rng(0).integers(1, 4096, size=shape, dtype=np.uint16)
+    spectrum, _ = SpectrumEngine().compute(image)
+
+    expected = np.fft.fftshift(np.log10(abs(np.fft.fft2(image))))
+    assert spectrum.shape == expected.shape
+    assert np.allclose(spectrum, expected, atol=1e-4)
+
+
+def test_spectrum_metrics():
+    x = np.arange(128)[np.newaxis, :].repeat(96, axis=0)
+    image = 100 + 50 * np.cos(2 * np.pi * x / 8)
+    engine = SpectrumEngine()
+
+    _, metrics = engine.compute(image)
+    assert metrics.peakPeriod == pytest.approx(8)
+    assert metrics.sharpness == pytest.approx(1)
+    peakBin = np.argmax(metrics.radialPower[1:]) + 1  # Skip the bin with the DC component
+    assert metrics.radialFrequencies[peakBin] == pytest.approx(1 / 8, abs=0.01)
+
+    # Frequencies are reported relative to the original pixels
+    engine.decimation = 2
+    engine.roi = (0, 0, 64, 64)
+    spectrum, metrics = engine.compute(image)
+    assert spectrum.shape == (32, 32)
+    assert metrics.peakPeriod == pytest.approx(8)
+    assert engine.compute(np.full((96, 128), 5.0))[1].sharpness == 0
+
+
+def test_spectrum_of_rgb_frame():
+    rgb = np.random.default_rng(0).integers(1, 256, size=(48, 64, 3), dtype=np.uint8)
+    spectrum, _ = SpectrumEngine().compute(rgb)
+
+    expected = np.fft.fftshift(np.log10(abs(np.fft.fft2(rgb.mean(axis=2)))))
+    assert spectrum.shape == (48, 64)
+    assert np.allclose(spectrum, expected, atol=1e-4)
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,17 @@
+import numpy as np
+
+from imswitch.imcontrol.model import LinearMotion, rasterWaypoints
+
+
+def test_raster_waypoints_snake():
+    waypoints = rasterWaypoints([0, 10], [0, 1, 2])
+    assert waypoints.tolist() == [[0, 0], [0, 1], [0, 2], [10, 2], [10, 1], [10, 0]]
+    assert rasterWaypoints([0, 10], [0, 1], snake=False)[2:].tolist() == [[10, 0], [10, 1]]
+
+
+def test_linear_motion_positions():
+    motion = LinearMotion(start=np.array([0., 100.]), end=np.array([50., 0.]),
+                          speeds=np.array([10., 50.]), startTime=1000.)
+    assert motion.duration == 5
+    positions = motion.positionsAt([999., 1001., 1004., 1010.])
+    assert positions.tolist() == [[0, 100], [10, 50], [40, 0], [50, 0]]
@@ -1,7 +1,9 @@
 from dataclasses import dataclass
 import os
 import pytest
-from imswitch.imcontrol.model.managers.RecordingManager import ZarrStorer, HDF5Storer, TiffStorer
+from imswitch.imcontrol.model.managers.RecordingManager import (
+    ZarrStorer, HDF5Storer, TiffStorer, OMEZarrStorer
+)
 from imswitch.imcontrol.model.managers.DetectorsManager import DetectorsManager
 import numpy as np
 import zarr
@@ -43,4 +45,22 @@ def test_hdf5_storer(tmpdir, fake_manager):
     path = os.path.join(tmpdir, "test")
     storer = HDF5Storer(path, {"test_channel": fake_manager})
     storer.snap({"test_channel": np.zeros((100,100))}, {"test_channel": {"test": 3}})
-    assert os.path.exists(path + "_test_channel.h5"), "path does not exist"
\ No newline at end of file
+    assert os.path.exists(path + "_test_channel.h5"), "path does not exist"
+
+
+def test_ome_zarr_storer(tmpdir, fake_manager):
+    """Test that streamed frames end up in an OME-NGFF multiscale image"""
+    path = os.path.join(tmpdir, "test")
+    storer = OMEZarrStorer(path, {"test_channel": fake_manager}, chunkFrames=4, numLevels=2)
+    frames = np.random.randint(0, 1000, (10, 100, 100)).astype(np.uint16)
+    storer.stream({"test_channel": frames[:3]})
+    storer.stream({"test_channel": frames[3:]})
+    storer.close()
+
+    group = zarr.open_group(path + ".ome.zarr", mode="r")["test_channel"]
+    multiscales = group.attrs["multiscales"][0]
+    assert [axis["name"] for axis in multiscales["axes"]] == ["t", "c", "z", "y", "x"]
+    assert group["0"].shape == (10, 1, 1, 100, 100)
+    assert group["0"].dtype == np.uint16
+    assert np.array_equal(group["0"][:, 0, 0], frames)
+    assert group["1"].shape == (10, 1, 1, 50, 50)
@@ -42,6 +42,12 @@ class CommunicationChannel(SignalInterface):
 
     sigUpdateRecTime = Signal(int)  # (recTime)
 
+    sigUpdateRecQueueDepth = Signal(str, int)  # (detectorName, numQueuedFrames)
+
+    sigUpdateRecFramesDropped = Signal(str, int)  # (detectorName, numDroppedFrames)
+
+    sigUpdateRecFrameStats = Signal(str, float, int)  # (detectorName, fps, numFrameGaps)
+
     sigMemorySnapAvailable = Signal(
         str, np.ndarray, object, bool
     )  # (name, image, filePath, savedToDisk)
@@ -60,6 +66,8 @@ class CommunicationChannel(SignalInterface):
 
     sigScanEnded = Signal()
 
+    sigSpectrumMetricsUpdated = Signal(str, object)  # (detectorName, SpectrumMetrics)
+
     sigSLMMaskUpdated = Signal(object)  # (mask)
     sigSIMMaskUpdated = Signal(object) # (mask)
 
@@ -56,6 +56,9 @@ class MasterController:
         self.recordingManager.sigRecordingEnded.connect(cc.sigRecordingEnded)
         self.recordingManager.sigRecordingFrameNumUpdated.connect(cc.sigUpdateRecFrameNum)
         self.recordingManager.sigRecordingTimeUpdated.connect(cc.sigUpdateRecTime)
+        self.recordingManager.sigRecordingQueueDepthUpdated.connect(cc.sigUpdateRecQueueDepth)
+        self.recordingManager.sigRecordingFramesDropped.connect(cc.sigUpdateRecFramesDropped)
+        self.recordingManager.sigRecordingFrameStatsUpdated.connect(cc.sigUpdateRecFrameStats)
         self.recordingManager.sigMemorySnapAvailable.connect(cc.sigMemorySnapAvailable)
         self.recordingManager.sigMemoryRecordingAvailable.connect(self.memoryRecordingAvailable)
 
@@ -37,6 +37,15 @@ class LiveUpdatedController(ImConWidgetController):
     def update(self, detectorName, im, init, isCurrentDetector):
         raise NotImplementedError
 
+    def subscribeLiveView(self, maxRate=None, roi=None, decimation=1):
+        """ Connects update to a live view subscription with its own maximum
+        rate, ROI and decimation, for controllers that don't need every frame
+        at full size from sigUpdateImage. Returns the subscription, whose
+        settings may be changed later. """
+        liveView = self._master.detectorsManager.subscribeLiveView(maxRate, roi, decimation)
+        liveView.sigImageUpdated.connect(self.update)
+        return liveView
+
 
 class SuperScanController(ImConWidgetController):
     def __init__(self, *args, **kwargs):
@@ -1,24 +1,27 @@
+import inspect
+import threading
 import time
 
 import numpy as np
-from time import perf_counter
-import scipy.ndimage as ndi
-import threading
 
-from imswitch.imcommon.framework import Thread, Timer
+from imswitch.imcommon.framework import Signal
 from imswitch.imcommon.model import initLogger, APIExport
+from imswitch.imcontrol.model import AutofocusAborted, AutofocusEngine
 from ..basecontrollers import ImConWidgetController
 
-import NanoImagingPack as nip
-
 
 # global axis for Z-positioning - should be Z
 gAxis = "Z" 
 T_DEBOUNCE = .2
+N_SETTLE_FRAMES = 2  # frames to wait for after a move, the first one may be exposed while moving
+T_FRAME_TIMEOUT = 2
+
+
 class AutofocusController(ImConWidgetController):
     """Linked to AutofocusWidget."""
 
-    
+    sigFocusCurveUpdated = Signal(object, object)  # (positions, focus values)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.__logger = initLogger(self)
@@ -27,6 +30,7 @@ class AutofocusController(ImConWidgetController):
             return
         
         self.isAutofusRunning = False
+        self._engine = None
 
         self.camera = self._setupInfo.autofocus.camera
         self.positioner = self._setupInfo.autofocus.positioner
@@ -35,10 +39,11 @@ class AutofocusController(ImConWidgetController):
         # Connect AutofocusWidget buttons
         self._widget.focusButton.clicked.connect(self.focusButton)
         self._commChannel.sigAutoFocus.connect(self.autoFocus)
+        self.sigFocusCurveUpdated.connect(self._widget.focusPlotCurve.setData)
 
         # select stage
-        self.stages = self._master.positionersManager[self._master.positionersManager.getAllDeviceNames()[0]]
-
+        self.stageName = self._master.positionersManager.getAllDeviceNames()[0]
+        self.stages = self._master.positionersManager[self.stageName]
 
     def __del__(self):
         self._AutofocusThead.quit()
@@ -54,114 +59,118 @@ class AutofocusController(ImConWidgetController):
             self.autoFocus(rangez,resolutionz)
         else:
             self.isAutofusRunning = False
-
+            if self._engine is not None:
+                self._engine.abort()
 
     @APIExport(runOnUIThread=True)
     # Update focus lock
-    def autoFocus(self, rangez=100, resolutionz=10):
+    def autoFocus(self, rangez=100, resolutionz=10, method=None, metric=None):
 
         '''
-        The stage moves from -rangez...+rangez with a resolution of resolutionz
-        For every stage-position a camera frame is captured and a contrast curve is determined
+        Searches for the focus between -rangez...+rangez around the current
+        position, down to a resolution of resolutionz. For every measured
+        stage position a camera frame is grabbed and a focus metric is
+        computed on it. method is one of AutofocusWidget.searchMethods and
+        metric one of AutofocusWidget.focusMetrics; the ones selected in the
+        widget are used by default.
 
         '''
-        # determine optimal focus position by stepping through all z-positions and cacluate the focus metric
+        method = method if method is not None else self._widget.getSearchMethod()
+        metric = metric if metric is not None else self._widget.getFocusMetric()
         self.isAutofusRunning = True
-        self._AutofocusThead = threading.Thread(target=self.doAutofocusBackground, args=(rangez, resolutionz), daemon=True)
+        self._AutofocusThead = threading.Thread(target=self.doAutofocusBackground,
+                                                args=(rangez, resolutionz, method, metric),
+                                                daemon=True)
         self._AutofocusThead.start()
 
     def grabCameraFrame(self):
+        """ Returns a frame captured after the last stage move. """
         detectorManager = self._master.detectorsManager[self.camera]
-        return detectorManager.getLatestFrame()
-        
-    def doAutofocusBackground(self, rangez=100, resolutionz=10):
-        self._commChannel.sigAutoFocusRunning.emit(True) # inidicate that we are running the autofocus
-
-        allfocusvals = []
-        allfocuspositions = []
-
-                        
-        # get current position
-        initialPosition = self.stages.getPosition()["Z"]
-        
-        
-        # precompute values for Z-scan
-        Nz = int(2*rangez//resolutionz)
-        allfocusvals = np.zeros(Nz)
-        allfocuspositions  = np.linspace(-abs(rangez),abs(rangez),Nz)+initialPosition
-        allfocusimages = []
-
-        # 0 move focus to initial position
-        self.stages.move(value=allfocuspositions[0], axis="Z", is_absolute=True, is_blocking=True)
-
-        # grab dummy frame? 
-        self.grabCameraFrame()     
-        
-        # 1 compute focus for every z position
-        for iz in range(Nz):
-
-            # exit autofocus if necessary
-            if not self.isAutofusRunning:
-                break
-            # 0 Move stage to the predefined position - remember: stage moves in relative coordinates
-            self.stages.move(value=allfocuspositions[iz], axis="Z", is_absolute=True, is_blocking=True)
-
+        frameBuffer = detectorManager.frameBuffer
+        if frameBuffer is None:
             time.sleep(T_DEBOUNCE)
-            self._logger.debug(f'Moving focus to {allfocuspositions[iz]}')
-
-            # 1 Grab camera frame
-            self._logger.debug("Grabbing Frame")
-            img = self.grabCameraFrame()
-            # crop frame, only take inner 40%
-            img = nip.extract(img, (int(img.shape[0]*0.4),int(img.shape[1]*0.4)))
-            allfocusimages.append(img)
-
-            # 2 Gaussian filter the image, to remove noise
-            self._logger.debug("Processing Frame")
-            #img_norm = img-np.min(img)
-            #img_norm = img_norm/np.mean(img_norm)
-            imagearraygf = ndi.filters.gaussian_filter(img, 3)
-
-            # 3 compute focus metric
-            focusquality = np.mean(ndi.filters.laplace(imagearraygf))
-            allfocusvals[iz]=focusquality
-
-        if self.isAutofusRunning:
-            # display the curve
-            self._widget.focusPlotCurve.setData(allfocuspositions,allfocusvals)
-
-            # 4 find maximum focus value and move stage to this position
-            allfocusvals=np.array(allfocusvals)
-            zindex=np.where(np.max(allfocusvals)==allfocusvals)[0]
-            bestzpos = allfocuspositions[np.squeeze(zindex)]
-
-            # 5 move focus back to initial position (reduce backlash)
-            self.stages.move(value=allfocuspositions[0], axis="Z", is_absolute=True, is_blocking=True)
-
-            # 6 Move stage to the position with max focus value
-            self._logger.debug(f'Moving focus to {zindex*resolutionz}')
-            self.stages.move(value=bestzpos, axis="Z", is_absolute=True, is_blocking=True)
-
-            if False:
-                allfocusimages=np.array(allfocusimages)
-                np.save('allfocusimages.npy', allfocusimages)
-                import tifffile as tif
-                tif.imsave("llfocusimages.tif", allfocusimages)
-                np.save('allfocuspositions.npy', allfocuspositions)
-                np.save('allfocusvals.npy', allfocusvals)
-
-        else:
-            self.stages.move(value=initialPosition, axis="Z", is_absolute=True, is_blocking=True)
-
-            
-
-        # DEBUG
+            return detectorManager.getLatestFrame()
+
+        # Wait for new frames instead of a fixed time
+        frameCount = frameBuffer.frameCount
+        deadline = time.monotonic() + T_FRAME_TIMEOUT
+        while frameBuffer.frameCount < frameCount + N_SETTLE_FRAMES:
+            if time.monotonic() > deadline:
+                self.__logger.warning('Timed out waiting for a new frame')
+                break
+            time.sleep(0.002)
+        return np.array(frameBuffer.getLatest())
+
+    def moveZ(self, position, isBlocking=True):
+        self.stages.move(value=position, axis=gAxis, is_absolute=True, is_blocking=isBlocking)
+
+    def getZ(self):
+        # The polled position, if there is one, doesn't need a round trip to the stage
+        positionMonitor = self._master.positionersManager.getPositionMonitor(self.stageName)
+        if positionMonitor.isPolling:
+            return positionMonitor.position[gAxis]
+        return self.stages.getPosition()[gAxis]
+
+    def supportsContinuousMotion(self):
+        """ Whether the stage can start a move without waiting for it to
+        complete and report its position while moving. """
+        return ('is_blocking' in inspect.signature(self.stages.move).parameters and
+                hasattr(self.stages, 'getPosition'))
+
+    def doAutofocusBackground(self, rangez=100, resolutionz=10, method='coarseToFine',
+                              metric='brenner'):
+        self._commChannel.sigAutoFocusRunning.emit(True) # inidicate that we are running the autofocus
 
-        # We are done!
-        self._commChannel.sigAutoFocusRunning.emit(False) # inidicate that we are running the autofocus
-        self.isAutofusRunning = False
-        
-        self._widget.focusButton.setText('Autofocus')
+        bestzpos = None
+        try:
+            # get current position
+            initialPosition = self.getZ()
+            lower, upper = initialPosition - abs(rangez), initialPosition + abs(rangez)
+
+            if method == 'continuous' and not self.supportsContinuousMotion():
+                self.__logger.warning('Stage does not support continuous motion, using a coarse to'
+                                      ' fine search instead')
+                method = 'coarseToFine'
+            continuous = method == 'continuous'
+
+            def onMeasured(_, __):
+                self.sigFocusCurveUpdated.emit(*self._engine.history)
+
+            self._engine = AutofocusEngine(
+                self.moveZ, self.grabCameraFrame, metric=metric, onMeasured=onMeasured,
+                startMove=((lambda position: self.moveZ(position, isBlocking=False))
+                           if continuous else None),
+                getPosition=self.getZ if continuous else None
+            )
+
+            try:
+                if method == 'linear':
+                    result = self._engine.linearScan(lower, upper, int(2*rangez//resolutionz))
+                elif method == 'goldenSection':
+                    result = self._engine.goldenSection(lower, upper, resolutionz)
+                elif method == 'hillClimb':
+                    result = self._engine.hillClimb(initialPosition, rangez/4, resolutionz,
+                                                    lower, upper)
+                elif method == 'continuous':
+                    result = self._engine.continuousScan(lower, upper, resolutionz)
+                else:
+                    result = self._engine.coarseToFine(lower, upper, resolutionz)
+            except AutofocusAborted:
+                self.moveZ(initialPosition)
+            else:
+                bestzpos = result.bestPosition
+                self.__logger.debug(f'Found focus at {bestzpos} with {len(result.positions)}'
+                                    f' measurements in {result.duration:.1f} s')
+
+                # move focus back to the lower end of the range (reduce backlash), then to the
+                # position with max focus value
+                self.moveZ(lower)
+                self.moveZ(bestzpos)
+        finally:
+            # We are done, also if the autofocus failed
+            self._commChannel.sigAutoFocusRunning.emit(False)
+            self.isAutofusRunning = False
+            self._widget.focusButton.setText('Autofocus')
         return bestzpos
 
 # Copyright (C) 2020-2021 ImSwitch developers
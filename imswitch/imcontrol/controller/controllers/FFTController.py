@@ -1,6 +1,7 @@
 import numpy as np
 
 from imswitch.imcommon.framework import Signal, Thread, Worker, Mutex
+from imswitch.imcontrol.model import SpectrumEngine
 from imswitch.imcontrol.view import guitools
 from ..basecontrollers import LiveUpdatedController
 
@@ -20,13 +21,16 @@ class FFTController(LiveUpdatedController):
         # Prepare image computation worker
         self.imageComputationWorker = self.FFTImageComputationWorker()
         self.imageComputationWorker.sigFftImageComputed.connect(self.displayImage)
+        self.imageComputationWorker.sigSpectrumMetricsComputed.connect(
+            self._commChannel.sigSpectrumMetricsUpdated
+        )
         self.imageComputationThread = Thread()
         self.imageComputationWorker.moveToThread(self.imageComputationThread)
         self.sigImageReceived.connect(self.imageComputationWorker.computeFFTImage)
         self.imageComputationThread.start()
 
-        # Connect CommunicationChannel signals
-        self._commChannel.sigUpdateImage.connect(self.update)
+        # Subscribe to the live view; the display doesn't need more than 10 frames per second
+        self._liveView = self.subscribeLiveView(maxRate=10)
 
         # Connect FFTWidget signals
         self._widget.sigShowToggled.connect(self.setShowFFT)
@@ -62,7 +66,7 @@ class FFTController(LiveUpdatedController):
 
         if self.it == self.updateRate:
             self.it = 0
-            self.imageComputationWorker.prepareForNewImage(im)
+            self.imageComputationWorker.prepareForNewImage(detectorName, im)
             self.sigImageReceived.emit()
         else:
             self.it += 1
@@ -107,11 +111,13 @@ class FFTController(LiveUpdatedController):
 
     class FFTImageComputationWorker(Worker):
         sigFftImageComputed = Signal(np.ndarray)
+        sigSpectrumMetricsComputed = Signal(str, object)  # (detectorName, SpectrumMetrics)
 
         def __init__(self):
             super().__init__()
             self._numQueuedImages = 0
             self._numQueuedImagesMutex = Mutex()
+            self._spectrumEngine = SpectrumEngine()
 
         def computeFFTImage(self):
             """ Compute FFT of an image. """
@@ -119,15 +125,18 @@ class FFTController(LiveUpdatedController):
                 if self._numQueuedImages > 1:
                     return  # Skip this frame in order to catch up
 
-                fftImage = np.fft.fftshift(np.log10(abs(np.fft.fft2(self._image))))
-                self.sigFftImageComputed.emit(fftImage)
+                fftImage, metrics = self._spectrumEngine.compute(self._image)
+                # The engine reuses its output buffers, so the displayed image must be a copy
+                self.sigFftImageComputed.emit(np.array(fftImage))
+                self.sigSpectrumMetricsComputed.emit(self._detectorName, metrics)
             finally:
                 self._numQueuedImagesMutex.lock()
                 self._numQueuedImages -= 1
                 self._numQueuedImagesMutex.unlock()
 
-        def prepareForNewImage(self, image):
+        def prepareForNewImage(self, detectorName, image):
             """ Must always be called before the worker receives a new image. """
+            self._detectorName = detectorName
             self._image = image
             self._numQueuedImagesMutex.lock()
             self._numQueuedImages += 1
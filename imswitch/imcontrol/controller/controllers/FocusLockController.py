@@ -1,19 +1,22 @@
 import time
+from dataclasses import asdict
+from typing import Dict
 
 import numpy as np
 from time import perf_counter
-import scipy.ndimage as ndi
 from lantz import Q_
-from skimage.feature import peak_local_max
 
-from imswitch.imcommon.framework import Thread, Timer
-from imswitch.imcommon.model import initLogger
+from imswitch.imcommon.framework import Signal, Thread, Timer
+from imswitch.imcommon.model import initLogger, APIExport
+from imswitch.imcontrol.model import BeamTracker, FocusLockEngine
 from ..basecontrollers import ImConWidgetController
 
 
 class FocusLockController(ImConWidgetController):
     """Linked to FocusLockWidget."""
 
+    sigSafetyUnlocked = Signal()
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.__logger = initLogger(self)
@@ -49,18 +52,26 @@ class FocusLockController(ImConWidgetController):
         self.zStackVar = False
         self.twoFociVar = False
         self.noStepVar = True
-        self.focusTime = 1000 / self.updateFreq  # time between focus signal updates in ms
-        self.lockPosition = 0
-        self.currentPosition = 0
-        self.lastZ = 0
+        self.focusTime = 1000 / self.updateFreq  # time between display updates in ms
         self.buffer = 40
-        self.currPoint = 0
-        self.setPointData = np.zeros(self.buffer)
-        self.timeData = np.zeros(self.buffer)
-        self.lockingData = np.zeros(7)
+        self._lastFrameCount = -1
+
+        # The focus lock loop runs on its own thread, independently of the display updates
+        positioner = self._master.positionersManager[self.positioner]
+        self._engine = FocusLockEngine(
+            self.waitForFrame,
+            moveBy=lambda distance: positioner.move(distance, 0),
+            getPosition=positioner.get_abs,
+            tracker=BeamTracker(roiSize=self._setupInfo.focusLock.roiSize,
+                                subpixelFit=self._setupInfo.focusLock.subpixelFit),
+            loopRate=(self._setupInfo.focusLock.loopRate
+                      if self._setupInfo.focusLock.loopRate is not None else self.updateFreq),
+            onUnlocked=self.sigSafetyUnlocked.emit
+        )
+        self.sigSafetyUnlocked.connect(self.unlockFocus)
 
         self._master.detectorsManager[self.camera].startAcquisition()
-        self.__processDataThread = ProcessDataThread(self)
+        self._engine.start()
 
         self.timer = Timer()
         self.timer.timeout.connect(self.update)
@@ -68,13 +79,13 @@ class FocusLockController(ImConWidgetController):
         self.startTime = perf_counter()
 
     def __del__(self):
-        self.__processDataThread.quit()
-        self.__processDataThread.wait()
+        self._engine.stop()
         if hasattr(super(), '__del__'):
             super().__del__()
 
     def unlockFocus(self):
         if self.locked:
+            self._engine.unlock()
             self.locked = False
             self._widget.lockButton.setChecked(False)
             self._widget.focusPlot.removeItem(self._widget.focusLockGraph.lineLock)
@@ -116,59 +127,65 @@ class FocusLockController(ImConWidgetController):
             self.twoFociVar = False
         else:
             self.twoFociVar = True
-
-    # Update focus lock
-    def update(self):
-        # 1 Grab camera frame
-        img = self.__processDataThread.grabCameraFrame()
-        # 2 Pass camera frame and get back focusSignalPosition from ProcessDataThread
-        self.setPointSignal = self.__processDataThread.update(self.twoFociVar)
-        # 3 Update PI with the new setPointSignal and get back the distance to move, send to
-        # update the PI control, and then send the move-distance to the z-piezo
-        if self.locked:
-            value_move = self.updatePI()
-            if self.noStepVar and abs(value_move) > 0.002:
-                # self.zstepupdate = self.zstepupdate + 1
-                self._master.positionersManager[self.positioner].move(value_move, 0)
-        # elif self.aboutToLock:
-        #    self.lockingPI()
-        # 4 Update image and focusSignalPosition in FocusLockWidget
-        self.updateSetPointData()
-        self._widget.camImg.setImage(img)
-        if self.currPoint < self.buffer:
-            self._widget.focusPlotCurve.setData(self.timeData[1:self.currPoint],
-                                                self.setPointData[1:self.currPoint])
+        self._engine.tracker.twoFoci = self.twoFociVar
+        self._engine.tracker.reset()
+
+    def waitForFrame(self, timeout):
+        """ Waits for a new frame from the focus lock camera and returns it
+        together with the time at which it arrived, or None if there was no
+        new frame within the timeout. """
+        detectorManager = self._master.detectorsManager[self.camera]
+        frameBuffer = detectorManager.frameBuffer
+        if frameBuffer is None:
+            frame, hostTimestamp = detectorManager.getLatestFrame(), time.time()
         else:
-            self._widget.focusPlotCurve.setData(self.timeData, self.setPointData)
+            frameCount = frameBuffer.frameCount
+            if frameCount == self._lastFrameCount:
+                deadline = time.monotonic() + timeout
+                while frameBuffer.frameCount == frameCount:
+                    if time.monotonic() > deadline:
+                        return None
+                    time.sleep(0.0005)
+            frame, metadata = frameBuffer.getLatestWithMetadata()
+            self._lastFrameCount = frameBuffer.frameCount
+            if frame is None:
+                return None
+            # A view of the buffer's slot, which the camera overwrites once the buffer wraps
+            frame = np.array(frame)
+            hostTimestamp = metadata.hostTimestamps[0]
+
+        # swap axes of frame (depending on setup, make this a variable in the json)
+        return np.swapaxes(frame, 0, 1), hostTimestamp
+
+    # Update focus lock display
+    def update(self):
+        self.setPointSignal = self._engine.focusSignal
+        img = self._engine.latestFrame
+        if img is not None:
+            self._widget.camImg.setImage(img)
 
-    def updateSetPointData(self):
-        if self.currPoint < self.buffer:
-            self.setPointData[self.currPoint] = self.setPointSignal
-            self.timeData[self.currPoint] = perf_counter() - self.startTime
-        else:
-            self.setPointData[:-1] = self.setPointData[1:]
-            self.setPointData[-1] = self.setPointSignal
-            self.timeData[:-1] = self.timeData[1:]
-            self.timeData[-1] = perf_counter() - self.startTime
-        self.currPoint += 1
-
-    def updatePI(self):
-        if not self.noStepVar:
-            self.noStepVar = True
-        self.currentPosition = self._master.positionersManager[self.positioner].get_abs()
-        distance = self.currentPosition - self.lockPosition
-        move = self.pi.update(self.setPointSignal)
-        self.lastZ = self.currentPosition
-
-        if abs(distance) > 5 or abs(move) > 3:
-            self.__logger.debug(f'Safety unlocking! Distance: {distance}, move: {move}.')
-            self.unlockFocus()
+        times, signals, _ = self._engine.getHistory()
+        self._widget.focusPlotCurve.setData(times[-self.buffer:], signals[-self.buffer:])
+
+        statistics = self._engine.getStatistics()
+        self._widget.setStatistics(statistics.loopRate, statistics.periodJitter * 1000,
+                                   statistics.meanLatency * 1000, statistics.lockError)
 
-        return move
+    @APIExport()
+    def getFocusLockStatistics(self) -> Dict[str, float]:
+        """ Returns the loop rate (Hz), period jitter (s), latency (s) and
+        lock error (px) of the focus lock loop. """
+        return asdict(self._engine.getStatistics())
 
     def lockFocus(self, kp, ki, absz):
         if not self.locked:
-            self.pi = PI(self.setPointSignal, 0.001, kp, ki)
+            try:
+                self._engine.lock(kp, ki)
+            except RuntimeError as e:
+                self.__logger.warning(str(e))
+                self._widget.lockButton.setChecked(False)
+                return
+            self.setPointSignal = self._engine.getSetPoint()
             self.lockPosition = absz
             self.locked = True
             self._widget.focusLockGraph.lineLock = self._widget.focusPlot.addLine(
@@ -176,67 +193,6 @@ class FocusLockController(ImConWidgetController):
             )
 
 
-class ProcessDataThread(Thread):
-    def __init__(self, controller, *args, **kwargs):
-        self._controller = controller
-        super().__init__(*args, **kwargs)
-
-    def grabCameraFrame(self):
-        detectorManager = self._controller._master.detectorsManager[self._controller.camera]
-        self.latestimg = detectorManager.getLatestFrame()
-        # 1.5 swap axes of frame (depending on setup, make this a variable in the json)
-        self.latestimg = np.swapaxes(self.latestimg,0,1)
-        return self.latestimg
-
-    def update(self, twoFociVar):
-        # Gaussian filter the image, to remove noise and so on, to get a better center estimate
-        imagearraygf = ndi.filters.gaussian_filter(self.latestimg, 7)
-
-        # Update the focus signal
-        if twoFociVar:
-            allmaxcoords = peak_local_max(imagearraygf, min_distance=60)
-            size = allmaxcoords.shape
-            maxvals = np.zeros(size[0])
-            maxvalpos = np.zeros(2)
-            for n in range(0, size[0]):
-                if imagearraygf[allmaxcoords[n][0], allmaxcoords[n][1]] > maxvals[0]:
-                    if imagearraygf[allmaxcoords[n][0], allmaxcoords[n][1]] > maxvals[1]:
-                        tempval = maxvals[1]
-                        maxvals[0] = tempval
-                        maxvals[1] = imagearraygf[allmaxcoords[n][0], allmaxcoords[n][1]]
-                        tempval = maxvalpos[1]
-                        maxvalpos[0] = tempval
-                        maxvalpos[1] = n
-                    else:
-                        maxvals[0] = imagearraygf[allmaxcoords[n][0], allmaxcoords[n][1]]
-                        maxvalpos[0] = n
-            xcenter = allmaxcoords[maxvalpos[0]][0]
-            ycenter = allmaxcoords[maxvalpos[0]][1]
-            if allmaxcoords[maxvalpos[1]][1] < ycenter:
-                xcenter = allmaxcoords[maxvalpos[1]][0]
-                ycenter = allmaxcoords[maxvalpos[1]][1]
-            centercoords2 = np.array([xcenter, ycenter])
-        else:
-            centercoords = np.where(imagearraygf == np.array(imagearraygf.max()))
-            centercoords2 = np.array([centercoords[0][0], centercoords[1][0]])
-
-        subsizey = 50
-        subsizex = 50
-        xlow = max(0, (centercoords2[0] - subsizex))
-        xhigh = min(1024, (centercoords2[0] + subsizex))
-        ylow = max(0, (centercoords2[1] - subsizey))
-        yhigh = min(1280, (centercoords2[1] + subsizey))
-
-        imagearraygfsub = imagearraygf[xlow:xhigh, ylow:yhigh]
-
-        massCenter = np.array(ndi.measurements.center_of_mass(imagearraygfsub))
-
-        # add the information about where the center of the subarray is
-        massCenterGlobal = massCenter[1] + centercoords2[1]  # - subsizey - self.sensorSize[1] / 2
-
-        return massCenterGlobal
-
-
 class FocusCalibThread(Thread):
     def __init__(self, focusWidget, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -275,77 +231,6 @@ class FocusCalibThread(Thread):
         np.savetxt('calibrationcurves.txt', self.savedCalibData)
 
 
-class PI:
-    """Simple implementation of a discrete PI controller.
-    Taken from http://code.activestate.com/recipes/577231-discrete-pid-controller/
-    Author: Federico Barabas"""
-
-    def __init__(self, setPoint, multiplier=1, kp=0, ki=0):
-
-        self._kp = multiplier * kp
-        self._ki = multiplier * ki
-        self._setPoint = setPoint
-        self.multiplier = multiplier
-        self.error = 0.0
-        self._started = False
-
-    def update(self, currentValue):
-        """
-        Calculate PID output value for given reference input and feedback.
-        I'm using the iterative formula to avoid integrative part building.
-        ki, kp > 0
-        """
-        self.error = self.setPoint - currentValue
-
-        if self.started:
-            self.dError = self.error - self.lastError
-            self.out = self.out + self.kp * self.dError + self.ki * self.error
-
-        else:
-            # This only runs in the first step
-            self.out = self.kp * self.error
-            self.started = True
-
-        self.lastError = self.error
-
-        return self.out
-
-    def restart(self):
-        self.started = False
-
-    @property
-    def started(self):
-        return self._started
-
-    @started.setter
-    def started(self, value):
-        self._started = value
-
-    @property
-    def setPoint(self):
-        return self._setPoint
-
-    @setPoint.setter
-    def setPoint(self, value):
-        self._setPoint = value
-
-    @property
-    def kp(self):
-        return self._kp
-
-    @kp.setter
-    def kp(self, value):
-        self._kp = value
-
-    @property
-    def ki(self):
-        return self._ki
-
-    @ki.setter
-    def ki(self, value):
-        self._ki = value
-
-
 # Copyright (C) 2020-2021 ImSwitch developers
 # This file is part of ImSwitch.
 #
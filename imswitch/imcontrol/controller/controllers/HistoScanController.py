@@ -1,5 +1,6 @@
 import json
 import os
+from concurrent.futures import CancelledError
 
 import numpy as np
 import time
@@ -230,24 +231,38 @@ class HistoScanController(LiveUpdatedController):
         # reserve and free space for displayed stacks
         self.LastStackLED = []
             
-        for iPos in range(len(coordinateList)):
-            # move to location
-            self._widget.setInformationLabel("Moving to : " + str(coordinateList[iPos,:]) + " µm ")
-            self.stages.move(value=coordinateList[iPos,:], axis="XY", speed=(self.speed,self.speed), is_absolute=True, is_blocking=True, timeout=5)
-            #self.stages.move(value=coordinateList[iPos,0], axis="X", speed=(self.speed), is_absolute=True, is_blocking=True)
-            #self.stages.move(value=coordinateList[iPos,1], axis="Y", speed=(self.speed), is_absolute=True, is_blocking=True)
-            
-            # want to do autofocus?
-            autofocusParams = self._widget.getAutofocusValues()
-            if self._widget.isAutofocus() and np.mod(self.nImages, int(autofocusParams['valuePeriod'])) == 0:
-                self._widget.setInformationLabel("Autofocusing...")
-                self.doAutofocus(autofocusParams)
-            
-            # turn on illumination # TODO: ensure it's the right light source!    
-            zstackParams = self._widget.getZStackValues()
-            self._logger.debug("Take image")
-            time.sleep(0.2) # antishake
-            self.takeImageIlluStack(xycoords = coordinateList[iPos,:], intensity=self.LEDValue, zstackParams=zstackParams)
+        # autofocus runs in its own controller and moves the stage itself, so it needs the stage to
+        # wait at each position
+        if hasattr(self.stages, "runTrajectory") and not self._widget.isAutofocus():
+            # the tiles are imaged here rather than on arrival, which would run the whole capture on
+            # the I/O thread of the board with its port held, so each position is queued once the
+            # previous tile has been imaged and the stage stays put meanwhile
+            for iPos in range(len(coordinateList)):
+                if not self.isHistoScanrunning:
+                    break
+                self._widget.setInformationLabel("Moving to : " + str(coordinateList[iPos,:]) + " µm ")
+                arrival = self.stages.runTrajectory(
+                    coordinateList[iPos:iPos+1,:], axis="XY", speed=(self.speed,self.speed),
+                    timeout=5, settleTime=0.2 # antishake
+                )[0]
+                try:
+                    arrival.result()
+                except CancelledError:
+                    break
+                except Exception as e:
+                    self._logger.error(f"Scan failed, stopping: {e}")
+                    self.stages.cancelTrajectory()
+                    break
+                self.imagePosition(coordinateList[iPos,:])
+        else:
+            for iPos in range(len(coordinateList)):
+                if not self.isHistoScanrunning:
+                    break
+                # move to location
+                self._widget.setInformationLabel("Moving to : " + str(coordinateList[iPos,:]) + " µm ")
+                self.stages.move(value=coordinateList[iPos,:], axis="XY", speed=(self.speed,self.speed), is_absolute=True, is_blocking=True, timeout=5)
+                time.sleep(0.2) # antishake
+                self.imagePosition(coordinateList[iPos,:])
 
         # move stage back to origine
         self.stages.move(value=initialPosition, axis="XY", speed=(self.speed,self.speed), is_absolute=True, is_blocking=True, timeout=5)
@@ -260,6 +275,20 @@ class HistoScanController(LiveUpdatedController):
         self._widget.HistoScanShowLastButton.setEnabled(True)
 
 
+    def imagePosition(self, xycoords):
+        self._widget.setInformationLabel("Imaging at : " + str(xycoords) + " µm ")
+
+        # want to do autofocus?
+        autofocusParams = self._widget.getAutofocusValues()
+        if self._widget.isAutofocus() and np.mod(self.nImages, int(autofocusParams['valuePeriod'])) == 0:
+            self._widget.setInformationLabel("Autofocusing...")
+            self.doAutofocus(autofocusParams)
+
+        # turn on illumination # TODO: ensure it's the right light source!
+        zstackParams = self._widget.getZStackValues()
+        self._logger.debug("Take image")
+        self.takeImageIlluStack(xycoords = xycoords, intensity=self.LEDValue, zstackParams=zstackParams)
+
     def takeImageIlluStack(self, xycoords, intensity, zstackParams=None):
         self._logger.debug("Take image: " + str(xycoords) + " - " + str(intensity))
         fileExtension = 'tif'
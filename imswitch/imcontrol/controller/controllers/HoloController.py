@@ -1,14 +1,8 @@
 import numpy as np
 
-try:
-    import NanoImagingPack as nip
-    isNIP = True
-except:
-    isNIP = False
-    
 from imswitch.imcommon.framework import Signal, Thread, Worker, Mutex
-from imswitch.imcontrol.view import guitools
-from imswitch.imcommon.model import initLogger
+from imswitch.imcommon.model import initLogger, APIExport
+from imswitch.imcontrol.model import HolographyEngine
 from ..basecontrollers import LiveUpdatedController
 
 
@@ -19,42 +13,36 @@ class HoloController(LiveUpdatedController):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        
+
         self.updateRate = 10
         self.it = 0
         self.init = False
         self.showPos = False
 
-        # reconstruction related settings
-        #TODO: Make parameters adaptable from Plugin
+        # reconstruction related settings, lengths in micrometers
         self.valueRangeMin=0
         self.valueRangeMax=0
-        self.pixelsize = 3.45*1e-6   
-        self.mWavelength = 488*1e-9
+        self.pixelsize = 3.45
+        self.mWavelength = 0.488
         self.NA=.3
         self.k0 = 2*np.pi/(self.mWavelength)
 
-        self.PSFpara = nip.PSF_PARAMS()
-        self.PSFpara.wavelength = self.mWavelength
-        self.PSFpara.NA=self.NA
-        self.PSFpara.pixelsize = self.pixelsize
-
-        self.dz = 40*1e-3
+        self.dz = 40*1e3
 
         # Prepare image computation worker
-        self.imageComputationWorker = self.HoloImageComputationWorker()
-        self.imageComputationWorker.set_pixelsize(self.pixelsize)
+        self.imageComputationWorker = self.HoloImageComputationWorker(
+            HolographyEngine(self.mWavelength, self.pixelsize, self.NA, roiSize=1024)
+        )
         self.imageComputationWorker.set_dz(self.dz)
-        self.imageComputationWorker.set_PSFpara(self.PSFpara)
         self.imageComputationWorker.sigHoloImageComputed.connect(self.displayImage)
-   
+
         self.imageComputationThread = Thread()
         self.imageComputationWorker.moveToThread(self.imageComputationThread)
         self.sigImageReceived.connect(self.imageComputationWorker.computeHoloImage)
         self.imageComputationThread.start()
 
-        # Connect CommunicationChannel signals
-        self._commChannel.sigUpdateImage.connect(self.update)
+        # Subscribe to the live view; the display doesn't need more than 10 frames per second
+        self._liveView = self.subscribeLiveView(maxRate=10)
 
         # Connect HoloWidget signals
         self._widget.sigShowToggled.connect(self.setShowHolo)
@@ -66,7 +54,7 @@ class HoloController(LiveUpdatedController):
 
     def valueChanged(self, magnitude):
         """ Change magnitude. """
-        self.dz = magnitude*1e-3
+        self.dz = magnitude*1e3  # The slider is in millimeters
         self.imageComputationWorker.set_dz(self.dz)
 
     def __del__(self):
@@ -81,6 +69,8 @@ class HoloController(LiveUpdatedController):
         self.mWavelength = self._widget.getWvl()
         self.NA = self._widget.getNA()
         self.k0 = 2 * np.pi / (self.mWavelength)
+        self.imageComputationWorker.setOpticalParameters(self.mWavelength, self.pixelsize,
+                                                         self.NA)
         self.active = enabled
         self.init = False
 
@@ -105,39 +95,34 @@ class HoloController(LiveUpdatedController):
         self.updateRate = updateRate
         self.it = 0
 
+    @APIExport()
+    def getRefocusedStack(self, minDz: float, maxDz: float, numPlanes: int) -> np.ndarray:
+        """ Refocuses the latest hologram at numPlanes distances from minDz
+        to maxDz (in millimeters) and returns the magnitudes as an array of
+        shape (numPlanes, height, width). """
+        hologram = self._master.detectorsManager.getCurrentDetector().getLatestFrame()
+        dzs = np.linspace(minDz, maxDz, numPlanes) * 1e3
+        return self.imageComputationWorker.engine.reconstructStack(hologram, dzs)
+
     class HoloImageComputationWorker(Worker):
         sigHoloImageComputed = Signal(np.ndarray)
 
-        def __init__(self):
+        def __init__(self, engine):
             super().__init__()
-            
+
             self._logger = initLogger(self, tryInheritParent=False)
             self._numQueuedImages = 0
             self._numQueuedImagesMutex = Mutex()
-            self.PSFpara = None
-            self.pixelsize = 1
+            self.engine = engine
             self.dz = 1
 
-
-        def reconholo(self, image, PSFpara, N_subroi=1024, pixelsize=1e-3, dz=50e-3):
-            mimage = nip.image(np.sqrt(image))
-            mimage = nip.extract(mimage, [N_subroi,N_subroi])
-            mimage.pixelsize=(pixelsize, pixelsize)
-            mpupil = nip.ft(mimage)         
-            #nip.__make_propagator__(mpupil, PSFpara, doDampPupil=True, shape=mpupil.shape, distZ=dz)
-            cos_alpha, sin_alpha = nip.cosSinAlpha(mimage, PSFpara)
-            defocus = self.dz #  defocus factor
-            PhaseMap = nip.defocusPhase(cos_alpha, defocus, PSFpara)
-            propagated = nip.ft2d((np.exp(1j * PhaseMap))*mpupil)
-            return np.squeeze(propagated)
-
         def computeHoloImage(self):
             """ Compute Holo of an image. """
             try:
                 if self._numQueuedImages > 1:
                     return  # Skip this frame in order to catch up
-                holorecon = np.flip(np.abs(self.reconholo(self._image, PSFpara=self.PSFpara, N_subroi=1024, pixelsize=self.pixelsize, dz=self.dz)),1)
-                
+                holorecon = self.engine.reconstruct(self._image, self.dz)
+
                 self.sigHoloImageComputed.emit(np.array(holorecon))
             finally:
                 self._numQueuedImagesMutex.lock()
@@ -153,12 +138,11 @@ class HoloController(LiveUpdatedController):
 
         def set_dz(self, dz):
             self.dz = dz
-        
-        def set_PSFpara(self, PSFpara):
-            self.PSFpara = PSFpara
 
-        def set_pixelsize(self, pixelsize):
-            self.pixelsize = pixelsize
+        def setOpticalParameters(self, wavelength, pixelsize, NA):
+            self.engine.wavelength = wavelength
+            self.engine.pixelsize = pixelsize
+            self.engine.NA = NA
 
 
 # Copyright (C) 2020-2021 ImSwitch developers
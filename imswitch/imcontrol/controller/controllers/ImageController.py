@@ -1,11 +1,16 @@
-from imswitch.imcontrol.view import guitools
 from ..basecontrollers import LiveUpdatedController
-from imswitch.imcommon.model import initLogger
+from imswitch.imcommon.model import APIExport, initLogger
+from imswitch.imcontrol.model import AutoLevelEngine
 import numpy as np
 
 class ImageController(LiveUpdatedController):
     """ Linked to ImageWidget."""
 
+    viewportMargin = 0.25
+    """ Margin around the visible region that is included in the live view
+    ROI, as a fraction of the visible width and height, so that small pans
+    don't require a new ROI. """
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -15,6 +20,9 @@ class ImageController(LiveUpdatedController):
 
         self._lastShape = self._master.detectorsManager.execOnCurrent(lambda c: c.shape)
         self._shouldResetView = False
+        self._autoLevelEngines = {}
+        self._continuousAutoLevels = False
+        self._viewportLiveView = False
 
         detectorName = self._master.detectorsManager.getAllDeviceNames(lambda c: c.forAcquisition)[0]
         # check if RGB 
@@ -26,8 +34,11 @@ class ImageController(LiveUpdatedController):
         self._widget.setLiveViewLayers(detectorName, isRGB)
 
 
+        # The live view has a subscription of its own, so that it can be reduced to the resolution
+        # it is displayed at while other controllers keep receiving full frames
+        self._liveView = self.subscribeLiveView()
+
         # Connect CommunicationChannel signals
-        self._commChannel.sigUpdateImage.connect(self.update)
         self._commChannel.sigAdjustFrame.connect(self.adjustFrame)
         self._commChannel.sigGridToggled.connect(self.gridToggle)
         self._commChannel.sigCrosshairToggled.connect(self.crosshairToggle)
@@ -36,6 +47,11 @@ class ImageController(LiveUpdatedController):
         self._commChannel.sigMemorySnapAvailable.connect(self.memorySnapAvailable)
         self._commChannel.sigSetExposure.connect(lambda t: self.setExposure(t))
 
+        # Connect ImageWidget signals
+        self._widget.sigContinuousLevelsToggled.connect(self.setContinuousAutoLevels)
+        self._widget.sigViewportLiveViewToggled.connect(self.setViewportLiveView)
+        self._widget.sigViewportChanged.connect(self.updateLiveViewResolution)
+
     def autoLevels(self, detectorNames=None, im=None):
         """ Set histogram levels automatically with current detector image."""
         if detectorNames is None:
@@ -47,8 +63,81 @@ class ImageController(LiveUpdatedController):
             if im is None:
                 im = self._widget.getImage(detectorName)
 
-            # self._widget.setImageDisplayLevels(detectorName, *guitools.bestLevels(im))
-            self._widget.setImageDisplayLevels(detectorName, *guitools.minmaxLevels(im))
+            engine = self._getAutoLevelEngine(detectorName)
+            engine.reset()
+            self._widget.setImageDisplayLevels(detectorName, *engine.update(im))
+
+    @APIExport(runOnUIThread=True)
+    def setContinuousAutoLevels(self, enabled: bool) -> None:
+        """ Sets whether the display levels of the live view are updated for
+        every frame, as opposed to only when the live view starts. The levels
+        are smoothed over time and only changed when the change is
+        visible. """
+        self._continuousAutoLevels = enabled
+        self._widget.setContinuousLevelsChecked(enabled)
+        for engine in self._autoLevelEngines.values():
+            engine.reset()
+
+    @APIExport(runOnUIThread=True)
+    def setViewportLiveView(self, enabled: bool) -> None:
+        """ Sets whether the live view is binned to the zoom level it is
+        displayed at, and cropped to the visible region when zoomed in, to
+        reduce the amount of data displayed for large sensors. Controllers
+        that process the frames are unaffected and still receive full
+        frames. """
+        self._viewportLiveView = enabled
+        self._widget.setViewportLiveViewChecked(enabled)
+        if enabled:
+            self.updateLiveViewResolution()
+        else:
+            self._liveView.roi = None
+            self._liveView.binning = 1
+
+    def updateLiveViewResolution(self):
+        """ Adapts the binning and ROI of the live view to the visible region,
+        if the viewport-aware live view is enabled. """
+        if not self._viewportLiveView:
+            return
+
+        geometry = self._liveView.getFrameGeometry(
+            self._master.detectorsManager.getCurrentDetectorName()
+        )
+        if geometry is None:
+            return  # Sensor size not known yet
+
+        sourceHeight, sourceWidth = geometry.sourceShape[:2]
+        (x, y, width, height), zoom = self._widget.getViewport()
+        binning = max(int(1 / zoom), 1) if zoom > 0 else 1
+
+        visible = (max(x, 0), max(y, 0), min(x + width, sourceWidth), min(y + height, sourceHeight))
+        if visible[2] <= visible[0] or visible[3] <= visible[1]:
+            return  # Frame not in view
+
+        # Keep the current ROI as long as it contains the visible region and isn't much larger
+        # than needed
+        marginX, marginY = width * self.viewportMargin, height * self.viewportMargin
+        x0, y0 = max(int(x - marginX), 0), max(int(y - marginY), 0)
+        x0, y0 = x0 - x0 % binning, y0 - y0 % binning  # Keep binned pixels on the sensor grid
+        x1 = min(int(np.ceil(x + width + marginX)), sourceWidth)
+        y1 = min(int(np.ceil(y + height + marginY)), sourceHeight)
+        currentX, currentY, currentWidth, currentHeight = (
+            self._liveView.roi if self._liveView.roi is not None
+            else (0, 0, sourceWidth, sourceHeight)
+        )
+        if (binning == self._liveView.binning and
+                currentX <= visible[0] and currentY <= visible[1] and
+                currentX + currentWidth >= visible[2] and currentY + currentHeight >= visible[3] and
+                currentWidth * currentHeight <= 4 * (x1 - x0) * (y1 - y0)):
+            return
+
+        fullFrame = x0 == 0 and y0 == 0 and x1 == sourceWidth and y1 == sourceHeight
+        self._liveView.roi = None if fullFrame else (x0, y0, x1 - x0, y1 - y0)
+        self._liveView.binning = binning
+
+    def _getAutoLevelEngine(self, detectorName):
+        if detectorName not in self._autoLevelEngines:
+            self._autoLevelEngines[detectorName] = AutoLevelEngine()
+        return self._autoLevelEngines[detectorName]
 
     def addItemToVb(self, item):
         """ Add item from communication channel to viewbox."""
@@ -65,11 +154,23 @@ class ImageController(LiveUpdatedController):
 
             if not init:
                 self.autoLevels([detectorName], im)
+            elif self._continuousAutoLevels:
+                levels = self._getAutoLevelEngine(detectorName).update(im)
+                if levels is not None:
+                    self._widget.setImageDisplayLevels(detectorName, *levels)
 
             self._widget.setImage(detectorName, im)
+            geometry = self._liveView.getFrameGeometry(detectorName)
+            if geometry is not None:
+                self._widget.setImageGeometry(detectorName, geometry.x, geometry.y, geometry.step)
 
             if not init or self._shouldResetView:
-                self.adjustFrame(instantResetView=True)
+                if geometry is not None and geometry.roi is not None:
+                    # Reset the view to the whole frame rather than the crop, once it arrives
+                    self._liveView.roi = None
+                    self._shouldResetView = True
+                else:
+                    self.adjustFrame(instantResetView=True)
 
     def adjustFrame(self, shape=None, instantResetView=False):
         """ Adjusts the viewbox to a new width and height. """
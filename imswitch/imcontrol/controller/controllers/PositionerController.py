@@ -1,5 +1,6 @@
 from typing import Dict, List
 
+from imswitch.imcommon.framework import Signal
 from imswitch.imcommon.model import APIExport
 from ..basecontrollers import ImConWidgetController
 from imswitch.imcommon.model import initLogger
@@ -8,6 +9,8 @@ from imswitch.imcommon.model import initLogger
 class PositionerController(ImConWidgetController):
     """ Linked to PositionerWidget."""
 
+    sigPositionChanged = Signal(str, object)  # (positionerName, position)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -39,6 +42,13 @@ class PositionerController(ImConWidgetController):
                 if hasStop:
                     self.setSharedAttr(pName, axis, _stopAttr, pManager.stop[axis])
 
+            # Positions from the position monitor arrive in its polling thread, they are forwarded
+            # to the GUI thread through sigPositionChanged
+            self._master.positionersManager.getPositionMonitor(pName).sigPositionChanged.connect(
+                self.sigPositionChanged
+            )
+        self.sigPositionChanged.connect(self.positionChanged)
+
         # Connect CommunicationChannel signals
         self._commChannel.sharedAttrs.sigAttributeSet.connect(self.attrChanged)
        
@@ -94,10 +104,18 @@ class PositionerController(ImConWidgetController):
         self._master.positionersManager[positionerName].setSpeed(speed, axis)
 
     def updatePosition(self, positionerName, axis):
-        newPos = self._master.positionersManager[positionerName].position[axis]
+        monitor = self._master.positionersManager.getPositionMonitor(positionerName)
+        monitor.recordCommanded()
+        newPos = monitor.position[axis]
         self._widget.updatePosition(positionerName, axis, newPos)
         self.setSharedAttr(positionerName, axis, _positionAttr, newPos)
 
+    def positionChanged(self, positionerName, position):
+        for axis in self._master.positionersManager[positionerName].axes:
+            if axis in position:
+                self._widget.updatePosition(positionerName, axis, position[axis])
+                self.setSharedAttr(positionerName, axis, _positionAttr, position[axis])
+
     def homeAxis(self, positionerName, axis):
         self.__logger.debug(f"Homing axis {axis}")
         self._master.positionersManager[positionerName].doHome(axis)
@@ -143,8 +161,21 @@ class PositionerController(ImConWidgetController):
 
     @APIExport()
     def getPositionerPositions(self) -> Dict[str, Dict[str, float]]:
-        """ Returns the positions of all positioners. """
-        return self.getPos()
+        """ Returns the positions of all positioners. The positions are
+        cached, so this doesn't wait for the hardware; for positioners whose
+        position isn't polled, they are the positions that the positioners
+        have last been told to go to. """
+        return self._master.positionersManager.getCachedPositions()
+
+    @APIExport()
+    def waitForPositionerSettled(self, positionerName: str, tolerance: float,
+                                 settleTime: float = 0.1, timeout: float = 10.0) -> bool:
+        """ Waits until no axis of the specified positioner has moved by more
+        than tolerance micrometers for settleTime seconds. Returns whether
+        that happened within timeout seconds. """
+        return self._master.positionersManager.getPositionMonitor(positionerName).waitSettled(
+            tolerance, settleTime=settleTime, timeout=timeout
+        )
 
     @APIExport(runOnUIThread=True)
     def setPositionerStepSize(self, positionerName: str, stepSize: float) -> None:
@@ -45,6 +45,7 @@ class RecordingController(ImConWidgetController):
         self._commChannel.sigScanDone.connect(self.scanDone)
         self._commChannel.sigUpdateRecFrameNum.connect(self.updateRecFrameNum)
         self._commChannel.sigUpdateRecTime.connect(self.updateRecTime)
+        self._commChannel.sigUpdateRecFrameStats.connect(self.updateRecFrameStats)
         self._commChannel.sharedAttrs.sigAttributeSet.connect(self.attrChanged)
         self._commChannel.sigSnapImg.connect(self.snap)
         self._commChannel.sigSnapImgPrev.connect(self.snapImagePrev)
@@ -220,6 +221,7 @@ class RecordingController(ImConWidgetController):
 
     def recordingStarted(self):
         self._widget.setFieldsEnabled(False)
+        self._widget.clearRecFrameStats()
 
     def recordingCycleEnded(self):
         if (self._widget.isRecButtonChecked() and self.recMode == RecMode.ScanLapse and
@@ -258,6 +260,9 @@ class RecordingController(ImConWidgetController):
         if self.recMode == RecMode.SpecTime:
             self._widget.updateRecTime(recTime)
 
+    def updateRecFrameStats(self, detectorName, fps, numGaps):
+        self._widget.updateRecFrameStats(detectorName, fps, numGaps)
+
     def specFrames(self):
         self._widget.checkSpecFrames()
         self._widget.setEnabledParams(specFrames=True)
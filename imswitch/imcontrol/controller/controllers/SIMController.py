@@ -8,6 +8,8 @@ from datetime import datetime
 import tifffile as tif
 
 from imswitch.imcommon.model import dirtools, initLogger, APIExport
+from imswitch.imcontrol.model import SIMCalibration, SIMParameters, SIMReconstructionService
+from imswitch.imcontrol.model.SIMReconstructionService import simulateSIMStack
 from ..basecontrollers import ImConWidgetController
 from imswitch.imcommon.framework import Signal, Thread, Worker, Mutex, Timer
 
@@ -46,7 +48,13 @@ try:
     from napari_sim_processor.hexSimProcessor import HexSimProcessor
     isSIM = True
 except:
-    isSIM = False
+    try:
+        # Newer versions of napari-sim-processor moved the processors to a subpackage
+        from napari_sim_processor.processors.convSimProcessor import ConvSimProcessor
+        from napari_sim_processor.processors.hexSimProcessor import HexSimProcessor
+        isSIM = True
+    except:
+        isSIM = False
 
 isDEBUG = False
 
@@ -170,6 +178,7 @@ class SIMController(LiveUpdatedController):
     def __del__(self):
         self.imageComputationThread.quit()
         self.imageComputationThread.wait()
+        self.imageComputationWorker.reconstructionService.shutdown()
 
     def toggleSIMDisplay(self, enabled):
         self._widget.setSIMDisplayVisible(enabled)
@@ -209,11 +218,13 @@ class SIMController(LiveUpdatedController):
         self._master.detectorsManager.startAcquisition(liveView=False)
         
         # reset the pattern iterator
+        self.imageComputationWorker.discardIncompleteStack()
         self.imageComputationWorker.setNumReconstructed(numReconstructed=self.iReconstructed)
 
     def stopSIM(self):
         # stop live processing 
         self.active = False
+        self.imageComputationWorker.discardIncompleteStack()
         self._master.detectorsManager.startAcquisition(liveView=True)
         self._master.detectorsManager.stopAcquisition()
 
@@ -262,6 +273,13 @@ class SIMController(LiveUpdatedController):
             # initilaize the reconstructor
             self.processor = SIMProcessor()
 
+            # stacks are reconstructed in the background with calibrations cached on disk
+            self.reconstructionService = SIMReconstructionService(
+                os.path.join(dirtools.UserFileDirs.Root, 'imcontrol_sim', 'calibrations')
+            )
+            self.reconstructionService.sigStackReconstructed.connect(self.displayReconstruction)
+            self._lastDisplayedStack = -1
+
         def setNumReconstructed(self, numReconstructed=0):
             self.iReconstructed = numReconstructed
 
@@ -274,6 +292,19 @@ class SIMController(LiveUpdatedController):
                 # Simulate SIM Stack
                 #self._image = self.processor.simSimulator(Nx=512, Ny=512, Nrot=3, Nphi=3)
 
+                if self.processor.reconstructionMethod == "napari":
+                    # use the cached calibration if there is one, otherwise calibrate once
+                    parameters = self.processor.getParameters()
+                    if not self.reconstructionService.loadCalibration(parameters,
+                                                                      self.allFramesNP.shape[-2:]):
+                        self.processor.setReconstructor()
+                        self.processor.calibrate(parameters.cropStack(self.allFramesNP))
+                        self.reconstructionService.setCalibration(
+                            self.processor.getCalibration()
+                        )
+                    self.reconstructionService.submit(self.allFramesNP)
+                    return
+
                 # initialize the model
                 if not self.processor.getIsCalibrated():
                     self.processor.setReconstructor()
@@ -288,11 +319,27 @@ class SIMController(LiveUpdatedController):
                 self._numQueuedImages -= 1
                 self._numQueuedImagesMutex.unlock()
 
+        def displayReconstruction(self, stackIndex, image):
+            """ Displays a stack reconstructed in the background, unless a
+            later stack has been displayed already. """
+            if stackIndex < self._lastDisplayedStack:
+                return
+            self._lastDisplayedStack = stackIndex
+            self.sigSIMProcessorImageComputed.emit(image)
+            self.iReconstructed += 1
+
+        def discardIncompleteStack(self):
+            """ Drops the frames of a stack that was not completed, e.g.
+            because SIM was stopped. """
+            if len(self.allFrames) > 0:
+                self.reconstructionService.reportIncompleteStack(len(self.allFrames))
+                self.allFrames = []
+
         def prepareForNewSIMStack(self, image):
             """ Must always be called before the worker receives a new image. """
             self.allFrames.append(image)
             self._logger.debug(len(self.allFrames))
-            if len(self.allFrames)>8:
+            if len(self.allFrames) >= self.nPhases * self.nRotations:
                 self.allFramesNP = np.array(self.allFrames)
                 self.allFramesList = self.allFrames
                 self.allFrames = []
@@ -339,6 +386,7 @@ class SIMProcessor(object):
         self.isCalibrated = False
         self.use_phases =  True
         self.use_torch = False
+        self.roi = None  # (x, y, width, height) of the frames to reconstruct
         
         # initialize logger
         self._logger = initLogger(self, tryInheritParent=False)
@@ -492,6 +540,18 @@ class SIMProcessor(object):
     def getIsCalibrated(self):
         return self.isCalibrated
 
+    def getParameters(self):
+        """ Returns the parameters that the calibration depends on. """
+        return SIMParameters(wavelength=self.wavelength, NA=self.NA, n=self.n,
+                             magnification=self.magnification, pixelsize=self.pixelsize,
+                             alpha=self.alpha, beta=self.beta, w=self.w, eta=self.eta,
+                             nPhases=self.phases_number, nRotations=self.angles_number,
+                             usePhases=self.use_phases, roi=self.roi)
+
+    def getCalibration(self):
+        """ Returns the calibration found by the napari reconstructor. """
+        return SIMCalibration.fromProcessor(self.h, self.getParameters())
+
                                 
 
 
@@ -551,19 +611,7 @@ class SIMProcessor(object):
             return imageSIM
 
     def simSimulator(self, Nx=512, Ny=512, Nrot=3, Nphi=3):
-        Isample = np.zeros((Nx,Ny))
-        Isample[np.random.random(Isample.shape)>0.999]=1
-
-        allImages = []
-        for iRot in range(Nrot):
-            for iPhi in range(Nphi):
-                IGrating = 1+np.sin(((iRot/Nrot)*nip.xx((Nx,Ny))+(Nrot-iRot)/Nrot*nip.yy((Nx,Ny)))*np.pi/2+np.pi*iPhi/Nphi)
-                allImages.append(nip.gaussf(IGrating*Isample,3))
-
-        allImages=np.array(allImages)
-        allImages-=np.min(allImages)
-        allImages/=np.max(allImages)
-        return allImages
+        return simulateSIMStack(Nx, Ny, Nrot, Nphi)
 
 
 
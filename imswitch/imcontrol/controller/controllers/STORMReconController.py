@@ -7,6 +7,7 @@ from datetime import datetime
 from imswitch.imcommon.framework import Signal, Thread, Worker, Mutex
 from imswitch.imcontrol.view import guitools
 from imswitch.imcommon.model import initLogger, dirtools
+from imswitch.imcontrol.model import LocalizationTable, MicroEyeLocalizer, SMLMLocalizationEngine
 from ..basecontrollers import LiveUpdatedController
 
 
@@ -27,6 +28,7 @@ class STORMReconController(LiveUpdatedController):
     """ Linked to STORMReconWidget."""
 
     sigImageReceived = Signal()
+    sigActiveChanged = Signal(bool)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -46,6 +48,9 @@ class STORMReconController(LiveUpdatedController):
             self.imageComputationThread = Thread()
             self.imageComputationWorker.moveToThread(self.imageComputationThread)
             self.sigImageReceived.connect(self.imageComputationWorker.computeSTORMReconImage)
+            # Starting and stopping (which saves the image) also run on the worker thread, after the
+            # frames that are already being localized
+            self.sigActiveChanged.connect(self.imageComputationWorker.setActive)
             self.imageComputationThread.start()
 
             # Connect CommunicationChannel signals
@@ -65,6 +70,7 @@ class STORMReconController(LiveUpdatedController):
 
             self.imageComputationWorker.setDetector(self.peakDetector)
             self.imageComputationWorker.setFilter(self.preFilter)
+            self.imageComputationWorker.setCamera(self._master.detectorsManager.getCurrentDetector())
 
     def valueChanged(self, magnitude):
         """ Change magnitude. """
@@ -98,23 +104,19 @@ class STORMReconController(LiveUpdatedController):
         self.imageComputationWorker.setFittingMethod(fitting_method)
         
         self.active = enabled
-        
-        # if it will be deactivated, trigger an image-save operation
-        if not self.active:
-            self.imageComputationWorker.saveImage()
-        else:
-            # this will activate/deactivate the live reconstruction
-            self.imageComputationWorker.setActive(enabled)
+
+        # this will activate/deactivate the live reconstruction, deactivating it saves the image
+        self.sigActiveChanged.emit(enabled)
             
 
     def update(self, detectorName, im, init, isCurrentDetector):
-        """ Update with new detector frame. """
+        """ Update with new detector frame. The worker localizes all frames
+        captured since the last update, not only the live view frame. """
         if not isCurrentDetector or not self.active:
             return
 
         if self.it == self.updateRate:
             self.it = 0
-            self.imageComputationWorker.prepareForNewImage(im)
             self.sigImageReceived.emit()
         else:
             self.it += 1
@@ -136,54 +138,23 @@ class STORMReconController(LiveUpdatedController):
             
             self.threshold = 0.2 # default threshold
             self.fit_roi_size = 13 # default roi size
+            self.fittingMethod = None
             
             self._logger = initLogger(self, tryInheritParent=False)
-            self._numQueuedImages = 0
-            self._numQueuedImagesMutex = Mutex()
-            
-            # store the sum of all reconstructed frames
-            self.sumReconstruction = None
-            self.allParameters = []
+
+            # every frame of the camera's frame buffer is localized in the background; the
+            # localizations are written to disk and accumulated in a histogram render
+            self.camera = None
+            self.frameReader = None
+            self.engine = None
+            self.filePathBase = None
             
             self.active = False
 
-
-        def reconSTORMFrame(self, frame, preFilter, peakDetector,
-                            rel_threshold=0.4, PSFparam=np.array([1.5]), 
-                            roiSize=13, method=None):
-            # tune parameters
-            if method is None: # avoid error when microeye is not installed..
-                FittingMethod._2D_Phasor_CPU
-            # parameters are read only once the SMLM reconstruction is initiated
-            # cannot be altered during recroding
-            index = 1
-            filtered = frame.copy() # nip.gaussf(frame, 1.5)
-            varim = None
-
-            # localize  frame 
-            # params = > x,y,background, max(0, intensity), magnitudeX / magnitudeY
-            frames, params, crlbs, loglike = localize_frame(
-                        index,
-                        frame,
-                        filtered,
-                        varim,
-                        preFilter,
-                        peakDetector,
-                        rel_threshold,
-                        PSFparam,
-                        roiSize,
-                        method)
-
-            # create a simple render
-            frameLocalized = np.zeros(frame.shape)
-            try:
-                allX = np.int32(params[:,0])
-                allY = np.int32(params[:,1])
-                frameLocalized[(allY, allX)] = 1
-            except Exception as e:
-                pass
-
-            return frameLocalized, params
+        def setCamera(self, camera):
+            """ Sets the detector manager whose frames are localized. """
+            self.camera = camera
+            self.frameReader = None
 
         def setThreshold(self, threshold):
             self.threshold = threshold
@@ -192,33 +163,35 @@ class STORMReconController(LiveUpdatedController):
             self.fit_roi_size = roiSize
             
         def computeSTORMReconImage(self):
-            """ Compute STORMRecon of an image. """
-            try:
-                if self._numQueuedImages > 1 or not self.active:
-                    return  # Skip this frame in order to catch up
-                STORMReconrecon, params = self.reconSTORMFrame(frame=self._image, 
-                                                               preFilter=self.preFilter, 
-                                                               peakDetector=self.peakDetector, 
-                                                               rel_threshold=self.threshold, 
-                                                               roiSize=self.fit_roi_size)
-                self.allParameters.append(params)
-                
-                if self.sumReconstruction is None:
-                    self.sumReconstruction = STORMReconrecon
-                else:
-                    self.sumReconstruction += STORMReconrecon
-                self.sigSTORMReconImageComputed.emit(np.array(self.sumReconstruction))
-            finally:
-                self._numQueuedImagesMutex.lock()
-                self._numQueuedImages -= 1
-                self._numQueuedImagesMutex.unlock()
-
-        def prepareForNewImage(self, image):
-            """ Must always be called before the worker receives a new image. """
-            self._image = image
-            self._numQueuedImagesMutex.lock()
-            self._numQueuedImages += 1
-            self._numQueuedImagesMutex.unlock()
+            """ Localize all frames captured since the last call. """
+            if not self.active or self.camera is None:
+                return
+
+            # Frames are read through a reader of our own, so that a recording running at the same
+            # time still gets all of them
+            if self.frameReader is not None:
+                frames, metadata = self.frameReader.getChunkWithMetadata()
+            else:
+                frames, metadata = self.camera.getChunkWithMetadata()
+            if len(frames) < 1:
+                return
+
+            if self.engine is None:
+                self.startEngine(frames.shape[1:])
+            self.engine.addFrames(frames, metadata.frameIds)
+
+        def startEngine(self, frameShape):
+            localizer = MicroEyeLocalizer(self.preFilter, self.peakDetector,
+                                          threshold=self.threshold, roiSize=self.fit_roi_size,
+                                          fittingMethod=self.fittingMethod)
+            Ntime = datetime.now().strftime("%Y_%m_%d-%I-%M-%S_%p")
+            self.filePathBase = os.path.splitext(
+                self.getSaveFilePath(date=Ntime, filename="STORMRecon", extension="tif")
+            )[0]
+            table = LocalizationTable(f"{self.filePathBase}_localizations.hdf5")
+            self.engine = SMLMLocalizationEngine(localizer, table, frameShape)
+            self.engine.sigRenderUpdated.connect(self.sigSTORMReconImageComputed)
+            self._logger.debug(f"Writing localizations to {table.path}")
 
         def setFittingMethod(self, method):
             self.fittingMethod = method
@@ -232,25 +205,18 @@ class STORMReconController(LiveUpdatedController):
             self.peakDetector = detector
             
         def saveImage(self, filename="STORMRecon", fileExtension="tif"):
-            if self.sumReconstruction is None:
+            self.active = False
+            if self.engine is None:
                 return
             
-            # wait to finish all queued images
-            while self._numQueuedImages > 0:
-                time.sleep(0.1)
-                
-            Ntime = datetime.now().strftime("%Y_%m_%d-%I-%M-%S_%p")            
-            filePath = self.getSaveFilePath(date=Ntime, 
-                                filename=filename, 
-                                extension=fileExtension)
-            
-            # self.switchOffIllumination()
+            # wait to finish all queued frames
+            self.engine.finish()
+            filePath = f"{self.filePathBase}.{fileExtension}"
             self._logger.debug(filePath)
-            tif.imwrite(filePath, self.sumReconstruction, append=False)
-            
-            # Reset sumReconstruction
-            self.sumReconstruction *= 0
-            self.allParameters = []
+            tif.imwrite(filePath, self.engine.render, append=False)
+            self._logger.info(f"Localized {self.engine.numFramesLocalized} frames,"
+                              f" {len(self.engine.table)} localizations")
+            self.engine = None
             
         def getSaveFilePath(self, date, filename, extension):
             mFilename =  f"{date}_{filename}.{extension}"
@@ -264,7 +230,14 @@ class STORMReconController(LiveUpdatedController):
             return newPath
         
         def setActive(self, enabled):
-            self.active = enabled
+            """ Starts localizing new frames, or stops and saves the image.
+            Runs on the worker thread. """
+            if not enabled:
+                self.saveImage()
+                return
+            if self.camera is not None:
+                self.frameReader = self.camera.openFrameReader()  # start with the next frame
+            self.active = True
 
 # Copyright (C) 2020-2021 ImSwitch developers
 # This file is part of ImSwitch.
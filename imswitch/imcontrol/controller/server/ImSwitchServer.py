@@ -1,10 +1,24 @@
+import asyncio
+import collections
+import ipaddress
+import os
+import threading
+import traceback
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import cv2
+import numpy as np
 import Pyro5
 import Pyro5.server
 from imswitch.imcommon.framework import Worker
 from imswitch.imcommon.model import initLogger
-from ._serialize import register_serializers
-from fastapi import FastAPI
+from ._serialize import DetectorFrame, compress_array, get_shared_frame_ring, register_serializers
+from fastapi import FastAPI, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic import BaseModel
 
 
 import uvicorn
@@ -13,6 +27,12 @@ from functools import wraps
 
 app = FastAPI()
 
+
+class APICall(BaseModel):
+    function: str
+    args: List[Any] = []
+    kwargs: Dict[str, Any] = {}
+
 origins = ["*"]
 
 app.add_middleware(
@@ -24,12 +44,24 @@ app.add_middleware(
 )
 
 class ImSwitchServer(Worker):
+    maxStoredCalls = 1000  # Results of calls started with submitCall that are kept for polling
 
-    def __init__(self, api, setupInfo):
+    def __init__(self, api, setupInfo, detectorsManager=None, recordingFolder=None):
         super().__init__()
 
         self.__logger = initLogger(self, tryInheritParent=True)
         self._api = api
+        self._detectorsManager = detectorsManager
+        self._recordingFolder = recordingFolder
+        self._uvicornServer = None
+        self._uvicornThread = None
+        self._functions = {}
+        self._calls = collections.OrderedDict()  # { callId: Future }
+        self._callsLock = threading.Lock()
+        # Runs the calls to API functions that don't run on the UI thread, one at a time in the
+        # order they were started, like those that do
+        self._callExecutor = ThreadPoolExecutor(max_workers=1,
+                                                thread_name_prefix='ImSwitchAPICalls')
         self._name = setupInfo.pyroServerInfo.name
         self._host = setupInfo.pyroServerInfo.host
         self._port = setupInfo.pyroServerInfo.port
@@ -39,7 +71,12 @@ class ImSwitchServer(Worker):
 
     def run(self):
         self.createAPI()
-        uvicorn.run(app)
+        # The web server runs its own asyncio event loop in a separate thread, so that it
+        # neither blocks the Pyro daemon below nor any of the acquisition threads
+        self._uvicornServer = uvicorn.Server(uvicorn.Config(app))
+        self._uvicornThread = threading.Thread(target=self._uvicornServer.run,
+                                               name='ImSwitchWebServer', daemon=True)
+        self._uvicornThread.start()
         self.__logger.debug("Started server with URI -> PYRO:" + self._name + "@" + self._host + ":" + str(self._port))
         try:
             Pyro5.config.SERIALIZER = "msgpack"
@@ -58,7 +95,193 @@ class ImSwitchServer(Worker):
         self.__logger.debug("Loop Finished")
 
     def stop(self):
-        self._daemon.shutdown()
+        if self._uvicornServer is not None:
+            self._uvicornServer.should_exit = True
+        if self._uvicornThread is not None:
+            self._uvicornThread.join(timeout=5)
+        self._callExecutor.shutdown(wait=False, cancel_futures=True)
+
+    @Pyro5.server.expose
+    def getLatestFrame(self, detectorName: Optional[str] = None) -> DetectorFrame:
+        """ Returns the latest frame of the specified detector, or of the
+        current detector if none is specified. Local clients receive it
+        through a shared memory ring per detector that they attach to once,
+        remote clients as compressed bytes. """
+        if detectorName is None:
+            detectorName = self._detectorsManager.getCurrentDetectorName()
+        return DetectorFrame(detectorName, self._detectorsManager[detectorName].getLatestFrame())
+
+    @Pyro5.server.expose
+    def submitCall(self, function: str, args=(), kwargs=None) -> str:
+        """ Starts a call to an API function without waiting for it to
+        finish, and returns an ID that can be passed to pollCall. """
+        future = self._startCall(function, args, kwargs or {})
+        callId = uuid.uuid4().hex
+        with self._callsLock:
+            self._calls[callId] = future
+            while len(self._calls) > self.maxStoredCalls:
+                self._calls.popitem(last=False)  # Forget the oldest calls
+        return callId
+
+    @Pyro5.server.expose
+    def pollCall(self, callId: str) -> dict:
+        """ Returns the status of a call started with submitCall, as a dict
+        with a done field and, once done, its result or error. """
+        with self._callsLock:
+            future = self._calls.get(callId)
+        if future is None:
+            raise KeyError(f'No call with ID {callId}')
+        if not future.done():
+            return {'done': False}
+        with self._callsLock:
+            self._calls.pop(callId, None)
+        return {'done': True, **self._callOutcome(future)}
+
+    @Pyro5.server.expose
+    def callBatch(self, calls: list) -> list:
+        """ Runs several API calls in one round trip and returns the result
+        or error of each. Calls are given as dicts with function, args and
+        kwargs. All calls are queued before waiting for any of them, so calls
+        that run on the UI thread are executed back to back. """
+        futures = [self._startCall(call['function'], call.get('args', ()),
+                                   call.get('kwargs', {}))
+                   for call in calls]
+        return [self._callOutcome(future, wait=True) for future in futures]
+
+    def _startCall(self, function, args, kwargs):
+        """ Starts a call to an API function and returns a future of its
+        result, without waiting for the function to run. """
+        func = self._functions.get(function)
+        if func is None:
+            future = Future()
+            future.set_exception(AttributeError(f'No API function "{function}"'))
+            return future
+        if getattr(func, '_APIRunOnUIThread', False):
+            return func(*args, **kwargs)  # Queued on the UI thread, returns an APIFuture
+        return self._callExecutor.submit(func, *args, **kwargs)
+
+    def _callOutcome(self, future, wait=False):
+        try:
+            result = future.result() if wait or future.done() else None
+        except Exception as e:
+            self.__logger.debug(traceback.format_exc())
+            return {'error': f'{type(e).__name__}: {e}'}
+        return {'result': result.tolist() if isinstance(result, np.ndarray) else result}
+
+    def _addStreamingRoutes(self):
+        @app.websocket("/detectors/{detectorName}/stream")
+        async def streamFrames(websocket: WebSocket, detectorName: str, format: str = 'raw',
+                               maxRate: float = 10, decimation: int = 1,
+                               roi: Optional[str] = None):
+            """ Streams live frames of a detector. Every frame is sent as a
+            JSON header (shape, dtype, format) followed by a binary message
+            with the raw pixels, or the PNG or JPEG encoded image. """
+            await websocket.accept()
+            error = self._checkStreamArgs(detectorName, format, roi)
+            if error is not None:
+                await websocket.close(code=1008, reason=error)
+                return
+            try:
+                async for image, payload in self._liveFrames(detectorName, format, maxRate,
+                                                             decimation, roi):
+                    await websocket.send_json({'detectorName': detectorName,
+                                               'shape': image.shape,
+                                               'dtype': str(image.dtype),
+                                               'format': format})
+                    await websocket.send_bytes(payload)
+            except WebSocketDisconnect:
+                pass
+
+        @app.get("/detectors/{detectorName}/mjpeg")
+        async def multipartFrames(detectorName: str, format: str = 'jpeg', maxRate: float = 10,
+                                  decimation: int = 1, roi: Optional[str] = None):
+            """ Streams live frames of a detector as multipart PNG or JPEG
+            images, which browsers can display directly in an img tag. """
+            if format not in ('png', 'jpeg'):
+                raise HTTPException(status_code=400, detail='format must be png or jpeg')
+            error = self._checkStreamArgs(detectorName, format, roi)
+            if error is not None:
+                raise HTTPException(status_code=400, detail=error)
+
+            async def parts():
+                async for _, payload in self._liveFrames(detectorName, format, maxRate,
+                                                         decimation, roi):
+                    yield (b'--frame\r\nContent-Type: image/' + format.encode() + b'\r\n\r\n' +
+                           payload + b'\r\n')
+
+            return StreamingResponse(parts(),
+                                     media_type='multipart/x-mixed-replace; boundary=frame')
+
+    def _addRecordingRoutes(self):
+        @app.get("/recordings")
+        def listRecordings():
+            """ Lists the recording files in the recording folder, with their
+            sizes in bytes. """
+            recordings = []
+            for root, _, files in os.walk(self._recordingFolder):
+                for file in files:
+                    path = os.path.join(root, file)
+                    recordings.append({
+                        'path': os.path.relpath(path, self._recordingFolder).replace(os.sep, '/'),
+                        'size': os.path.getsize(path)
+                    })
+            return recordings
+
+        @app.get("/recordings/download")
+        def downloadRecording(path: str):
+            """ Downloads a recording file, given by its path relative to the
+            recording folder. The file is sent in chunks, and HTTP range
+            requests are supported so that interrupted downloads can be
+            resumed. """
+            root = os.path.realpath(self._recordingFolder)
+            filePath = os.path.realpath(os.path.join(root, path))
+            if os.path.commonpath([root, filePath]) != root or not os.path.isfile(filePath):
+                raise HTTPException(status_code=404, detail=f'No recording "{path}"')
+            return FileResponse(filePath, filename=os.path.basename(filePath))
+
+    def _checkStreamArgs(self, detectorName, imageFormat, roi):
+        """ Returns an error message if live frames can't be streamed with
+        the specified arguments, otherwise None. """
+        if detectorName not in self._detectorsManager.getAllDeviceNames():
+            return f'No detector "{detectorName}"'
+        if imageFormat not in ('raw', 'png', 'jpeg'):
+            return 'format must be raw, png or jpeg'
+        try:
+            parseRoi(roi)
+        except ValueError as e:
+            return str(e)
+        return None
+
+    async def _liveFrames(self, detectorName, imageFormat, maxRate, decimation, roi):
+        """ Yields (image, encodedImage) for the live frames of a detector,
+        as delivered by a live view subscription. Only the latest frame is
+        kept while the client is busy, and frames are encoded in the thread
+        pool. """
+        loop = asyncio.get_running_loop()
+        latest = asyncio.Queue(maxsize=1)
+
+        def putLatest(image):
+            if latest.full():
+                latest.get_nowait()
+            latest.put_nowait(image)
+
+        def frameDelivered(name, image, init, isCurrentDetector):
+            # Called in the GUI thread
+            if name == detectorName:
+                loop.call_soon_threadsafe(putLatest, np.ascontiguousarray(image))
+
+        subscription = self._detectorsManager.subscribeLiveView(
+            maxRate=maxRate, decimation=decimation,
+            roi=parseRoi(roi)
+        )
+        subscription.addCallback(frameDelivered)
+        try:
+            while True:
+                image = await latest.get()
+                payload = await loop.run_in_executor(None, encodeFrame, image, imageFormat)
+                yield image, payload
+        finally:
+            self._detectorsManager.unsubscribeLiveView(subscription)
 
     @app.get("/")
     def createAPI(self):
@@ -66,10 +289,17 @@ class ImSwitchServer(Worker):
         functions = api_dict.keys()
 
         def includeAPI(str, func):
+            # Not a coroutine, so that FastAPI runs it in its thread pool instead of blocking the
+            # event loop while e.g. waiting for the UI thread
             @app.get(str)
             @wraps(func)
-            async def wrapper(*args, **kwargs):
-                return func(*args, **kwargs)
+            def wrapper(*args, **kwargs):
+                result = func(*args, **kwargs)
+                if isinstance(result, Future):
+                    result = result.result()  # Wait for the UI thread
+                if isinstance(result, np.ndarray):
+                    return arrayResponse(result)
+                return result
             return wrapper
 
 
@@ -145,9 +375,57 @@ class ImSwitchServer(Worker):
         def includePyro(func):
             @Pyro5.server.expose
             def wrapper(*args, **kwargs):
-                return func(*args, **kwargs)
+                result = func(*args, **kwargs)
+                if isinstance(result, Future):
+                    result = result.result()  # Wait for the UI thread
+                return result
             return wrapper
 
+        @app.post("/calls")
+        def submitCall(call: APICall):
+            """ Starts an API call without waiting for it and returns its
+            ID, to be polled with GET /calls/{callId}. """
+            return {'id': self.submitCall(call.function, call.args, call.kwargs)}
+
+        @app.get("/calls/{callId}")
+        def pollCall(callId: str):
+            try:
+                return self.pollCall(callId)
+            except KeyError as e:
+                raise HTTPException(status_code=404, detail=str(e))
+
+        @app.post("/calls/batch")
+        def callBatch(calls: List[APICall]):
+            """ Runs several API calls in one round trip. """
+            return self.callBatch([{'function': call.function, 'args': call.args,
+                                    'kwargs': call.kwargs} for call in calls])
+
+        if self._detectorsManager is not None:
+            self._addStreamingRoutes()
+
+        if self._recordingFolder is not None:
+            self._addRecordingRoutes()
+
+        if self._detectorsManager is not None:
+            @app.get("/detectors/latestFrame")
+            def latestFrame(request: Request, detectorName: Optional[str] = None):
+                """ Local clients get a reference to the frame in the shared
+                memory ring of the detector, others the compressed frame. """
+                frame = self.getLatestFrame(detectorName)
+                try:
+                    isLocal = ipaddress.ip_address(request.client.host).is_loopback
+                except ValueError:
+                    isLocal = request.client.host == 'localhost'
+                if isLocal:
+                    return get_shared_frame_ring(f'detector:{frame.detector_name}').put(frame.frame)
+
+                compressed = compress_array(frame.frame)
+                return Response(content=compressed['data'], media_type='application/octet-stream',
+                                headers={'X-Shape': ','.join(map(str, compressed['shape'])),
+                                         'X-Dtype': compressed['dtype'],
+                                         'X-Compression': compressed['compression']})
+
+        self._functions = api_dict
         for f in functions:
             func = api_dict[f]
             if hasattr(func, 'module'):
@@ -158,6 +436,45 @@ class ImSwitchServer(Worker):
 
 
 
+def parseRoi(roi):
+    """ Parses a roi query parameter of the form "x,y,width,height" into a
+    tuple of non-negative ints, or returns None if no roi is given. Raises
+    ValueError if the roi is malformed. """
+    if not roi:
+        return None
+    try:
+        values = tuple(int(v) for v in roi.split(','))
+    except ValueError:
+        values = ()
+    if len(values) != 4 or any(v < 0 for v in values):
+        raise ValueError('roi must be four non-negative integers: x,y,width,height')
+    return values
+
+
+def encodeFrame(image, imageFormat):
+    """ Encodes a frame as raw bytes in its own dtype, PNG (8 or 16 bit) or
+    JPEG (scaled to 8 bit). """
+    if imageFormat == 'raw':
+        return image.tobytes()
+    if imageFormat == 'jpeg' and image.dtype != np.uint8:
+        image = cv2.normalize(image, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+    elif imageFormat == 'png' and image.dtype not in (np.uint8, np.uint16):
+        image = cv2.normalize(image, None, 0, 65535, cv2.NORM_MINMAX, dtype=cv2.CV_16U)
+    success, encoded = cv2.imencode('.jpg' if imageFormat == 'jpeg' else '.png', image)
+    if not success:
+        raise ValueError(f'Failed to encode frame as {imageFormat}')
+    return encoded.tobytes()
+
+
+def arrayResponse(array):
+    """ Returns an array as raw bytes, with its shape and dtype in the
+    headers. """
+    array = np.ascontiguousarray(array)
+    return Response(content=array.tobytes(), media_type='application/octet-stream',
+                    headers={'X-Shape': ','.join(map(str, array.shape)),
+                             'X-Dtype': str(array.dtype)})
+
+
 # Copyright (C) 2020-2022 ImSwitch developers
 # This file is part of ImSwitch.
 #
@@ -1,13 +1,25 @@
 import atexit
+import ipaddress
+import threading
+import time
+import zlib
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
 from multiprocessing.shared_memory import SharedMemory
-from typing import Deque, Generic, TypeVar
+from typing import Any, Dict, Generic, List, Optional, Tuple, TypeVar
 
 import numpy as np
 import Pyro5
 import Pyro5.api
+import Pyro5.callcontext
 import useq
 
+try:
+    from numcodecs import Blosc
+    isBlosc = True
+except ImportError:
+    isBlosc = False
+
 T = TypeVar("T")
 
 
@@ -46,37 +58,264 @@ class Serializer(ABC, Generic[T]):
         return f"{cls.type_().__module__}.{cls.type_().__name__}"
 
 
-class SerNDArray(Serializer[np.ndarray]):
-    SHM_SENT: Deque[SharedMemory] = Deque(maxlen=15)
+class SharedFrameRing:
+    """A persistent shared memory segment with a fixed number of frame slots,
+    written round-robin. Arrays are sent as a reference to the slot they were
+    copied into, so clients on the same machine attach to the segment once and
+    no segment is created or unlinked per call. Each slot starts with the
+    sequence number of the frame in it, which lets clients detect frames that
+    were overwritten while they were being read.
+
+    Slots written for the same response are never reused within that
+    response; the ring doubles its number of slots instead. The segment is
+    also reallocated when a frame larger than the slots comes in. Replaced
+    segments are kept for RETIRE_SECONDS before they are unlinked, so clients
+    that still hold a reference to them can attach and finish reading."""
+
+    HEADER_BYTES = 8
+    RETIRE_SECONDS = 10.0
+
+    def __init__(self, key: str, num_slots: int = 8):
+        self.key = key
+        self.num_slots = num_slots
+        self._shm: Optional[SharedMemory] = None
+        self._slot_bytes = 0
+        self._seq = 0
+        self._next_slot = 0
+        self._slot_responses: List[Any] = []
+        self._retired: List[Tuple[float, SharedMemory]] = []
+        self._lock = threading.Lock()
+
+    def put(self, array: np.ndarray, response: Any = None) -> dict:
+        """Copies array into the next slot and returns a reference to it.
+        response identifies the reply the array is part of; slots holding
+        earlier arrays of the same response are not overwritten."""
+        array = np.ascontiguousarray(array)
+        with self._lock:
+            self._unlink_retired()
+            if self._shm is None or array.nbytes > self._slot_bytes:
+                self._allocate(max(array.nbytes, self._slot_bytes), self.num_slots)
+            elif (response is not None
+                  and self._slot_responses[self._next_slot] == response):
+                self._allocate(self._slot_bytes, self.num_slots * 2)
+
+            slot = self._next_slot
+            self._next_slot = (slot + 1) % self.num_slots
+            self._slot_responses[slot] = response
+            self._seq += 1
+            offset = slot * (self.HEADER_BYTES + self._slot_bytes)
+            header = np.ndarray((1,), dtype=np.uint64, buffer=self._shm.buf, offset=offset)
+            header[0] = 0  # Mark slot as being written
+            np.ndarray(array.shape, dtype=array.dtype, buffer=self._shm.buf,
+                       offset=offset + self.HEADER_BYTES)[...] = array
+            header[0] = self._seq
+            return {
+                "ring": self.key,
+                "shm": self._shm.name,
+                "offset": offset,
+                "seq": self._seq,
+                "shape": array.shape,
+                "dtype": str(array.dtype),
+            }
+
+    def close(self):
+        """Unlinks all segments of the ring. Client rings are closed by Pyro
+        when the client disconnects."""
+        with _RINGS_LOCK:
+            if _RINGS.get(self.key) is self:
+                del _RINGS[self.key]
+        with self._lock:
+            self._retire()
+            self._unlink_retired(force=True)
+
+    def _allocate(self, slot_bytes, num_slots):
+        self._retire()
+        self.num_slots = num_slots
+        self._slot_bytes = slot_bytes
+        self._next_slot = 0
+        self._slot_responses = [None] * num_slots
+        self._shm = SharedMemory(create=True,
+                                 size=max(num_slots * (self.HEADER_BYTES + slot_bytes), 1))
+
+    def _retire(self):
+        if self._shm is None:
+            return
+        self._shm.close()
+        self._retired.append((time.monotonic(), self._shm))
+        self._shm = None
+
+    def _unlink_retired(self, force=False):
+        now = time.monotonic()
+        keep = []
+        for retired_at, shm in self._retired:
+            if not force and now - retired_at < self.RETIRE_SECONDS:
+                keep.append((retired_at, shm))
+                continue
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+        self._retired = keep
+
+
+class SharedFrameOverwrittenError(RuntimeError):
+    """Raised by read_shared_frame if the slot was reused for a newer frame
+    before the client was done copying it."""
+    pass
+
+
+_RINGS: Dict[str, SharedFrameRing] = {}
+_RINGS_LOCK = threading.Lock()
+_ATTACHED: Dict[str, SharedMemory] = {}
+
+
+def get_shared_frame_ring(key: str) -> SharedFrameRing:
+    """Returns the ring with the given key (e.g. a detector name), creating it
+    on first use."""
+    with _RINGS_LOCK:
+        if key not in _RINGS:
+            _RINGS[key] = SharedFrameRing(key)
+        return _RINGS[key]
+
+
+def get_client_frame_ring(prefix: str) -> SharedFrameRing:
+    """Returns the ring of the client whose Pyro call is currently being
+    handled, so that clients never overwrite each other's slots. The ring is
+    closed when the client disconnects. Outside of a Pyro call, the shared
+    ring with the given key is returned."""
+    context = Pyro5.callcontext.current_context
+    addr = getattr(context, "client_sock_addr", None)
+    if not addr or getattr(context, "client", None) is None:
+        return get_shared_frame_ring(prefix)
+
+    key = f"{prefix}:{addr[0]}:{addr[1]}"
+    with _RINGS_LOCK:
+        ring = _RINGS.get(key)
+        if ring is None:
+            ring = _RINGS[key] = SharedFrameRing(key)
+            context.track_resource(ring)
+    return ring
+
+
+def read_shared_frame(d: dict) -> np.ndarray:
+    """Client side of SharedFrameRing.put: copies the referenced frame out of
+    the ring. The segment is attached on first use and reused afterwards. The
+    slot's sequence header is checked before and after copying."""
+    shm = _ATTACHED.get(d["ring"])
+    if shm is None or shm.name.lstrip("/") != d["shm"].lstrip("/"):
+        if shm is not None:
+            shm.close()  # The ring was reallocated
+            del _ATTACHED[d["ring"]]
+        try:
+            shm = SharedMemory(name=d["shm"], create=False)
+        except FileNotFoundError:
+            raise SharedFrameOverwrittenError(
+                f'Frame {d["seq"]} in ring "{d["ring"]}" is in a segment that no longer exists'
+            ) from None
+        _ATTACHED[d["ring"]] = shm
 
+    header = np.ndarray((1,), dtype=np.uint64, buffer=shm.buf, offset=d["offset"])
+    if header[0] != d["seq"]:
+        raise SharedFrameOverwrittenError(
+            f'Frame {d["seq"]} in ring "{d["ring"]}" was overwritten before it was read'
+        )
+    array = np.ndarray(d["shape"], dtype=d["dtype"], buffer=shm.buf,
+                       offset=d["offset"] + SharedFrameRing.HEADER_BYTES).copy()
+    if header[0] != d["seq"]:
+        raise SharedFrameOverwrittenError(
+            f'Frame {d["seq"]} in ring "{d["ring"]}" was overwritten while it was being read'
+        )
+    return array
+
+
+def compress_array(array: np.ndarray) -> dict:
+    """Fallback for clients on other machines, which can't attach to shared
+    memory."""
+    data = np.ascontiguousarray(array)
+    if isBlosc:
+        compressed = Blosc(cname="lz4", clevel=5, shuffle=Blosc.SHUFFLE).encode(data)
+        compression = "blosc"
+    else:
+        compressed = zlib.compress(data.tobytes(), 1)
+        compression = "zlib"
+    return {
+        "data": bytes(compressed),
+        "compression": compression,
+        "shape": array.shape,
+        "dtype": str(array.dtype),
+    }
+
+
+def decompress_array(d: dict) -> np.ndarray:
+    if d["compression"] == "blosc":
+        data = Blosc().decode(d["data"])
+    else:
+        data = zlib.decompress(d["data"])
+    return np.frombuffer(data, dtype=d["dtype"]).reshape(d["shape"]).copy()
+
+
+def is_local_client() -> bool:
+    """Whether the Pyro call currently being handled comes from this machine.
+    Outside of a Pyro call, shared memory is assumed to be usable."""
+    addr = getattr(Pyro5.callcontext.current_context, "client_sock_addr", None)
+    if not addr:
+        return True
+    try:
+        return ipaddress.ip_address(addr[0]).is_loopback
+    except ValueError:
+        return addr[0] == "localhost"
+
+
+def current_response() -> Any:
+    """An id of the Pyro call currently being handled, or None outside of a
+    Pyro call."""
+    return getattr(Pyro5.callcontext.current_context, "correlation_id", None)
+
+
+def array_to_dict(array: np.ndarray, ring: SharedFrameRing) -> dict:
+    if is_local_client():
+        return ring.put(array, current_response())
+    return compress_array(array)
+
+
+def array_from_dict(d: dict) -> np.ndarray:
+    if "ring" in d:
+        return read_shared_frame(d)
+    return decompress_array(d)
+
+
+@dataclass
+class DetectorFrame:
+    """A frame of a detector, sent through the shared memory ring of that
+    detector. Clients receive it as a plain np.ndarray."""
+
+    detector_name: str
+    frame: np.ndarray
+
+
+class SerNDArray(Serializer[np.ndarray]):
     def to_dict(self, obj: np.ndarray):
-        shm = SharedMemory(create=True, size=obj.nbytes)
-        SerNDArray.SHM_SENT.append(shm)
-        b: np.ndarray = np.ndarray(obj.shape, dtype=obj.dtype, buffer=shm.buf)
-        b[:] = obj[:]
-        return {
-            "shm": shm.name,
-            "shape": obj.shape,
-            "dtype": str(obj.dtype),
-        }
+        return array_to_dict(obj, get_client_frame_ring("ndarray"))
 
     def from_dict(self, classname: str, d: dict):
-        """convert dict from `ndarray_to_dict` back to np.ndarray"""
-        shm = SharedMemory(name=d["shm"], create=False)
-        array = np.ndarray(d["shape"], dtype=d["dtype"], buffer=shm.buf).copy()
-        shm.close()
-        shm.unlink()
-        return array
+        """convert dict from `to_dict` back to np.ndarray"""
+        return array_from_dict(d)
+
+
+class SerDetectorFrame(Serializer[DetectorFrame]):
+    def to_dict(self, obj: DetectorFrame):
+        return array_to_dict(obj.frame, get_shared_frame_ring(f"detector:{obj.detector_name}"))
+
+    def from_dict(self, classname: str, d: dict):
+        return array_from_dict(d)
 
 
 @atexit.register  # pragma: no cover
 def _cleanup():
-    for shm in SerNDArray.SHM_SENT:
+    for ring in list(_RINGS.values()):
+        ring.close()
+    for shm in _ATTACHED.values():
         shm.close()
-        try:
-            shm.unlink()
-        except FileNotFoundError:
-            pass
 
 
 def remove_shm_from_resource_tracker():
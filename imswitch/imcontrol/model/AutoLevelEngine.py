@@ -0,0 +1,95 @@
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+def subsampledPercentiles(image: np.ndarray, percentiles, maxSamples: int = 65536) -> np.ndarray:
+    """ Returns the given percentiles of the pixel values of the image,
+    estimated from a regular grid of at most about maxSamples pixels. For RGB
+    images, all channels are pooled. """
+    height, width = image.shape[:2]
+    step = max(int(math.ceil(math.sqrt(height * width / maxSamples))), 1)
+    samples = image[::step, ::step]
+    return np.percentile(samples, percentiles)
+
+
+class AutoLevelEngine:
+    """ Computes display levels for a stream of live view frames.
+
+    The levels are percentiles of a subsample of each frame (see
+    subsampledPercentiles), so computing them takes about the same time
+    whatever the size of the frame. They are smoothed over time with an
+    exponential moving average with the given smoothing factor (1 disables
+    the smoothing), and update only returns new levels when they differ from
+    the last returned ones by more than threshold times the width of the
+    level range, so that the display isn't updated for changes that can't be
+    seen. """
+
+    def __init__(self, lowPercentile: float = 0.1, highPercentile: float = 99.9,
+                 maxSamples: int = 65536, smoothing: float = 0.3, threshold: float = 0.02):
+        self.lowPercentile = lowPercentile
+        self.highPercentile = highPercentile
+        self.maxSamples = maxSamples
+        self.smoothing = smoothing
+        self.threshold = threshold
+        self._levels = None
+        self._appliedLevels = None
+
+    @property
+    def levels(self) -> Optional[Tuple[float, float]]:
+        """ The last levels returned by update, or None if update hasn't
+        returned any levels since the last reset. """
+        return self._appliedLevels
+
+    def reset(self) -> None:
+        """ Forgets the previous frames, so that the next call to update
+        returns the levels of its frame only. """
+        self._levels = None
+        self._appliedLevels = None
+
+    def computeLevels(self, image: np.ndarray) -> Tuple[float, float]:
+        """ Returns the levels of a single frame, without smoothing. """
+        low, high = subsampledPercentiles(image, [self.lowPercentile, self.highPercentile],
+                                          self.maxSamples)
+        if high <= low:
+            high = low + 1  # Flat image
+        return float(low), float(high)
+
+    def update(self, image: np.ndarray) -> Optional[Tuple[float, float]]:
+        """ Adds a frame and returns the new levels, or None if they haven't
+        changed by more than the threshold. """
+        low, high = self.computeLevels(image)
+        if self._levels is None:
+            self._levels = (low, high)
+        else:
+            a = self.smoothing
+            self._levels = ((1 - a) * self._levels[0] + a * low,
+                            (1 - a) * self._levels[1] + a * high)
+
+        if self._appliedLevels is not None:
+            appliedLow, appliedHigh = self._appliedLevels
+            tolerance = self.threshold * (appliedHigh - appliedLow)
+            if (abs(self._levels[0] - appliedLow) <= tolerance and
+                    abs(self._levels[1] - appliedHigh) <= tolerance):
+                return None
+
+        self._appliedLevels = self._levels
+        return self._appliedLevels
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,294 @@
+import math
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+
+
+def brenner(image: np.ndarray) -> float:
+    """ Brenner gradient: the mean squared difference between pixels two
+    columns apart. """
+    diff = image[:, 2:] - image[:, :-2]
+    return float(np.mean(diff * diff))
+
+
+def tenengrad(image: np.ndarray) -> float:
+    """ Tenengrad: the mean squared magnitude of the Sobel gradient. """
+    # Separable Sobel filters, evaluated on the interior of the image
+    smoothY = image[:-2] + 2 * image[1:-1] + image[2:]
+    smoothX = image[:, :-2] + 2 * image[:, 1:-1] + image[:, 2:]
+    gx = smoothY[:, 2:] - smoothY[:, :-2]
+    gy = smoothX[2:] - smoothX[:-2]
+    return float(np.mean(gx * gx + gy * gy))
+
+
+def normalizedVariance(image: np.ndarray) -> float:
+    """ Variance of the image divided by its mean, which makes the metric
+    insensitive to changes of the illumination intensity. """
+    mean = image.mean()
+    return float(image.var() / mean) if mean > 0 else 0.0
+
+
+def fftBandEnergy(image: np.ndarray, lowFrequency: float = 0.05,
+                  highFrequency: float = 0.25) -> float:
+    """ Spectral power between lowFrequency and highFrequency cycles per
+    pixel relative to the DC power, which makes the metric insensitive to
+    changes of the illumination intensity. Mid frequencies are used as the
+    highest ones are dominated by noise. """
+    power = np.abs(np.fft.rfft2(image)) ** 2
+    fy = np.fft.fftfreq(image.shape[0])[:, np.newaxis]
+    fx = np.fft.rfftfreq(image.shape[1])[np.newaxis, :]
+    frequencies = np.sqrt(fy ** 2 + fx ** 2)
+    band = (frequencies >= lowFrequency) & (frequencies <= highFrequency)
+    return float(power[band].sum() / power[0, 0]) if power[0, 0] > 0 else 0.0
+
+
+focusMetrics = {
+    'brenner': brenner,
+    'tenengrad': tenengrad,
+    'normalizedVariance': normalizedVariance,
+    'fftBandEnergy': fftBandEnergy,
+}
+""" The focus metrics that may be passed to AutofocusEngine, by name. All of
+them increase as the image gets sharper. """
+
+
+@dataclass
+class AutofocusResult:
+    """ Outcome of an autofocus search. """
+
+    bestPosition: float
+    """ Position with the highest focus metric. """
+
+    bestValue: float
+    """ Focus metric at bestPosition. """
+
+    positions: np.ndarray
+    """ Positions measured during the search, in the order they were
+    measured. """
+
+    values: np.ndarray
+    """ Focus metric at each of positions. """
+
+    duration: float
+    """ Duration of the search in seconds. """
+
+
+class AutofocusAborted(Exception):
+    """ Raised by the searches of AutofocusEngine when abort has been
+    called. """
+    pass
+
+
+class AutofocusEngine:
+    """ Finds the focus position by evaluating a focus metric on frames
+    grabbed at different positions of a focus stage.
+
+    The stage and camera are accessed through callables: moveTo(position)
+    moves the stage and returns when the move has completed, and grabFrame()
+    returns a frame captured after the last move. For continuous scans,
+    startMove(position) starts a move without waiting for it to complete and
+    getPosition() returns the current position of the stage.
+
+    Frames are cropped to the central cropFraction of each dimension and
+    decimated before the metric is computed. Only the positions and metric
+    values are kept, in a history of bounded length, not the frames. """
+
+    def __init__(self, moveTo: Callable[[float], None], grabFrame: Callable[[], np.ndarray],
+                 metric: str = 'brenner', cropFraction: float = 0.4, decimation: int = 2,
+                 historyLength: int = 1000,
+                 startMove: Optional[Callable[[float], None]] = None,
+                 getPosition: Optional[Callable[[], float]] = None,
+                 onMeasured: Optional[Callable[[float, float], None]] = None):
+        if metric not in focusMetrics:
+            raise ValueError(f'Unknown focus metric "{metric}", must be one of'
+                             f' {list(focusMetrics.keys())}')
+
+        self.metric = metric
+        self.cropFraction = cropFraction
+        self.decimation = decimation
+        self._moveTo = moveTo
+        self._grabFrame = grabFrame
+        self._startMove = startMove
+        self._getPosition = getPosition
+        self._onMeasured = onMeasured
+        self._history = deque(maxlen=historyLength)
+        self._searchMeasurements = []
+        self._aborted = threading.Event()
+
+    @property
+    def supportsContinuousScan(self) -> bool:
+        return self._startMove is not None and self._getPosition is not None
+
+    @property
+    def history(self) -> Tuple[np.ndarray, np.ndarray]:
+        """ Positions and focus metric values of the latest measurements. """
+        if not self._history:
+            return np.zeros(0), np.zeros(0)
+        positions, values = zip(*self._history)
+        return np.array(positions), np.array(values)
+
+    def abort(self) -> None:
+        """ Makes the running search raise AutofocusAborted as soon as
+        possible. """
+        self._aborted.set()
+
+    def computeMetric(self, frame: np.ndarray) -> float:
+        """ Returns the focus metric of the frame. """
+        height, width = frame.shape[:2]
+        cropHeight = max(int(height * self.cropFraction), 3)
+        cropWidth = max(int(width * self.cropFraction), 3)
+        y, x = (height - cropHeight) // 2, (width - cropWidth) // 2
+        roi = frame[y:y + cropHeight:self.decimation, x:x + cropWidth:self.decimation]
+        return focusMetrics[self.metric](roi.astype(np.float32))
+
+    def measure(self, position: float) -> float:
+        """ Moves to the position and returns the focus metric there. """
+        self._checkAborted()
+        self._moveTo(position)
+        return self._record(position, self.computeMetric(self._grabFrame()))
+
+    def linearScan(self, lower: float, upper: float, numSteps: int) -> AutofocusResult:
+        """ Measures numSteps evenly spaced positions from lower to
+        upper. """
+        return self._search(lambda: [self.measure(position)
+                                     for position in np.linspace(lower, upper, numSteps)])
+
+    def coarseToFine(self, lower: float, upper: float, resolution: float,
+                     numSteps: int = 7) -> AutofocusResult:
+        """ Measures numSteps positions from lower to upper, then repeatedly
+        narrows the range to the neighbours of the best position until the
+        steps are no larger than resolution. """
+        def search():
+            low, high = lower, upper
+            while True:
+                positions = np.linspace(low, high, numSteps)
+                values = [self.measure(position) for position in positions]
+                step = positions[1] - positions[0]
+                if step <= resolution:
+                    return
+                best = positions[int(np.argmax(values))]
+                low, high = max(best - step, lower), min(best + step, upper)
+
+        return self._search(search)
+
+    def goldenSection(self, lower: float, upper: float, resolution: float) -> AutofocusResult:
+        """ Golden-section search for the maximum of the focus metric between
+        lower and upper, down to an interval of resolution. Assumes that the
+        metric only has one maximum in the range; takes one measurement per
+        iteration. """
+        return self._search(lambda: self._goldenSection(lower, upper, resolution))
+
+    def hillClimb(self, start: float, step: float, resolution: float,
+                  lower: float = -np.inf, upper: float = np.inf) -> AutofocusResult:
+        """ Steps from start in the direction in which the focus metric
+        increases, reversing direction and halving the step whenever it
+        decreases, until the step is smaller than resolution. Suited to
+        correcting small drifts from a known focus. """
+        def search():
+            position, value = start, self.measure(start)
+            currentStep = step
+            while abs(currentStep) >= resolution:
+                nextPosition = min(max(position + currentStep, lower), upper)
+                nextValue = self.measure(nextPosition) if nextPosition != position else -np.inf
+                if nextValue > value:
+                    position, value = nextPosition, nextValue
+                else:
+                    currentStep = -currentStep / 2
+
+        return self._search(search)
+
+    def continuousScan(self, lower: float, upper: float, resolution: float,
+                       timeout: float = 60.0) -> AutofocusResult:
+        """ Moves to lower, then sweeps to upper without stopping while
+        grabbing frames, and finally refines the best position of the sweep
+        with a golden-section search over the neighbouring frames. Requires
+        startMove and getPosition. """
+        if not self.supportsContinuousScan:
+            raise RuntimeError('Continuous scans require startMove and getPosition')
+
+        def search():
+            self._checkAborted()
+            self._moveTo(lower)
+            self._startMove(upper)
+            startTime = time.monotonic()
+            positions, values = [], []
+            while time.monotonic() - startTime < timeout:
+                self._checkAborted()
+                # The stage keeps moving while the frame is grabbed, so the frame is assigned the
+                # mean of the positions before and after
+                positionBefore = self._getPosition()
+                frame = self._grabFrame()
+                positionAfter = self._getPosition()
+                position = (positionBefore + positionAfter) / 2
+                positions.append(position)
+                values.append(self._record(position, self.computeMetric(frame)))
+                if abs(upper - positionAfter) <= resolution / 2:
+                    break
+
+            best = int(np.argmax(values))
+            refineLower = positions[max(best - 1, 0)]
+            refineUpper = positions[min(best + 1, len(positions) - 1)]
+            if abs(refineUpper - refineLower) > resolution:
+                self._goldenSection(min(refineLower, refineUpper),
+                                    max(refineLower, refineUpper), resolution)
+
+        return self._search(search)
+
+    def _goldenSection(self, lower, upper, resolution):
+        ratio = (math.sqrt(5) - 1) / 2
+        low, high = lower, upper
+        left, right = high - ratio * (high - low), low + ratio * (high - low)
+        leftValue, rightValue = self.measure(left), self.measure(right)
+        while high - low > resolution:
+            if leftValue > rightValue:
+                high, right, rightValue = right, left, leftValue
+                left = high - ratio * (high - low)
+                leftValue = self.measure(left)
+            else:
+                low, left, leftValue = left, right, rightValue
+                right = low + ratio * (high - low)
+                rightValue = self.measure(right)
+
+    def _search(self, search):
+        self._aborted.clear()
+        self._searchMeasurements = []
+        startTime = time.monotonic()
+        search()
+        duration = time.monotonic() - startTime
+
+        positions, values = map(np.array, zip(*self._searchMeasurements))
+        best = int(np.argmax(values))
+        return AutofocusResult(bestPosition=float(positions[best]), bestValue=float(values[best]),
+                               positions=positions, values=values, duration=duration)
+
+    def _record(self, position, value):
+        self._history.append((position, value))
+        self._searchMeasurements.append((position, value))
+        if self._onMeasured is not None:
+            self._onMeasured(position, value)
+        return value
+
+    def _checkAborted(self):
+        if self._aborted.is_set():
+            raise AutofocusAborted
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
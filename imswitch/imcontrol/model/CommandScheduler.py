@@ -0,0 +1,177 @@
+import contextlib
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Hashable, Optional
+
+from imswitch.imcommon.model import initLogger
+
+
+class _Command:
+    __slots__ = ('func', 'args', 'kwargs', 'coalesceKey', 'merge', 'futures')
+
+    def __init__(self, func, args, kwargs, coalesceKey, merge):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.coalesceKey = coalesceKey
+        self.merge = merge
+        self.futures = [Future()]
+
+
+class CommandScheduler:
+    """ Runs the commands sent to a device on a dedicated I/O thread, one at
+    a time and in the order they were submitted, so that callers don't block
+    on slow round trips and commands from different managers sharing a port
+    don't interleave.
+
+    submit returns a future that completes with the return value of the
+    command (i.e. the response of the device) or the exception it raised.
+    Commands submitted with the same coalesceKey as the command at the end of
+    the queue are coalesced with it while it waits: the new command replaces
+    it, or, if merge is given, merge(previous, new) combines the two. previous
+    and new are (args, kwargs) tuples, and merge returns the (args, kwargs) of
+    the combined command, or None if they can't be combined. The futures of
+    coalesced commands complete together with the combined command. Only the
+    last queued command is considered, so the order of commands with
+    different keys is never changed.
+
+    Commands submitted from the I/O thread itself, i.e. by a running
+    command, are run immediately instead of being queued.
+
+    If a lock is given, it is held while each command runs, so that other
+    threads can send short commands to the device (e.g. status queries or
+    stops) in between queued commands, without waiting for the whole queue,
+    by acquiring it. """
+
+    def __init__(self, name: str = 'CommandScheduler', lock=None):
+        self.__logger = initLogger(self, instanceName=name)
+        self._lock = lock if lock is not None else contextlib.nullcontext()
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._numCoalesced = 0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    @property
+    def numPending(self) -> int:
+        """ Number of commands waiting to be run. """
+        with self._condition:
+            return len(self._queue)
+
+    @property
+    def numCoalesced(self) -> int:
+        """ Number of commands that were coalesced with others instead of
+        being run on their own. """
+        return self._numCoalesced
+
+    def submit(self, func: Callable, *args, coalesceKey: Optional[Hashable] = None,
+               merge: Optional[Callable] = None, **kwargs) -> Future:
+        """ Queues func(*args, **kwargs) and returns a future of its
+        result. """
+        if threading.current_thread() is self._thread:
+            # Commands sent by the running command (e.g. from a callback) are run right away, as
+            # queueing them behind it would deadlock
+            future = Future()
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('Command scheduler has been closed')
+
+            if coalesceKey is not None and self._queue:
+                last = self._queue[-1]
+                if last.coalesceKey == coalesceKey and last.func == func:
+                    combined = ((args, kwargs) if merge is None
+                                else merge((last.args, last.kwargs), (args, kwargs)))
+                    if combined is not None:
+                        last.args, last.kwargs = combined
+                        last.futures.append(Future())
+                        self._numCoalesced += 1
+                        return last.futures[-1]
+
+            command = _Command(func, args, kwargs, coalesceKey, merge)
+            self._queue.append(command)
+            self._condition.notify()
+            return command.futures[0]
+
+    def call(self, func: Callable, *args, timeout: Optional[float] = None, **kwargs):
+        """ Runs func(*args, **kwargs) after the commands already queued and
+        returns its result, blocking until it is available. """
+        return self.submit(func, *args, **kwargs).result(timeout)
+
+    def cancel(self, coalesceKey: Hashable) -> int:
+        """ Removes the queued commands with the given coalesceKey, cancelling
+        their futures, and returns how many were removed. The command that is
+        running, if any, is not affected. """
+        with self._condition:
+            cancelled = [command for command in self._queue
+                         if command.coalesceKey == coalesceKey]
+            for command in cancelled:
+                self._queue.remove(command)
+                for future in command.futures:
+                    future.cancel()
+            return len(cancelled)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """ Runs the queued commands and stops the I/O thread. """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._queue or self._closed)
+                if not self._queue:
+                    return
+                command = self._queue.popleft()
+
+            # Futures cancelled by their callers while the command was queued are dropped, and the
+            # others can't be cancelled anymore from here on
+            futures = [future for future in command.futures
+                       if future.set_running_or_notify_cancel()]
+            if not futures:
+                continue
+
+            try:
+                with self._lock:
+                    result = command.func(*command.args, **command.kwargs)
+            except Exception as e:
+                self.__logger.error(f'Command {getattr(command.func, "__name__", command.func)}'
+                                    f' failed: {e}')
+                self._complete(futures, exception=e)
+            else:
+                self._complete(futures, result=result)
+
+    def _complete(self, futures, result=None, exception=None):
+        for future in futures:
+            try:
+                if exception is not None:
+                    future.set_exception(exception)
+                else:
+                    future.set_result(result)
+            except Exception as e:
+                self.__logger.error(f'Failed to complete command future: {e}')
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,434 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+
+from imswitch.imcommon.model import initLogger
+
+
+class BeamTracker:
+    """ Locates the reflected focus lock beam in camera frames.
+
+    The beam is searched for in a decimated, box-filtered copy of the whole
+    frame only when it has not been found yet or has been lost. Otherwise,
+    only a square ROI of roiSize pixels around its last position is processed:
+    the background (the median of the ROI border) is subtracted and the beam
+    position is the centroid of the remaining intensity, refined with a
+    three-point Gaussian fit of the row and column profiles through the
+    brightest pixel if subpixelFit is set. The ROI follows the beam.
+
+    In twoFoci mode, the beam is the one of the two brightest spots with the
+    lowest column index. """
+
+    def __init__(self, roiSize: int = 100, decimation: int = 4, minSignal: float = 10,
+                 subpixelFit: bool = False, twoFoci: bool = False, minFociDistance: int = 60):
+        self.roiSize = roiSize
+        self.decimation = decimation
+        self.minSignal = minSignal
+        """ Minimum peak height above the background for the beam to be
+        considered found. """
+
+        self.subpixelFit = subpixelFit
+        self.twoFoci = twoFoci
+        self.minFociDistance = minFociDistance
+        self._center = None
+        self._roi = None
+
+    @property
+    def roi(self) -> Optional[Tuple[int, int, int, int]]:
+        """ The tracked region ``(row, column, height, width)``, or None if
+        the beam is not being tracked. """
+        return self._roi if self._center is not None else None
+
+    def reset(self) -> None:
+        """ Makes the next call to locate search the whole frame. """
+        self._center = None
+
+    def locate(self, frame: np.ndarray) -> Optional[Tuple[float, float]]:
+        """ Returns the (row, column) position of the beam in the frame, or
+        None if no beam was found. """
+        if self._center is None:
+            self._center = self._search(frame)
+            if self._center is None:
+                return None
+
+        top, left, roi = self._extractRoi(frame, *self._center)
+        peak = np.unravel_index(np.argmax(roi), roi.shape)
+        if (abs(peak[0] - roi.shape[0] // 2) > self.roiSize // 4 or
+                abs(peak[1] - roi.shape[1] // 2) > self.roiSize // 4):
+            # The beam has moved far since the last frame, centre the ROI on it
+            top, left, roi = self._extractRoi(frame, top + peak[0], left + peak[1])
+            peak = np.unravel_index(np.argmax(roi), roi.shape)
+
+        if roi[peak] < self.minSignal:
+            self._center = None  # Lost the beam
+            return None
+
+        if self.subpixelFit:
+            position = (top + self._fitGaussian(roi[:, peak[1]], peak[0]),
+                        left + self._fitGaussian(roi[peak[0], :], peak[1]))
+        else:
+            total = roi.sum()
+            position = (top + np.dot(roi.sum(axis=1), np.arange(roi.shape[0])) / total,
+                        left + np.dot(roi.sum(axis=0), np.arange(roi.shape[1])) / total)
+
+        self._center = (int(round(position[0])), int(round(position[1])))
+        return float(position[0]), float(position[1])
+
+    def _extractRoi(self, frame, row, column):
+        """ Returns the top and left coordinates of the ROI centred on the
+        given pixel, and the background-subtracted ROI. """
+        half = self.roiSize // 2
+        top, left = max(row - half, 0), max(column - half, 0)
+        roi = frame[top:row + half, left:column + half].astype(np.float32)
+        self._roi = (top, left, roi.shape[0], roi.shape[1])
+
+        border = np.concatenate([roi[0], roi[-1], roi[1:-1, 0], roi[1:-1, -1]])
+        roi -= np.median(border)
+        np.maximum(roi, 0, out=roi)
+        return top, left, roi
+
+    def _search(self, frame):
+        """ Returns the approximate (row, column) of the beam, or None. """
+        d = self.decimation
+        height, width = frame.shape[0] // d * d, frame.shape[1] // d * d
+        binned = frame[:height, :width].reshape(height // d, d, width // d, d).sum(axis=(1, 3),
+                                                                                  dtype=np.float32)
+        background = np.median(binned)
+        peak = np.unravel_index(np.argmax(binned), binned.shape)
+        if (binned[peak] - background) / d ** 2 < self.minSignal:
+            return None
+
+        if self.twoFoci:
+            # Mask the first spot and look for the second one
+            distance = max(self.minFociDistance // d, 1)
+            masked = binned.copy()
+            masked[max(peak[0] - distance, 0):peak[0] + distance + 1,
+                   max(peak[1] - distance, 0):peak[1] + distance + 1] = background
+            secondPeak = np.unravel_index(np.argmax(masked), masked.shape)
+            if ((masked[secondPeak] - background) / d ** 2 >= self.minSignal and
+                    secondPeak[1] < peak[1]):
+                peak = secondPeak
+
+        return peak[0] * d + d // 2, peak[1] * d + d // 2
+
+    @staticmethod
+    def _fitGaussian(profile, peak):
+        """ Returns the subpixel position of the maximum of the profile from
+        a Gaussian through the peak and its neighbours. """
+        if peak == 0 or peak == len(profile) - 1:
+            return float(peak)
+        left, center, right = np.log(np.maximum(profile[peak - 1:peak + 2], 1e-6))
+        denominator = left - 2 * center + right
+        if denominator >= 0:
+            return float(peak)
+        return peak + 0.5 * (left - right) / denominator
+
+
+class PI:
+    """Simple implementation of a discrete PI controller.
+    Taken from http://code.activestate.com/recipes/577231-discrete-pid-controller/
+    Author: Federico Barabas"""
+
+    def __init__(self, setPoint, multiplier=1, kp=0, ki=0):
+
+        self._kp = multiplier * kp
+        self._ki = multiplier * ki
+        self._setPoint = setPoint
+        self.multiplier = multiplier
+        self.error = 0.0
+        self._started = False
+
+    def update(self, currentValue):
+        """
+        Calculate PID output value for given reference input and feedback.
+        I'm using the iterative formula to avoid integrative part building.
+        ki, kp > 0
+        """
+        self.error = self.setPoint - currentValue
+
+        if self.started:
+            self.dError = self.error - self.lastError
+            self.out = self.out + self.kp * self.dError + self.ki * self.error
+
+        else:
+            # This only runs in the first step
+            self.out = self.kp * self.error
+            self.started = True
+
+        self.lastError = self.error
+
+        return self.out
+
+    def restart(self):
+        self.started = False
+
+    @property
+    def started(self):
+        return self._started
+
+    @started.setter
+    def started(self, value):
+        self._started = value
+
+    @property
+    def setPoint(self):
+        return self._setPoint
+
+    @setPoint.setter
+    def setPoint(self, value):
+        self._setPoint = value
+
+    @property
+    def kp(self):
+        return self._kp
+
+    @kp.setter
+    def kp(self, value):
+        self._kp = value
+
+    @property
+    def ki(self):
+        return self._ki
+
+    @ki.setter
+    def ki(self, value):
+        self._ki = value
+
+
+@dataclass
+class FocusLockStatistics:
+    """ Timing and lock quality of the latest iterations of the focus lock
+    loop. """
+
+    loopRate: float
+    """ Mean number of frames processed per second. """
+
+    periodJitter: float
+    """ Standard deviation of the time between processed frames, in
+    seconds. """
+
+    meanLatency: float
+    """ Mean time from the arrival of a frame to the end of its processing
+    (including the stage move), in seconds. """
+
+    maxLatency: float
+    """ Maximum time from the arrival of a frame to the end of its
+    processing, in seconds. """
+
+    lockError: float
+    """ RMS difference between the focus signal and the setpoint while
+    locked, in pixels. NaN if the lock was not engaged. """
+
+    numFrames: int
+    """ Total number of frames processed. """
+
+    numLostFrames: int
+    """ Total number of frames in which the beam was not found. """
+
+
+class FocusLockEngine:
+    """ Runs the focus lock loop on a dedicated thread.
+
+    Each iteration waits for a new frame from waitForFrame(timeout), which
+    returns a (frame, hostTimestamp) tuple or None if there was no new frame
+    within the timeout, locates the beam with a BeamTracker and, while
+    locked, feeds the beam column (the focus signal) to a PI controller whose
+    output is passed to moveBy. The loop runs at most at loopRate iterations
+    per second.
+
+    For safety, the lock is released if the position reported by
+    getPosition moves more than maxDistance from the position at which the
+    lock was engaged, or if a single move exceeds maxMove; onUnlocked is then
+    called from the loop thread.
+
+    The focus signal, setpoint error and timing of the latest historyLength
+    iterations are kept in a ring buffer for display and statistics. """
+
+    def __init__(self, waitForFrame: Callable[[float], Optional[Tuple[np.ndarray, float]]],
+                 moveBy: Callable[[float], None], getPosition: Callable[[], float],
+                 tracker: Optional[BeamTracker] = None, loopRate: float = 50,
+                 historyLength: int = 1000, minMove: float = 0.002, maxMove: float = 3,
+                 maxDistance: float = 5, onUnlocked: Optional[Callable[[], None]] = None):
+        self.__logger = initLogger(self, tryInheritParent=False)
+        self.tracker = tracker if tracker is not None else BeamTracker()
+        self.loopRate = loopRate
+        self.minMove = minMove
+        self.maxMove = maxMove
+        self.maxDistance = maxDistance
+        self._waitForFrame = waitForFrame
+        self._moveBy = moveBy
+        self._getPosition = getPosition
+        self._onUnlocked = onUnlocked
+
+        self._lock = threading.Lock()
+        self._historyLength = historyLength
+        self._times = np.zeros(historyLength)
+        self._signals = np.zeros(historyLength)
+        self._errors = np.full(historyLength, np.nan)
+        self._latencies = np.zeros(historyLength)
+        self._numEntries = 0
+        self._numFrames = 0
+        self._numLostFrames = 0
+
+        self._focusSignal = np.nan
+        self._latestFrame = None
+        self._pi = None
+        self._lockPosition = None
+        self._thread = None
+        self._stopEvent = threading.Event()
+        self._startTime = time.perf_counter()
+
+    @property
+    def focusSignal(self) -> float:
+        """ The latest focus signal, i.e. the column of the beam in pixels.
+        NaN if the beam was not found. """
+        return self._focusSignal
+
+    @property
+    def latestFrame(self) -> Optional[np.ndarray]:
+        """ The latest frame processed. """
+        return self._latestFrame
+
+    @property
+    def locked(self) -> bool:
+        return self._pi is not None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """ Starts the loop thread. """
+        if self.running:
+            return
+        self._stopEvent.clear()
+        self._thread = threading.Thread(target=self._run, name='FocusLockEngine', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """ Stops the loop thread and waits for it to finish. """
+        self._stopEvent.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def lock(self, kp: float, ki: float, setPoint: Optional[float] = None) -> None:
+        """ Engages the lock at setPoint, or at the current focus signal if
+        setPoint is None. """
+        setPoint = setPoint if setPoint is not None else self._focusSignal
+        if np.isnan(setPoint):
+            raise RuntimeError('Cannot lock the focus, the beam has not been found')
+        with self._lock:
+            self._pi = PI(setPoint, 0.001, kp, ki)
+            self._lockPosition = self._getPosition()
+
+    def unlock(self) -> None:
+        with self._lock:
+            self._pi = None
+
+    def getSetPoint(self) -> Optional[float]:
+        pi = self._pi
+        return pi.setPoint if pi is not None else None
+
+    def getHistory(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """ Returns copies of the times (in seconds since the engine was
+        created), focus signals and setpoint errors (NaN while unlocked) of
+        the latest iterations, oldest first. """
+        with self._lock:
+            order = self._historyOrder()
+            return self._times[order], self._signals[order], self._errors[order]
+
+    def getStatistics(self) -> FocusLockStatistics:
+        with self._lock:
+            order = self._historyOrder()
+            periods = np.diff(self._times[order])
+            latencies = self._latencies[order]
+            errors = self._errors[order]
+            errors = errors[~np.isnan(errors)]
+            return FocusLockStatistics(
+                loopRate=float(1 / periods.mean()) if len(periods) > 0 else 0.0,
+                periodJitter=float(periods.std()) if len(periods) > 0 else 0.0,
+                meanLatency=float(latencies.mean()) if len(latencies) > 0 else 0.0,
+                maxLatency=float(latencies.max()) if len(latencies) > 0 else 0.0,
+                lockError=float(np.sqrt(np.mean(errors ** 2))) if len(errors) > 0 else np.nan,
+                numFrames=self._numFrames,
+                numLostFrames=self._numLostFrames
+            )
+
+    def _historyOrder(self):
+        """ Indices of the filled history entries, oldest first. Must be
+        called with the lock held. """
+        numEntries = min(self._numEntries, self._historyLength)
+        return np.arange(self._numEntries - numEntries, self._numEntries) % self._historyLength
+
+    def _run(self):
+        period = 1 / self.loopRate
+        nextTime = time.perf_counter()
+        while not self._stopEvent.is_set():
+            try:
+                frameAndTimestamp = self._waitForFrame(period)
+                if frameAndTimestamp is not None:
+                    self._step(*frameAndTimestamp)
+            except Exception:
+                self.__logger.exception('Error in focus lock loop')
+
+            # Keep to the loop rate without accumulating delays
+            nextTime = max(nextTime + period, time.perf_counter())
+            self._stopEvent.wait(max(nextTime - time.perf_counter(), 0))
+
+    def _step(self, frame, hostTimestamp):
+        self._latestFrame = frame
+        self._numFrames += 1
+        position = self.tracker.locate(frame)
+        if position is None:
+            self._numLostFrames += 1
+            self._focusSignal = np.nan
+            return
+
+        self._focusSignal = focusSignal = position[1]
+        error = np.nan
+        unlocked = False
+        with self._lock:
+            pi = self._pi
+        if pi is not None:
+            error = focusSignal - pi.setPoint
+            move = pi.update(focusSignal)
+            distance = self._getPosition() - self._lockPosition
+            if abs(distance) > self.maxDistance or abs(move) > self.maxMove:
+                self.__logger.debug(f'Safety unlocking! Distance: {distance}, move: {move}.')
+                self.unlock()
+                unlocked = True
+            elif abs(move) > self.minMove:
+                self._moveBy(move)
+
+        now = time.perf_counter()
+        with self._lock:
+            index = self._numEntries % self._historyLength
+            self._times[index] = now - self._startTime
+            self._signals[index] = focusSignal
+            self._errors[index] = error
+            self._latencies[index] = max(time.time() - hostTimestamp, 0)
+            self._numEntries += 1
+
+        if unlocked and self._onUnlocked is not None:
+            self._onUnlocked()
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,262 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+@dataclass
+class FrameMetadata:
+    """ Per-frame metadata of a chunk of frames, with one entry per frame. """
+
+    frameIds: np.ndarray
+    """ Frame IDs as counted by the camera, or sequence numbers assigned on
+    the host if the camera doesn't provide them. -1 if unknown. """
+
+    hostTimestamps: np.ndarray
+    """ Time (in seconds since the epoch) at which the host received each
+    frame. """
+
+    cameraTimestamps: np.ndarray
+    """ Timestamps from the camera's own clock, in the units of the camera.
+    NaN if the camera doesn't provide them. """
+
+    def __len__(self):
+        return len(self.frameIds)
+
+    def __getitem__(self, item) -> 'FrameMetadata':
+        return FrameMetadata(self.frameIds[item], self.hostTimestamps[item],
+                             self.cameraTimestamps[item])
+
+    def copy(self) -> 'FrameMetadata':
+        return FrameMetadata(self.frameIds.copy(), self.hostTimestamps.copy(),
+                             self.cameraTimestamps.copy())
+
+    @classmethod
+    def unknown(cls, numFrames: int, hostTimestamp: Optional[float] = None) -> 'FrameMetadata':
+        """ Returns metadata for numFrames frames for which only the time of
+        arrival is known, e.g. chunks from detectors without a frame
+        buffer. """
+        if hostTimestamp is None:
+            hostTimestamp = time.time()
+        return cls(np.full(numFrames, -1, dtype=np.int64),
+                   np.full(numFrames, hostTimestamp, dtype=np.float64),
+                   np.full(numFrames, np.nan, dtype=np.float64))
+
+
+class FrameRingBuffer:
+    """ A preallocated ring buffer of detector frames, stored in a single
+    contiguous array of shape (capacity, height, width, ...) together with
+    the frame ID, host timestamp and camera timestamp of every frame.
+
+    Detector interfaces add frames from their acquisition thread, and
+    getChunk returns the frames added since the last call as a view into the
+    buffer, without copying. Views stay valid until the slots they point to
+    are overwritten, i.e. until another capacity frames have been added, so
+    consumers that hold on to chunks for longer than that should copy them.
+    If the consumer falls behind by more than capacity frames, the oldest
+    unread frames are lost; this is counted in numOverrunFrames.
+
+    getChunk, flush and numUnread use the default read position of the
+    buffer, which belongs to the recording. Other consumers of the same
+    frames must use a reader of their own from openReader, so that they don't
+    take frames from each other. """
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError('Capacity must be at least 1')
+
+        self._capacity = capacity
+        self._lock = threading.Lock()
+
+        self._frames = None
+        self._frameIds = np.zeros(capacity, dtype=np.int64)
+        self._hostTimestamps = np.zeros(capacity, dtype=np.float64)
+        self._cameraTimestamps = np.zeros(capacity, dtype=np.float64)
+
+        self._numAdded = 0  # Number of frames added before the buffer was last reallocated
+        self._numWritten = 0  # Total number of frames added since the buffer was (re)allocated
+        self._generation = 0  # Number of times the buffer was reallocated
+        self._defaultReader = FrameBufferReader(self, self._lock, 0)
+
+    @property
+    def capacity(self) -> int:
+        """ Number of frames the buffer can hold. """
+        return self._capacity
+
+    @property
+    def numOverrunFrames(self) -> int:
+        """ Number of frames that were overwritten before they were read. """
+        return self._defaultReader.numOverrunFrames
+
+    @property
+    def frameCount(self) -> int:
+        """ Total number of frames added to the buffer. """
+        with self._lock:
+            return self._numAdded + self._numWritten
+
+    @property
+    def numUnread(self) -> int:
+        """ Number of frames that getChunk has not returned yet. """
+        return self._defaultReader.numUnread
+
+    def openReader(self) -> 'FrameBufferReader':
+        """ Returns a read position of its own for a consumer of the frames,
+        starting at the next frame added. """
+        with self._lock:
+            return FrameBufferReader(self, self._lock, self._numWritten)
+
+    def add(self, frame: np.ndarray, frameId: Optional[int] = None,
+            cameraTimestamp: Optional[float] = None) -> None:
+        """ Copies a frame into the next slot of the buffer, stamped with the
+        current time. frameId and cameraTimestamp should be passed if the
+        camera provides them; otherwise, frames are numbered in the order they
+        were added. If the frame shape or dtype differs from that of the
+        frames in the buffer (e.g. after a ROI or binning change), the buffer
+        is reallocated and frames not yet read are discarded. """
+        hostTimestamp = time.time()
+
+        with self._lock:
+            if (self._frames is None or self._frames.shape[1:] != frame.shape or
+                    self._frames.dtype != frame.dtype):
+                self._frames = np.empty((self._capacity, *frame.shape), dtype=frame.dtype)
+                self._numAdded += self._numWritten
+                self._numWritten = 0
+                self._generation += 1
+
+            slot = self._numWritten % self._capacity
+            self._frames[slot] = frame
+            self._frameIds[slot] = (frameId if frameId is not None
+                                    else self._numAdded + self._numWritten)
+            self._hostTimestamps[slot] = hostTimestamp
+            self._cameraTimestamps[slot] = (cameraTimestamp if cameraTimestamp is not None
+                                            else np.nan)
+            self._numWritten += 1
+
+    def getLatest(self) -> Optional[np.ndarray]:
+        """ Returns a view of the most recently added frame, or None if no
+        frames have been added. """
+        with self._lock:
+            if self._numWritten < 1:
+                return None
+            return self._frames[(self._numWritten - 1) % self._capacity]
+
+    def getLatestWithMetadata(self) -> Tuple[Optional[np.ndarray], Optional[FrameMetadata]]:
+        """ Same as getLatest, but also returns the metadata of the frame as
+        a FrameMetadata of length 1. """
+        with self._lock:
+            if self._numWritten < 1:
+                return None, None
+            slot = (self._numWritten - 1) % self._capacity
+            metadata = FrameMetadata(self._frameIds[slot:slot + 1].copy(),
+                                     self._hostTimestamps[slot:slot + 1].copy(),
+                                     self._cameraTimestamps[slot:slot + 1].copy())
+            return self._frames[slot], metadata
+
+    def getChunk(self) -> np.ndarray:
+        """ Returns the frames added since getChunk was last called, or since
+        the buffer was last flushed, as a view of shape
+        (numFrames, height, width, ...). When the unread frames wrap around
+        the end of the buffer, only the frames up to the end are returned;
+        the rest are returned by the next call. """
+        return self._defaultReader.getChunk()
+
+    def getChunkWithMetadata(self) -> Tuple[np.ndarray, FrameMetadata]:
+        """ Same as getChunk, but also returns the metadata of the frames in
+        the chunk. The metadata arrays are copies. """
+        return self._defaultReader.getChunkWithMetadata()
+
+    def flush(self) -> None:
+        """ Discards all unread frames, so that getChunk starts at the next
+        frame added. """
+        self._defaultReader.flush()
+
+
+class FrameBufferReader:
+    """ A read position in a FrameRingBuffer, which returns the frames added
+    to the buffer independently of other readers. Created with
+    FrameRingBuffer.openReader. """
+
+    def __init__(self, buffer: FrameRingBuffer, lock, numRead: int):
+        self._buffer = buffer
+        self._lock = lock
+        self._numRead = numRead  # Total number of frames returned by getChunk or flushed
+        self._generation = buffer._generation
+        self._numOverrunFrames = 0
+
+    @property
+    def numOverrunFrames(self) -> int:
+        """ Number of frames that were overwritten before this reader read
+        them. """
+        return self._numOverrunFrames
+
+    @property
+    def numUnread(self) -> int:
+        """ Number of frames that getChunk has not returned yet. """
+        with self._lock:
+            self._checkGeneration()
+            return min(self._buffer._numWritten - self._numRead, self._buffer.capacity)
+
+    def getChunk(self) -> np.ndarray:
+        """ Same as FrameRingBuffer.getChunk, for this reader. """
+        return self.getChunkWithMetadata()[0]
+
+    def getChunkWithMetadata(self) -> Tuple[np.ndarray, FrameMetadata]:
+        """ Same as FrameRingBuffer.getChunkWithMetadata, for this reader. """
+        buffer = self._buffer
+        with self._lock:
+            start, stop = self._takeUnread()
+            metadata = FrameMetadata(buffer._frameIds[start:stop].copy(),
+                                     buffer._hostTimestamps[start:stop].copy(),
+                                     buffer._cameraTimestamps[start:stop].copy())
+            if buffer._frames is None:
+                return np.empty((0, 0, 0)), metadata
+            return buffer._frames[start:stop], metadata
+
+    def flush(self) -> None:
+        """ Discards the frames this reader hasn't read, so that getChunk
+        starts at the next frame added. """
+        with self._lock:
+            self._checkGeneration()
+            self._numRead = self._buffer._numWritten
+
+    def _checkGeneration(self):
+        """ Starts over at the first frame if the buffer has been reallocated
+        since the last read. Must be called with the lock held. """
+        if self._generation != self._buffer._generation:
+            self._generation = self._buffer._generation
+            self._numRead = 0
+
+    def _takeUnread(self):
+        """ Marks the next contiguous run of unread frames as read and
+        returns its slot range. Must be called with the lock held. """
+        self._checkGeneration()
+        capacity = self._buffer.capacity
+        numUnread = self._buffer._numWritten - self._numRead
+        if numUnread > capacity:
+            self._numOverrunFrames += numUnread - capacity
+            self._numRead = self._buffer._numWritten - capacity
+            numUnread = capacity
+
+        start = self._numRead % capacity
+        stop = min(start + numUnread, capacity)
+        self._numRead += stop - start
+        return start, stop
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,206 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Sequence
+
+import numpy as np
+
+try:
+    import pyfftw
+    import pyfftw.interfaces.scipy_fft
+    isPyFFTW = True
+except ImportError:
+    isPyFFTW = False
+
+try:
+    import scipy.fft
+    isSciPyFFT = True
+except ImportError:
+    isSciPyFFT = False
+
+
+class HolographyEngine:
+    """ Refocuses inline holograms by angular spectrum propagation.
+
+    The hologram amplitude (the square root of the recorded intensity) is
+    transformed with a real FFT, multiplied by the transfer function of free
+    space over the propagation distance dz and transformed back. Transfer
+    functions are cached per frame shape, dz, wavelength, NA, refractive
+    index and pixel size, so refocusing at a fixed distance only costs the
+    two FFTs. All buffers are allocated once per frame shape and reused.
+
+    Lengths (wavelength, pixel size, dz) may be given in any unit as long as
+    it is the same for all of them. The frame can be cropped to a centred
+    square of roiSize pixels before it is refocused.
+
+    reconstruct returns the image in one of two alternating output buffers,
+    so an image stays valid until reconstruct has been called twice more.
+    Callers that need it for longer must copy it. """
+
+    maxCachedKernels = 64
+    """ Maximum number of transfer functions kept in the cache. """
+
+    def __init__(self, wavelength: float, pixelsize: float, NA: float, n: float = 1.0,
+                 roiSize: Optional[int] = None, workers: Optional[int] = None):
+        self.wavelength = wavelength
+        self.pixelsize = pixelsize
+        self.NA = NA
+        self.n = n
+        self.roiSize = roiSize
+        self._workers = workers if workers is not None else max(os.cpu_count() // 2, 1)
+
+        self._lock = threading.Lock()
+        self._kernels = OrderedDict()
+        self._grids = {}
+        self._shape = None
+
+        if isPyFFTW:
+            pyfftw.interfaces.cache.enable()  # Keep the plans of the last used shapes
+
+    @property
+    def backend(self) -> str:
+        """ Name of the FFT library used. """
+        if isPyFFTW:
+            return 'pyfftw'
+        elif isSciPyFFT:
+            return 'scipy'
+        else:
+            return 'numpy'
+
+    def propagate(self, hologram: np.ndarray, dz: float) -> np.ndarray:
+        """ Returns the complex field refocused by dz. The returned array is
+        a buffer that is overwritten by the next call. """
+        with self._lock:
+            return self._propagate(hologram, dz)
+
+    def reconstruct(self, hologram: np.ndarray, dz: float) -> np.ndarray:
+        """ Returns the magnitude of the field refocused by dz, as float32. """
+        with self._lock:
+            field = self._propagate(hologram, dz)
+            image = self._images[self._imageIndex]
+            self._imageIndex = (self._imageIndex + 1) % len(self._images)
+            np.abs(field, out=image)
+            return image
+
+    def reconstructStack(self, hologram: np.ndarray, dzs: Sequence[float]) -> np.ndarray:
+        """ Returns the magnitude of the field refocused by each of dzs, as a
+        new float32 array of shape (len(dzs), height, width). The hologram is
+        transformed once and all planes are transformed back in a single
+        batched FFT. """
+        with self._lock:
+            spectrum = self._transform(hologram)
+            kernels = np.stack([self._getKernel(dz) for dz in dzs])
+            kernels *= spectrum
+            fields = self._ifft2(kernels)
+            return np.abs(fields)
+
+    def _propagate(self, hologram, dz):
+        spectrum = self._transform(hologram)
+        spectrum *= self._getKernel(dz)
+        return self._ifft2(spectrum)
+
+    def _transform(self, hologram):
+        """ Returns the full spectrum of the amplitude of the (cropped)
+        hologram. Must be called with the lock held. """
+        hologram = self._crop(hologram)
+        if hologram.shape != self._shape:
+            self._allocate(hologram.shape)
+
+        np.sqrt(hologram, out=self._input, casting='unsafe')
+        halfSpectrum = self._rfft2(self._input)
+
+        # The real FFT only returns the non-negative x frequencies; the negative ones follow from
+        # the Hermitian symmetry of the spectrum of a real image
+        halfWidth = halfSpectrum.shape[1]
+        spectrum = self._spectrum
+        spectrum[:, :halfWidth] = halfSpectrum
+        np.take(halfSpectrum[:, self._shape[1] - halfWidth:0:-1], self._negRows, axis=0,
+                out=spectrum[:, halfWidth:])
+        np.conjugate(spectrum[:, halfWidth:], out=spectrum[:, halfWidth:])
+        return spectrum
+
+    def _crop(self, hologram):
+        if self.roiSize is None:
+            return hologram
+        height, width = hologram.shape
+        cropHeight, cropWidth = min(self.roiSize, height), min(self.roiSize, width)
+        y, x = (height - cropHeight) // 2, (width - cropWidth) // 2
+        return hologram[y:y + cropHeight, x:x + cropWidth]
+
+    def _allocate(self, shape):
+        """ Allocates the buffers for frames of the given (cropped) shape. """
+        self._input = np.empty(shape, dtype=np.float32)
+        self._spectrum = np.empty(shape, dtype=np.complex64)
+        self._images = [np.empty(shape, dtype=np.float32) for _ in range(2)]
+        self._imageIndex = 0
+        self._negRows = -np.arange(shape[0]) % shape[0]
+        self._shape = shape
+
+    def _getKernel(self, dz):
+        """ Returns the transfer function for the current shape and
+        parameters, in unshifted FFT order. Must be called with the lock
+        held. """
+        key = (self._shape, dz, self.wavelength, self.NA, self.n, self.pixelsize)
+        kernel = self._kernels.get(key)
+        if kernel is not None:
+            self._kernels.move_to_end(key)
+            return kernel
+
+        kz, pupil = self._getGrid()
+        kernel = np.where(pupil, np.exp(1j * kz * dz), 0).astype(np.complex64)
+        self._kernels[key] = kernel
+        while len(self._kernels) > self.maxCachedKernels:
+            self._kernels.popitem(last=False)
+        return kernel
+
+    def _getGrid(self):
+        """ Returns the axial wavenumber of each spatial frequency together
+        with the pupil, i.e. the frequencies within the NA. """
+        key = (self._shape, self.wavelength, self.NA, self.n, self.pixelsize)
+        grid = self._grids.get(key)
+        if grid is None:
+            height, width = self._shape
+            fy = np.fft.fftfreq(height, d=self.pixelsize)[:, np.newaxis]
+            fx = np.fft.fftfreq(width, d=self.pixelsize)[np.newaxis, :]
+            frequencySquared = fy ** 2 + fx ** 2
+            pupil = frequencySquared <= (self.NA / self.wavelength) ** 2
+            kzSquared = np.maximum((self.n / self.wavelength) ** 2 - frequencySquared, 0)
+            kz = 2 * np.pi * np.sqrt(kzSquared)
+            grid = (kz, pupil)
+            self._grids = {key: grid}  # Only the grid for the current settings is kept
+        return grid
+
+    def _rfft2(self, image):
+        if isPyFFTW:
+            return pyfftw.interfaces.scipy_fft.rfft2(image, workers=self._workers)
+        elif isSciPyFFT:
+            return scipy.fft.rfft2(image, workers=self._workers)
+        else:
+            return np.fft.rfft2(image).astype(np.complex64)
+
+    def _ifft2(self, spectrum):
+        if isPyFFTW:
+            return pyfftw.interfaces.scipy_fft.ifft2(spectrum, axes=(-2, -1),
+                                                     workers=self._workers, overwrite_x=True)
+        elif isSciPyFFT:
+            return scipy.fft.ifft2(spectrum, axes=(-2, -1), workers=self._workers,
+                                   overwrite_x=True)
+        else:
+            return np.fft.ifft2(spectrum, axes=(-2, -1)).astype(np.complex64)
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,175 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from imswitch.imcommon.framework import Signal, SignalInterface
+from imswitch.imcommon.model import initLogger
+
+
+@dataclass(frozen=True)
+class PositionSample:
+    """ A position of a positioner together with the time it was read. """
+
+    position: Dict[str, float]
+    """ The position of each axis, in the format ``{ axis: position }``. """
+
+    timestamp: float
+    """ Time (in seconds since the epoch) at which the position was read or
+    recorded. """
+
+
+class PositionMonitor(SignalInterface):
+    """ Caches the position of a positioner, so that it can be read without
+    a round trip to the hardware.
+
+    If rate is non-zero, the position is read from the hardware (with the
+    positioner's getPosition, if it has one) rate times per second on a
+    background thread. Otherwise, or if the positioner can't report its
+    position, the position the positioner has last been told to go to is
+    returned. sigPositionChanged is emitted whenever an axis has moved by more
+    than changeTolerance, as seen by polling or by recordCommanded. """
+
+    sigPositionChanged = Signal(str, object)  # (positionerName, position)
+
+    def __init__(self, positioner, rate: float = 0.0, changeTolerance: float = 0.0):
+        super().__init__()
+        self.__logger = initLogger(self, instanceName=positioner.name)
+        self._positioner = positioner
+        self._rate = rate
+        self.changeTolerance = changeTolerance
+
+        self._condition = threading.Condition()
+        self._sample = PositionSample(dict(positioner.position), time.time())
+        self._stopEvent = threading.Event()
+        self._thread = None
+        self._lastError = None
+
+        getPosition = getattr(positioner, 'getPosition', None)
+        self._readPosition = getPosition if callable(getPosition) else None
+        if rate > 0 and self._readPosition is not None:
+            self.start()
+
+    @property
+    def isPolling(self) -> bool:
+        """ Whether the position is being read from the hardware in the
+        background. """
+        return self._thread is not None
+
+    @property
+    def sample(self) -> PositionSample:
+        """ The latest position, together with the time it was read. """
+        if not self.isPolling:
+            return PositionSample(dict(self._positioner.position), time.time())
+        return self._sample
+
+    @property
+    def position(self) -> Dict[str, float]:
+        """ The latest position of each axis. """
+        return self.sample.position
+
+    def start(self) -> None:
+        """ Starts reading the position in the background. """
+        if self._thread is not None or self._readPosition is None or self._rate <= 0:
+            return
+        self._stopEvent.clear()
+        self._thread = threading.Thread(target=self._poll, daemon=True,
+                                        name=f'{self._positioner.name}PositionMonitor')
+        self._thread.start()
+
+    def stop(self) -> None:
+        """ Stops reading the position in the background. """
+        if self._thread is None:
+            return
+        self._stopEvent.set()
+        self._thread.join()
+        self._thread = None
+
+    def refresh(self) -> PositionSample:
+        """ Reads the position from the hardware now, blocking until it has
+        been read, and returns it. """
+        if self._readPosition is None:
+            return self._record(dict(self._positioner.position))
+        return self._record(dict(self._readPosition()))
+
+    def recordCommanded(self) -> None:
+        """ Records the position the positioner has been told to go to, i.e.
+        its position property, and notifies if it has changed. Ignored while
+        polling, as the position read from the hardware is more accurate. """
+        if not self.isPolling:
+            self._record(dict(self._positioner.position))
+
+    def waitSettled(self, tolerance: float, settleTime: float = 0.1,
+                    timeout: Optional[float] = None,
+                    target: Optional[Dict[str, float]] = None) -> bool:
+        """ Waits until no axis has moved by more than tolerance for
+        settleTime seconds and, if target is given, all of its axes are
+        within tolerance of it. Returns whether that happened before the
+        timeout. Meant to replace fixed sleeps after moves; requires the
+        position to be polled, or reads it itself if it isn't. """
+        deadline = None if timeout is None else time.time() + timeout
+        interval = 1 / self._rate if self._rate > 0 else 0.02
+        sample = self.sample if self.isPolling else self.refresh()
+        reference = sample
+        while True:
+            if (_maxDistance(sample.position, reference.position) > tolerance or
+                    (target is not None and _maxDistance(sample.position, target) > tolerance)):
+                reference = sample  # Still moving, start over
+            elif sample.timestamp - reference.timestamp >= settleTime:
+                return True
+
+            if deadline is not None and time.time() + interval > deadline:
+                return False
+            if self.isPolling:
+                with self._condition:
+                    self._condition.wait_for(lambda: self._sample is not sample,
+                                             None if deadline is None else deadline - time.time())
+                sample = self._sample
+            else:
+                time.sleep(interval)
+                sample = self.refresh()
+
+    def _poll(self):
+        while not self._stopEvent.wait(1 / self._rate):
+            try:
+                self.refresh()
+                self._lastError = None
+            except Exception as e:
+                if str(e) != self._lastError:  # Don't repeat the same error at every poll
+                    self.__logger.warning(f'Failed to read position: {e}')
+                    self._lastError = str(e)
+
+    def _record(self, position):
+        sample = PositionSample(position, time.time())
+        with self._condition:
+            changed = _maxDistance(position, self._sample.position) > self.changeTolerance
+            self._sample = sample
+            self._condition.notify_all()
+        if changed:
+            self.sigPositionChanged.emit(self._positioner.name, position)
+        return sample
+
+
+def _maxDistance(position, otherPosition):
+    """ Returns the largest difference between the axes that both positions
+    have. """
+    distances = [abs(position[axis] - otherPosition[axis])
+                 for axis in position.keys() & otherPosition.keys()]
+    return max(distances, default=0.0)
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
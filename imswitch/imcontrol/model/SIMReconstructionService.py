@@ -0,0 +1,392 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, fields
+from typing import Optional, Tuple
+
+import numpy as np
+
+from imswitch.imcommon.framework import Signal, SignalInterface
+from imswitch.imcommon.model import initLogger
+
+try:
+    import scipy.fft as fft
+    isSciPyFFT = True
+except ImportError:
+    import numpy.fft as fft
+    isSciPyFFT = False
+
+
+@dataclass(frozen=True)
+class SIMParameters:
+    """ Optical and reconstruction parameters that a SIM calibration depends
+    on. Lengths are in micrometers. """
+
+    wavelength: float
+    """ Emission wavelength. """
+
+    NA: float
+    """ Numerical aperture of the objective. """
+
+    n: float
+    """ Refractive index at the sample. """
+
+    magnification: float
+    """ Magnification from the sample to the camera. """
+
+    pixelsize: float
+    """ Camera pixel size. """
+
+    alpha: float = 0.5
+    """ Zero order attenuation width. """
+
+    beta: float = 0.98
+    """ Zero order attenuation. """
+
+    w: float = 0.2
+    """ Wiener parameter. """
+
+    eta: float = 0.65
+    """ Relative search radius for the illumination carrier frequencies. """
+
+    nPhases: int = 3
+    nRotations: int = 3
+
+    usePhases: bool = True
+    """ Whether the phases of the individual frames are measured during
+    calibration. """
+
+    roi: Optional[Tuple[int, int, int, int]] = None
+    """ Region ``(x, y, width, height)`` of the frames to reconstruct, or None
+    to reconstruct the whole frames. """
+
+    @property
+    def numFrames(self) -> int:
+        """ Number of frames in a phase/angle stack. """
+        return self.nPhases * self.nRotations
+
+    def cacheKey(self, frameShape: Tuple[int, int]) -> str:
+        """ Returns a key that identifies calibrations with these parameters
+        for frames of the given shape (after cropping to the ROI). """
+        description = json.dumps({**asdict(self), 'frameShape': list(frameShape)},
+                                 sort_keys=True)
+        return hashlib.sha1(description.encode()).hexdigest()[:16]
+
+    def cropStack(self, stack: np.ndarray) -> np.ndarray:
+        """ Returns the part of the stack inside the ROI. """
+        if self.roi is None:
+            return stack
+        x, y, width, height = self.roi
+        return stack[..., y:y + height, x:x + width]
+
+
+@dataclass
+class SIMCalibration:
+    """ Everything needed to reconstruct stacks: the illumination carrier
+    parameters found during calibration, the OTF-based prefilter, the Wiener
+    postfilter and the per-frame reconstruction factors. """
+
+    parameters: SIMParameters
+    kx: np.ndarray
+    ky: np.ndarray
+    p: np.ndarray
+    ampl: np.ndarray
+    prefilter: np.ndarray
+    postfilter: np.ndarray
+    reconfactor: np.ndarray
+
+    @property
+    def frameShape(self) -> Tuple[int, int]:
+        """ Shape of the frames (after cropping to the ROI) that this
+        calibration applies to. """
+        return self.prefilter.shape
+
+    @classmethod
+    def fromProcessor(cls, processor, parameters: SIMParameters) -> 'SIMCalibration':
+        """ Extracts the calibration from a calibrated napari-sim-processor
+        processor. """
+        return cls(parameters=parameters,
+                   kx=np.array(processor.kx), ky=np.array(processor.ky),
+                   p=np.array(processor.p), ampl=np.array(processor.ampl),
+                   prefilter=np.array(processor._prefilter, dtype=np.float32),
+                   postfilter=np.array(processor._postfilter, dtype=np.float32),
+                   reconfactor=np.array(processor._reconfactor, dtype=np.float32))
+
+    def save(self, path: str) -> None:
+        arrays = {field.name: getattr(self, field.name) for field in fields(self)
+                  if field.name != 'parameters'}
+        with open(path, 'wb') as file:
+            np.savez(file, parameters=json.dumps(asdict(self.parameters)), **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> 'SIMCalibration':
+        with np.load(path) as data:
+            parameters = json.loads(str(data['parameters']))
+            if parameters['roi'] is not None:
+                parameters['roi'] = tuple(parameters['roi'])
+            return cls(parameters=SIMParameters(**parameters),
+                       **{field.name: data[field.name] for field in fields(cls)
+                          if field.name != 'parameters'})
+
+
+class SIMCalibrationCache:
+    """ Stores SIM calibrations on disk, so that they can be reused across
+    sessions for as long as the parameters and frame shape don't change. """
+
+    def __init__(self, directory: str):
+        self._directory = directory
+
+    def getPath(self, parameters: SIMParameters, frameShape: Tuple[int, int]) -> str:
+        return os.path.join(self._directory, f'calibration_{parameters.cacheKey(frameShape)}.npz')
+
+    def load(self, parameters: SIMParameters,
+             frameShape: Tuple[int, int]) -> Optional[SIMCalibration]:
+        """ Returns the cached calibration for the given parameters and frame
+        shape, or None if there is none. """
+        path = self.getPath(parameters, frameShape)
+        if not os.path.isfile(path):
+            return None
+        return SIMCalibration.load(path)
+
+    def save(self, calibration: SIMCalibration) -> str:
+        """ Saves the calibration and returns the path of the file. """
+        os.makedirs(self._directory, exist_ok=True)
+        path = self.getPath(calibration.parameters, calibration.frameShape)
+        tempPath = f'{path}.{os.getpid()}.tmp'
+        calibration.save(tempPath)
+        os.replace(tempPath, path)  # Never leave a partly written calibration behind
+        return path
+
+
+def reconstructSIMStack(stack: np.ndarray, calibration: SIMCalibration,
+                        workers: int = 1) -> np.ndarray:
+    """ Reconstructs a super-resolved image of twice the size of the frames
+    from a phase/angle stack. Equivalent to napari-sim-processor's
+    reconstruct_rfftw. """
+    fftArgs = {'workers': workers} if isSciPyFFT else {}
+    nSteps = calibration.reconfactor.shape[0]
+    ny, nx = stack.shape[-2:]
+    stack = stack.reshape(nSteps, ny, nx)
+
+    imf = fft.rfft2(stack.astype(np.float32), **fftArgs)
+    imf *= calibration.prefilter[:, :nx // 2 + 1]
+
+    # Zero-pad in frequency space to twice the size
+    carray = np.zeros((nSteps, 2 * ny, nx + 1), dtype=np.complex64)
+    carray[:, :ny // 2, :nx // 2 + 1] = imf[:, :ny // 2, :nx // 2 + 1]
+    carray[:, 3 * ny // 2:, :nx // 2 + 1] = imf[:, ny // 2:, :nx // 2 + 1]
+
+    img2 = np.sum(fft.irfft2(carray, **fftArgs) * calibration.reconfactor, 0)
+    return fft.irfft2(fft.rfft2(img2, **fftArgs) * calibration.postfilter[:, :nx + 1],
+                      **fftArgs)
+
+
+def simulateSIMStack(Nx=512, Ny=512, Nrot=3, Nphi=3, seed=None):
+    """ Simulates a SIM stack of sparse point emitters under tilted sinusoidal
+    illumination, with the phase steps of each rotation consecutive. """
+    from scipy.ndimage import gaussian_filter
+
+    sample = np.zeros((Nx, Ny))
+    sample[np.random.default_rng(seed).random(sample.shape) > 0.999] = 1
+    xx = np.arange(Ny) - Ny // 2
+    yy = (np.arange(Nx) - Nx // 2)[:, np.newaxis]
+
+    allImages = []
+    for iRot in range(Nrot):
+        for iPhi in range(Nphi):
+            grating = 1 + np.sin(((iRot / Nrot) * xx + (Nrot - iRot) / Nrot * yy) * np.pi / 2
+                                 + np.pi * iPhi / Nphi)
+            allImages.append(gaussian_filter(grating * sample, 3))
+
+    allImages = np.array(allImages)
+    allImages -= np.min(allImages)
+    allImages /= np.max(allImages)
+    return allImages
+
+
+_workerCalibration = None
+
+
+def _initWorker(calibrationPath):
+    global _workerCalibration
+    _workerCalibration = SIMCalibration.load(calibrationPath)
+
+
+def _reconstructInWorker(stack):
+    return reconstructSIMStack(stack, _workerCalibration)
+
+
+class SIMReconstructionService(SignalInterface):
+    """ Reconstructs SIM phase/angle stacks in the background on a pool of
+    worker processes, using a calibration that is cached on disk.
+
+    Stacks are passed to submit as they come in; the reconstructed images are
+    emitted through sigStackReconstructed, possibly out of order. Stacks that
+    can't be reconstructed, because they are incomplete, no calibration
+    matches them or too many stacks are already queued, are reported through
+    sigStackSkipped instead of being silently dropped. """
+
+    sigStackReconstructed = Signal(int, np.ndarray)  # (stackIndex, image)
+    sigStackSkipped = Signal(int, str)  # (stackIndex, reason)
+
+    def __init__(self, cacheDirectory: str, numWorkers: Optional[int] = None,
+                 useProcesses: bool = True, maxQueuedStacks: Optional[int] = None):
+        super().__init__()
+        self.__logger = initLogger(self)
+        self._cache = SIMCalibrationCache(cacheDirectory)
+        self._numWorkers = (numWorkers if numWorkers is not None
+                            else max(min(os.cpu_count() - 1, 4), 1))
+        self._useProcesses = useProcesses
+        self._maxQueuedStacks = (maxQueuedStacks if maxQueuedStacks is not None
+                                 else 2 * self._numWorkers)
+
+        self._lock = threading.Lock()
+        self._calibration = None
+        self._executor = None
+        self._generation = 0  # Incremented whenever the calibration changes
+        self._numStacks = 0
+        self._numQueuedStacks = 0
+        self._numSkippedStacks = 0
+
+    @property
+    def calibration(self) -> Optional[SIMCalibration]:
+        return self._calibration
+
+    @property
+    def numQueuedStacks(self) -> int:
+        """ Number of stacks submitted that have not been reconstructed
+        yet. """
+        return self._numQueuedStacks
+
+    @property
+    def numSkippedStacks(self) -> int:
+        """ Total number of stacks that could not be reconstructed. """
+        return self._numSkippedStacks
+
+    def loadCalibration(self, parameters: SIMParameters, frameShape: Tuple[int, int]) -> bool:
+        """ Activates the cached calibration for the given parameters and
+        frame shape (before cropping to the ROI), if there is one. Returns
+        whether a calibration was found. """
+        if parameters.roi is not None:
+            frameShape = (parameters.roi[3], parameters.roi[2])
+        if (self._calibration is not None and self._calibration.parameters == parameters
+                and self._calibration.frameShape == tuple(frameShape)):
+            return True
+
+        calibration = self._cache.load(parameters, frameShape)
+        if calibration is None:
+            return False
+
+        self.__logger.info(f'Loaded cached calibration for {frameShape[1]}x{frameShape[0]}'
+                           f' frames')
+        self._activate(calibration, self._cache.getPath(parameters, frameShape))
+        return True
+
+    def setCalibration(self, calibration: SIMCalibration) -> None:
+        """ Saves the calibration to the cache and uses it for all stacks
+        submitted from now on. """
+        self._activate(calibration, self._cache.save(calibration))
+
+    def submit(self, stack: np.ndarray) -> int:
+        """ Queues a phase/angle stack (with the phases of each rotation
+        consecutive) for reconstruction and returns its index. """
+        with self._lock:
+            stackIndex = self._numStacks
+            self._numStacks += 1
+
+            calibration = self._calibration
+            if calibration is None:
+                return self._skip(stackIndex, 'not calibrated')
+            if len(stack) != calibration.parameters.numFrames:
+                return self._skip(stackIndex, f'incomplete stack ({len(stack)} of'
+                                              f' {calibration.parameters.numFrames} frames)')
+            stack = calibration.parameters.cropStack(np.asarray(stack))
+            if stack.shape[-2:] != calibration.frameShape:
+                return self._skip(stackIndex, f'frame shape {stack.shape[-2:]} does not match'
+                                              f' the calibration')
+            if self._numQueuedStacks >= self._maxQueuedStacks:
+                return self._skip(stackIndex, 'reconstruction queue full')
+
+            self._numQueuedStacks += 1
+            generation = self._generation
+            if self._useProcesses:
+                future = self._executor.submit(_reconstructInWorker, stack)
+            else:
+                future = self._executor.submit(reconstructSIMStack, stack, calibration)
+
+        future.add_done_callback(lambda f: self._onReconstructed(stackIndex, generation, f))
+        return stackIndex
+
+    def reportIncompleteStack(self, numFrames: int) -> int:
+        """ Reports a stack that was abandoned after numFrames frames, e.g.
+        because acquisition was stopped, and returns its index. """
+        with self._lock:
+            stackIndex = self._numStacks
+            self._numStacks += 1
+            return self._skip(stackIndex, f'incomplete stack ({numFrames} frames)')
+
+    def shutdown(self, wait: bool = False) -> None:
+        """ Stops the worker pool. Stacks that are still queued are
+        discarded. """
+        with self._lock:
+            executor = self._executor
+            self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _activate(self, calibration, path):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            if self._useProcesses:
+                # Workers load the calibration once from disk instead of receiving it with every
+                # stack. Spawn rather than fork, as forking a process with Qt threads is unsafe.
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self._numWorkers, mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_initWorker, initargs=(path,)
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self._numWorkers,
+                                                    thread_name_prefix='SIMReconstruction')
+            self._calibration = calibration
+            self._generation += 1
+            self._numQueuedStacks = 0
+
+    def _skip(self, stackIndex, reason):
+        """ Must be called with the lock held. """
+        self._numSkippedStacks += 1
+        self.__logger.warning(f'Skipped SIM stack {stackIndex}: {reason}')
+        self.sigStackSkipped.emit(stackIndex, reason)
+        return stackIndex
+
+    def _onReconstructed(self, stackIndex, generation, future):
+        with self._lock:
+            if generation == self._generation:
+                self._numQueuedStacks -= 1
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                self._skip(stackIndex, f'reconstruction failed ({future.exception()})')
+                return
+
+        self.sigStackReconstructed.emit(stackIndex, future.result())
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
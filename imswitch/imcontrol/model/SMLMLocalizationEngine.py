@@ -0,0 +1,311 @@
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+import h5py
+import numpy as np
+
+from imswitch.imcommon.framework import Signal, SignalInterface
+from imswitch.imcommon.model import initLogger
+
+try:
+    from microEye.fitting.fit import localize_frame
+    from microEye.fitting.results import FittingMethod
+    isMicroEye = True
+except ImportError:
+    isMicroEye = False
+
+
+LOCALIZATION_DTYPE = np.dtype([
+    ('frame', np.int64),
+    ('x', np.float32),
+    ('y', np.float32),
+    ('background', np.float32),
+    ('intensity', np.float32),
+])
+""" Columns of a localization table. x and y are in camera pixels. """
+
+
+class MicroEyeLocalizer:
+    """ Localizes emitters in single frames with microEye. Instances are sent
+    to the worker processes of SMLMLocalizationEngine, so the filter and
+    detector must be picklable for the localization to run on processes. """
+
+    def __init__(self, preFilter, peakDetector, threshold=0.4, roiSize=13, fittingMethod=None,
+                 psfParam=1.5):
+        if not isMicroEye:
+            raise RuntimeError('microEye is not installed')
+
+        self.preFilter = preFilter
+        self.peakDetector = peakDetector
+        self.threshold = threshold
+        self.roiSize = roiSize
+        self.fittingMethod = (fittingMethod if fittingMethod is not None
+                              else FittingMethod._2D_Phasor_CPU)
+        self.psfParam = psfParam
+
+    def localize(self, frame: np.ndarray, frameIndex: int) -> np.ndarray:
+        """ Returns the localizations in the frame as an array of
+        LOCALIZATION_DTYPE. """
+        _, params, _, _ = localize_frame(
+            frameIndex, frame, frame.copy(), None, self.preFilter, self.peakDetector,
+            self.threshold, np.array([self.psfParam]), self.roiSize, self.fittingMethod
+        )
+
+        localizations = np.zeros(0 if params is None else len(params), dtype=LOCALIZATION_DTYPE)
+        if len(localizations) > 0:
+            # params columns are x, y, background, intensity, ...
+            localizations['frame'] = frameIndex
+            for i, name in enumerate(['x', 'y', 'background', 'intensity']):
+                localizations[name] = params[:, i]
+        return localizations
+
+
+class LocalizationTable:
+    """ An append-only table of localizations, stored column by column in
+    resizable datasets of an HDF5 file so that memory use doesn't grow with
+    the number of localizations. """
+
+    def __init__(self, path: str, chunkSize: int = 65536):
+        self._file = h5py.File(path, 'w')
+        self._group = self._file.create_group('localizations')
+        for name in LOCALIZATION_DTYPE.names:
+            self._group.create_dataset(name, shape=(0,), maxshape=(None,),
+                                       dtype=LOCALIZATION_DTYPE[name], chunks=(chunkSize,))
+        self._length = 0
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> str:
+        return self._file.filename
+
+    def __len__(self):
+        return self._length
+
+    def append(self, localizations: np.ndarray) -> None:
+        with self._lock:
+            start, stop = self._length, self._length + len(localizations)
+            for name in LOCALIZATION_DTYPE.names:
+                dataset = self._group[name]
+                dataset.resize(stop, axis=0)
+                dataset[start:stop] = localizations[name]
+            self._length = stop
+
+    def read(self, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """ Returns the localizations in the given range of rows as an array
+        of LOCALIZATION_DTYPE. """
+        with self._lock:
+            stop = self._length if stop is None else min(stop, self._length)
+            localizations = np.zeros(max(stop - start, 0), dtype=LOCALIZATION_DTYPE)
+            for name in LOCALIZATION_DTYPE.names:
+                localizations[name] = self._group[name][start:stop]
+            return localizations
+
+    def close(self) -> None:
+        with self._lock:
+            self._group.attrs['numLocalizations'] = self._length
+            self._file.close()
+
+
+class HistogramRender:
+    """ A super-resolution image that counts the localizations falling into
+    each of its pixels, which are magnification times smaller than the camera
+    pixels. """
+
+    def __init__(self, frameShape, magnification: int = 4):
+        self.magnification = magnification
+        self._image = np.zeros((frameShape[0] * magnification, frameShape[1] * magnification),
+                               dtype=np.float32)
+
+    @property
+    def image(self) -> np.ndarray:
+        return self._image
+
+    def add(self, localizations: np.ndarray) -> None:
+        height, width = self._image.shape
+        x = np.floor(localizations['x'] * self.magnification).astype(np.intp)
+        y = np.floor(localizations['y'] * self.magnification).astype(np.intp)
+        inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+        np.add.at(self._image, (y[inside], x[inside]), 1)
+
+
+_workerLocalizer = None
+
+
+def _initWorker(pickledLocalizer):
+    global _workerLocalizer
+    _workerLocalizer = pickle.loads(pickledLocalizer)
+
+
+def _localizeBatch(frames, frameIndices, localizer=None):
+    localizer = localizer if localizer is not None else _workerLocalizer
+    localizations = [localizer.localize(frame, frameIndex)
+                     for frame, frameIndex in zip(frames, frameIndices)]
+    return np.concatenate(localizations) if localizations else np.zeros(0, LOCALIZATION_DTYPE)
+
+
+class SMLMLocalizationEngine(SignalInterface):
+    """ Localizes every frame of an SMLM acquisition in the background.
+
+    Frames are passed to addFrames in chunks (e.g. from the detector's frame
+    buffer), grouped into batches and localized on a pool of worker
+    processes. The localizations are appended to a LocalizationTable and
+    accumulated in a HistogramRender as the batches complete. At most
+    maxQueuedBatches batches are in flight; addFrames blocks when the workers
+    fall behind, so frames are never dropped and memory stays bounded.
+
+    The localizer is anything with a localize(frame, frameIndex) method that
+    returns an array of LOCALIZATION_DTYPE. If it can't be pickled, threads
+    are used instead of processes. """
+
+    sigLocalized = Signal(int, int)  # (numFramesLocalized, numLocalizations)
+    sigRenderUpdated = Signal(np.ndarray)  # (render)
+
+    def __init__(self, localizer, table: LocalizationTable, frameShape,
+                 renderMagnification: int = 4, batchSize: int = 16,
+                 numWorkers: Optional[int] = None, useProcesses: bool = True,
+                 maxQueuedBatches: Optional[int] = None, renderInterval: float = 0.5):
+        super().__init__()
+        self.__logger = initLogger(self)
+        self._table = table
+        self._render = HistogramRender(frameShape, renderMagnification)
+        self._batchSize = batchSize
+        self._renderInterval = renderInterval
+
+        numWorkers = numWorkers if numWorkers is not None else max(os.cpu_count() - 1, 1)
+        maxQueuedBatches = maxQueuedBatches if maxQueuedBatches is not None else 2 * numWorkers
+        self._batchSlots = threading.BoundedSemaphore(maxQueuedBatches)
+
+        self._localizer = None
+        if useProcesses:
+            try:
+                pickledLocalizer = pickle.dumps(localizer)
+            except Exception as e:
+                self.__logger.warning(f'Localizer cannot be sent to other processes ({e}),'
+                                      f' localizing on threads instead')
+                useProcesses = False
+        if useProcesses:
+            self._executor = ProcessPoolExecutor(
+                max_workers=numWorkers, mp_context=multiprocessing.get_context('spawn'),
+                initializer=_initWorker, initargs=(pickledLocalizer,)
+            )
+        else:
+            self._localizer = localizer
+            self._executor = ThreadPoolExecutor(max_workers=numWorkers,
+                                                thread_name_prefix='SMLMLocalization')
+
+        self._lock = threading.Lock()
+        self._pendingFrames = []
+        self._pendingFrameIndices = []
+        self._numFramesAdded = 0
+        self._numFramesLocalized = 0
+        self._numFailedBatches = 0
+        self._numQueuedBatches = 0
+        self._allDone = threading.Condition(self._lock)
+        self._lastRenderTime = 0
+
+    @property
+    def table(self) -> LocalizationTable:
+        return self._table
+
+    @property
+    def render(self) -> np.ndarray:
+        """ The current super-resolution render. Updated in place. """
+        return self._render.image
+
+    @property
+    def numFramesLocalized(self) -> int:
+        return self._numFramesLocalized
+
+    @property
+    def numFailedBatches(self) -> int:
+        return self._numFailedBatches
+
+    def addFrames(self, frames: np.ndarray, frameIndices: Optional[np.ndarray] = None) -> None:
+        """ Queues a chunk of frames of shape (numFrames, height, width) for
+        localization. frameIndices are stored in the frame column of the
+        table; by default, frames are numbered in the order they are added.
+        The frames are copied, so views into a frame buffer may be passed. """
+        if frameIndices is None:
+            frameIndices = np.arange(self._numFramesAdded, self._numFramesAdded + len(frames))
+        self._numFramesAdded += len(frames)
+
+        for frame, frameIndex in zip(frames, frameIndices):
+            self._pendingFrames.append(np.array(frame))
+            self._pendingFrameIndices.append(int(frameIndex))
+            if len(self._pendingFrames) >= self._batchSize:
+                self.flush()
+
+    def flush(self) -> None:
+        """ Submits the frames that don't fill a whole batch yet. """
+        if not self._pendingFrames:
+            return
+
+        frames = np.stack(self._pendingFrames)
+        frameIndices = np.array(self._pendingFrameIndices)
+        self._pendingFrames = []
+        self._pendingFrameIndices = []
+
+        self._batchSlots.acquire()  # Wait for the workers to catch up
+        with self._lock:
+            self._numQueuedBatches += 1
+        future = self._executor.submit(_localizeBatch, frames, frameIndices, self._localizer)
+        future.add_done_callback(lambda f: self._onBatchLocalized(len(frames), f))
+
+    def finish(self) -> None:
+        """ Localizes the remaining frames, waits for all batches to complete,
+        emits the final render and closes the table. """
+        self.flush()
+        with self._allDone:
+            self._allDone.wait_for(lambda: self._numQueuedBatches == 0)
+        self._executor.shutdown()
+        self.sigRenderUpdated.emit(self._render.image.copy())
+        self._table.close()
+
+    def _onBatchLocalized(self, numFrames, future):
+        try:
+            if future.exception() is not None:
+                self.__logger.error(f'Failed to localize {numFrames} frames: {future.exception()}')
+                with self._lock:
+                    self._numFailedBatches += 1
+                return
+
+            localizations = future.result()
+            self._table.append(localizations)
+            with self._lock:
+                self._render.add(localizations)
+                self._numFramesLocalized += numFrames
+                emitRender = time.monotonic() - self._lastRenderTime >= self._renderInterval
+                if emitRender:
+                    self._lastRenderTime = time.monotonic()
+                    render = self._render.image.copy()
+
+            self.sigLocalized.emit(self._numFramesLocalized, len(self._table))
+            if emitRender:
+                self.sigRenderUpdated.emit(render)
+        finally:
+            self._batchSlots.release()
+            with self._allDone:
+                self._numQueuedBatches -= 1
+                self._allDone.notify_all()
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
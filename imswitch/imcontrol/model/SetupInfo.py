@@ -103,6 +103,11 @@ class PositionerInfo(DeviceInfo):
     forScanning: bool = False
     """ Whether the positioner is used for scanning. """
 
+    positionPollingRate: float = 0.0
+    """ Rate (in Hz) at which the position is read from the positioner in the
+    background and cached. 0 disables polling; the cache then holds the
+    positions the positioner has been told to go to. """
+
 
 @dataclass(frozen=True)
 class RS232Info:
@@ -227,6 +232,18 @@ class FocusLockInfo:
     frameCroph: int
     """ Height of frame crop. """
 
+    loopRate: Optional[float] = None
+    """ Maximum rate, in Hz, of the focus lock loop, which runs on its own
+    thread independently of the display updates. Defaults to updateFreq. """
+
+    roiSize: int = 100
+    """ Size in pixels of the region around the reflected beam that is
+    processed in each iteration of the focus lock loop. """
+
+    subpixelFit: bool = False
+    """ Whether to locate the beam with a Gaussian fit instead of the
+    centroid. """
+
 @dataclass(frozen=True)
 class AutofocusInfo:
     camera: str
@@ -0,0 +1,224 @@
+import os
+import threading
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+
+try:
+    import pyfftw
+    isPyFFTW = True
+except ImportError:
+    isPyFFTW = False
+
+try:
+    import scipy.fft
+    isSciPyFFT = True
+except ImportError:
+    isSciPyFFT = False
+
+
+@dataclass
+class SpectrumMetrics:
+    """ Quantities derived from the power spectrum of a frame. Frequencies are
+    in cycles per pixel of the original (non-decimated) frame. """
+
+    radialFrequencies: np.ndarray
+    """ Centre frequency of each bin of radialPower. """
+
+    radialPower: np.ndarray
+    """ Mean power of the frequency components in each radial frequency
+    bin. """
+
+    peakFrequency: float
+    """ Radial frequency of the strongest component above the engine's
+    minPeakFrequency, e.g. the frequency of a grating or SIM pattern. """
+
+    peakPeriod: float
+    """ Period in pixels of the strongest component, i.e.
+    1 / peakFrequency. """
+
+    sharpness: float
+    """ Fraction of the (non-DC) power above the engine's sharpnessCutoff
+    frequency. Increases as the image gets sharper. """
+
+
+class SpectrumEngine:
+    """ Computes the log-magnitude spectrum of live frames along with
+    SpectrumMetrics.
+
+    Frames are transformed with a real FFT, which is about half the work of a
+    full complex FFT, using pyFFTW with a cached plan if it is installed and
+    otherwise scipy.fft (or numpy.fft) with several workers. All buffers are
+    allocated once per frame shape and reused. The frame can be cropped to a
+    ROI and decimated before it is transformed.
+
+    compute returns the spectrum in one of two alternating output buffers,
+    so a spectrum stays valid until compute has been called twice more.
+    Callers that need it for longer must copy it. An engine must not be used
+    from several threads at the same time. """
+
+    def __init__(self, roi: Optional[Tuple[int, int, int, int]] = None, decimation: int = 1,
+                 numRadialBins: int = 64, minPeakFrequency: float = 0.02,
+                 sharpnessCutoff: float = 0.1, workers: Optional[int] = None):
+        self.roi = roi
+        """ Region ``(x, y, width, height)`` of the frame to transform, or
+        None to transform the whole frame. """
+
+        self.decimation = decimation
+        """ Only every decimation-th pixel of the frame (or ROI) in both
+        directions is transformed. """
+
+        self.numRadialBins = numRadialBins
+        self.minPeakFrequency = minPeakFrequency
+        self.sharpnessCutoff = sharpnessCutoff
+        self._workers = workers if workers is not None else max(os.cpu_count() // 2, 1)
+
+        self._lock = threading.Lock()
+        self._shape = None
+        self._settings = None
+
+    @property
+    def backend(self) -> str:
+        """ Name of the FFT library used. """
+        if isPyFFTW:
+            return 'pyfftw'
+        elif isSciPyFFT:
+            return 'scipy'
+        else:
+            return 'numpy'
+
+    def compute(self, image: np.ndarray) -> Tuple[np.ndarray, SpectrumMetrics]:
+        """ Returns the centred log10 magnitude spectrum of the frame, of the
+        same layout as ``np.fft.fftshift(np.log10(abs(np.fft.fft2(image))))``
+        but in float32, together with its SpectrumMetrics. RGB frames, of
+        shape (height, width, channels), are transformed as the mean of their
+        channels. """
+        with self._lock:
+            x, y, width, height = (self.roi if self.roi is not None
+                                   else (0, 0, image.shape[1], image.shape[0]))
+            image = image[y:y + height:self.decimation, x:x + width:self.decimation]
+            if image.shape[:2] != self._shape:
+                self._allocate(image.shape[:2])
+            settings = (self.decimation, self.numRadialBins, self.minPeakFrequency,
+                        self.sharpnessCutoff)
+            if settings != self._settings:
+                self._computeFrequencyGrid()
+                self._settings = settings
+
+            if image.ndim == 3:
+                np.mean(image, axis=2, dtype=np.float32, out=self._input)
+            else:
+                np.copyto(self._input, image, casting='unsafe')
+            transformed = self._rfft2()
+
+            np.abs(transformed, out=self._magnitude)
+            np.square(self._magnitude, out=self._power)
+            metrics = self._computeMetrics()
+
+            with np.errstate(divide='ignore'):
+                np.log10(self._magnitude, out=self._magnitude)
+
+            spectrum = self._spectra[self._spectrumIndex]
+            self._spectrumIndex = (self._spectrumIndex + 1) % len(self._spectra)
+            halfWidth = self._shape[1] // 2
+            # The right half of the centred spectrum (non-negative x frequencies) is stored in the
+            # real FFT output directly; the left half follows from its Hermitian symmetry
+            np.take(self._magnitude[:, :self._shape[1] - halfWidth], self._posRows, axis=0,
+                    out=spectrum[:, halfWidth:])
+            np.take(self._magnitude[:, halfWidth:0:-1], self._negRows, axis=0,
+                    out=spectrum[:, :halfWidth])
+            return spectrum, metrics
+
+    def _allocate(self, shape):
+        """ Allocates the buffers and FFT plan for frames of the given
+        (decimated) shape. """
+        height, width = shape
+        if isPyFFTW:
+            self._fftw = pyfftw.builders.rfft2(
+                pyfftw.empty_aligned(shape, dtype=np.float32), threads=self._workers,
+                planner_effort='FFTW_MEASURE'
+            )
+            self._input = self._fftw.input_array
+        else:
+            self._input = np.empty(shape, dtype=np.float32)
+
+        halfShape = (height, width // 2 + 1)
+        self._magnitude = np.empty(halfShape, dtype=np.float32)
+        self._power = np.empty(halfShape, dtype=np.float32)
+        self._spectra = [np.empty(shape, dtype=np.float32) for _ in range(2)]
+        self._spectrumIndex = 0
+
+        # Rows of the real FFT output in the order of the centred spectrum, for the positive and
+        # (mirrored) negative x frequencies
+        rows = np.arange(height)
+        self._posRows = (rows - height // 2) % height
+        self._negRows = (height // 2 - rows) % height
+
+        self._shape = shape
+        self._settings = None
+
+    def _computeFrequencyGrid(self):
+        """ Precomputes the radial frequency of each component of the real
+        FFT output along with the bins and masks used for the metrics. """
+        height, width = self._shape
+        nyquist = 0.5 / self.decimation
+        fy = np.fft.fftfreq(height, d=self.decimation)[:, np.newaxis]
+        fx = np.fft.rfftfreq(width, d=self.decimation)[np.newaxis, :]
+        frequencies = np.sqrt(fy ** 2 + fx ** 2)
+        self._frequencies = frequencies
+        self._radialBinIndices = np.minimum(
+            (frequencies / nyquist * self.numRadialBins).astype(np.intp), self.numRadialBins
+        ).ravel()  # Frequencies above Nyquist (the corners) go to an extra bin that is discarded
+        self._radialBinCounts = np.bincount(self._radialBinIndices,
+                                            minlength=self.numRadialBins + 1)
+        self._radialFrequencies = ((np.arange(self.numRadialBins) + 0.5) / self.numRadialBins
+                                   * nyquist)
+        self._peakMask = (frequencies >= self.minPeakFrequency).astype(np.float32)
+        self._sharpnessMask = frequencies >= self.sharpnessCutoff
+
+    def _rfft2(self):
+        if isPyFFTW:
+            return self._fftw()
+        elif isSciPyFFT:
+            return scipy.fft.rfft2(self._input, workers=self._workers, overwrite_x=True)
+        else:
+            return np.fft.rfft2(self._input)
+
+    def _computeMetrics(self):
+        power = self._power
+        radialPower = np.bincount(self._radialBinIndices, weights=power.ravel(),
+                                  minlength=self.numRadialBins + 1)
+        with np.errstate(invalid='ignore'):
+            radialPower = (radialPower / self._radialBinCounts)[:self.numRadialBins]
+
+        peakIndex = np.unravel_index(np.argmax(power * self._peakMask), power.shape)
+        peakFrequency = self._frequencies[peakIndex]
+
+        acPower = power.sum() - power[0, 0]
+        sharpness = power[self._sharpnessMask].sum() / acPower if acPower > 0 else 0.0
+
+        return SpectrumMetrics(
+            radialFrequencies=self._radialFrequencies,
+            radialPower=radialPower,
+            peakFrequency=float(peakFrequency),
+            peakPeriod=float(1 / peakFrequency) if peakFrequency > 0 else np.inf,
+            sharpness=float(sharpness)
+        )
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
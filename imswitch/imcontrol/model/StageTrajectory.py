@@ -0,0 +1,71 @@
+from dataclasses import dataclass
+from typing import Sequence
+
+import numpy as np
+
+
+def rasterWaypoints(xPositions: Sequence[float], yPositions: Sequence[float],
+                    snake: bool = True) -> np.ndarray:
+    """ Returns the (x, y) waypoints of a raster scan over the given positions
+    as an array of shape (len(xPositions) * len(yPositions), 2), going along y
+    for each x position. With snake, every other line is traversed backwards
+    so that the stage doesn't have to return to the start of the line. """
+    xPositions, yPositions = np.asarray(xPositions), np.asarray(yPositions)
+    ys = np.tile(yPositions, (len(xPositions), 1))
+    if snake:
+        ys[1::2] = ys[1::2, ::-1]
+    xs = np.repeat(xPositions, len(yPositions)).reshape(ys.shape)
+    return np.stack([xs.ravel(), ys.ravel()], axis=1)
+
+
+@dataclass(frozen=True)
+class LinearMotion:
+    """ A move of one or more axes from start to end, each at a constant
+    speed, which lets the times at which frames were captured during the move
+    be mapped to stage positions. Acceleration is neglected, so positions
+    shortly after the start of the move are approximate; scans should start
+    the move some distance before the region of interest. """
+
+    start: np.ndarray
+    """ Start position of each axis. """
+
+    end: np.ndarray
+    """ End position of each axis. """
+
+    speeds: np.ndarray
+    """ Speed of each axis, in units of position per second. """
+
+    startTime: float
+    """ Time (in seconds since the epoch, like FrameMetadata.hostTimestamps)
+    at which the move was started. """
+
+    @property
+    def duration(self) -> float:
+        """ Time in seconds until the last axis arrives at its end
+        position. """
+        return float(np.max(np.abs(self.end - self.start) / self.speeds))
+
+    def positionsAt(self, times) -> np.ndarray:
+        """ Returns the positions of the axes at the given times, as an array
+        of shape (len(times), number of axes). """
+        elapsed = np.clip(np.asarray(times, dtype=float) - self.startTime, 0, None)
+        distances = self.end - self.start
+        travelled = np.minimum(elapsed[:, np.newaxis] * self.speeds, np.abs(distances))
+        return self.start + np.sign(distances) * travelled
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
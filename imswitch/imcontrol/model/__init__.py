@@ -1,7 +1,24 @@
 from .Options import Options
 from .SetupInfo import DeviceInfo, DetectorInfo, LaserInfo, PositionerInfo, ScanInfo, SetupInfo
 from .errors import *
+from .AutoLevelEngine import AutoLevelEngine, subsampledPercentiles
+from .AutofocusEngine import (
+    AutofocusAborted, AutofocusEngine, AutofocusResult, focusMetrics
+)
+from .CommandScheduler import CommandScheduler
+from .FocusLockEngine import BeamTracker, FocusLockEngine, FocusLockStatistics
+from .FrameRingBuffer import FrameBufferReader, FrameMetadata, FrameRingBuffer
+from .HolographyEngine import HolographyEngine
 from .managers import *
+from .PositionMonitor import PositionMonitor, PositionSample
+from .SIMReconstructionService import (
+    SIMCalibration, SIMCalibrationCache, SIMParameters, SIMReconstructionService
+)
+from .SMLMLocalizationEngine import (
+    HistogramRender, LocalizationTable, MicroEyeLocalizer, SMLMLocalizationEngine
+)
+from .SpectrumEngine import SpectrumEngine, SpectrumMetrics
+from .StageTrajectory import LinearMotion, rasterWaypoints
 from .signaldesigners import SignalDesignerFactory
 import sys
 
@@ -2,6 +2,7 @@ import numpy as np
 import time
 import cv2
 from imswitch.imcommon.model import initLogger
+from imswitch.imcontrol.model.FrameRingBuffer import FrameRingBuffer
 
 
 try:
@@ -11,7 +12,6 @@ except:
     isVimba = False
     print("No pymba installed..")
     
-import collections
 
  
 class CameraAV:
@@ -39,7 +39,7 @@ class CameraAV:
         
         # reserve some space for the framebuffer
         self.buffersize = 60
-        self.frame_buffer = collections.deque(maxlen=self.buffersize)
+        self.frameBuffer = FrameRingBuffer(self.buffersize)
         
         #%% starting the camera thread
         if isVimba:
@@ -138,11 +138,7 @@ class CameraAV:
         return self.frame
 
     def getLastChunk(self):
-        chunk = np.array(self.frame_buffer)
-        #frameids = self.frame_buffer[1]
-        self.__logger.debug("Buffer: "+str(len(self.frame_buffer))+"  "+str(chunk.shape))
-        self.frame_buffer.clear()
-        return chunk
+        return self.frameBuffer.getChunk()
         
 
     def setROI(self,hpos=None,vpos=None,hsize=None,vsize=None):
@@ -155,7 +151,7 @@ class CameraAV:
         self.hsize = hsize
         self.hpos = hpos 
         self.vpos = vpos 
-        self.frame_buffer.clear()
+        self.frameBuffer.flush()
         '''
         self.__logger.debug(
              f'{self.model}: setROI started with {hsize}x{vsize} at {hpos},{vpos}.')
@@ -288,7 +284,7 @@ class CameraAV:
         self.frame_id = frame.data.frameID
         if self.frame is None or frame.data.receiveStatus == -1:
             self.frame = np.zeros(self.shape)
-        self.frame_buffer.append(self.frame)
+        self.frameBuffer.add(self.frame, self.frame_id, frame.data.timestamp)
     
 
 # Copyright (C) ImSwitch developers 2021
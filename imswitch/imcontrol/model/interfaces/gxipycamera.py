@@ -3,9 +3,9 @@ import numpy as np
 import time
 import cv2
 from imswitch.imcommon.model import initLogger
+from imswitch.imcontrol.model.FrameRingBuffer import FrameRingBuffer
 
 import imswitch.imcontrol.model.interfaces.gxipy as gx
-import collections
 
 class TriggerMode:
     SOFTWARE = 'Software Trigger'
@@ -38,8 +38,7 @@ class CameraGXIPY:
 
         # reserve some space for the framebuffer
         self.NBuffer = 200
-        self.frame_buffer = collections.deque(maxlen=self.NBuffer)
-        self.frameid_buffer = collections.deque(maxlen=self.NBuffer)
+        self.frameBuffer = FrameRingBuffer(self.NBuffer)
         
         #%% starting the camera thread
         self.camera = None
@@ -186,15 +185,10 @@ class CameraGXIPY:
 
 
     def flushBuffer(self):
-        self.frameid_buffer.clear()
-        self.frame_buffer.clear()
+        self.frameBuffer.flush()
         
     def getLastChunk(self):
-        chunk = np.array(self.frame_buffer)
-        frameids = np.array(self.frameid_buffer)
-        self.flushBuffer()
-        self.__logger.debug("Buffer: "+str(chunk.shape)+" IDs: " + str(frameids))
-        return chunk
+        return self.frameBuffer.getChunk()
     
     def setROI(self,hpos=None,vpos=None,hsize=None,vsize=None):
         #hsize = max(hsize, 25)*10  # minimum ROI size
@@ -359,13 +353,12 @@ class CameraGXIPY:
             return
         self.frame = numpy_image
         self.frameNumber = frame.get_frame_id()
-        self.timestamp = time.time()
+        self.timestamp = frame.get_timestamp()
         
         if self.binning > 1:
             numpy_image = cv2.resize(numpy_image, dsize=None, fx=1/self.binning, fy=1/self.binning, interpolation=cv2.INTER_AREA)
     
-        self.frame_buffer.append(numpy_image)
-        self.frameid_buffer.append(self.frameNumber)
+        self.frameBuffer.add(numpy_image, self.frameNumber, self.timestamp)
     
 
 # Copyright (C) ImSwitch developers 2021
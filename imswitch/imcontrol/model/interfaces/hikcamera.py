@@ -3,11 +3,11 @@ import numpy as np
 import time
 import cv2
 from imswitch.imcommon.model import initLogger
+from imswitch.imcontrol.model.FrameRingBuffer import FrameRingBuffer
 
 import sys
 import threading
 from ctypes import *
-import collections
 
 from sys import platform
 if platform == "linux" or platform == "linux2":
@@ -51,8 +51,7 @@ class CameraHIK:
 
         # reserve some space for the framebuffer
         self.NBuffer = 200
-        self.frame_buffer = collections.deque(maxlen=self.NBuffer)
-        self.frameid_buffer = collections.deque(maxlen=self.NBuffer)
+        self.frameBuffer = FrameRingBuffer(self.NBuffer)
         
         #%% starting the camera thread
         self.camera = None
@@ -226,15 +225,10 @@ class CameraHIK:
         return self.frame
 
     def flushBuffer(self):
-        self.frameid_buffer.clear()
-        self.frame_buffer.clear()
+        self.frameBuffer.flush()
         
     def getLastChunk(self):
-        chunk = np.array(self.frame_buffer)
-        frameids = np.array(self.frameid_buffer)
-        self.flushBuffer()
-        self.__logger.debug("Buffer: "+str(chunk.shape)+" IDs: " + str(frameids))
-        return chunk
+        return self.frameBuffer.getChunk()
     
     def setROI(self,hpos=None,vpos=None,hsize=None,vsize=None):
         #hsize = max(hsize, 25)*10  # minimum ROI size
@@ -353,9 +347,9 @@ class CameraHIK:
 
                     self.SensorHeight, self.SensorWidth = stOutFrame.stFrameInfo.nHeight, stOutFrame.stFrameInfo.nWidth
                     self.frame_id = stOutFrame.stFrameInfo.nFrameNum
-                    self.timestamp = time.time()
-                    self.frame_buffer.append(self.frame)
-                    self.frameid_buffer.append(self.frame_id)
+                    self.timestamp = (stOutFrame.stFrameInfo.nDevTimeStampHigh << 32 |
+                                      stOutFrame.stFrameInfo.nDevTimeStampLow)
+                    self.frameBuffer.add(self.frame, self.frame_id, self.timestamp)
                 else:
                     pass 
                 if self.g_bExit == True:
@@ -384,9 +378,8 @@ class CameraHIK:
 
                 self.SensorHeight, self.SensorWidth = stDeviceList.nWidth, stDeviceList.nHeight  
                 self.frame_id = stDeviceList.nFrameNum
-                self.timestamp = time.time()
-                self.frame_buffer.append(self.frame)
-                self.frameid_buffer.append(self.frame_id)
+                self.timestamp = stDeviceList.nDevTimeStampHigh << 32 | stDeviceList.nDevTimeStampLow
+                self.frameBuffer.add(self.frame, self.frame_id, self.timestamp)
                     
                     
                 '''
@@ -4,9 +4,9 @@ import numpy as np
 import time
 import cv2, queue, threading
 from imswitch.imcommon.model import initLogger
+from imswitch.imcontrol.model.FrameRingBuffer import FrameRingBuffer
 from threading import Thread
 
-import collections
 
 class CameraOpenCV:
     def __init__(self, cameraindex=0):
@@ -33,7 +33,7 @@ class CameraOpenCV:
 
         # reserve some space for the framebuffer
         self.buffersize = 60
-        self.frame_buffer = collections.deque(maxlen=self.buffersize)
+        self.frameBuffer = FrameRingBuffer(self.buffersize)
 
         #%% starting the camera => self.camera  will be created
         self.cameraindex = cameraindex
@@ -104,11 +104,7 @@ class CameraOpenCV:
         return self.frame
 
     def getLastChunk(self):
-        chunk = np.array(self.frame_buffer)
-        #frameids = self.frame_buffer[1]
-        self.__logger.debug("Buffer: "+str(len(self.frame_buffer))+"  "+str(chunk.shape))
-        self.frame_buffer.clear()
-        return chunk
+        return self.frameBuffer.getChunk()
 
     def setROI(self, hpos, vpos, hsize, vsize):
         pass
@@ -178,7 +174,7 @@ class CameraOpenCV:
         while(self.camera_is_open):
             try:
                 self.frame = np.mean(self.camera.read()[1], -1)
-                self.frame_buffer.append(self.frame)
+                self.frameBuffer.add(self.frame)
             except Exception as e:
                 self.camera_is_open = False
                 self.__logger.debug(e)
@@ -1,8 +1,13 @@
-from time import sleep
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from time import perf_counter, sleep
+from typing import Optional, Tuple
 
 import numpy as np
 
 from imswitch.imcommon.framework import Mutex, Signal, SignalInterface, Thread, Timer, Worker
+from imswitch.imcommon.model import initLogger
 from .MultiManager import MultiManager
 
 
@@ -17,22 +22,33 @@ class DetectorsManager(MultiManager, SignalInterface):
         str, np.ndarray, bool, bool
     )  # (detectorName, image, init, isCurrentDetector)
 
+    acquisitionTimeout = 10.0
+    """ Time in seconds that starting or stopping acquisition may take per
+    detector. The detectors are started and stopped concurrently. """
+
+    liveViewPollTimeout = 1.0
+    """ Time in seconds that the live view waits for the frames of the
+    detectors on each poll. Detectors that take longer are skipped until they
+    return. """
+
     def __init__(self, detectorInfos, updatePeriod, **lowLevelManagers):
         MultiManager.__init__(self, detectorInfos, 'detectors', **lowLevelManagers)
         SignalInterface.__init__(self)
+        self.__logger = initLogger(self)
 
         self._activeAcqHandles = []
         self._activeAcqLVHandles = []
         self._activeAcqsMutex = Mutex()
 
         self._currentDetectorName = None
+        self._dispatcher = LiveViewDispatcher(self)
         for detectorName, detectorInfo in detectorInfos.items():
             if not self._subManagers[detectorName].forAcquisition:
                 continue
             # Connect signals
             self._subManagers[detectorName].sigImageUpdated.connect(
-                lambda image, init, detectorName=detectorName: self.sigImageUpdated.emit(
-                    detectorName, image, init, detectorName == self._currentDetectorName
+                lambda image, init, detectorName=detectorName: self._dispatcher.post(
+                    detectorName, image, init
                 )
             )
 
@@ -40,7 +56,15 @@ class DetectorsManager(MultiManager, SignalInterface):
             if self._currentDetectorName is None:
                 self._currentDetectorName = detectorName
 
-        # A timer will collect the new frame and update it through the communication channel
+        # A timer will collect new frames and hand them to the dispatcher, which forwards them to
+        # sigImageUpdated and the live view subscriptions. The detectors are polled on a pool of
+        # their own, with at most one poll per detector in flight, so that a hung device can
+        # neither starve the live view nor be starved by other users of execOnAll
+        self._liveViewPolls = {}
+        self._liveViewExecutor = ThreadPoolExecutor(
+            max_workers=max(len(self.getAllDeviceNames(lambda c: c.forAcquisition)), 1),
+            thread_name_prefix='LiveViewPoll'
+        )
         self._lvWorker = LVWorker(self, updatePeriod)
         self._thread = Thread()
         self._lvWorker.moveToThread(self._thread)
@@ -50,6 +74,7 @@ class DetectorsManager(MultiManager, SignalInterface):
     def __del__(self):
         self._thread.quit()
         self._thread.wait()
+        self._liveViewExecutor.shutdown(wait=False)
         if hasattr(super(), '__del__'):
             super().__del__()
 
@@ -112,7 +137,8 @@ class DetectorsManager(MultiManager, SignalInterface):
 
         # Do actual enabling
         if enableAcq:
-            self.execOnAll(lambda c: c.startAcquisition(), condition=lambda c: c.forAcquisition)
+            self.execOnAll(lambda c: c.startAcquisition(), condition=lambda c: c.forAcquisition,
+                           parallel=True, timeout=self.acquisitionTimeout)
             self.sigAcquisitionStarted.emit()
         if enableLV:
             sleep(0.3)
@@ -148,7 +174,8 @@ class DetectorsManager(MultiManager, SignalInterface):
             self._thread.quit()
             self._thread.wait()
         if disableAcq:
-            self.execOnAll(lambda c: c.stopAcquisition(), condition=lambda c: c.forAcquisition)
+            self.execOnAll(lambda c: c.stopAcquisition(), condition=lambda c: c.forAcquisition,
+                           parallel=True, timeout=self.acquisitionTimeout)
             self.sigAcquisitionStopped.emit()
 
     def setUpdatePeriod(self, updatePeriod):
@@ -157,6 +184,225 @@ class DetectorsManager(MultiManager, SignalInterface):
         self._thread.wait()
         self._thread.start()
 
+    def subscribeLiveView(self, maxRate: Optional[float] = None,
+                          roi: Optional[Tuple[int, int, int, int]] = None,
+                          decimation: int = 1, binning: int = 1) -> 'LiveViewSubscription':
+        """ Returns a new live view subscription, whose sigImageUpdated is
+        emitted with new frames at most maxRate times per second per
+        detector, cropped to roi ``(x, y, width, height)``, binned by
+        averaging blocks of binning x binning pixels and decimated by taking
+        every decimation-th pixel in both directions. Use this instead of
+        sigImageUpdated for consumers that don't need every frame at full
+        size. """
+        subscription = LiveViewSubscription(maxRate, roi, decimation, binning)
+        self._dispatcher.addSubscription(subscription)
+        return subscription
+
+    def unsubscribeLiveView(self, subscription: 'LiveViewSubscription'):
+        """ Stops delivering frames to a subscription returned by
+        subscribeLiveView. """
+        self._dispatcher.removeSubscription(subscription)
+
+    def _pollLiveView(self, init):
+        """ Hands the latest frame of every acquisition detector to the
+        dispatcher, skipping detectors that haven't captured a new frame and
+        detectors whose previous poll hasn't returned yet. Called from the
+        live view thread. """
+        futures = {}
+        for detectorName in self.getAllDeviceNames(lambda c: c.forAcquisition):
+            previous = self._liveViewPolls.get(detectorName)
+            if previous is not None and not previous.done():
+                continue
+
+            futures[detectorName] = self._liveViewExecutor.submit(
+                self._subManagers[detectorName].getNewLiveViewFrame, force=not init
+            )
+            self._liveViewPolls[detectorName] = futures[detectorName]
+
+        wait(futures.values(), timeout=self.liveViewPollTimeout)
+        for detectorName, future in futures.items():
+            if not future.done():
+                self.__logger.warning(f'{detectorName} did not return a live view frame within'
+                                      f' {self.liveViewPollTimeout} s')
+            elif future.exception() is not None:
+                self.__logger.error(f'Failed to get live view frame of {detectorName}:'
+                                    f' {future.exception()}')
+            elif future.result() is not None:
+                self._dispatcher.post(detectorName, future.result(), init)
+
+
+def binImage(image, binning):
+    """ Returns the image reduced by averaging blocks of binning x binning
+    pixels, with the same data type. Rows and columns that don't fill a whole
+    block are dropped. """
+    if binning <= 1:
+        return image
+
+    height, width = image.shape[0] // binning, image.shape[1] // binning
+    blocks = image[:height * binning, :width * binning].reshape(
+        height, binning, width, binning, *image.shape[2:]
+    )
+    binned = blocks.mean(axis=(1, 3), dtype=np.float32)
+    if np.issubdtype(image.dtype, np.integer):
+        np.rint(binned, out=binned)
+    return binned.astype(image.dtype, copy=False)
+
+
+@dataclass(frozen=True)
+class LiveViewFrameGeometry:
+    """ Where the pixels of a frame delivered to a LiveViewSubscription are
+    on the sensor. """
+
+    x: float
+    """ Sensor x coordinate of the centre of the first pixel. """
+
+    y: float
+    """ Sensor y coordinate of the centre of the first pixel. """
+
+    step: int
+    """ Distance between the centres of neighbouring pixels, in sensor
+    pixels. """
+
+    roi: Optional[Tuple[int, int, int, int]]
+    """ The ROI the frame was cropped to, None if it covers the whole
+    sensor. """
+
+    sourceShape: Tuple[int, ...]
+    """ Shape of the frame before it was cropped and reduced. """
+
+
+class LiveViewSubscription(SignalInterface):
+    """ A consumer of live view frames with its own maximum rate, ROI,
+    binning and decimation. Created by DetectorsManager.subscribeLiveView.
+    The settings may be changed at any time; frames are cropped and reduced
+    in the live view thread, before they are handed to the GUI thread. """
+
+    sigImageUpdated = Signal(
+        str, np.ndarray, bool, bool
+    )  # (detectorName, image, init, isCurrentDetector)
+
+    def __init__(self, maxRate=None, roi=None, decimation=1, binning=1):
+        super().__init__()
+        self.maxRate = maxRate  # Frames per second per detector, None for no limit
+        self.roi = roi  # (x, y, width, height), None for the full frame
+        self.decimation = decimation
+        self.binning = binning
+        self._lastDeliveryTimes = {}
+        self._frameGeometries = {}
+        self._callbacks = []
+
+    def addCallback(self, callback):
+        """ Adds a function that is called with the same arguments as
+        sigImageUpdated, directly in the thread the frames are delivered in.
+        For consumers that don't run a Qt event loop, such as the web
+        server. """
+        self._callbacks = self._callbacks + [callback]
+
+    def getFrameGeometry(self, detectorName) -> Optional[LiveViewFrameGeometry]:
+        """ Returns the geometry of the latest frame delivered for the
+        detector, or None if no frame has been delivered. Matches the frame
+        passed to sigImageUpdated while the signal is being handled. """
+        return self._frameGeometries.get(detectorName)
+
+    def _prepare(self, detectorName, image, init):
+        """ Returns the frame cropped and reduced according to the current
+        settings, together with its geometry, or None if it should be
+        skipped to respect maxRate. """
+        now = perf_counter()
+        if (self.maxRate and init and
+                now - self._lastDeliveryTimes.get(detectorName, -np.inf) < 1 / self.maxRate):
+            return None
+
+        self._lastDeliveryTimes[detectorName] = now
+        roi, binning, decimation = self.roi, max(int(self.binning), 1), self.decimation
+        sourceShape = image.shape
+        x, y = 0, 0
+        if roi is not None:
+            x, y, width, height = roi
+            image = image[y:y + height, x:x + width]
+        image = binImage(image, binning)
+        if decimation > 1:
+            image = image[::decimation, ::decimation]
+
+        firstPixelOffset = (binning - 1) / 2
+        geometry = LiveViewFrameGeometry(x=x + firstPixelOffset, y=y + firstPixelOffset,
+                                         step=binning * decimation, roi=roi,
+                                         sourceShape=sourceShape)
+        return image, geometry
+
+    def _deliver(self, detectorName, image, init, isCurrentDetector, geometry):
+        self._frameGeometries[detectorName] = geometry
+        self.sigImageUpdated.emit(detectorName, image, init, isCurrentDetector)
+        for callback in self._callbacks:
+            callback(detectorName, image, init, isCurrentDetector)
+
+
+class LiveViewDispatcher(SignalInterface):
+    """ Forwards live view frames from the live view thread to
+    sigImageUpdated of the DetectorsManager and to the live view
+    subscriptions, in the thread the DetectorsManager lives in. Frames are
+    kept in a mailbox with one slot per detector; while a delivery is
+    pending, newer frames replace older ones instead of queueing up, so a busy
+    GUI always gets the latest frame and never a backlog. """
+
+    _sigDeliveryRequested = Signal()
+
+    def __init__(self, detectorsManager):
+        super().__init__()
+        self._detectorsManager = detectorsManager
+        self._subscriptions = []
+        self._pending = {}
+        self._deliveryRequested = False
+        self._lock = threading.Lock()
+        self._sigDeliveryRequested.connect(self._deliver)
+
+    def addSubscription(self, subscription):
+        self._subscriptions = self._subscriptions + [subscription]
+
+    def removeSubscription(self, subscription):
+        self._subscriptions = [s for s in self._subscriptions if s is not subscription]
+
+    def post(self, detectorName, image, init):
+        """ Queues a frame for delivery, replacing any frame of the same
+        detector that has not been delivered yet. The frames for the
+        subscriptions are prepared right away, in the calling thread. May be
+        called from any thread. """
+        subscriptionFrames = {}
+        for subscription in self._subscriptions:
+            prepared = subscription._prepare(detectorName, image, init)
+            if prepared is not None:
+                subscriptionFrames[subscription] = prepared
+
+        with self._lock:
+            if detectorName in self._pending:
+                _, pendingInit, pendingSubscriptionFrames = self._pending[detectorName]
+                # Keep the first-frame flag of a coalesced frame, so it isn't lost, as well as
+                # the frames of subscriptions that skip the new one
+                init = init and pendingInit
+                subscriptionFrames = {**pendingSubscriptionFrames, **subscriptionFrames}
+            self._pending[detectorName] = (image, init, subscriptionFrames)
+            if self._deliveryRequested:
+                return
+            self._deliveryRequested = True
+        self._sigDeliveryRequested.emit()
+
+    def _deliver(self):
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            self._deliveryRequested = False
+
+        currentDetectorName = self._detectorsManager.getCurrentDetectorName()
+        for detectorName, (image, init, subscriptionFrames) in pending.items():
+            isCurrentDetector = detectorName == currentDetectorName
+            self._detectorsManager.sigImageUpdated.emit(detectorName, image, init,
+                                                        isCurrentDetector)
+            for subscription in self._subscriptions:
+                if subscription in subscriptionFrames:
+                    subscriptionImage, geometry = subscriptionFrames[subscription]
+                    subscription._deliver(detectorName, subscriptionImage, init,
+                                          isCurrentDetector, geometry)
+
 
 class LVWorker(Worker):
     def __init__(self, detectorsManager, updatePeriod):
@@ -166,13 +412,9 @@ class LVWorker(Worker):
         self._vtimer = None
 
     def run(self):
-        self._detectorsManager.execOnAll(lambda c: c.updateLatestFrame(False),
-                                         condition=lambda c: c.forAcquisition)
+        self._detectorsManager._pollLiveView(False)
         self._vtimer = Timer()
-        self._vtimer.timeout.connect(
-            lambda: self._detectorsManager.execOnAll(lambda c: c.updateLatestFrame(True),
-                                                     condition=lambda c: c.forAcquisition)
-        )
+        self._vtimer.timeout.connect(lambda: self._detectorsManager._pollLiveView(True))
         self._vtimer.start(self._updatePeriod)
 
     def stop(self):
@@ -45,13 +45,15 @@ class ESP32LEDMatrixManager(LEDMatrixManager):
     def setAll(self, state=(0,0,0), intensity=None):
         # dealing with on or off,
         # intensity is adjjusting the global value
-        self.mLEDmatrix.setAll(state, intensity)
+        self._rs232manager.submit(self.mLEDmatrix.setAll, state, intensity,
+                                  coalesceKey=(self.name(), 'all'))
 
     def setPattern(self, pattern):
-        self.mLEDmatrix.pattern(pattern)
+        self._rs232manager.submit(self.mLEDmatrix.pattern, pattern,
+                                  coalesceKey=(self.name(), 'pattern'))
     
     def getPattern(self):
-        return self.mLEDmatrix.getPattern()
+        return self._rs232manager.scheduler.call(self.mLEDmatrix.getPattern)
 
     def setEnabled(self, enabled):
         """Turn on (N) or off (F) LEDMatrix emission"""
@@ -60,12 +62,34 @@ class ESP32LEDMatrixManager(LEDMatrixManager):
     def setLEDSingle(self, indexled=0, state=(0,0,0)):
         """Handles output power.
         Sends a RS232 command to the LEDMatrix specifying the new intensity.
+        LEDs that are set while others are still queued are sent together
+        as one pattern.
         """
-        self.mLEDmatrix.setSingle(indexled, state=state)
+        self._rs232manager.submit(self._setLEDs, {indexled: state},
+                                  coalesceKey=(self.name(), 'single'), merge=self._mergeLEDs)
 
     def setLEDIntensity(self, intensity=(0,0,0)):
-        self.mLEDmatrix.setIntensity(intensity)
-
+        self._rs232manager.submit(self.mLEDmatrix.setIntensity, intensity,
+                                  coalesceKey=(self.name(), 'intensity'))
+
+    def _setLEDs(self, states):
+        """ Sends the states of the given LEDs, by index. Runs on the I/O
+        thread of the board. """
+        if len(states) == 1:
+            (indexled, state), = states.items()
+            return self.mLEDmatrix.setSingle(indexled, state=state)
+
+        # Several LEDs are sent as one pattern, which only takes a single round trip
+        pattern = np.array(self.mLEDmatrix.getPattern())
+        for indexled, state in states.items():
+            pattern[indexled] = state
+        return self.mLEDmatrix.pattern(pattern)
+
+    @staticmethod
+    def _mergeLEDs(previous, new):
+        (previousStates,), _ = previous
+        (newStates,), kwargs = new
+        return ({**previousStates, **newStates},), kwargs
 
 
 # Copyright (C) 2020-2021 ImSwitch developers
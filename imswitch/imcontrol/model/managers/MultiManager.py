@@ -1,5 +1,7 @@
 import importlib
+import threading
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, wait
 from imswitch.imcommon.model import initLogger
 
 from imswitch.imcommon.model import pythontools
@@ -45,15 +47,53 @@ class MultiManager(ABC):
         self._validateManagedDeviceName(managedDeviceName)
         return func(self._subManagers[managedDeviceName])
 
-    def execOnAll(self, func, *, condition=None):
+    def execOnAll(self, func, *, condition=None, parallel=False, timeout=None):
         """ Executes a function on all sub-managers and returns the
-        results. """
+        results.
+
+        If parallel is True, the function is executed on the sub-managers
+        concurrently in a thread pool, so that the call takes as long as the
+        slowest device rather than the sum of all devices. Calls that have not
+        finished after timeout seconds are given up on (they keep running in
+        the background). Failures are collected and raised together as a
+        MultiManagerError once all calls have finished or timed out. """
         if condition is None:
             def condition(_): return True
 
-        return {managedDeviceName: func(subManager)
-                for managedDeviceName, subManager in self._subManagers.items()
-                if condition(subManager)}
+        subManagers = {managedDeviceName: subManager
+                       for managedDeviceName, subManager in self._subManagers.items()
+                       if condition(subManager)}
+        if not parallel:
+            return {managedDeviceName: func(subManager)
+                    for managedDeviceName, subManager in subManagers.items()}
+
+        results = {}
+        errors = {}
+        if len(subManagers) == 1 and timeout is None:
+            # Not worth a round trip through the thread pool
+            (managedDeviceName, subManager), = subManagers.items()
+            try:
+                results[managedDeviceName] = func(subManager)
+            except Exception as e:
+                errors[managedDeviceName] = e
+        elif len(subManagers) > 0:
+            executor = _getExecutor()
+            futures = {managedDeviceName: executor.submit(func, subManager)
+                       for managedDeviceName, subManager in subManagers.items()}
+            wait(futures.values(), timeout=timeout)
+            for managedDeviceName, future in futures.items():
+                if not future.done():
+                    errors[managedDeviceName] = TimeoutError(
+                        f'Did not finish within {timeout} s'
+                    )
+                elif future.exception() is not None:
+                    errors[managedDeviceName] = future.exception()
+                else:
+                    results[managedDeviceName] = future.result()
+
+        if errors:
+            raise MultiManagerError(errors, results)
+        return results
 
     def finalize(self):
         """ Close/cleanup sub-managers. """
@@ -75,12 +115,43 @@ class MultiManager(ABC):
         yield from self._subManagers.items()
 
 
+_executor = None
+_executorLock = threading.Lock()
+
+
+def _getExecutor():
+    """ Returns the thread pool used by execOnAll, creating it on first use.
+    The pool is shared by all managers and lives as long as the process, so
+    that execOnAll keeps working when called from finalizers of managers that
+    are being garbage collected. """
+    global _executor
+    with _executorLock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(thread_name_prefix='MultiManager')
+        return _executor
+
+
 class NoSuchSubManagerError(RuntimeError):
     """ Error raised when a function related to a sub-manager is called if the
     sub-manager is not managed by the MultiManager. """
     pass
 
 
+class MultiManagerError(RuntimeError):
+    """ Error raised by execOnAll in parallel mode when the function failed or
+    timed out on one or more sub-managers. errors maps the names of those
+    devices to the exceptions raised, and results contains the results from
+    the devices on which the function succeeded. """
+
+    def __init__(self, errors, results):
+        self.errors = errors
+        self.results = results
+        super().__init__(
+            'Failed on ' + ', '.join(f'"{managedDeviceName}" ({type(e).__name__}: {e})'
+                                     for managedDeviceName, e in errors.items())
+        )
+
+
 # Copyright (C) 2020-2021 ImSwitch developers
 # This file is part of ImSwitch.
 #
@@ -1,12 +1,40 @@
+from typing import Dict
+
 from .MultiManager import MultiManager
+from ..PositionMonitor import PositionMonitor
 
 
 class PositionersManager(MultiManager):
     """ PositionersManager interface for dealing with PositionerManagers. It is
-    a MultiManager for positioners. """
+    a MultiManager for positioners.
+
+    Each positioner has a PositionMonitor that caches its position, polled in
+    the background at the positionPollingRate of the positioner. """
 
     def __init__(self, positionerInfos, **lowLevelManagers):
         super().__init__(positionerInfos, 'positioners', **lowLevelManagers)
+        self._positionMonitors = {
+            positionerName: PositionMonitor(
+                positioner, rate=positionerInfos[positionerName].positionPollingRate
+            )
+            for positionerName, positioner in self
+        }
+
+    def getPositionMonitor(self, positionerName: str) -> PositionMonitor:
+        """ Returns the PositionMonitor of the specified positioner. """
+        self._validateManagedDeviceName(positionerName)
+        return self._positionMonitors[positionerName]
+
+    def getCachedPositions(self) -> Dict[str, Dict[str, float]]:
+        """ Returns the cached position of every positioner, without reading
+        it from the hardware. """
+        return {positionerName: monitor.position
+                for positionerName, monitor in self._positionMonitors.items()}
+
+    def finalize(self):
+        for monitor in self._positionMonitors.values():
+            monitor.stop()
+        super().finalize()
 
 
 # Copyright (C) 2020-2021 ImSwitch developers
@@ -1,6 +1,10 @@
+import collections
 import enum
 import os
+import threading
 import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from typing import Dict, Optional, Type
 
@@ -8,6 +12,12 @@ import debugpy
 
 import h5py
 import zarr
+from numcodecs import Blosc
+try:
+    import hdf5plugin
+    isHdf5plugin = True
+except ImportError:
+    isHdf5plugin = False
 import numpy as np
 import tifffile as tiff
 import cv2
@@ -17,6 +27,7 @@ from imswitch.imcommon.model import initLogger
 import abc
 import logging
 
+from imswitch.imcontrol.model.FrameRingBuffer import FrameMetadata
 from imswitch.imcontrol.model.managers.DetectorsManager import DetectorsManager
 
 logger = logging.getLogger(__name__)
@@ -76,6 +87,203 @@ class ZarrStorer(Storer):
                 logger.info(f"Saved image to zarr file {path}")
 
 
+class OMEZarrStorer(Storer):
+    """ A storer that streams frames into an OME-NGFF (v0.4) Zarr store, with
+    one multiscale image of shape (t, c, z, y, x) per detector. Chunks span
+    several frames so that long recordings don't produce millions of tiny
+    files, and downsampled pyramid levels are generated in the background
+    while the recording is running. """
+
+    def __init__(self, filepath, detectorManager, chunkFrames=8, chunkSize=(1024, 1024),
+                 numLevels=3, compressor=None):
+        """
+        Args:
+            filepath: Path of the store, without the .ome.zarr extension.
+            detectorManager: The DetectorsManager of the detectors to store.
+            chunkFrames: Number of frames (t) per chunk.
+            chunkSize: Chunk size in (y, x).
+            numLevels: Number of resolution levels, including full
+              resolution. Each level is downsampled by 2 in y and x.
+            compressor: numcodecs compressor to use. Defaults to Blosc zstd
+              with bit shuffling.
+        """
+        super().__init__(filepath, detectorManager)
+        self.chunkFrames = chunkFrames
+        self.chunkSize = chunkSize
+        self.numLevels = numLevels
+        self.compressor = compressor if compressor is not None else Blosc(
+            cname='zstd', clevel=3, shuffle=Blosc.BITSHUFFLE
+        )
+
+        self.path = f'{filepath}.ome.zarr'
+        self._store = zarr.storage.DirectoryStore(self.path, dimension_separator='/')
+        self._root = zarr.group(store=self._store)
+        self._groupsLock = threading.Lock()
+        self._images = {}
+        self._pyramidExecutor = ThreadPoolExecutor(max_workers=1,
+                                                   thread_name_prefix='OMEZarrPyramid')
+
+    def snap(self, images: Dict[str, np.ndarray], attrs: Dict[str, str] = None):
+        for channel, image in images.items():
+            self.stream({channel: image[np.newaxis]}, attrs=attrs)
+        self.close()
+        logger.info(f"Saved image to OME-Zarr store {self.path}")
+
+    def stream(self, data: Dict[str, np.ndarray] = None, attrs: Dict[str, dict] = None,
+               frameMetadata: Dict[str, FrameMetadata] = None, **kwargs):
+        """ Appends frames, given as {detectorName: frames} with frames of
+        shape (numFrames, y, x) or (numFrames, y, x, c), to the store. Frames
+        of different detectors may be streamed from different threads. If
+        frameMetadata is given, the frame IDs and timestamps are stored as 1D
+        arrays next to the resolution levels. """
+        for channel, frames in data.items():
+            with self._groupsLock:
+                if channel not in self._images:
+                    self._images[channel] = self._createImage(
+                        channel, frames, attrs.get(channel) if attrs else None
+                    )
+            image = self._images[channel]
+            if frameMetadata is not None and channel in frameMetadata:
+                writeFrameMetadata(image.group, image.numFrames, frameMetadata[channel])
+            image.append(frames)
+
+    def close(self):
+        """ Writes any buffered frames, waits for the pyramid levels to be
+        generated and finalizes the metadata. """
+        for image in self._images.values():
+            image.flush()
+        self._pyramidExecutor.shutdown(wait=True)
+        for image in self._images.values():
+            image.group.attrs['writing'] = False
+        self._store.close()
+
+    def _createImage(self, channel, frames, attrs):
+        group = self._root.create_group(channel, overwrite=True)
+        if attrs is not None:
+            group.attrs['ImSwitchData'] = attrs
+        group.attrs['detector_name'] = channel
+        group.attrs['writing'] = True
+
+        pixelSizeUm = np.atleast_1d(self.detectorManager[channel].pixelSizeUm)
+        if len(pixelSizeUm) < 3:
+            pixelSizeUm = np.array([1, pixelSizeUm[-1], pixelSizeUm[-1]])
+
+        return _OMEZarrImage(group, channel, frames, pixelSizeUm.tolist(), self.chunkFrames,
+                             self.chunkSize, self.numLevels, self.compressor,
+                             self._pyramidExecutor)
+
+
+class _OMEZarrImage:
+    """ A single multiscale image in an OMEZarrStorer. """
+
+    def __init__(self, group, name, firstFrames, pixelSizeUm, chunkFrames, chunkSize,
+                 numLevels, compressor, pyramidExecutor):
+        self.group = group
+        self._chunkFrames = chunkFrames
+        self._pyramidExecutor = pyramidExecutor
+        self._numWritten = 0
+        self.numFrames = 0  # Including frames that are staged but not yet written
+
+        numChannels = firstFrames.shape[3] if firstFrames.ndim > 3 else 1
+        height, width = firstFrames.shape[1:3]
+        self._levels = []
+        datasets = []
+        for level in range(numLevels):
+            factor = 2 ** level
+            levelShape = (max(height // factor, 1), max(width // factor, 1))
+            self._levels.append(group.create_dataset(
+                str(level), shape=(0, numChannels, 1, *levelShape),
+                chunks=(chunkFrames, 1, 1, min(chunkSize[0], levelShape[0]),
+                        min(chunkSize[1], levelShape[1])),
+                dtype=firstFrames.dtype, compressor=compressor, dimension_separator='/'
+            ))
+            datasets.append({
+                'path': str(level),
+                'coordinateTransformations': [{
+                    'type': 'scale',
+                    'scale': [1.0, 1.0, float(pixelSizeUm[0]),
+                              float(pixelSizeUm[1]) * factor, float(pixelSizeUm[2]) * factor]
+                }]
+            })
+
+        group.attrs['multiscales'] = [{
+            'version': '0.4',
+            'name': name,
+            'axes': [
+                {'name': 't', 'type': 'time', 'unit': 'second'},
+                {'name': 'c', 'type': 'channel'},
+                {'name': 'z', 'type': 'space', 'unit': 'micrometer'},
+                {'name': 'y', 'type': 'space', 'unit': 'micrometer'},
+                {'name': 'x', 'type': 'space', 'unit': 'micrometer'}
+            ],
+            'datasets': datasets,
+            'type': 'mean'
+        }]
+
+        self._staging = np.empty((chunkFrames, *self._levels[0].shape[1:]),
+                                 dtype=firstFrames.dtype)
+        self._numStaged = 0
+
+    def append(self, frames):
+        self.numFrames += len(frames)
+        frames = self._toTCZYX(frames)
+        pos = 0
+        while pos < len(frames):
+            numToStage = min(len(frames) - pos, self._chunkFrames - self._numStaged)
+            self._staging[self._numStaged:self._numStaged + numToStage] = \
+                frames[pos:pos + numToStage]
+            self._numStaged += numToStage
+            pos += numToStage
+            if self._numStaged == self._chunkFrames:
+                self._writeStaged()
+
+    def flush(self):
+        if self._numStaged > 0:
+            self._writeStaged()
+
+    def _writeStaged(self):
+        block = self._staging[:self._numStaged].copy()
+        start = self._numWritten
+        fullRes = self._levels[0]
+        fullRes.resize(start + len(block), *fullRes.shape[1:])
+        fullRes[start:start + len(block)] = block
+        self._numWritten += len(block)
+        self._numStaged = 0
+
+        if len(self._levels) > 1:
+            self._pyramidExecutor.submit(self._writePyramid, start, block)
+
+    def _writePyramid(self, start, block):
+        try:
+            for level in self._levels[1:]:
+                block = downsampleMean(block, level.shape[-2:])
+                level.resize(max(level.shape[0], start + len(block)), *level.shape[1:])
+                level[start:start + len(block)] = block
+        except Exception:
+            logger.error(f'Failed to write pyramid levels: {traceback.format_exc()}')
+
+    @staticmethod
+    def _toTCZYX(frames):
+        if frames.ndim > 3:  # (t, y, x, c)
+            return np.moveaxis(frames, -1, 1)[:, :, np.newaxis]
+        return frames[:, np.newaxis, np.newaxis]
+
+
+def downsampleMean(block, shape):
+    """ Downsamples the last two axes of block by 2 by averaging 2x2 pixel
+    blocks, cropped/padded to the specified (y, x) shape. """
+    height, width = block.shape[-2:]
+    evenBlock = block[..., :height - height % 2, :width - width % 2]
+    reduced = evenBlock.reshape(*evenBlock.shape[:-2], evenBlock.shape[-2] // 2, 2,
+                                evenBlock.shape[-1] // 2, 2).mean(axis=(-3, -1))
+    reduced = reduced[..., :shape[0], :shape[1]]
+    if reduced.shape[-2:] != tuple(shape):
+        padding = [(0, 0)] * (reduced.ndim - 2) + [(0, shape[0] - reduced.shape[-2]),
+                                                     (0, shape[1] - reduced.shape[-1])]
+        reduced = np.pad(reduced, padding, mode='edge')
+    return reduced.astype(block.dtype)
+
+
 class HDF5Storer(Storer):
     """ A storer that stores the images in a series of hd5 files """
 
@@ -135,18 +343,183 @@ class SaveFormat(enum.Enum):
     TIFF = 2
     ZARR = 3
     MP4 = 4
+    OME_ZARR = 5
+
+
+HDF5_COMPRESSIONS = ['blosc-lz4', 'lz4', 'gzip', 'lzf']
 
 
 DEFAULT_STORER_MAP: Dict[str, Type[Storer]] = {
     SaveFormat.ZARR: ZarrStorer,
     SaveFormat.HDF5: HDF5Storer,
     SaveFormat.TIFF: TiffStorer,
-    SaveFormat.MP4: MP4Storer
+    SaveFormat.MP4: MP4Storer,
+    SaveFormat.OME_ZARR: OMEZarrStorer
 }
 
 
 
 
+class PreallocatedHDF5Dataset:
+    """ An HDF5 dataset that is allocated up front for a known number of
+    frames. The dataset is created when the first frames arrive, so that it
+    keeps the native dtype and frame shape of the detector (e.g. uint8,
+    uint16 or RGB). Frames are staged and written one whole chunk at a time,
+    so HDF5 never has to resize the dataset or read back partial chunks. """
+
+    def __init__(self, group, name, numFrames, attrs, compression=None,
+                 chunkBytes=4 * 1024 ** 2):
+        """
+        Args:
+            group: HDF5 file or group to create the dataset in.
+            name: Name of the dataset.
+            numFrames: Number of frames to allocate.
+            attrs: Attributes to set on the dataset once it is created.
+            compression: None, or one of HDF5_COMPRESSIONS.
+            chunkBytes: Approximate target size of a chunk in bytes. A chunk
+              always holds a whole number of frames.
+        """
+        self._group = group
+        self._name = name
+        self._numFrames = numFrames
+        self._attrs = attrs
+        self._compressionArgs = getHDF5CompressionArgs(compression)
+        self._chunkBytes = chunkBytes
+
+        self._dataset = None
+        self._staging = None
+        self._numStaged = 0
+        self._numWritten = 0
+
+    @property
+    def dataset(self):
+        """ The underlying h5py dataset, or None if no frames have been written
+        yet. """
+        return self._dataset
+
+    def write(self, it, frames):
+        """ Writes frames starting at frame index it. Frames must be written
+        in order. """
+        if self._dataset is None:
+            self._create(frames.shape[1:], frames.dtype)
+
+        if it != self._numWritten + self._numStaged:
+            raise ValueError(f'Expected frame {self._numWritten + self._numStaged}, got {it}')
+
+        n = min(len(frames), self._numFrames - it)
+        framesPerChunk = self._dataset.chunks[0]
+        pos = 0
+        while pos < n:
+            if self._numStaged == 0 and n - pos >= framesPerChunk:
+                # Whole chunk available, write it without staging
+                self._writeChunk(frames[pos:pos + framesPerChunk], framesPerChunk)
+                pos += framesPerChunk
+                continue
+
+            numToStage = min(n - pos, framesPerChunk - self._numStaged)
+            self._staging[self._numStaged:self._numStaged + numToStage] = \
+                frames[pos:pos + numToStage]
+            self._numStaged += numToStage
+            pos += numToStage
+            if self._numStaged == framesPerChunk:
+                self._writeChunk(self._staging, framesPerChunk)
+                self._numStaged = 0
+
+    def close(self, defaultShape, defaultDtype):
+        """ Writes any staged frames and trims the dataset to the number of
+        frames actually written. If no frames were written, an empty dataset
+        with frames of defaultShape and defaultDtype is created. """
+        if self._dataset is None:
+            self._create(defaultShape, np.dtype(defaultDtype))
+
+        if self._numStaged > 0:
+            self._writeChunk(self._staging, self._numStaged)
+            self._numStaged = 0
+
+        if self._numWritten < self._numFrames:
+            self._dataset.resize(self._numWritten, axis=0)
+        self._staging = None
+
+    def _create(self, frameShape, dtype):
+        frameBytes = int(np.prod(frameShape)) * np.dtype(dtype).itemsize
+        framesPerChunk = int(max(1, min(self._numFrames, self._chunkBytes // max(frameBytes, 1))))
+        chunks = (framesPerChunk, *frameShape)
+
+        self._dataset = self._group.create_dataset(
+            self._name, (self._numFrames, *frameShape), maxshape=(None, *frameShape),
+            chunks=chunks, dtype=dtype, **self._compressionArgs
+        )
+        for key, value in self._attrs.items():
+            try:
+                self._dataset.attrs[key] = value
+            except Exception:
+                pass
+
+        self._staging = np.empty(chunks, dtype=dtype)
+
+    def _writeChunk(self, data, numFrames):
+        start = self._numWritten
+        if numFrames == self._dataset.chunks[0] and not self._compressionArgs:
+            # Chunk-aligned and unfiltered, so the bytes can go straight to the file
+            offset = (start,) + (0,) * (self._dataset.ndim - 1)
+            self._dataset.id.write_direct_chunk(
+                offset, np.ascontiguousarray(data[:numFrames], dtype=self._dataset.dtype)
+            )
+        else:
+            self._dataset.write_direct(np.ascontiguousarray(data[:numFrames],
+                                                            dtype=self._dataset.dtype),
+                                       dest_sel=np.s_[start:start + numFrames])
+        self._numWritten += numFrames
+
+
+FRAME_METADATA_GROUP = 'frame_metadata'
+""" Group of HDF5 and Zarr recordings that holds the frame metadata of each
+image dataset, in a subgroup named like the dataset. """
+
+FRAME_METADATA_FIELDS = {
+    'frame_ids': ('frameIds', np.int64),
+    'host_timestamps': ('hostTimestamps', np.float64),
+    'camera_timestamps': ('cameraTimestamps', np.float64)
+}
+
+
+def writeFrameMetadata(group, start, metadata):
+    """ Writes the frame IDs and timestamps of frames start to
+    start + len(metadata) to 1D datasets named frame_ids, host_timestamps and
+    camera_timestamps in group, which may be an h5py or zarr group. The
+    datasets are created if they don't exist yet and grown as needed. """
+    stop = start + len(metadata)
+    for name, (attr, dtype) in FRAME_METADATA_FIELDS.items():
+        if name not in group:
+            if isinstance(group, h5py.Group):
+                group.create_dataset(name, shape=(0,), maxshape=(None,), dtype=dtype,
+                                     chunks=(4096,))
+            else:
+                group.create_dataset(name, shape=(0,), dtype=dtype, chunks=(4096,))
+
+        dataset = group[name]
+        if dataset.shape[0] < stop:
+            dataset.resize((stop,))
+        dataset[start:stop] = getattr(metadata, attr)
+
+
+def getHDF5CompressionArgs(compression):
+    """ Returns the keyword arguments to pass to h5py's create_dataset for the
+    specified compression (None, or one of HDF5_COMPRESSIONS). """
+    if compression is None:
+        return {}
+    if compression not in HDF5_COMPRESSIONS:
+        raise ValueError(f'Unsupported HDF5 compression "{compression}"')
+    if compression in ['gzip', 'lzf']:
+        return {'compression': compression}
+    if not isHdf5plugin:
+        raise ValueError(f'The hdf5plugin package is required for {compression} compression')
+    if compression == 'blosc-lz4':
+        return dict(hdf5plugin.Blosc(cname='lz4', clevel=5, shuffle=hdf5plugin.Blosc.SHUFFLE))
+    return dict(hdf5plugin.LZ4())
+
+
+
 class RecordingManager(SignalInterface):
     """ RecordingManager handles single frame captures as well as continuous
     recordings of detector data. """
@@ -161,6 +534,9 @@ class RecordingManager(SignalInterface):
     sigMemoryRecordingAvailable = Signal(
         str, object, object, bool
     )  # (name, file, filePath, savedToDisk)
+    sigRecordingQueueDepthUpdated = Signal(str, int)  # (detectorName, numQueuedFrames)
+    sigRecordingFramesDropped = Signal(str, int)  # (detectorName, numDroppedFrames)
+    sigRecordingFrameStatsUpdated = Signal(str, float, int)  # (detectorName, fps, numFrameGaps)
 
     def __init__(self, detectorsManager, storerMap: Optional[Dict[str, Type[Storer]]] = None):
         super().__init__()
@@ -188,14 +564,20 @@ class RecordingManager(SignalInterface):
     def detectorsManager(self):
         return self.__detectorsManager
 
+    @property
+    def storerMap(self) -> Dict[str, Type[Storer]]:
+        """ The storer class to use for each save format. """
+        return self.__storerMap
+
     def startRecording(self, detectorNames, recMode, savename, saveMode, attrs,
                        saveFormat=SaveFormat.HDF5, singleMultiDetectorFile=False, singleLapseFile=False,
-                       recFrames=None, recTime=None):
+                       recFrames=None, recTime=None, hdf5Compression=None):
         """ Starts a recording with the specified detectors, recording mode,
         file name prefix and attributes to save to the recording per detector.
         In SpecFrames mode, recFrames (the number of frames) must be specified,
         and in SpecTime mode, recTime (the recording time in seconds) must be
-        specified. """
+        specified. HDF5 recordings can be compressed by setting
+        hdf5Compression to one of HDF5_COMPRESSIONS. """
 
         self.__logger.info('Starting recording')
         self.__record = True
@@ -207,10 +589,12 @@ class RecordingManager(SignalInterface):
         self.__recordingWorker.attrs = attrs
         self.__recordingWorker.recFrames = recFrames
         self.__recordingWorker.recTime = recTime
+        self.__recordingWorker.hdf5Compression = hdf5Compression
         self.__recordingWorker.singleMultiDetectorFile = singleMultiDetectorFile
         self.__recordingWorker.singleLapseFile = singleLapseFile
         self.__detectorsManager.execOnAll(lambda c: c.flushBuffers(),
-                                          condition=lambda c: c.forAcquisition)
+                                          condition=lambda c: c.forAcquisition,
+                                          parallel=True)
         self.__thread.start()
 
     def endRecording(self, emitSignal=True, wait=True):
@@ -219,7 +603,8 @@ class RecordingManager(SignalInterface):
         method will wait until the recording is complete before returning. """
 
         self.__detectorsManager.execOnAll(lambda c: c.flushBuffers(),
-                                          condition=lambda c: c.forAcquisition)
+                                          condition=lambda c: c.forAcquisition,
+                                          parallel=True)
 
         if self.__record:
             self.__logger.info('Stopping recording')
@@ -230,6 +615,14 @@ class RecordingManager(SignalInterface):
         if wait:
             self.__thread.wait()
 
+    def setWriterQueueLimits(self, maxQueueBytes, backpressureTimeout):
+        """ Sets how many bytes of frame data may be queued per detector
+        while waiting to be written to disk, and for how long (in seconds)
+        acquisition is held back when the queue is full before frames are
+        dropped. Takes effect from the next recording. """
+        self.__recordingWorker.maxQueueBytes = maxQueueBytes
+        self.__recordingWorker.backpressureTimeout = backpressureTimeout
+
     def snap(self, detectorNames, savename, saveMode, saveFormat, attrs):
         """ Saves an image with the specified detectors to a file
         with the specified name prefix, save mode, file format and attributes
@@ -327,7 +720,8 @@ class RecordingWorker(Worker):
         super().__init__()
         self.__logger = initLogger(self)
         self.__recordingManager = recordingManager
-        self.__logger = initLogger(self)
+        self.maxQueueBytes = 512 * 1024 ** 2
+        self.backpressureTimeout = 1.0
 
     def run(self):
         acqHandle = self.__recordingManager.detectorsManager.startAcquisition()
@@ -346,7 +740,9 @@ class RecordingWorker(Worker):
         
         currentFrame = {}
         datasets = {}
+        datasetNames = {}
         filenames = {}
+        omeZarrStorer = None
         for detectorName in self.detectorNames:
             currentFrame[detectorName] = 0
 
@@ -359,6 +755,7 @@ class RecordingWorker(Worker):
                     scanNum += 1
                     datasetNameWithScan = f'{datasetName}_scan{scanNum}'
                 datasetName = datasetNameWithScan
+            datasetNames[detectorName] = datasetName
 
             # Initial number of frames must not be 0; otherwise, too much disk space may get
             # allocated. We remove this default frame later on if no frames are captured.
@@ -366,13 +763,27 @@ class RecordingWorker(Worker):
             if len(shape) > 2:
                 shape = shape[-2:]
 
-            if self.saveFormat == SaveFormat.HDF5:
+            if self.saveFormat == SaveFormat.HDF5 and self.recMode in [RecMode.SpecFrames,
+                                                                        RecMode.ScanOnce,
+                                                                        RecMode.ScanLapse]:
+                # The number of frames is known, so allocate them all up front
+                datasetAttrs = dict(self.attrs[detectorName])
+                datasetAttrs['detector_name'] = detectorName
+                # For ImageJ compatibility
+                datasetAttrs['element_size_um'] = \
+                    self.__recordingManager.detectorsManager[detectorName].pixelSizeUm
+                datasets[detectorName] = PreallocatedHDF5Dataset(
+                    files[detectorName], datasetName, self.recFrames, datasetAttrs,
+                    compression=self.hdf5Compression
+                )
+
+            elif self.saveFormat == SaveFormat.HDF5:
                 # Initial number of frames must not be 0; otherwise, too much disk space may get
                 # allocated. We remove this default frame later on if no frames are captured.
                 datasets[detectorName] = files[detectorName].create_dataset(
                     datasetName, (1, *reversed(shape)),
                     maxshape=(None, *reversed(shape)),
-                    dtype='i2'
+                    dtype='i2', **getHDF5CompressionArgs(self.hdf5Compression)
                 )
 
                 for key, value in self.attrs[detectorName].items():
@@ -411,6 +822,19 @@ class RecordingWorker(Worker):
                 filenames[detectorName] = self.__recordingManager.getSaveFilePath(
                     f'{self.savename}_{detectorName}.{fileExtension}', False, False)
 
+            elif self.saveFormat == SaveFormat.OME_ZARR:
+                # All detectors are streamed into the same store, one image per detector
+                if omeZarrStorer is None:
+                    basePath = self.savename
+                    numExisting = 0
+                    while os.path.exists(f'{basePath}.ome.zarr'):
+                        numExisting += 1
+                        basePath = f'{self.savename}_{numExisting}'
+                    omeZarrStorer = self.__recordingManager.storerMap[SaveFormat.OME_ZARR](
+                        basePath, self.__recordingManager.detectorsManager
+                    )
+                datasets[detectorName] = omeZarrStorer
+
             elif self.saveFormat == SaveFormat.ZARR:
                 datasets[detectorName] = files[detectorName].create_dataset(datasetName, shape=(1, *reversed(shape)),
                                                                             dtype='i2', chunks=(1, 512, 512)
@@ -424,6 +848,35 @@ class RecordingWorker(Worker):
                 datasets[detectorName].attrs['writing'] = True
 
 
+        self._datasets = datasets
+        self._filenames = filenames
+        self._metadataGroups = {}
+        if self.saveFormat == SaveFormat.HDF5 or self.saveFormat == SaveFormat.ZARR:
+            # Frame IDs and timestamps go into a group of their own, so that the image datasets
+            # remain the only datasets at the root of the file
+            self._metadataGroups = {
+                detectorName: files[detectorName].require_group(
+                    f'{FRAME_METADATA_GROUP}/{datasetNames[detectorName]}'
+                )
+                for detectorName in self.detectorNames
+            }
+        self._writers = {
+            detectorName: FrameQueueWriter(
+                detectorName,
+                lambda it, frames, metadata, detectorName=detectorName: self._writeFrames(
+                    detectorName, it, frames, metadata
+                ),
+                maxQueueBytes=self.maxQueueBytes, timeout=self.backpressureTimeout
+            )
+            for detectorName in self.detectorNames
+        }
+        self._reportedQueueDepths = {detectorName: 0 for detectorName in self.detectorNames}
+        self._reportedDroppedFrames = {detectorName: 0 for detectorName in self.detectorNames}
+        self._frameStats = {detectorName: FrameStatistics() for detectorName in self.detectorNames}
+        self._lastFrameStatsReport = 0
+        for writer in self._writers.values():
+            writer.start()
+
         self.__recordingManager.sigRecordingStarted.emit()
         try:
             if len(self.detectorNames) < 1:
@@ -438,53 +891,17 @@ class RecordingWorker(Worker):
                 while (self.__recordingManager.record and
                        any([currentFrame[detectorName] < recFrames
                             for detectorName in self.detectorNames])):
+                    gotFrames = False
                     for detectorName in self.detectorNames:
                         if currentFrame[detectorName] >= recFrames:
                             continue  # Reached requested number of frames with this detector, skip
 
-                        newFrames = self._getNewFrames(detectorName)
-                        n = len(newFrames)
-
-                        if n > 0:
+                        newFrames, metadata = self._getNewFrames(detectorName)
+                        if len(newFrames) > 0:
+                            gotFrames = True
                             it = currentFrame[detectorName]
-                            if self.saveFormat == SaveFormat.TIFF:
-                                try:
-                                    filePath = filenames[detectorName]
-                                    tiff.imwrite(filePath, newFrames, append=True)
-                                except ValueError:
-                                    self.__logger.error("TIFF File exceeded 4GB.")
-                                    if self.saveFormat == SaveFormat.TIFF:
-                                        filePath = self.__recordingManager.getSaveFilePath(
-                                            f'{self.savename}_{detectorName}.{fileExtension}', False, False)
-                                        continue
-                            elif self.saveFormat == SaveFormat.HDF5:
-                                dataset = datasets[detectorName]
-                                if (it + n) <= recFrames:
-                                    dataset.resize(n + it, axis=0)
-                                    dataset[it:it + n, :, :] = newFrames
-                                    currentFrame[detectorName] += n
-                                else:
-                                    dataset.resize(recFrames, axis=0)
-                                    dataset[it:recFrames, :, :] = newFrames[0:recFrames - it]
-                                    currentFrame[detectorName] = recFrames
-                            elif self.saveFormat == SaveFormat.ZARR:
-                                dataset = datasets[detectorName]
-                                if it == 0:
-                                    dataset[0, :, :] = newFrames[0, :, :]
-                                    if n > 0:
-                                        dataset.append(newFrames[1:n, :, :])
-                                else:
-                                    dataset.append(newFrames)
-                                currentFrame[detectorName] += n
-                            elif self.saveFormat == SaveFormat.MP4:
-                                for iframe in range(n):
-                                    frame = newFrames[iframe,:,:]
-                                    #https://stackoverflow.com/questions/30509573/writing-an-mp4-video-using-python-opencv
-                                    frame = cv2.cvtColor(cv2.convertScaleAbs(frame), cv2.COLOR_GRAY2BGR)
-                                    self.__logger.debug(type(frame))
-
-                                    datasets[detectorName].write(frame)
-                                    
+                            self._pushFrames(detectorName, newFrames[0:recFrames - it],
+                                             metadata[0:recFrames - it], currentFrame)
 
                             # Things get a bit weird if we have multiple detectors when we report
                             # the current frame number, since the detectors may not be synchronized.
@@ -492,7 +909,8 @@ class RecordingWorker(Worker):
                             self.__recordingManager.sigRecordingFrameNumUpdated.emit(
                                 min(list(currentFrame.values()))
                             )
-                    time.sleep(0.0001)  # Prevents freezing for some reason
+                    if not gotFrames:
+                        time.sleep(0.001)  # Nothing new from the detectors, don't spin
 
                 self.__recordingManager.sigRecordingFrameNumUpdated.emit(0)
             elif self.recMode == RecMode.SpecTime:
@@ -504,35 +922,12 @@ class RecordingWorker(Worker):
                 currentRecTime = 0
                 shouldStop = False
                 while True:
+                    gotFrames = False
                     for detectorName in self.detectorNames:
-                        newFrames = self._getNewFrames(detectorName)
-                        n = len(newFrames)
-                        if n > 0:
-                            if self.saveFormat == SaveFormat.TIFF:
-                                try:
-                                    filePath = filenames[detectorName]
-                                    tiff.imwrite(filePath, newFrames, append=True)
-                                except ValueError:
-                                    self.__logger.error("TIFF File exceeded 4GB.")
-                                    if self.saveFormat == SaveFormat.TIFF:
-                                        filePath = self.__recordingManager.getSaveFilePath(
-                                            f'{self.savename}_{detectorName}.{fileExtension}', False, False)
-                                        continue
-                            elif self.saveFormat == SaveFormat.HDF5 or self.saveFormat == SaveFormat.ZARR:
-                                it = currentFrame[detectorName]
-                                dataset = datasets[detectorName]
-                                dataset.resize(n + it, axis=0)
-                                dataset[it:it + n, :, :] = newFrames
-                            elif self.saveFormat == SaveFormat.MP4:
-                                for iframe in range(n):
-                                    frame = newFrames[iframe,:,:]
-                                    #https://stackoverflow.com/questions/30509573/writing-an-mp4-video-using-python-opencv
-                                    frame = cv2.cvtColor(cv2.convertScaleAbs(frame), cv2.COLOR_GRAY2BGR)
-                                    self.__logger.debug(type(frame))
-
-                                    datasets[detectorName].write(frame)
-                                    
-                            currentFrame[detectorName] += n
+                        newFrames, metadata = self._getNewFrames(detectorName)
+                        if len(newFrames) > 0:
+                            gotFrames = True
+                            self._pushFrames(detectorName, newFrames, metadata, currentFrame)
                             self.__recordingManager.sigRecordingTimeUpdated.emit(
                                 np.around(currentRecTime, decimals=2)
                             )
@@ -544,52 +939,19 @@ class RecordingWorker(Worker):
                     if not self.__recordingManager.record or currentRecTime >= recTime:
                         shouldStop = True
 
-                    time.sleep(0.0001)  # Prevents freezing for some reason
+                    if not gotFrames:
+                        time.sleep(0.001)  # Nothing new from the detectors, don't spin
 
                 self.__recordingManager.sigRecordingTimeUpdated.emit(0)
             elif self.recMode == RecMode.UntilStop:
                 shouldStop = False
                 while True:
+                    gotFrames = False
                     for detectorName in self.detectorNames:
-                        newFrames = self._getNewFrames(detectorName)
-                        n = len(newFrames)
-                        if n > 0:
-                            if self.saveFormat == SaveFormat.TIFF:
-                                try:
-                                    filePath = filenames[detectorName]
-                                    tiff.imwrite(filePath, newFrames, append=True)
-                                except ValueError:
-                                    self.__logger.error("TIFF File exceeded 4GB.")
-                                    if self.saveFormat == SaveFormat.TIFF:
-                                        filePath = self.__recordingManager.getSaveFilePath(
-                                            f'{self.savename}_{detectorName}.{fileExtension}', False, False)
-                                        continue
-
-                            elif self.saveFormat == SaveFormat.HDF5:
-                                it = currentFrame[detectorName]
-                                dataset = datasets[detectorName]
-                                dataset.resize(n + it, axis=0)
-                                dataset[it:it + n, :, :] = newFrames
-
-                            elif self.saveFormat == SaveFormat.ZARR:
-                                it = currentFrame[detectorName]
-                                dataset = datasets[detectorName]
-                                if it == 0:
-                                    dataset[0, :, :] = newFrames[0, :, :]
-                                    if n > 0:
-                                        dataset.append(newFrames[1:n, :, :])
-                                else:
-                                    dataset.append(newFrames)
-                            elif self.saveFormat == SaveFormat.MP4:
-                                for iframe in range(n):
-                                    frame = newFrames[iframe,:,:]
-                                    #https://stackoverflow.com/questions/30509573/writing-an-mp4-video-using-python-opencv
-                                    frame = cv2.cvtColor(cv2.convertScaleAbs(frame), cv2.COLOR_GRAY2BGR)
-
-                                    datasets[detectorName].write(frame)
-                                    
-
-                            currentFrame[detectorName] += n
+                        newFrames, metadata = self._getNewFrames(detectorName)
+                        if len(newFrames) > 0:
+                            gotFrames = True
+                            self._pushFrames(detectorName, newFrames, metadata, currentFrame)
 
                     if shouldStop:
                         break
@@ -597,15 +959,37 @@ class RecordingWorker(Worker):
                     if not self.__recordingManager.record:
                         shouldStop = True  # Enter loop one final time, then stop
 
-                    time.sleep(0.0001)  # Prevents freezing for some reason
+                    if not gotFrames:
+                        time.sleep(0.001)  # Nothing new from the detectors, don't spin
             else:
                 raise ValueError('Unsupported recording mode specified')
         finally:
+            # Let the writers drain their queues before the files are closed
+            for writer in self._writers.values():
+                writer.finish()
+            self._reportWriterStatus()
+            self._reportFrameStats(force=True)
+
+            if self.saveFormat == SaveFormat.MP4:
+                for detectorName in self.detectorNames:
+                    datasets[detectorName].release()
+            elif self.saveFormat == SaveFormat.OME_ZARR and omeZarrStorer is not None:
+                omeZarrStorer.close()
 
             if self.saveFormat == SaveFormat.HDF5 or self.saveFormat == SaveFormat.ZARR:
                 for detectorName, file in files.items():
+                    if isinstance(datasets[detectorName], PreallocatedHDF5Dataset):
+                        # No frames to take the shape and dtype from if none were captured, so
+                        # use those of the detector's latest frame
+                        latestFrame = self.__recordingManager.detectorsManager[detectorName].image
+                        if latestFrame is not None and latestFrame.size > 0:
+                            datasets[detectorName].close(latestFrame.shape, latestFrame.dtype)
+                        else:
+                            datasets[detectorName].close(
+                                tuple(reversed(shapes[detectorName][-2:])), np.dtype('i2')
+                            )
                     # Remove default frame if no frames have been captured
-                    if currentFrame[detectorName] < 1:
+                    elif currentFrame[detectorName] < 1:
                         if self.saveFormat == SaveFormat.HDF5:
                             datasets[detectorName].resize(0, axis=0)
 
@@ -626,15 +1010,93 @@ class RecordingWorker(Worker):
                     else:
                         if self.saveFormat == SaveFormat.HDF5:
                             file.close()
-                        elif self.saveFormat == SaveFormat.MP4:
-                            for detectorName, file in files.items():
-                                datasets[detectorName].release()
                         else:
                             datasets[detectorName].attrs['writing'] = False
                             self.store.close()
 
             self.__recordingManager.endRecording(wait=False)
 
+    def _pushFrames(self, detectorName, newFrames, metadata, currentFrame):
+        """ Hands new frames and their metadata over to the writer of the
+        detector and advances the frame counter if they were accepted. """
+        n = len(newFrames)
+        self._frameStats[detectorName].update(metadata)
+        writer = self._writers[detectorName]
+        if n > 0 and writer.put(currentFrame[detectorName], newFrames, metadata):
+            currentFrame[detectorName] += n
+        self._reportWriterStatus()
+        self._reportFrameStats()
+
+    def _reportFrameStats(self, force=False):
+        """ Emits the measured frame rate and number of frame ID gaps of each
+        detector, at most twice per second unless force is true. """
+        now = time.time()
+        if not force and now - self._lastFrameStatsReport < 0.5:
+            return
+
+        self._lastFrameStatsReport = now
+        for detectorName, stats in self._frameStats.items():
+            self.__recordingManager.sigRecordingFrameStatsUpdated.emit(
+                detectorName, stats.fps, stats.numGaps
+            )
+
+    def _reportWriterStatus(self):
+        for detectorName, writer in self._writers.items():
+            queueDepth = writer.queueDepth
+            if queueDepth != self._reportedQueueDepths[detectorName]:
+                self._reportedQueueDepths[detectorName] = queueDepth
+                self.__recordingManager.sigRecordingQueueDepthUpdated.emit(detectorName,
+                                                                           queueDepth)
+
+            droppedFrames = writer.droppedFrames
+            if droppedFrames != self._reportedDroppedFrames[detectorName]:
+                self._reportedDroppedFrames[detectorName] = droppedFrames
+                self.__logger.warning(f'Writer for {detectorName} is falling behind,'
+                                      f' {droppedFrames} frames dropped so far')
+                self.__recordingManager.sigRecordingFramesDropped.emit(detectorName,
+                                                                       droppedFrames)
+
+    def _writeFrames(self, detectorName, it, newFrames, metadata):
+        """ Writes frames and their metadata to the file of the detector,
+        starting at frame index it. Runs on the writer thread of the
+        detector. """
+        n = len(newFrames)
+        if detectorName in self._metadataGroups:
+            writeFrameMetadata(self._metadataGroups[detectorName], it, metadata)
+        if self.saveFormat == SaveFormat.TIFF:
+            try:
+                tiff.imwrite(self._filenames[detectorName], newFrames, append=True)
+            except ValueError:
+                self.__logger.error("TIFF File exceeded 4GB.")
+                fileExtension = str(self.saveFormat.name).lower()
+                self._filenames[detectorName] = self.__recordingManager.getSaveFilePath(
+                    f'{self.savename}_{detectorName}.{fileExtension}', False, False)
+                tiff.imwrite(self._filenames[detectorName], newFrames, append=True)
+        elif self.saveFormat == SaveFormat.HDF5:
+            dataset = self._datasets[detectorName]
+            if isinstance(dataset, PreallocatedHDF5Dataset):
+                dataset.write(it, newFrames)
+                return
+            dataset.resize(n + it, axis=0)
+            dataset[it:it + n, :, :] = newFrames
+        elif self.saveFormat == SaveFormat.ZARR:
+            dataset = self._datasets[detectorName]
+            if it == 0:
+                dataset[0, :, :] = newFrames[0, :, :]
+                if n > 1:
+                    dataset.append(newFrames[1:n, :, :])
+            else:
+                dataset.append(newFrames)
+        elif self.saveFormat == SaveFormat.OME_ZARR:
+            self._datasets[detectorName].stream({detectorName: newFrames}, attrs=self.attrs,
+                                                frameMetadata={detectorName: metadata})
+        elif self.saveFormat == SaveFormat.MP4:
+            for iframe in range(n):
+                frame = newFrames[iframe, :, :]
+                #https://stackoverflow.com/questions/30509573/writing-an-mp4-video-using-python-opencv
+                frame = cv2.cvtColor(cv2.convertScaleAbs(frame), cv2.COLOR_GRAY2BGR)
+                self._datasets[detectorName].write(frame)
+
     def _getFiles(self):
         singleMultiDetectorFile = self.singleMultiDetectorFile
         singleLapseFile = self.recMode == RecMode.ScanLapse and self.singleLapseFile
@@ -679,9 +1141,149 @@ class RecordingWorker(Worker):
         return files, fileDests, filePaths
 
     def _getNewFrames(self, detectorName):
-        newFrames = self.__recordingManager.detectorsManager[detectorName].getChunk()
-        newFrames = np.array(newFrames)
-        return newFrames
+        newFrames, metadata = \
+            self.__recordingManager.detectorsManager[detectorName].getChunkWithMetadata()
+        newFrames = np.asarray(newFrames)  # Chunks from frame buffers are views, don't copy them
+        return newFrames, metadata
+
+
+class FrameQueueWriter:
+    """ Persists the frames of one detector on a dedicated writer thread, so
+    that slow disks do not stall frame acquisition. Frame chunks are buffered
+    in a queue that is bounded by its size in bytes. When the queue is full,
+    put blocks for up to timeout seconds (backpressure on the acquisition
+    side) and drops the chunk if the writer still hasn't caught up. """
+
+    def __init__(self, name, writeFunc, maxQueueBytes=512 * 1024 ** 2, timeout=1.0):
+        """
+        Args:
+            name: Name of the detector the frames belong to.
+            writeFunc: Function ``(startFrameIndex, frames, metadata)`` that
+              persists a chunk of frames. Called from the writer thread, in the order
+              the chunks were put.
+            maxQueueBytes: Maximum number of bytes of frame data to buffer.
+            timeout: How long (in seconds) put may block while the queue is
+              full before the chunk is dropped.
+        """
+        self.__logger = initLogger(self, instanceName=name)
+        self._name = name
+        self._writeFunc = writeFunc
+        self._maxQueueBytes = maxQueueBytes
+        self._timeout = timeout
+
+        self._queue = collections.deque()
+        self._queueBytes = 0
+        self._queueFrames = 0
+        self._droppedFrames = 0
+        self._finished = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=f'FrameQueueWriter-{name}',
+                                        daemon=True)
+
+    @property
+    def queueDepth(self):
+        """ Number of frames waiting to be written. """
+        return self._queueFrames
+
+    @property
+    def droppedFrames(self):
+        """ Number of frames dropped because the queue was full. """
+        return self._droppedFrames
+
+    def start(self):
+        self._thread.start()
+
+    def put(self, it, frames, metadata=None):
+        """ Queues frames, and optionally their FrameMetadata, to be written
+        starting at frame index it. Returns whether the frames were accepted;
+        if not, they have been counted as dropped. Frames that don't own their
+        data, e.g. chunks from a detector's frame buffer, are copied, as the
+        buffer may overwrite them before they are written. """
+        if frames.base is not None:
+            frames = frames.copy()
+        nbytes = frames.nbytes
+        with self._condition:
+            # A chunk larger than the whole queue is accepted once the queue is empty
+            accepted = self._condition.wait_for(
+                lambda: (self._queueBytes + nbytes <= self._maxQueueBytes or
+                         len(self._queue) < 1),
+                timeout=self._timeout
+            )
+            if not accepted:
+                self._droppedFrames += len(frames)
+                return False
+
+            self._queue.append((it, frames, metadata))
+            self._queueBytes += nbytes
+            self._queueFrames += len(frames)
+            self._condition.notify_all()
+            return True
+
+    def finish(self):
+        """ Writes all queued frames and stops the writer thread. """
+        with self._condition:
+            self._finished = True
+            self._condition.notify_all()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: len(self._queue) > 0 or self._finished)
+                if len(self._queue) < 1:
+                    return  # Finished and drained
+                it, frames, metadata = self._queue[0]
+
+            try:
+                self._writeFunc(it, frames, metadata)
+            except Exception:
+                self.__logger.error(f'Failed to write frames {it}-{it + len(frames) - 1}:'
+                                    f' {traceback.format_exc()}')
+
+            with self._condition:
+                self._queue.popleft()
+                self._queueBytes -= frames.nbytes
+                self._queueFrames -= len(frames)
+                self._condition.notify_all()
+
+
+class FrameStatistics:
+    """ Keeps track of the frame rate and of gaps in the frame IDs of the
+    frames received from a detector. The frame rate is measured from the host
+    receive timestamps over a sliding window. """
+
+    def __init__(self, window=1.0):
+        self._window = window
+        self._timestamps = collections.deque()
+        self._lastFrameId = None
+        self.numGaps = 0
+        self.numMissingFrames = 0
+
+    @property
+    def fps(self):
+        """ Frames per second received during the last window seconds. """
+        if len(self._timestamps) < 2 or self._timestamps[-1] <= self._timestamps[0]:
+            return 0.0
+        return (len(self._timestamps) - 1) / (self._timestamps[-1] - self._timestamps[0])
+
+    def update(self, metadata):
+        if len(metadata) < 1:
+            return
+
+        frameIds = metadata.frameIds[metadata.frameIds >= 0]  # Negative means unknown
+        if len(frameIds) > 0:
+            if self._lastFrameId is not None:
+                frameIds = np.concatenate(([self._lastFrameId], frameIds))
+            steps = np.diff(frameIds)
+            gaps = steps > 1
+            self.numGaps += int(np.count_nonzero(gaps))
+            self.numMissingFrames += int(np.sum(steps[gaps] - 1))
+            self._lastFrameId = frameIds[-1]
+
+        self._timestamps.extend(metadata.hostTimestamps.tolist())
+        while self._timestamps[-1] - self._timestamps[0] > self._window:
+            self._timestamps.popleft()
 
 
 class RecMode(enum.Enum):
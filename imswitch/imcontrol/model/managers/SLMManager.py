@@ -1,3 +1,4 @@
+import collections
 import enum
 import glob
 import math
@@ -144,8 +145,11 @@ class SLMManager(SignalInterface):
     def setAberrations(self, aber_info):
         dAberFactors = aber_info["left"]
         tAberFactors = aber_info["right"]
-        self.__masksAber[0].setAberrations(dAberFactors)
-        self.__masksAber[1].setAberrations(tAberFactors)
+        for mask, aberFactors in zip(self.__masksAber, [dAberFactors, tAberFactors]):
+            # Only recompute the half-masks whose aberrations changed
+            if (mask.mask_type != MaskMode.Aber or
+                    getattr(mask, 'aber_params_info', None) != aberFactors):
+                mask.setAberrations(dict(aberFactors))
         # self.__logger.debug(f'Set aberrations on both phase mask.')
 
     def setRadius(self, radius):
@@ -176,6 +180,88 @@ class SLMManager(SignalInterface):
         return returnmask.image()
 
 
+def nollToZernike(j):
+    """ Returns the radial order n and azimuthal frequency m of the Zernike
+    polynomial with Noll index j (starting at 1). Negative m denote sine
+    terms. """
+    n = 0
+    j1 = j - 1
+    while j1 > n:
+        n += 1
+        j1 -= n
+    m = (-1) ** j * ((n % 2) + 2 * int((j1 + ((n + 1) % 2)) / 2))
+    return n, m
+
+
+class ZernikeBasisCache:
+    """ Cache of Zernike bases, i.e. stacks of the Noll-normalized Zernike
+    polynomials evaluated on the pixels of a mask, keyed by the mask shape,
+    center and radius. The polar coordinates are computed once per basis and
+    modes are only added to a basis when a higher Noll index is requested.
+    The least recently used bases are evicted when more than maxSize are
+    cached. """
+
+    def __init__(self, maxSize=4):
+        self.maxSize = maxSize
+        self._bases = collections.OrderedDict()
+
+    def getBasis(self, shape, center, radius, numModes):
+        """ Returns an array of shape (numModes, height, width) with the
+        polynomials with Noll indices 1 to numModes. The array must not be
+        modified. """
+        key = (tuple(shape), tuple(center), radius)
+        basis = self._bases.get(key)
+        if basis is None or len(basis) < numModes:
+            basis = self._computeBasis(shape, center, radius, numModes)
+            self._bases[key] = basis
+        self._bases.move_to_end(key)
+        while len(self._bases) > self.maxSize:
+            self._bases.popitem(last=False)
+        return basis[:numModes]
+
+    @staticmethod
+    def _computeBasis(shape, center, radius, numModes):
+        x, y = np.ogrid[-center[0]:shape[0] - center[0], -center[1]:shape[1] - center[1]]
+        x, y = x / radius, y / radius
+        rho = np.sqrt(x ** 2 + y ** 2)
+        theta = np.arctan2(y, x)
+
+        rhoPowers = {0: np.ones_like(rho)}
+        basis = np.empty((numModes, *shape), dtype=np.float32)
+        for j in range(1, numModes + 1):
+            n, m = nollToZernike(j)
+            radial = np.zeros_like(rho)
+            for k in range((n - abs(m)) // 2 + 1):
+                power = n - 2 * k
+                if power not in rhoPowers:
+                    rhoPowers[power] = rho ** power
+                radial += ((-1) ** k * math.factorial(n - k) /
+                           (math.factorial(k) * math.factorial((n + abs(m)) // 2 - k) *
+                            math.factorial((n - abs(m)) // 2 - k))) * rhoPowers[power]
+            if m == 0:
+                basis[j - 1] = np.sqrt(n + 1) * radial
+            elif m > 0:
+                basis[j - 1] = np.sqrt(2 * (n + 1)) * radial * np.cos(m * theta)
+            else:
+                basis[j - 1] = np.sqrt(2 * (n + 1)) * radial * np.sin(-m * theta)
+        return basis
+
+
+_zernikeBasisCache = ZernikeBasisCache()
+
+aberrationNollIndices = {
+    'tip': 2,
+    'tilt': 3,
+    'defocus': 4,
+    'obliqueAstigmatism': 5,
+    'verticalAstigmatism': 6,
+    'verticalComa': 7,
+    'horizontalComa': 8,
+    'spherical': 11,
+}
+""" Noll indices of the named aberrations of Mask.setAberrations. """
+
+
 class Mask:
     """Class creating a mask to be displayed by the SLM."""
 
@@ -185,6 +271,7 @@ class Mask:
         wavelength is the illumination wavelength in nm"""
         self.__logger = initLogger(self, tryInheritParent=True)
 
+        self._isCircular = False
         self.img = np.zeros((height, width), dtype=np.uint8)
         self.height = height
         self.width = width
@@ -208,10 +295,25 @@ class Mask:
             self.value_max = int(wavelength * 0.45 - 105)
             self.__logger.warning("Caution: a linear approximation has been made")
 
+    @property
+    def img(self):
+        return self._img
+
+    @img.setter
+    def img(self, value):
+        self._img = value
+        self._isCircular = False
+
+    def invalidate(self):
+        """ Makes concat regenerate the image, after a parameter that it
+        depends on has changed. """
+        self._isCircular = False
+
     def concat(self, maskOther):
         for mask in [self, maskOther]:
-            mask.updateImage()
-            mask.setCircular()
+            if not mask._isCircular:  # Only regenerate masks that changed since the last concat
+                mask.updateImage()
+                mask.setCircular()
         maskCombined = Mask(self.height, self.width * 2, self.wavelength)
         imgCombined = np.concatenate((self.img, maskOther.img), axis=1)
         maskCombined.loadArray(imgCombined)
@@ -283,6 +385,7 @@ class Mask:
         result = np.zeros((self.height, self.width))
         result[mask_bin] = self.img[mask_bin]
         self.img = result
+        self._isCircular = True
 
     def setTilt(self, angle=None, pixelsize=None):
         """Creates a tilt mask, blazed grating, for off-axis holography."""
@@ -316,25 +419,26 @@ class Mask:
         self.mask_type = MaskMode.Tilt
 
     def setAberrations(self, aber_params_info=None):
+        """ Sets the mask to the sum of Zernike polynomials with the
+        coefficients in aber_params_info. Its keys are either names in
+        aberrationNollIndices or Noll indices (ints) of any other mode. The
+        Zernike basis is cached per mask geometry, so changing only the
+        coefficients costs a single weighted sum. """
         if aber_params_info:
             self.aber_params_info = aber_params_info
-        fTilt = self.aber_params_info["tilt"]
-        fTip = self.aber_params_info["tip"]
-        fDefoc = self.aber_params_info["defocus"]
-        fSph = self.aber_params_info["spherical"]
-        fVertComa = self.aber_params_info["verticalComa"]
-        fHozComa = self.aber_params_info["horizontalComa"]
-        fVertAst = self.aber_params_info["verticalAstigmatism"]
-        fOblAst = self.aber_params_info["obliqueAstigmatism"]
-
-        mask = np.fromfunction(lambda i, j: fTilt * 2 * np.sqrt(((i - self.centerx) / self.radius)**2 + ((j - self.centery) / self.radius)**2) * np.sin(np.arctan2(((j - self.centery) / self.radius), ((i - self.centerx) / self.radius))), (self.height, self.width), dtype="float")
-        mask += np.fromfunction(lambda i, j: fTip * 2 * np.sqrt(((i - self.centerx) / self.radius)**2 + ((j - self.centery) / self.radius)**2) * np.cos(np.arctan2(((j - self.centery) / self.radius), ((i - self.centerx) / self.radius))), (self.height, self.width), dtype="float")
-        mask += np.fromfunction(lambda i, j: fDefoc * np.sqrt(3) * (2 * (((i - self.centerx) / self.radius)**2 + ((j - self.centery) / self.radius)**2) - 1), (self.height, self.width), dtype="float")
-        mask += np.fromfunction(lambda i, j: fSph * np.sqrt(5) * (6 * (((i - self.centerx) / self.radius)**2 + ((j - self.centery) / self.radius)**2)**4 - 6 * (((i - self.centerx) / self.radius)**2 + ((j - self.centery) / self.radius)**2) + 1), (self.height, self.width), dtype="float")
-        mask += np.fromfunction(lambda i, j: fVertComa * np.sqrt(8) * np.sin(np.arctan2(((j - self.centery) / self.radius), ((i - self.centerx) / self.radius))) * (3 * (np.sqrt(((i - self.centerx) / self.radius)**2 + ((j - self.centery) / self.radius)**2))**3 - 2 * np.sqrt(((i - self.centerx) / self.radius)**2 + ((j - self.centery) / self.radius)**2)), (self.height, self.width), dtype="float")
-        mask += np.fromfunction(lambda i, j: fHozComa * np.sqrt(8) * np.cos(np.arctan2(((j - self.centery) / self.radius), ((i - self.centerx) / self.radius))) * (3 * (np.sqrt(((i - self.centerx) / self.radius)**2 + ((j - self.centery) / self.radius)**2))**3 - 2 * np.sqrt(((i - self.centerx) / self.radius)**2 + ((j - self.centery) / self.radius)**2)), (self.height, self.width), dtype="float")
-        mask += np.fromfunction(lambda i, j: fVertAst * np.sqrt(6) * np.cos(2 * np.arctan2(((j - self.centery) / self.radius), ((i - self.centerx) / self.radius))) * ((np.sqrt(((i - self.centerx) / self.radius)**2 + ((j - self.centery) / self.radius)**2))**2), (self.height, self.width), dtype="float")
-        mask += np.fromfunction(lambda i, j: fOblAst * np.sqrt(6) * np.sin(2 * np.arctan2(((j - self.centery) / self.radius), ((i - self.centerx) / self.radius))) * ((np.sqrt(((i - self.centerx) / self.radius)**2 + ((j - self.centery) / self.radius)**2))**2), (self.height, self.width), dtype="float")
+
+        coefficients = {}
+        for key, value in self.aber_params_info.items():
+            nollIndex = key if isinstance(key, int) else aberrationNollIndices[key]
+            coefficients[nollIndex] = coefficients.get(nollIndex, 0) + value
+        numModes = max(coefficients.keys(), default=1)
+        weights = np.zeros(numModes)
+        for nollIndex, value in coefficients.items():
+            weights[nollIndex - 1] = value
+
+        basis = _zernikeBasisCache.getBasis((self.height, self.width),
+                                            (self.centerx, self.centery), self.radius, numModes)
+        mask = np.tensordot(weights, basis, axes=1)
 
         mask %= 2 * math.pi
         self.img = mask
@@ -346,19 +450,24 @@ class Mask:
 
     def setCenter(self, setCoords):
         self.centerx, self.centery = setCoords
+        self.invalidate()
 
     def setRadius(self, radius):
         self.radius = radius
+        self.invalidate()
 
     def setSigma(self, sigma):
         self.sigma = sigma
+        self.invalidate()
 
     def setRotationAngle(self, rotation_angle):
         self.angle_rotation = rotation_angle
+        self.invalidate()
 
     def moveCenter(self, move_v):
         self.centerx = self.centerx + move_v[0]
         self.centery = self.centery + move_v[1]
+        self.invalidate()
 
     def setBlack(self):
         self.img = np.zeros((self.height, self.width), dtype=np.uint8)
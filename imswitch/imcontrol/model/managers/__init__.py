@@ -1,8 +1,10 @@
 from .AutofocusManager import AutofocusManager
-from .DetectorsManager import DetectorsManager, NoDetectorsError
+from .DetectorsManager import (
+    DetectorsManager, LiveViewFrameGeometry, LiveViewSubscription, NoDetectorsError
+)
 from .LasersManager import LasersManager
 from .LEDMatrixsManager import LEDMatrixsManager
-from .MultiManager import MultiManager
+from .MultiManager import MultiManager, MultiManagerError
 from .PositionersManager import PositionersManager
 from .RS232sManager import RS232sManager
 from .OFMsManager import OFMsManager
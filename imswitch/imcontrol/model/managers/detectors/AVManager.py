@@ -55,7 +55,8 @@ class AVManager(DetectorManager):
         }
 
         super().__init__(detectorInfo, name, fullShape=fullShape, supportedBinnings=[1],
-                         model=model, parameters=parameters, actions=actions, croppable=True)
+                         model=model, parameters=parameters, actions=actions, croppable=True,
+                         frameBuffer=getattr(self._camera, 'frameBuffer', None))
 
     def getLatestFrame(self, is_save=False):
         if is_save:
@@ -95,11 +96,16 @@ class AVManager(DetectorManager):
     def setBinning(self, binning):
         super().setBinning(binning) 
         
-    def getChunk(self):        
-        return self._camera.getLastChunk()
+    def getChunk(self):
+        if self.frameBuffer is None:
+            return self._camera.getLastChunk()  # Mocker without a frame buffer
+        return super().getChunk()
 
     def flushBuffers(self):
-        pass
+        if self.frameBuffer is None:
+            self._camera.flushBuffer()
+        else:
+            super().flushBuffers()
 
     def startAcquisition(self):
         if not self._running:
@@ -7,6 +7,9 @@ import numpy as np
 
 from imswitch.imcommon.framework import Signal, SignalInterface
 from imswitch.imcommon.model import initLogger
+from imswitch.imcontrol.model.FrameRingBuffer import (
+    FrameBufferReader, FrameMetadata, FrameRingBuffer
+)
 
 
 @dataclass
@@ -71,7 +74,8 @@ class DetectorManager(SignalInterface):
                  parameters: Optional[Dict[str, DetectorParameter]] = None,
                  actions: Optional[Dict[str, DetectorAction]] = None,
                  croppable: bool = True, 
-                 isRGB: bool = False) -> None:
+                 isRGB: bool = False,
+                 frameBuffer: Optional[FrameRingBuffer] = None) -> None:
         """
         Args:
             detectorInfo: See setup file documentation.
@@ -84,6 +88,9 @@ class DetectorManager(SignalInterface):
             actions: Actions to make available to the user to execute.
             croppable: Whether the detector image can be cropped.
             isRGB: color non monochromatic camera
+            frameBuffer: Ring buffer that the detector interface adds its
+              frames to. If specified, getChunk and flushBuffers are served
+              from it.
         """
 
         super().__init__()
@@ -103,6 +110,9 @@ class DetectorManager(SignalInterface):
         self.__fullShape = fullShape
         self.__supportedBinnings = supportedBinnings
         self.__image = np.array([])
+        self.__frameBuffer = frameBuffer
+        self.__numOverrunFrames = 0
+        self.__liveViewFrameCount = None
 
         self.__forAcquisition = detectorInfo.forAcquisition
         self.__forFocusLock = detectorInfo.forFocusLock
@@ -128,6 +138,25 @@ class DetectorManager(SignalInterface):
         else:
             self.sigImageUpdated.emit(self.__image, init)
 
+    def getNewLiveViewFrame(self, force: bool = False) -> Optional[np.ndarray]:
+        """ :meta private:
+        Returns the latest frame for the live view, or None if the frame
+        buffer reports that no frame has been captured since the last call
+        (unless force is True). Detectors without a frame buffer can't tell,
+        so the latest frame is always returned for them. """
+        if self.__frameBuffer is not None:
+            frameCount = self.__frameBuffer.frameCount
+            if frameCount == self.__liveViewFrameCount and not force:
+                return None
+            self.__liveViewFrameCount = frameCount
+
+        try:
+            self.__image = self.getLatestFrame()
+        except Exception:
+            self.__logger.error(traceback.format_exc())
+            return None
+        return self.__image
+
     def setParameter(self, name: str, value: Any) -> Dict[str, DetectorParameter]:
         """ Sets a parameter value and returns the updated list of parameters.
         If the parameter doesn't exist, i.e. the parameters field doesn't
@@ -197,6 +226,12 @@ class DetectorManager(SignalInterface):
         """ Latest LiveView image. """
         return self.__image
 
+    @property
+    def frameBuffer(self) -> Optional[FrameRingBuffer]:
+        """ The ring buffer the detector's frames are collected in, or None
+        if the detector doesn't use one. """
+        return self.__frameBuffer
+
     @property
     def parameters(self) -> Dict[str, DetectorParameter]:
         """ Dictionary of available parameters. """
@@ -241,19 +276,57 @@ class DetectorManager(SignalInterface):
         (height, width). """
         pass
 
-    @abstractmethod
     def getChunk(self) -> np.ndarray:
         """ Returns the frames captured by the detector since getChunk was last
         called, or since the buffers were last flushed (whichever happened
         last). The returned object is a numpy array of shape
-        (numFrames, height, width). """
-        pass
+        (numFrames, height, width). By default, the frames are returned from
+        frameBuffer as a view, without copying; detectors that don't use a
+        frame buffer must override this method. """
+        if self.__frameBuffer is None:
+            raise NotImplementedError(f'{self.__class__.__name__} has no frame buffer')
+
+        chunk = self.__frameBuffer.getChunk()
+        self._checkFrameBufferOverrun()
+        return chunk
+
+    def getChunkWithMetadata(self) -> Tuple[np.ndarray, FrameMetadata]:
+        """ Same as getChunk, but also returns the frame IDs, host receive
+        timestamps and (where the camera provides them) camera timestamps of
+        the returned frames. For detectors without a frame buffer, only the
+        time at which the chunk was fetched is known. """
+        if self.__frameBuffer is None:
+            chunk = self.getChunk()
+            return chunk, FrameMetadata.unknown(len(chunk))
+
+        chunk, metadata = self.__frameBuffer.getChunkWithMetadata()
+        self._checkFrameBufferOverrun()
+        return chunk, metadata
+
+    def _checkFrameBufferOverrun(self) -> None:
+        numOverrunFrames = self.__frameBuffer.numOverrunFrames
+        if numOverrunFrames != self.__numOverrunFrames:
+            self.__logger.warning(f'Frame buffer overrun, {numOverrunFrames} frames lost'
+                                  f' since the detector was initialized')
+            self.__numOverrunFrames = numOverrunFrames
+
+    def openFrameReader(self) -> Optional[FrameBufferReader]:
+        """ Returns a reader of its own of the frames in frameBuffer, for
+        consumers other than the recording, or None if the detector has no
+        frame buffer. Unlike getChunk and flushBuffers, the reader doesn't
+        take frames away from the recording. """
+        if self.__frameBuffer is None:
+            return None
+        return self.__frameBuffer.openReader()
 
-    @abstractmethod
     def flushBuffers(self) -> None:
         """ Flushes the detector buffers so that getChunk starts at the last
-        frame captured at the time that this function was called. """
-        pass
+        frame captured at the time that this function was called. Detectors
+        that don't use a frame buffer must override this method. """
+        if self.__frameBuffer is None:
+            raise NotImplementedError(f'{self.__class__.__name__} has no frame buffer')
+
+        self.__frameBuffer.flush()
 
     @abstractmethod
     def startAcquisition(self) -> None:
@@ -76,7 +76,8 @@ class GXPIPYManager(DetectorManager):
         }
 
         super().__init__(detectorInfo, name, fullShape=fullShape, supportedBinnings=[1],
-                         model=model, parameters=parameters, actions=actions, croppable=True)
+                         model=model, parameters=parameters, actions=actions, croppable=True,
+                         frameBuffer=getattr(self._camera, 'frameBuffer', None))
         
 
     def getLatestFrame(self, is_save=False):
@@ -127,13 +128,15 @@ class GXPIPYManager(DetectorManager):
 
         
     def getChunk(self):
-        try:
-            return self._camera.getLastChunk()
-        except:
-            return None
+        if self.frameBuffer is None:
+            return self._camera.getLastChunk()  # Mocker without a frame buffer
+        return super().getChunk()
 
     def flushBuffers(self):
-        self._camera.flushBuffer()
+        if self.frameBuffer is None:
+            self._camera.flushBuffer()
+        else:
+            super().flushBuffers()
 
     def startAcquisition(self):
         if self._camera.model == "mock":
@@ -73,7 +73,8 @@ class HikCamManager(DetectorManager):
         }
 
         super().__init__(detectorInfo, name, fullShape=fullShape, supportedBinnings=[1],
-                         model=model, parameters=parameters, actions=actions, croppable=True)
+                         model=model, parameters=parameters, actions=actions, croppable=True,
+                         frameBuffer=getattr(self._camera, 'frameBuffer', None))
         
 
     def getLatestFrame(self, is_save=False):
@@ -110,13 +111,15 @@ class HikCamManager(DetectorManager):
         pass
         
     def getChunk(self):
-        try:
-            return self._camera.getLastChunk()
-        except:
-            return None
+        if self.frameBuffer is None:
+            return self._camera.getLastChunk()  # Mocker without a frame buffer
+        return super().getChunk()
 
     def flushBuffers(self):
-        self._camera.flushBuffer()
+        if self.frameBuffer is None:
+            self._camera.flushBuffer()
+        else:
+            super().flushBuffers()
 
     def startAcquisition(self):
         if self._camera.model == "mock":
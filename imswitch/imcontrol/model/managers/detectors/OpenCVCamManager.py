@@ -53,7 +53,8 @@ class OpenCVCamManager(DetectorManager):
         }
 
         super().__init__(detectorInfo, name, fullShape=fullShape, supportedBinnings=[1],
-                         model=model, parameters=parameters, actions=actions, croppable=True)
+                         model=model, parameters=parameters, actions=actions, croppable=True,
+                         frameBuffer=getattr(self._camera, 'frameBuffer', None))
 
     def getLatestFrame(self, is_save=False):
         if is_save:
@@ -90,11 +91,16 @@ class OpenCVCamManager(DetectorManager):
     def setBinning(self, binning):
         super().setBinning(binning) 
         
-    def getChunk(self):        
-        return np.expand_dims(self._camera.getLastChunk(),0)
+    def getChunk(self):
+        if self.frameBuffer is None:
+            return self._camera.getLastChunk()  # Mocker without a frame buffer
+        return super().getChunk()
 
     def flushBuffers(self):
-        pass
+        if self.frameBuffer is None:
+            self._camera.flushBuffer()
+        else:
+            super().flushBuffers()
 
     def startAcquisition(self):
         if not self._running:
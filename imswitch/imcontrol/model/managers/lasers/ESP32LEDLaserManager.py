@@ -45,14 +45,7 @@ class ESP32LEDLaserManager(LaserManager):
     def setEnabled(self, enabled):
         """Turn on (N) or off (F) laser emission"""
         self.enabled = enabled
-        if self.channel_index == "LED":
-            self._led.send_LEDMatrix_full(intensity = (self.power*self.enabled,self.power*self.enabled,self.power*self.enabled))
-        else:
-            self._laser.set_laser(self.channel_index, 
-                                                int(self.power*self.enabled),  
-                                                despeckleAmplitude = self.laser_despeckle_amplitude,
-                                                despecklePeriod = self.laser_despeckle_period, 
-                                                is_blocking=True)
+        self._sendValue()
 
     def setValue(self, power):
         """Handles output power.
@@ -60,17 +53,28 @@ class ESP32LEDLaserManager(LaserManager):
         """
         self.power = power
         if self.enabled:
-            if self.channel_index == "LED":
-                self._led.send_LEDMatrix_full(intensity = (self.power*self.enabled,self.power*self.enabled,self.power*self.enabled))
-            else:
-                self._laser.set_laser(self.channel_index, 
-                                    int(self.power),
-                                    despeckleAmplitude = self.laser_despeckle_amplitude,
-                                    despecklePeriod = self.laser_despeckle_period, 
-                                    is_blocking=True)
+            self._sendValue()
+
+    def _sendValue(self):
+        """ Queues the current value on the I/O thread of the board without
+        waiting for it to be sent. A value that is still queued when a new
+        one is set (e.g. while a slider is dragged) is replaced by it. """
+        value = self.power * self.enabled
+        if self.channel_index == "LED":
+            return self._rs232manager.submit(
+                self._led.send_LEDMatrix_full, intensity=(value, value, value),
+                coalesceKey=(self.name(), 'value')
+            )
+        else:
+            return self._rs232manager.submit(
+                self._laser.set_laser, self.channel_index, int(value),
+                despeckleAmplitude=self.laser_despeckle_amplitude,
+                despecklePeriod=self.laser_despeckle_period, is_blocking=True,
+                coalesceKey=(self.name(), 'value')
+            )
 
     def sendTrigger(self, triggerId):
-        self._esp32.digital.sendTrigger(triggerId)
+        self._rs232manager.submit(self._esp32.digital.sendTrigger, triggerId)
     
     '''
     def sendScanner(self, scannernFrames=100, scannerXFrameMin=0, scannerXFrameMax=255,
@@ -1,10 +1,18 @@
+import threading
+from concurrent.futures import Future
+from typing import List
+
 from imswitch.imcommon.model import initLogger
+from imswitch.imcontrol.model.StageTrajectory import LinearMotion
 from .PositionerManager import PositionerManager
 import time
 import numpy as np
 
 PHYS_FACTOR = 1
 gTIMEOUT = 10
+gPOLLINTERVAL = 0.05  # s, between position reads while waiting for a blocking move
+gARRIVALTOLERANCE = 1  # how far from the target a stage that has stopped counts as arrived
+gAXISINDICES = {"A": 0, "X": 1, "Y": 2, "Z": 3}  # of each axis in the board's positions
 class ESP32StageManager(PositionerManager):
 
 
@@ -146,6 +154,9 @@ class ESP32StageManager(PositionerManager):
         
         self.is_enabled = False
 
+        # set by stops, so that blocking moves stop waiting for the stage to reach their target
+        self._stopRequested = threading.Event()
+
         # get bootup position and write to GUI
         self._position  = self.getPosition()
         # force setting the position
@@ -155,54 +166,200 @@ class ESP32StageManager(PositionerManager):
 
 
     def enalbeMotors(self, enable=True):
-        self._motor.set_motor_enable(axis=0, is_enable=enable)
+        self._call(self._motor.set_motor_enable, axis=0, is_enable=enable)
 
     def setupMotor(self, minPos, maxPos, stepSize, backlash, axis):
-        self._motor.setup_motor(axis=axis, minPos=minPos, maxPos=maxPos, stepSize=stepSize, backlash=backlash)
+        self._call(self._motor.setup_motor, axis=axis, minPos=minPos, maxPos=maxPos,
+                   stepSize=stepSize, backlash=backlash)
         
     def move(self, value=0, axis="X", is_absolute=False, is_blocking=True, speed=None, timeout=gTIMEOUT):
+        """ Queues a move on the I/O thread of the board and returns a future
+        of the board's response; waits for it if is_blocking. Relative moves
+        that are queued one after the other are sent as a single move. """
+        if axis not in ("X", "Y", "Z", "XY", "XYZ"):
+            print('Wrong axis, has to be "X" "Y" or "Z".')
+            return None
+
+        values = (value,) if len(axis) == 1 else tuple(value)
+        speeds = self._getSpeeds(axis, speed)
+        for iaxis, ivalue in zip(axis, values):
+            if not is_absolute: self._position[iaxis] = self._position[iaxis] + ivalue
+            else: self._position[iaxis] = ivalue
+
+        future = self._rs232manager.submit(
+            self._moveAxes, dict(zip(axis, values)), dict(zip(axis, speeds)),
+            is_absolute=is_absolute, is_blocking=is_blocking, timeout=timeout,
+            coalesceKey='move', merge=self._mergeMoves
+        )
+        if is_blocking:
+            future.result()
+        return future
+
+    def runTrajectory(self, waypoints, axis="XY", speed=None, onArrival=None, settleTime=0.0,
+                      timeout=gTIMEOUT) -> List[Future]:
+        """ Queues absolute moves through the waypoints, an array with one row
+        per waypoint and one column per axis, and returns a future per
+        waypoint that completes with the return value of
+        onArrival(index, position) once the stage has arrived there.
+
+        The moves are queued all at once, so no round trip to the caller is
+        needed between waypoints. onArrival is called on the I/O thread of
+        the board, settleTime seconds after arrival and before the stage
+        moves on, so that frames can be captured at each waypoint; it may
+        itself send commands to the board (e.g. to switch illumination or
+        move another axis). The port is held while it runs, so it should be
+        short (e.g. a camera trigger); longer captures should rather wait for
+        the future of the waypoint and queue the next one afterwards.
+        forceStop or cancelTrajectory drop the remaining waypoints. """
+        waypoints = np.asarray(waypoints, dtype=float).reshape(-1, len(axis))
+        speeds = dict(zip(axis, self._getSpeeds(axis, speed)))
+        arrivals = []
+        for index, waypoint in enumerate(waypoints):
+            values = dict(zip(axis, waypoint))
+            self._rs232manager.submit(
+                self._moveAxes, values, speeds, is_absolute=True, is_blocking=True,
+                timeout=timeout, coalesceKey='move', merge=self._mergeMoves
+            )
+            arrivals.append(self._rs232manager.submit(
+                self._arrive, index, values, onArrival, settleTime,
+                coalesceKey='move', merge=lambda previous, new: None
+            ))
+        return arrivals
+
+    def moveAlongLine(self, start, end, axis="X", speed=None, timeout=gTIMEOUT) -> Future:
+        """ Moves to start, then starts a move to end at constant speed
+        without waiting for it to complete, so that frames can be captured
+        while the stage moves. Returns a future that completes once the move
+        has started, with a LinearMotion that maps the times at which frames
+        were captured (e.g. FrameMetadata.hostTimestamps) to positions. """
+        start, end = np.atleast_1d(start).astype(float), np.atleast_1d(end).astype(float)
+        speeds = dict(zip(axis, self._getSpeeds(axis, speed)))
+        self._rs232manager.submit(
+            self._moveAxes, dict(zip(axis, start)), speeds, is_absolute=True, is_blocking=True,
+            timeout=timeout, coalesceKey='move', merge=self._mergeMoves
+        )
+        return self._rs232manager.submit(
+            self._startLinearMotion, axis, start, end, speeds,
+            coalesceKey='move', merge=lambda previous, new: None
+        )
+
+    def cancelTrajectory(self):
+        """ Drops the queued moves, including the remaining waypoints of a
+        trajectory. The current move is completed. """
+        self._rs232manager.scheduler.cancel('move')
+
+    def _arrive(self, index, values, onArrival, settleTime):
+        self._position.update(values)
+        if settleTime > 0:
+            self._rs232manager.pause(settleTime)
+        if onArrival is not None:
+            return onArrival(index, np.array(list(values.values())))
+
+    def _startLinearMotion(self, axis, start, end, speeds):
+        startTime = time.time()
+        self._moveAxes(dict(zip(axis, end)), speeds, is_absolute=True, is_blocking=False,
+                       timeout=gTIMEOUT)
+        self._position.update(zip(axis, end))
+        return LinearMotion(start=start, end=end, startTime=startTime,
+                            speeds=np.array([abs(speeds[iaxis]) for iaxis in axis], dtype=float))
+
+    def _getSpeeds(self, axis, speed):
         if speed is None:
-            if axis == "X": speed = self.speed["X"]
-            if axis == "Y": speed = self.speed["Y"]
-            if axis == "Z": speed = self.speed["Z"]
-            if axis == "XY": speed = (self.speed["X"], self.speed["Y"])
-            if axis == "XYZ": speed = (self.speed["X"], self.speed["Y"], self.speed["Z"])
-        if axis == 'X':
-            self._motor.move_x(value, speed, is_absolute=is_absolute, is_enabled=self.is_enabled, is_blocking=is_blocking, timeout=timeout)
-            if not is_absolute: self._position[axis] = self._position[axis] + value
-            else: self._position[axis] = value
-        elif axis == 'Y':
-            self._motor.move_y(value, speed, is_absolute=is_absolute, is_enabled=self.is_enabled, is_blocking=is_blocking, timeout=timeout)
-            if not is_absolute: self._position[axis] = self._position[axis] + value
-            else: self._position[axis] = value
-        elif axis == 'Z':
-            self._motor.move_z(value, speed, is_absolute=is_absolute, is_enabled=self.is_enabled, is_blocking=is_blocking, timeout=timeout)
-            if not is_absolute: self._position[axis] = self._position[axis] + value
-            else: self._position[axis] = value
-        elif axis == 'XY':
-            self._motor.move_xy(value, speed, is_absolute=is_absolute, is_enabled=self.is_enabled, is_blocking=is_blocking, timeout=timeout)
-            for i, iaxis in enumerate(("X", "Y")):
-                if not is_absolute: self._position[iaxis] = self._position[iaxis] + value[i]
-                else: self._position[iaxis] = value[i]
-        elif axis == 'XYZ':
-            self._motor.move_xyz(value, speed, is_absolute=is_absolute, is_enabled=self.is_enabled, is_blocking=is_blocking, timeout=timeout)
-            for i, iaxis in enumerate(("X", "Y")):
-                if not is_absolute: self._position[iaxis] = self._position[iaxis] + value[i]
-                else: self._position[iaxis] = value[i]
+            return tuple(self.speed[iaxis] for iaxis in axis)
+        return (speed,) if len(axis) == 1 else tuple(speed)
+
+    def _moveAxes(self, values, speeds, is_absolute, is_blocking, timeout):
+        """ Sends a move of one or more axes to the board. Runs on the I/O
+        thread. Blocking moves are sent as non-blocking ones followed by
+        _waitForArrival, so that the port is free for position reads and
+        stops while the stage moves. """
+        axes = ''.join(iaxis for iaxis in "XYZ" if iaxis in values)
+        if is_blocking:
+            self._stopRequested.clear()
+            startPositions = np.asarray(self._motor.get_position(), dtype=float)
+            targets = {iaxis: values[iaxis] if is_absolute
+                       else startPositions[gAXISINDICES[iaxis]] + values[iaxis]
+                       for iaxis in axes}
+        kwargs = dict(is_absolute=is_absolute, is_enabled=self.is_enabled,
+                      is_blocking=False, timeout=timeout)
+        if len(axes) == 1:
+            moveAxis = getattr(self._motor, f'move_{axes.lower()}')
+            response = moveAxis(values[axes], speeds[axes], **kwargs)
+        elif axes == "XY":
+            response = self._motor.move_xy((values["X"], values["Y"]),
+                                           (speeds["X"], speeds["Y"]), **kwargs)
         else:
-            print('Wrong axis, has to be "X" "Y" or "Z".')
-
-
-
+            # Relative moves of the axes that aren't moved are zero
+            response = self._motor.move_xyz(tuple(values.get(iaxis, 0) for iaxis in "XYZ"),
+                                            tuple(speeds.get(iaxis, self.speed[iaxis])
+                                                  for iaxis in "XYZ"),
+                                            **kwargs)
+        if is_blocking:
+            self._waitForArrival(targets, startPositions, timeout)
+        return response
+
+    def _waitForArrival(self, targets, startPositions, timeout):
+        """ Reads the position of the board until the stage has reached the
+        targets of the moved axes, was stopped, or has stopped short of the
+        targets after moving (e.g. at an end stop). The port is released
+        between reads. Raises TimeoutError if the stage doesn't get there
+        within timeout seconds. Runs on the I/O thread. """
+        indices = [gAXISINDICES[iaxis] for iaxis in targets]
+        targets = np.array(list(targets.values()), dtype=float)
+        deadline = time.monotonic() + timeout
+        lastPositions = None
+        while time.monotonic() < deadline:
+            self._rs232manager.pause(gPOLLINTERVAL)
+            if self._stopRequested.is_set():
+                return
+            positions = np.asarray(self._motor.get_position(), dtype=float)
+            if np.all(np.abs(positions[indices] - targets) <= gARRIVALTOLERANCE):
+                return
+            # The board may take a while to start moving, so a stage that hasn't left its start
+            # position yet is still waited for
+            if (lastPositions is not None and np.array_equal(positions, lastPositions)
+                    and not np.array_equal(positions, startPositions)):
+                self.__logger.warning(f'Stage stopped at {positions[indices]} instead of'
+                                      f' {targets}')
+                return
+            lastPositions = positions
+        raise TimeoutError(f'Stage did not reach {targets} within {timeout} s')
+
+    @staticmethod
+    def _mergeMoves(previous, new):
+        """ Combines two queued relative moves into one, adding up the steps
+        of each axis, as long as the axes they share have the same speed. """
+        (previousValues, previousSpeeds), previousKwargs = previous
+        (newValues, newSpeeds), newKwargs = new
+        if previousKwargs['is_absolute'] or newKwargs['is_absolute']:
+            return None
+        if any(previousSpeeds[iaxis] != newSpeeds[iaxis]
+               for iaxis in newValues if iaxis in previousValues):
+            return None
+
+        values = dict(previousValues)
+        for iaxis, ivalue in newValues.items():
+            values[iaxis] = values.get(iaxis, 0) + ivalue
+        kwargs = dict(newKwargs,
+                      is_blocking=previousKwargs['is_blocking'] or newKwargs['is_blocking'],
+                      timeout=max(previousKwargs['timeout'], newKwargs['timeout']))
+        return (values, {**previousSpeeds, **newSpeeds}), kwargs
+
+    def _call(self, func, *args, **kwargs):
+        """ Runs a function of the board on its I/O thread, after the queued
+        commands, and returns the response. """
+        return self._rs232manager.scheduler.call(func, *args, **kwargs)
     
     def measure(self, sensorID=0, NAvg=100):
-        return self._motor.read_sensor(sensorID=sensorID, NAvg=NAvg)
+        return self._call(self._motor.read_sensor, sensorID=sensorID, NAvg=NAvg)
 
     def setupPIDcontroller(self, PIDactive=1, Kp=100, Ki=10, Kd=1, target=500, PID_updaterate=200):
-        return self._motor.set_pidcontroller(PIDactive=PIDactive, Kp=Kp, Ki=Ki, Kd=Kd, target=target, PID_updaterate=PID_updaterate)
+        return self._call(self._motor.set_pidcontroller, PIDactive=PIDactive, Kp=Kp, Ki=Ki, Kd=Kd,
+                          target=target, PID_updaterate=PID_updaterate)
 
     def moveForever(self, speed=(0,0,0), is_stop=False):
-        self._motor.move_forever(speed=speed, is_stop=is_stop)
+        self.cancelTrajectory()
+        self._rs232manager.submit(self._motor.move_forever, speed=speed, is_stop=is_stop)
         
     def setEnabled(self, is_enabled):
         self.is_enabled = is_enabled
@@ -218,7 +375,7 @@ class ESP32StageManager(PositionerManager):
 
     def setPosition(self, value, axis):
         if value: value+=1 # TODO: Firmware weirdness
-        self._motor.set_position(axis=axis, position=value)
+        self._call(self._motor.set_position, axis=axis, position=value)
         self._position[axis] = value
 
     def closeEvent(self):
@@ -226,14 +383,19 @@ class ESP32StageManager(PositionerManager):
 
     
     def getPosition(self):
+        # Read right away instead of waiting for the queued moves, so that the position can be
+        # followed while the stage moves
         try:
-            allPositions = self._motor.get_position()
+            allPositions = self._rs232manager.request(self._motor.get_position)
         except:
             allPositions = [0,0,0,0]
         
         return {"X": allPositions[1], "Y": allPositions[2], "Z": allPositions[3], "A": allPositions[0]}
     
     def forceStop(self, axis):
+        # Stops are requested rather than waiting for the queued commands, and the queued moves
+        # are dropped so that they don't start after the stop
+        self.cancelTrajectory()
         if axis=="X":
             self.stop_x()
         elif axis=="Y":
@@ -244,16 +406,20 @@ class ESP32StageManager(PositionerManager):
             self.stopAll()
         
     def stop_x(self):
-        self._motor.stop(axis = "X")
+        self._stopRequested.set()
+        self._rs232manager.request(self._motor.stop, axis="X")
 
     def stop_y(self):
-        self._motor.stop(axis = "Y")
+        self._stopRequested.set()
+        self._rs232manager.request(self._motor.stop, axis="Y")
 
     def stop_z(self):
-        self._motor.stop(axis = "Z")
+        self._stopRequested.set()
+        self._rs232manager.request(self._motor.stop, axis="Z")
 
     def stopAll(self):
-        self._motor.stop()
+        self._stopRequested.set()
+        self._rs232manager.request(self._motor.stop)
 
         
     def doHome(self, axis):
@@ -265,19 +431,19 @@ class ESP32StageManager(PositionerManager):
             self.home_z()
 
     def home_x(self):
-        self._homeModule.home_x(speed = self.homeSpeedX, direction = self.homeDirectionX )
+        self._call(self._homeModule.home_x, speed = self.homeSpeedX, direction = self.homeDirectionX)
         self._position["X"] = 0
         
     def home_y(self):
-        self._homeModule.home_y(speed = self.homeSpeedY, direction = self.homeDirectionY)
+        self._call(self._homeModule.home_y, speed = self.homeSpeedY, direction = self.homeDirectionY)
         self._position["Y"] = 0
         
     def home_z(self):
-        self._homeModule.home_z(speed = self.homeSpeedZ, direction = self.homeDirectionZ)
+        self._call(self._homeModule.home_z, speed = self.homeSpeedZ, direction = self.homeDirectionZ)
         self._position["Z"] = 0
         
     def home_xyz(self):
-        self._motor.home_xyz()
+        self._call(self._motor.home_xyz)
         self._position["X"] = 0
         self._position["Y"] = 0
         self._position["Z"] = 0
@@ -1,11 +1,21 @@
+import threading
+from concurrent.futures import Future
+
 import uc2rest as uc2  # pip install UC2-REST
 from imswitch.imcommon.model import initLogger
 from imswitch.imcommon.model import APIExport
+from imswitch.imcontrol.model.CommandScheduler import CommandScheduler
 
 import imswitch.imcontrol.model.interfaces.esp32driver as espdriver
 
 class ESP32Manager:
     """ A low-level wrapper for TCP-IP communication (ESP32 REST API)
+
+    All communication with the board should go through submit (or query),
+    which run the commands on an I/O thread of the port so that managers
+    sharing the board don't block each other or interleave their commands.
+    Status queries and stops go through request instead, which doesn't wait
+    for the queued commands but is still serialized with them on the port.
     """
     def __init__(self, rs232Info, name, **_lowLevelManagers):
         self.__logger = initLogger(self, instanceName=name)
@@ -15,16 +25,43 @@ class ESP32Manager:
         self._port = rs232Info.managerProperties['serialport']             
         
         self._esp32 = espdriver.ESP32Driver(self._port)
+        # Held by the I/O thread while a command runs, and by request. A condition, so that a
+        # running command can release it while it waits (see pause)
+        self._portLock = threading.Condition(threading.RLock())
+        self._scheduler = CommandScheduler(name=f'{name}Commands', lock=self._portLock)
+
+    @property
+    def scheduler(self) -> CommandScheduler:
+        return self._scheduler
 
+    def submit(self, func, *args, **kwargs) -> Future:
+        """ Queues a call to a function of the board (e.g. of
+        ``_esp32.motor``) and returns a future of its response. Accepts the
+        coalescing arguments of CommandScheduler.submit. """
+        return self._scheduler.submit(func, *args, **kwargs)
+
+    def request(self, func, *args, **kwargs):
+        """ Runs a short call to a function of the board (e.g. a status query
+        or a stop) right away on the calling thread, without waiting for the
+        queued commands, and returns its response. It only waits for the
+        command that is being sent, if any; commands that wait for the board
+        (e.g. blocking moves) let requests through while they wait. """
+        with self._portLock:
+            return func(*args, **kwargs)
+
+    def pause(self, seconds: float) -> None:
+        """ Waits on the I/O thread without holding the port, so that
+        requests can be sent meanwhile. Only to be called by a running
+        command. """
+        self._portLock.wait(seconds)
 
     def query(self, arg: str) -> str:
         """ Sends the specified command to the RS232 device and returns a
         string encoded from the received bytes. """
-        return self._esp32._write(arg)
-
+        return self._scheduler.call(self._esp32._write, arg)
     
     def finalize(self):
-        pass
+        self._scheduler.close()
 
 
 # Copyright (C) 2020-2021 ImSwitch developers
@@ -9,6 +9,9 @@ from .basewidgets import Widget
 class AutofocusWidget(Widget):
     """ Widget containing focus lock interface. """
 
+    searchMethods = ['coarseToFine', 'goldenSection', 'hillClimb', 'continuous', 'linear']
+    focusMetrics = ['brenner', 'tenengrad', 'normalizedVariance', 'fftBandEnergy']
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -22,6 +25,12 @@ class AutofocusWidget(Widget):
         self.zStepRangeLabel = QtWidgets.QLabel('Focus search range (nm)')
         self.zStepSizeEdit = QtWidgets.QLineEdit('10')
         self.zStepSizeLabel = QtWidgets.QLabel('Stepsize (nm)')
+        self.searchMethodList = QtWidgets.QComboBox()
+        self.searchMethodList.addItems(self.searchMethods)
+        self.searchMethodLabel = QtWidgets.QLabel('Search')
+        self.focusMetricList = QtWidgets.QComboBox()
+        self.focusMetricList.addItems(self.focusMetrics)
+        self.focusMetricLabel = QtWidgets.QLabel('Focus metric')
 
         # self.focusDataBox = QtWidgets.QCheckBox('Save data')  # Connect to exportData
         #self.camDialogButton = guitools.BetterPushButton('Camera Dialog')
@@ -61,9 +70,19 @@ class AutofocusWidget(Widget):
         grid.addWidget(self.zStepRangeEdit, 4, 4)
         grid.addWidget(self.zStepSizeLabel, 3, 5)
         grid.addWidget(self.zStepSizeEdit, 4, 5)
+        grid.addWidget(self.searchMethodLabel, 3, 6)
+        grid.addWidget(self.searchMethodList, 4, 6)
+        grid.addWidget(self.focusMetricLabel, 3, 7)
+        grid.addWidget(self.focusMetricList, 4, 7)
         grid.addWidget(self.positionLabel, 1, 6)
         grid.addWidget(self.positionEdit, 1, 7)
         #grid.addWidget(self.positionSetButton, 2, 6, 1, 2)
+
+    def getSearchMethod(self):
+        return self.searchMethodList.currentText()
+
+    def getFocusMetric(self):
+        return self.focusMetricList.currentText()
         
 
 # Copyright (C) 2020-2021 ImSwitch developers
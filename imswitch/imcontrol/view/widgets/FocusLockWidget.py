@@ -52,6 +52,7 @@ class FocusLockWidget(Widget):
         self.calibrationDisplay = QtWidgets.QLineEdit(
             'Previous calib: none')  # Edit this from the controller with calibration values
         self.calibrationDisplay.setReadOnly(True)
+        self.statisticsLabel = QtWidgets.QLabel()
         # CREATE CALIBRATION CURVE WINDOW AND FOCUS CALIBRATION GRAPH SOMEHOW
 
         # Focus lock graph
@@ -101,6 +102,13 @@ class FocusLockWidget(Widget):
         grid.addWidget(self.positionEdit, 1, 7)
         grid.addWidget(self.positionSetButton, 2, 6, 1, 2)
         grid.addWidget(self.camDialogButton, 3, 6, 1, 2)
+        grid.addWidget(self.statisticsLabel, 5, 0, 1, 9)
+
+    def setStatistics(self, loopRate, jitterMs, latencyMs, lockError):
+        self.statisticsLabel.setText(
+            f'Loop rate: {loopRate:.1f} Hz, jitter: {jitterMs:.2f} ms,'
+            f' latency: {latencyMs:.2f} ms, lock error (RMS): {lockError:.3f} px'
+        )
 
 
 # Copyright (C) 2020-2021 ImSwitch developers
@@ -1,5 +1,5 @@
 import numpy as np
-from qtpy import QtWidgets
+from qtpy import QtCore, QtWidgets
 
 from imswitch.imcommon.model import shortcut
 from imswitch.imcommon.view.guitools import naparitools
@@ -8,6 +8,10 @@ from imswitch.imcommon.view.guitools import naparitools
 class ImageWidget(QtWidgets.QWidget):
     """ Widget containing viewbox that displays the new detector frames. """
 
+    sigContinuousLevelsToggled = QtCore.Signal(bool)  # (enabled)
+    sigViewportLiveViewToggled = QtCore.Signal(bool)  # (enabled)
+    sigViewportChanged = QtCore.Signal()
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -16,13 +20,25 @@ class ImageWidget(QtWidgets.QWidget):
         self.updateLevelsWidget = naparitools.NapariUpdateLevelsWidget.addToViewer(
             self.napariViewer
         )
+        self.updateLevelsWidget.sigContinuousToggled.connect(self.sigContinuousLevelsToggled)
         self.NapariShiftWidget = naparitools.NapariShiftWidget.addToViewer(self.napariViewer)
         self.imgLayers = {}
 
+        self.viewportLiveViewCheck = QtWidgets.QCheckBox('Display live view at screen resolution')
+        self.viewportLiveViewCheck.setToolTip(
+            'Bin the live view to the zoom level and only fetch the visible part of the frame at'
+            ' full resolution when zoomed in'
+        )
+        self.viewportLiveViewCheck.toggled.connect(self.sigViewportLiveViewToggled)
+
         self.viewCtrlLayout = QtWidgets.QVBoxLayout()
         self.viewCtrlLayout.addWidget(self.napariViewer.get_widget())
+        self.viewCtrlLayout.addWidget(self.viewportLiveViewCheck)
         self.setLayout(self.viewCtrlLayout)
 
+        self.napariViewer.camera.events.zoom.connect(lambda _: self.sigViewportChanged.emit())
+        self.napariViewer.camera.events.center.connect(lambda _: self.sigViewportChanged.emit())
+
         self.grid = naparitools.VispyGridVisual(color='yellow')
         self.grid.hide()
         self.addItem(self.grid)
@@ -68,11 +84,48 @@ class ImageWidget(QtWidgets.QWidget):
         return self.imgLayers[name].data
 
     def setImage(self, name, im):
-        self.imgLayers[name].data = im
+        """ Shows im in the layer of the given name. If im has the same shape
+        and data type as the image shown, it is copied into the layer's array
+        instead of replacing it, so napari only needs to refresh the view. The
+        layer never keeps a reference to im. """
+        layer = self.imgLayers[name]
+        data = layer.data
+        if (isinstance(data, np.ndarray) and data.shape == im.shape and data.dtype == im.dtype
+                and data.flags.writeable):
+            np.copyto(data, im)
+            layer.refresh()
+        else:
+            layer.data = np.array(im)
+
+    def setImageGeometry(self, name, x, y, step):
+        """ Places the image of the given name so that the centre of its first
+        pixel is at (x, y) and its pixels are step units apart, in the
+        coordinates of full-resolution frames. """
+        layer = self.imgLayers[name]
+        translate, scale = (y, x), (step, step)
+        if tuple(layer.translate[-2:]) != translate or tuple(layer.scale[-2:]) != scale:
+            layer.scale = scale
+            layer.translate = translate
+
+    def getViewport(self):
+        """ Returns the visible region, as ``(x, y, width, height)`` in the
+        coordinates of full-resolution frames, and the zoom level in screen
+        pixels per frame pixel. """
+        camera = self.napariViewer.camera
+        canvas = self.napariViewer.window.qt_viewer.canvas.native
+        centerY, centerX = camera.center[-2:]
+        width, height = canvas.width() / camera.zoom, canvas.height() / camera.zoom
+        return (centerX - width / 2, centerY - height / 2, width, height), camera.zoom
+
+    def setViewportLiveViewChecked(self, checked):
+        self.viewportLiveViewCheck.setChecked(checked)
 
     def clearImage(self, name):
         self.setImage(name, np.zeros((1, 1)))
 
+    def setContinuousLevelsChecked(self, checked):
+        self.updateLevelsWidget.continuousCheck.setChecked(checked)
+
     def getImageDisplayLevels(self, name):
         return self.imgLayers[name].contrast_limits
 
@@ -96,7 +96,7 @@ class RecordingWidget(Widget):
 
         self.saveFormatLabel = QtWidgets.QLabel('<strong>File format:</strong>')
         self.saveFormatList = QtWidgets.QComboBox()
-        self.saveFormatList.addItems(['HDF5', 'TIFF', 'ZARR', 'MP4'])
+        self.saveFormatList.addItems(['HDF5', 'TIFF', 'ZARR', 'MP4', 'OME-ZARR'])
 
         self.snapSaveModeLabel = QtWidgets.QLabel('<strong>Snap save mode:</strong>')
         self.snapSaveModeList = QtWidgets.QComboBox()
@@ -110,6 +110,11 @@ class RecordingWidget(Widget):
                                        'Save in memory for reconstruction',
                                        'Save on disk and keep in memory'])
 
+        # Measured frame rate and frame ID gaps per detector while recording
+        self.frameStatsLabel = QtWidgets.QLabel('')
+        self.frameStatsLabel.setVisible(False)
+        self._frameStats = {}
+
         # Add items to GridLayout
         buttonWidget = QtWidgets.QWidget()
         buttonGrid = QtWidgets.QGridLayout()
@@ -189,6 +194,7 @@ class RecordingWidget(Widget):
         self.recGridContainer.setLayout(recGrid)
 
         layout.addWidget(self.recGridContainer)
+        layout.addWidget(self.frameStatsLabel)
         layout.addWidget(buttonWidget)
 
         # Initial condition of fields and checkboxes.
@@ -380,6 +386,16 @@ class RecordingWidget(Widget):
     def updateRecLapseNum(self, lapseNum):
         self.currentLapse.setText(str(lapseNum) + ' /')
 
+    def updateRecFrameStats(self, detectorName, fps, numGaps):
+        self._frameStats[detectorName] = f'{detectorName}: {fps:.1f} fps, {numGaps} gaps'
+        self.frameStatsLabel.setText('\n'.join(self._frameStats.values()))
+        self.frameStatsLabel.setVisible(True)
+
+    def clearRecFrameStats(self):
+        self._frameStats = {}
+        self.frameStatsLabel.setText('')
+        self.frameStatsLabel.setVisible(False)
+
     @shortcut('Ctrl+R', "Record")
     def toggleRecButton(self):
         self.recButton.toggle()
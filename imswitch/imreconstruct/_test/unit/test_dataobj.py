@@ -0,0 +1,150 @@
+import h5py
+import numpy as np
+import pytest
+import tifffile as tiff
+import zarr
+
+from imswitch.imreconstruct.model import DataObj, ScaledFrames
+from imswitch.imreconstruct.model.DataObj import TiffFrames
+
+
+numFrames, rows, cols = 11, 6, 8
+
+
+@pytest.fixture
+def frames():
+    rng = np.random.default_rng(0)
+    return rng.integers(100, 4000, size=(numFrames, rows, cols)).astype(np.uint16)
+
+
+@pytest.fixture(params=['hdf5', 'zarr', 'tif', 'compressed tif'])
+def path(request, tmp_path, frames):
+    if request.param == 'hdf5':
+        path = tmp_path / 'data.hdf5'
+        with h5py.File(path, 'w') as file:
+            file.create_dataset('data', data=frames, chunks=(1, rows, cols))
+    elif request.param == 'zarr':
+        path = tmp_path / 'data.zarr'
+        group = zarr.open(str(path), mode='w')
+        group.create_dataset('data', data=frames, chunks=(1, rows, cols))
+    elif request.param == 'tif':
+        path = tmp_path / 'data.tif'
+        tiff.imwrite(path, frames)
+    else:
+        path = tmp_path / 'data.tif'
+        tiff.imwrite(path, frames, compression='zlib')
+    return str(path)
+
+
+@pytest.fixture
+def dataObj(path):
+    dataObj = DataObj('test', None, path=path)
+    dataObj.checkAndLoadData()
+    dataObj.chunkBytes = 3 * rows * cols * 2  # Three frames per chunk
+    yield dataObj
+    dataObj.checkAndUnloadData()
+
+
+def oldBleachingCorrection(data):
+    """ The bleaching correction of ImRecMainViewController before it
+    scaled the frames as they are read. """
+    correctedData = data.copy()
+    energy = np.sum(data, axis=(1, 2))
+    for i in range(data.shape[0]):
+        c = (energy[0] / energy[i]) ** 4
+        correctedData[i, :, :] = data[i, :, :] * c
+    return correctedData
+
+
+def test_frames_are_read(dataObj, frames):
+    assert dataObj.numFrames == numFrames
+    np.testing.assert_array_equal(dataObj.getFrames(2, 5), frames[2:5])
+    np.testing.assert_array_equal(dataObj.getFrames(4, 5), frames[4:5])
+
+
+def test_iter_frame_chunks(dataObj, frames):
+    chunks = list(dataObj.iterFrameChunks())
+    assert [start for start, _ in chunks] == [0, 3, 6, 9]
+    assert all(isinstance(chunk, np.ndarray) for _, chunk in chunks)
+    np.testing.assert_array_equal(np.concatenate([chunk for _, chunk in chunks]), frames)
+
+
+def test_statistics(dataObj, frames):
+    np.testing.assert_allclose(dataObj.getMeanData(), frames.mean(0), rtol=1e-6)
+    np.testing.assert_array_equal(dataObj.getFrameSums(), frames.sum(axis=(1, 2)))
+    assert dataObj.getDataRange() == (frames.min(), frames.max())
+
+    # Computed in a single pass and kept until the data is unloaded
+    dataObj.checkAndUnloadData()
+    assert dataObj._meanData is None and dataObj._frameSums is None
+
+
+def test_tiff_data(tmp_path, frames):
+    path = tmp_path / 'data.tif'
+    tiff.imwrite(path, frames)
+    with tiff.TiffFile(path) as file:
+        assert isinstance(DataObj._getTiffData(file), np.memmap)
+
+    tiff.imwrite(path, frames, compression='zlib')
+    with tiff.TiffFile(path) as file:
+        assert isinstance(DataObj._getTiffData(file), TiffFrames)
+
+    tiff.imwrite(path, frames[0])  # A single page that isn't a stack of frames
+    with tiff.TiffFile(path) as file:
+        np.testing.assert_array_equal(DataObj._getTiffData(file), frames[0])
+
+
+def test_tiff_frames(tmp_path, frames):
+    path = tmp_path / 'data.tif'
+    tiff.imwrite(path, frames, compression='zlib')
+    with tiff.TiffFile(path) as file:
+        tiffFrames = TiffFrames(file)
+        assert tiffFrames.shape == frames.shape
+        assert tiffFrames.dtype == frames.dtype
+        assert len(tiffFrames) == numFrames
+        np.testing.assert_array_equal(tiffFrames[3], frames[3])
+        np.testing.assert_array_equal(tiffFrames[-1], frames[-1])
+        np.testing.assert_array_equal(tiffFrames[2:3], frames[2:3])
+        np.testing.assert_array_equal(tiffFrames[1:9:3], frames[1:9:3])
+        np.testing.assert_array_equal(tiffFrames[5:5], frames[5:5])
+        np.testing.assert_array_equal(tiffFrames[2:6, 1:3, ::2], frames[2:6, 1:3, ::2])
+        np.testing.assert_array_equal(tiffFrames[4, 2], frames[4, 2])
+
+
+@pytest.mark.parametrize('dtype', [np.uint16, np.float32])
+def test_scaled_frames_match_old_bleaching_correction(dtype):
+    rng = np.random.default_rng(1)
+    # Bleaching by about 2 % per frame
+    data = (rng.uniform(1000, 2000, size=(numFrames, rows, cols)) *
+            0.98 ** np.arange(numFrames)[:, np.newaxis, np.newaxis]).astype(dtype)
+    energy = data.sum(axis=(1, 2), dtype=np.float64)
+    scaledFrames = ScaledFrames(data, (energy[0] / energy) ** 4)
+    expected = oldBleachingCorrection(data)
+
+    assert scaledFrames.shape == data.shape
+    assert scaledFrames.dtype == data.dtype
+    assert len(scaledFrames) == numFrames
+    for frames, expectedFrames in [(scaledFrames[:], expected),
+                                   (scaledFrames[3:7], expected[3:7]),
+                                   (scaledFrames[5], expected[5])]:
+        assert frames.dtype == data.dtype
+        # The frames are scaled in single precision, which may round integers the other way
+        np.testing.assert_allclose(frames, expectedFrames, rtol=1e-6,
+                                   atol=1 if dtype == np.uint16 else 0)
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,155 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from imswitch.imreconstruct.model import ReconObj
+
+r_l_text, u_d_text, b_f_text, timepoints_text = 'Right/Left', 'Up/Down', 'Back/Forth', 'Timepoints'
+
+
+def makeReconObj(scanParDict):
+    return ReconObj('test', scanParDict, r_l_text, u_d_text, b_f_text, timepoints_text,
+                    'pos', 'neg')
+
+
+def loopCoeffsToImage(coeffs, scanParDict, fixBidirectional):
+    """ The frame by frame placement of coeffsToImage before it was
+    vectorised. Bidirectional scans flipped the fast axis using the length
+    of dim1, or that of the fast axis itself (dim0) if fixBidirectional. """
+    frames = np.shape(coeffs)[0]
+    dim0Side, dim1Side, dim2Side, dim3Side = (int(step) for step in scanParDict['steps'])
+    dimensions = scanParDict['dimensions']
+    timepoints = int(scanParDict['steps'][dimensions.index(timepoints_text)])
+    slices = int(scanParDict['steps'][dimensions.index(b_f_text)])
+    sqRows = int(scanParDict['steps'][dimensions.index(u_d_text)])
+    sqCols = int(scanParDict['steps'][dimensions.index(r_l_text)])
+
+    im = np.zeros([timepoints, slices, sqRows * np.shape(coeffs)[1],
+                   sqCols * np.shape(coeffs)[2]], dtype=np.float32)
+    for i in range(frames):
+        t = int(np.floor(i / (frames / dim3Side)))
+        slow = int(np.mod(i, frames / timepoints) / (dim0Side * dim1Side))
+        mid = int(np.mod(i, dim0Side * dim1Side) / dim0Side)
+        fast = np.mod(i, dim0Side)
+
+        if not scanParDict['unidirectional'] and np.mod(mid, 2) == 1:
+            fast = (dim0Side if fixBidirectional else dim1Side) - 1 - fast
+
+        if scanParDict['directions'][0] == 'neg':
+            fast = dim0Side - 1 - fast
+        if scanParDict['directions'][1] == 'neg':
+            mid = dim1Side - 1 - mid
+        if scanParDict['directions'][2] == 'neg':
+            slow = dim2Side - 1 - slow
+
+        positions = {dimensions[0]: (fast, dim0Side), dimensions[1]: (mid, dim1Side),
+                     dimensions[2]: (slow, dim2Side)}
+        (c, pc), (r, pr), (s, _) = (positions[r_l_text], positions[u_d_text],
+                                    positions[b_f_text])
+        im[t, s, r::pr, c::pc] = coeffs[i]
+
+    return im
+
+
+def scanParDicts():
+    """ Yields every order of the spatial dimensions, direction and scan
+    mode, for square and non-square scans. """
+    for steps, order, directions, unidirectional in itertools.product(
+            [(2, 2, 3, 2), (3, 2, 2, 1), (2, 3, 2, 2), (4, 3, 1, 1)],
+            itertools.permutations([r_l_text, u_d_text, b_f_text]),
+            itertools.product(['pos', 'neg'], repeat=3),
+            [True, False]
+    ):
+        yield {'steps': list(steps), 'dimensions': list(order) + [timepoints_text],
+               'directions': list(directions) + ['pos'], 'unidirectional': unidirectional}
+
+
+def coeffsFor(scanParDict):
+    frames = int(np.prod(scanParDict['steps']))
+    return np.random.default_rng(0).uniform(1, 2, size=(frames, 2, 3)).astype(np.float32)
+
+
+def test_output_of_loop_is_kept():
+    """ Scans that the loop reconstructed correctly: unidirectional ones, and
+    bidirectional ones with as many fast as mid steps. """
+    numCases = 0
+    for scanParDict in scanParDicts():
+        steps = scanParDict['steps']
+        if not scanParDict['unidirectional'] and steps[0] != steps[1]:
+            continue
+        coeffs = coeffsFor(scanParDict)
+        np.testing.assert_array_equal(
+            makeReconObj(scanParDict).coeffsToImage(coeffs, scanParDict),
+            loopCoeffsToImage(coeffs, scanParDict, fixBidirectional=False)
+        )
+        numCases += 1
+    assert numCases == 240
+
+
+def test_bidirectional_non_square_scans_are_fixed():
+    """ Bidirectional scans with a different number of fast and mid steps,
+    which the loop placed at wrapped around positions, or failed on. """
+    numCases = 0
+    for scanParDict in scanParDicts():
+        steps = scanParDict['steps']
+        if scanParDict['unidirectional'] or steps[0] == steps[1]:
+            continue
+        coeffs = coeffsFor(scanParDict)
+        im = makeReconObj(scanParDict).coeffsToImage(coeffs, scanParDict)
+        np.testing.assert_array_equal(
+            im, loopCoeffsToImage(coeffs, scanParDict, fixBidirectional=True)
+        )
+        assert np.all(im > 0)  # Every pixel is filled exactly once
+        numCases += 1
+    assert numCases == 144
+
+
+def test_bidirectional_scan():
+    scanParDict = {'steps': [3, 2, 1, 1],
+                   'dimensions': [r_l_text, u_d_text, b_f_text, timepoints_text],
+                   'directions': ['pos', 'pos', 'pos', 'pos'], 'unidirectional': False}
+    coeffs = np.arange(6, dtype=np.float32).reshape(6, 1, 1)
+    im = makeReconObj(scanParDict).coeffsToImage(coeffs, scanParDict)
+    # The second row is scanned backwards. The loop placed it at [4, 3, 5].
+    np.testing.assert_array_equal(im[0, 0], [[0, 1, 2], [5, 4, 3]])
+    np.testing.assert_array_equal(
+        loopCoeffsToImage(coeffs, scanParDict, fixBidirectional=False)[0, 0],
+        [[0, 1, 2], [4, 3, 5]]
+    )
+
+
+def test_leading_dimensions():
+    scanParDict = next(scanParDicts())
+    coeffs = coeffsFor(scanParDict)
+    stacked = np.stack([np.stack([coeffs, 2 * coeffs])] * 3)  # Datasets and bases
+    im = makeReconObj(scanParDict).coeffsToImage(stacked, scanParDict)
+    expected = loopCoeffsToImage(coeffs, scanParDict, fixBidirectional=False)
+    assert im.shape == (3, 2) + expected.shape
+    np.testing.assert_array_equal(im[2, 1], 2 * expected)
+
+
+@pytest.mark.parametrize('numTimepoints', [1, 2, 5])
+def test_add_coeffs_timepoints(numTimepoints):
+    reconObj = makeReconObj(next(scanParDicts()))
+    timepoints = [np.full((2, 3), i, dtype=np.float32) for i in range(numTimepoints)]
+    for coeffs in timepoints:
+        reconObj.addCoeffsTP(coeffs)
+    np.testing.assert_array_equal(reconObj.getCoeffs(), np.stack(timepoints))
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,113 @@
+import os
+
+import numpy as np
+import pytest
+
+from imswitch.imreconstruct.model import NumpySignalExtractor, SignalExtractor
+
+pattern = [3.0, 2.0, 8.0, 7.0]  # Row offset, column offset, row period, column period
+sigma = 1.3
+background = 10.0
+sigmas = [sigma, 9999 / 2.355]  # Signal and constant background
+
+
+def makeData(numFrames, imRows, imCols, seed=0):
+    """ Returns frames of Gaussian spots of random amplitudes on the pattern
+    grid, on a constant background, and the amplitudes. """
+    gridRows, gridCols = NumpySignalExtractor.calcCoeffGridSize(imRows, imCols, pattern)
+    amplitudes = np.random.default_rng(seed).uniform(
+        50, 500, size=(numFrames, gridRows, gridCols)
+    ).astype(np.float32)
+    rowCentres = pattern[0] + pattern[2] * np.arange(gridRows)
+    colCentres = pattern[1] + pattern[3] * np.arange(gridCols)
+    rowSpots = np.exp(-(np.arange(imRows) - rowCentres[:, np.newaxis]) ** 2 / (2 * sigma ** 2))
+    colSpots = np.exp(-(np.arange(imCols) - colCentres[:, np.newaxis]) ** 2 / (2 * sigma ** 2))
+    data = rowSpots.T.astype(np.float32) @ amplitudes @ colSpots.astype(np.float32)
+    return data + background, amplitudes
+
+
+def patternGridSize(numPixels, offset, period):
+    """ The number of pattern grid points along an axis, as drawn by
+    DataFrameController.makePatternGrid. """
+    return int(1 + np.floor(((numPixels - 1) - offset) / period))
+
+
+@pytest.mark.parametrize('imRows,imCols', [(64, 64), (48, 80), (81, 33), (9, 3)])
+def test_grid_size_matches_pattern_grid(imRows, imCols):
+    assert NumpySignalExtractor.calcCoeffGridSize(imRows, imCols, pattern) == (
+        patternGridSize(imRows, pattern[0], pattern[2]),
+        patternGridSize(imCols, pattern[1], pattern[3])
+    )
+
+
+def test_grid_size_of_pattern_outside_image():
+    assert NumpySignalExtractor.calcCoeffGridSize(2, 2, pattern) == (0, 0)
+    coeffs = NumpySignalExtractor().extractSignal(np.ones((3, 2, 2)), sigmas, pattern)
+    assert coeffs.shape == (2, 3, 0, 0)
+
+
+@pytest.mark.parametrize('imRows,imCols', [(64, 64), (48, 80)])
+def test_amplitudes_are_recovered(imRows, imCols):
+    data, amplitudes = makeData(5, imRows, imCols)
+    coeffs = NumpySignalExtractor().extractSignal(data, sigmas, pattern)
+
+    assert coeffs.shape == (len(sigmas),) + amplitudes.shape
+    np.testing.assert_allclose(coeffs[0], amplitudes, atol=0.01 * amplitudes.max())
+    np.testing.assert_allclose(coeffs[1], background, rtol=0.2)
+
+
+def test_disabled_basis_is_zero():
+    data, _ = makeData(2, 32, 32)
+    coeffs = NumpySignalExtractor().extractSignal(data, [sigma, 0], pattern)
+    assert not coeffs[1].any()
+
+
+def test_chunks_and_threads_do_not_change_coeffs():
+    data, _ = makeData(23, 40, 56)
+    single = NumpySignalExtractor(chunkSize=len(data), numWorkers=1).extractSignal(
+        data, sigmas, pattern
+    )
+    chunked = NumpySignalExtractor(chunkSize=4, numWorkers=3).extractSignal(
+        data, sigmas, pattern
+    )
+    np.testing.assert_allclose(chunked, single, rtol=1e-5, atol=1e-3)
+
+
+def test_numpy_backend():
+    extractor = SignalExtractor(backend='numpy')
+    assert extractor.backend == 'numpy'
+
+    data, _ = makeData(3, 32, 32)
+    np.testing.assert_array_equal(extractor.extractSignal(data, sigmas, pattern, 'cpu'),
+                                  NumpySignalExtractor().extractSignal(data, sigmas, pattern))
+    with pytest.raises(ValueError):
+        extractor.extractSignal(data, sigmas, pattern, 'tpu')
+
+
+def test_invalid_backend():
+    with pytest.raises(ValueError):
+        SignalExtractor(backend='cuda')
+
+
+@pytest.mark.skipif(os.name == 'nt', reason='the reconstruction DLL may be available')
+def test_default_backend_without_dll():
+    assert SignalExtractor().backend == 'numpy'
+    with pytest.raises(RuntimeError):
+        SignalExtractor(backend='dll')
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
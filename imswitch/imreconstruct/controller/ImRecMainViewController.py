@@ -6,7 +6,9 @@ import tifffile as tiff
 
 import imswitch.imreconstruct.view.guitools as guitools
 from imswitch.imcommon.controller import PickDatasetsController
-from imswitch.imreconstruct.model import DataObj, ReconObj, PatternFinder, SignalExtractor
+from imswitch.imreconstruct.model import (
+    DataObj, ReconObj, PatternFinder, ScaledFrames, SignalExtractor
+)
 from .DataFrameController import DataFrameController
 from .MultiDataFrameController import MultiDataFrameController
 from .WatcherFrameController import WatcherFrameController
@@ -286,7 +288,7 @@ class ImRecMainViewController(ImRecWidgetController):
 
                 data = dataObj.data
                 if self._widget.bleachBool.value():
-                    data = self.bleachingCorrection(data)
+                    data = self.bleachingCorrection(dataObj)
 
                 coeffs = self.extractData(data)
             finally:
@@ -303,13 +305,11 @@ class ImRecMainViewController(ImRecWidgetController):
             self._widget.addNewData(reconObj, f'{reconObj.name}_multi')
             self._commChannel.sigExecutionFinished.emit(self.reconstructionController.getImage())
 
-    def bleachingCorrection(self, data):
-        correctedData = data.copy()
-        energy = np.sum(data, axis=(1, 2))
-        for i in range(data.shape[0]):
-            c = (energy[0] / energy[i]) ** 4
-            correctedData[i, :, :] = data[i, :, :] * c
-        return correctedData
+    def bleachingCorrection(self, dataObj):
+        """ Returns the data of dataObj with each frame scaled to compensate
+        for bleaching. The frames are scaled as they are read. """
+        energy = dataObj.getFrameSums()
+        return ScaledFrames(dataObj.data, (energy[0] / energy) ** 4)
 
     def saveCurrent(self, dataType):
         """ Saves the reconstructed image or coefficeints from the current
@@ -9,6 +9,14 @@ from imswitch.imcommon.model import initLogger
 
 
 class DataObj:
+    """ A dataset of frames in an HDF5, Zarr or TIFF file. The frames are
+    read lazily: data is an array-like of shape (frames, rows, cols) that
+    only reads the frames it is indexed with, and statistics such as the mean
+    frame are computed in a single pass over chunks of frames. """
+
+    chunkBytes = 256 * 1024 ** 2
+    """ Approximate size in bytes of the chunks of frames read at once. """
+
     def __init__(self, name, datasetName, *, path=None, file=None):
         self.__logger = initLogger(self, instanceName=f'{name}/{datasetName}')
 
@@ -16,6 +24,8 @@ class DataObj:
         self.dataPath = path
         self.darkFrame = None
         self._meanData = None
+        self._frameSums = None
+        self._dataRange = None
         self._file = file
         self._data = None
         self._datasetName = datasetName
@@ -24,15 +34,18 @@ class DataObj:
 
     @property
     def data(self):
+        """ The frames, as an array-like that reads the frames it is indexed
+        with from the file. Use getFrames or iterFrameChunks to get them as
+        NumPy arrays. """
         if self._data is not None:
             return self._data
 
         if isinstance(self._file, h5py.File):
-            self._data = np.array(self._file.get(self._datasetName)[:])
+            self._data = self._file.get(self._datasetName)
         elif isinstance(self._file, tiff.TiffFile):
-            self._data = self._file.asarray()
+            self._data = DataObj._getTiffData(self._file)
         elif isinstance(self._file, zarr.hierarchy.Group):
-            self._data = np.array(self._file[self._datasetName])
+            self._data = self._file[self._datasetName]
         return self._data
 
     @property
@@ -85,19 +98,66 @@ class DataObj:
         self._data = None
         self._attrs = None
         self._meanData = None
+        self._frameSums = None
+        self._dataRange = None
+
+    def getFrames(self, start, stop):
+        """ Returns frames start to stop (exclusive) as a NumPy array. """
+        return np.asarray(self.data[start:stop])
+
+    def iterFrameChunks(self):
+        """ Yields (start, frames) for consecutive chunks of about chunkBytes
+        of frames, as NumPy arrays. """
+        numFrames = self.numFrames
+        frameBytes = int(np.prod(self.data.shape[1:])) * np.dtype(self.data.dtype).itemsize
+        framesPerChunk = max(1, int(self.chunkBytes // max(frameBytes, 1)))
+        for start in range(0, numFrames, framesPerChunk):
+            yield start, self.getFrames(start, min(start + framesPerChunk, numFrames))
 
     def getMeanData(self):
         if self._meanData is None:
-            self._meanData = np.array(np.mean(self.data, 0), dtype=np.float32)
+            self._computeStatistics()
 
         return self._meanData
 
+    def getFrameSums(self):
+        """ Returns the sum of the pixel values of each frame. """
+        if self._frameSums is None:
+            self._computeStatistics()
+
+        return self._frameSums
+
+    def getDataRange(self):
+        """ Returns the minimum and maximum pixel values of the data. """
+        if self._dataRange is None:
+            self._computeStatistics()
+
+        return self._dataRange
+
+    def _computeStatistics(self):
+        """ Computes the mean frame, the frame sums and the data range in a
+        single pass over the data. """
+        frameShape = self.data.shape[1:]
+        total = np.zeros(frameShape, dtype=np.float64)
+        frameSums = np.zeros(self.numFrames, dtype=np.float64)
+        minimum, maximum = np.inf, -np.inf
+        for start, frames in self.iterFrameChunks():
+            total += frames.sum(0, dtype=np.float64)
+            frameSums[start:start + len(frames)] = frames.reshape(len(frames), -1).sum(
+                1, dtype=np.float64
+            )
+            minimum, maximum = min(minimum, frames.min()), max(maximum, frames.max())
+
+        self._meanData = (total / max(self.numFrames, 1)).astype(np.float32)
+        self._frameSums = frameSums
+        self._dataRange = (minimum, maximum)
+
     @staticmethod
     def getDatasetNames(path):
         file, _ = DataObj._open(path, allowMultipleDatasets=True)
         try:
             if isinstance(file, h5py.File) or isinstance(file, zarr.hierarchy.Group):
-                return list(file.keys())
+                return DataObj._listDatasets(file)
             elif isinstance(file, tiff.TiffFile):
                 return ['default']
             else:
@@ -106,31 +166,52 @@ class DataObj:
             if isinstance(file, h5py.File):
                 file.close()
 
+    @staticmethod
+    def _getTiffData(file):
+        series = file.series[0]
+        if len(series.shape) != 3 or len(series.pages) != series.shape[0]:
+            return file.asarray()  # Pages aren't frames, read everything
+
+        try:
+            return tiff.memmap(file.filehandle.path, mode='r')
+        except ValueError:
+            return TiffFrames(file)  # E.g. compressed
+
+    @staticmethod
+    def _listDatasets(file):
+        """ Returns the names of the datasets at the root of an HDF5 file or
+        Zarr group. Groups, such as the frame metadata of recordings, are not
+        datasets. """
+        return [name for name, item in file.items()
+                if isinstance(item, (h5py.Dataset, zarr.Array))]
+
     @staticmethod
     def _open(path, datasetName=None, allowMultipleDatasets=False):
         ext = os.path.splitext(path)[1]
         if ext in ['.hdf5', '.hdf']:
             file = h5py.File(path, 'r')
-            if len(file) < 1:
+            datasetNames = DataObj._listDatasets(file)
+            if len(datasetNames) < 1:
                 raise RuntimeError('File does not contain any datasets')
-            elif len(file) > 1 and datasetName is None and not allowMultipleDatasets:
+            elif len(datasetNames) > 1 and datasetName is None and not allowMultipleDatasets:
                 raise RuntimeError('File contains multiple datasets')
 
             if datasetName is None and not allowMultipleDatasets:
-                datasetName = list(file.keys())[0]
+                datasetName = datasetNames[0]
 
             return file, datasetName
         elif ext in ['.tiff', '.tif']:
             return tiff.TiffFile(path), None
         elif ext in ['.zarr']:
             file = zarr.open(path, mode='r')
-            if len(file) < 1:
+            datasetNames = DataObj._listDatasets(file)
+            if len(datasetNames) < 1:
                 raise RuntimeError('File does not contain any datasets')
-            elif len(file) > 1 and datasetName is None and not allowMultipleDatasets:
+            elif len(datasetNames) > 1 and datasetName is None and not allowMultipleDatasets:
                 raise RuntimeError('File contains multiple datasets')
 
             if datasetName is None and not allowMultipleDatasets:
-                datasetName = list(file.keys())[0]
+                datasetName = datasetNames[0]
 
             return file, datasetName
         else:
@@ -152,6 +233,59 @@ class DataObj:
             raise OSError(f'Writing in progress')
 
 
+class TiffFrames:
+    """ Array-like access to the frames of a TIFF file whose pages are the
+    frames, for files that can't be memory-mapped. Only the indexed pages are
+    read. """
+
+    def __init__(self, file):
+        self._file = file
+        self.shape = file.series[0].shape
+        self.dtype = file.series[0].dtype
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        frameKey, otherKeys = (key[0], key[1:]) if isinstance(key, tuple) else (key, ())
+        if isinstance(frameKey, slice):
+            pages = range(*frameKey.indices(len(self)))
+            if len(pages) < 1:
+                frames = np.zeros((0,) + self.shape[1:], dtype=self.dtype)
+            else:
+                frames = self._file.asarray(key=pages)
+                if len(pages) == 1:
+                    frames = frames[np.newaxis]
+            # The frame axis has already been indexed
+            otherKeys = (slice(None),) + otherKeys
+        else:
+            frames = self._file.asarray(key=range(len(self))[frameKey])
+        return frames[otherKeys]
+
+
+class ScaledFrames:
+    """ Array-like that multiplies each frame of data by a factor as the
+    frames are read, e.g. to correct for bleaching without a copy of the
+    data. The scaled frames keep the data type of data. Only supports
+    indexing along the frame axis. """
+
+    def __init__(self, data, factors):
+        self._data = data
+        self._factors = np.asarray(factors, dtype=np.float32)
+        self.shape = data.shape
+        self.dtype = data.dtype
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        # A copy, also for float32 data, so that the data itself isn't scaled
+        frames = np.array(self._data[key], dtype=np.float32)
+        factors = self._factors[key]
+        frames *= factors if np.ndim(factors) == 0 else factors[:, np.newaxis, np.newaxis]
+        return frames.astype(self.dtype, copy=False)
+
+
 # Copyright (C) 2020-2021 ImSwitch developers
 # This file is part of ImSwitch.
 #
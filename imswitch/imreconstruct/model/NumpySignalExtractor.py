@@ -0,0 +1,119 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class NumpySignalExtractor:
+    """ Pure NumPy implementation of the signal extraction of
+    GPU_acc_recon.dll, which runs on any operating system.
+
+    At every point of the pattern grid, the pixels within a window of
+    windowSize pattern periods are fitted by linear least squares with one
+    Gaussian per sigma, all centred on the point. A sigma of 0 disables its
+    basis (its coefficients are zero), and a sigma much larger than the
+    period acts as a constant background. The coefficients are the peak
+    values of the fitted Gaussians.
+
+    As the bases are separable, the fit reduces to two matrix products per
+    frame and basis followed by a small linear system per grid point, whose
+    inverse only depends on the grid and is computed once per call. Frames
+    are processed in chunks of chunkSize, split between numWorkers threads,
+    so memory use doesn't grow with the number of frames. """
+
+    def __init__(self, windowSize: float = 1.0, chunkSize: int = 64,
+                 numWorkers: Optional[int] = None):
+        self.windowSize = windowSize
+        self.chunkSize = chunkSize
+        self.numWorkers = numWorkers if numWorkers is not None else os.cpu_count()
+
+    @staticmethod
+    def calcCoeffGridSize(imRows: int, imCols: int,
+                          pattern: Sequence[float]) -> Tuple[int, int]:
+        """ Returns the number of rows and columns of the pattern grid, i.e.
+        of the coefficients extracted from each frame. pattern is [row offset,
+        column offset, row period, column period] in pixels. """
+        gridRows = int(1 + np.floor((imRows - 1 - pattern[0]) / pattern[2]))
+        gridCols = int(1 + np.floor((imCols - 1 - pattern[1]) / pattern[3]))
+        return max(gridRows, 0), max(gridCols, 0)
+
+    def extractSignal(self, data, sigmas: Sequence[float],
+                      pattern: Sequence[float]) -> np.ndarray:
+        """ Extracts the signal of the data, which has shape (frames, rows,
+        cols), according to given parameters. Output is a 4D matrix where
+        first dimension is base and last three are frame and grid
+        coordinates. """
+        numFrames, imRows, imCols = np.shape(data)
+        gridRows, gridCols = self.calcCoeffGridSize(imRows, imCols, pattern)
+        sigmas = np.atleast_1d(np.asarray(sigmas, dtype=np.float64))
+
+        rowWeights = self._getWeights(imRows, pattern[0], pattern[2], gridRows, sigmas)
+        colWeights = self._getWeights(imCols, pattern[1], pattern[3], gridCols, sigmas)
+
+        # The normal matrix of each grid point is the elementwise product of the overlaps of the
+        # row weights and of the column weights. Bases that are zero at a point (disabled, or
+        # outside the image) get zero coefficients thanks to the pseudo-inverse.
+        rowOverlaps = np.einsum('irp,jrp->rij', rowWeights, rowWeights)
+        colOverlaps = np.einsum('icp,jcp->cij', colWeights, colWeights)
+        normalMatrices = rowOverlaps[:, np.newaxis] * colOverlaps[np.newaxis, :]
+        solvers = np.linalg.pinv(normalMatrices).astype(np.float32)
+
+        rowWeights = rowWeights.astype(np.float32)
+        colWeightsT = np.ascontiguousarray(colWeights.transpose(0, 2, 1), dtype=np.float32)
+
+        coeffs = np.zeros((len(sigmas), numFrames, gridRows, gridCols), dtype=np.float32)
+        if gridRows < 1 or gridCols < 1:
+            return coeffs
+
+        def extractFrames(start, stop):
+            frames = np.asarray(data[start:stop], dtype=np.float32)
+            projections = np.stack([rowWeights[b] @ frames @ colWeightsT[b]
+                                    for b in range(len(sigmas))])
+            coeffs[:, start:stop] = np.einsum('rcij,jfrc->ifrc', solvers, projections)
+
+        chunks = [(start, min(start + self.chunkSize, numFrames))
+                  for start in range(0, numFrames, self.chunkSize)]
+        if self.numWorkers > 1 and len(chunks) > 1:
+            # NumPy releases the GIL in the matrix products. Chunks are mapped lazily so that only
+            # about numWorkers of them are in memory at once.
+            with ThreadPoolExecutor(max_workers=self.numWorkers) as executor:
+                for start in range(0, len(chunks), self.numWorkers):
+                    list(executor.map(lambda chunk: extractFrames(*chunk),
+                                      chunks[start:start + self.numWorkers]))
+        else:
+            for chunk in chunks:
+                extractFrames(*chunk)
+
+        return coeffs
+
+    def _getWeights(self, numPixels, offset, period, numPoints, sigmas):
+        """ Returns, for each basis, the 1D Gaussians centred on the grid
+        points along one axis, cut to the fitting window. The result has shape
+        (bases, points, pixels). """
+        centres = offset + period * np.arange(numPoints)
+        distances = np.arange(numPixels)[np.newaxis, :] - centres[:, np.newaxis]
+        inWindow = np.abs(distances) <= self.windowSize * period / 2
+
+        weights = np.zeros((len(sigmas), numPoints, numPixels))
+        for b, sigma in enumerate(sigmas):
+            if sigma > 0:
+                weights[b] = np.where(inWindow, np.exp(-distances ** 2 / (2 * sigma ** 2)), 0)
+        return weights
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -23,6 +23,11 @@ class ReconObj:
 
         self.dispLevels = None
 
+        self._coeffsBuffer = None
+        self._numCoeffsTPs = 0
+        self._indexMapKey = None
+        self._indexMap = None
+
     def setDispLevels(self, levels):
         self.dispLevels = levels
 
@@ -39,17 +44,23 @@ class ReconObj:
         return self.scanParDict
 
     def addCoeffsTP(self, inCoeffs):
-        """ Adds a set of coefficients to the existing set of coefficients. """
-        if self.coeffs is None:
-            # self.__logger.debug(f'In if, shape is: {np.shape(inCoeffs)}')
-            # self.__logger.debug(f'Coeffs are: {inCoeffs}')
-            self.coeffs = np.array([inCoeffs])
+        """ Adds a set of coefficients to the existing set of coefficients.
+        The coefficients are stored in a buffer whose capacity is doubled when
+        it is full, so adding a timepoint doesn't copy the previous ones. """
+        inCoeffs = np.asarray(inCoeffs)
+        if self._coeffsBuffer is None:
+            self._coeffsBuffer = np.empty((1,) + inCoeffs.shape, dtype=inCoeffs.dtype)
         else:
-            # self.__logger.debug(f'In else, shape self.data is: {np.shape(inCoeffs)}')
-            # self.__logger.debug(f'In else, shape inCoeffs is: {np.shape(inCoeffs)}')
             self.__logger.debug(f'Max in coeffs: {inCoeffs.max()}')
-            inCoeffs = np.expand_dims(inCoeffs, 0)
-            self.coeffs = np.vstack((self.coeffs, inCoeffs))
+            if self._numCoeffsTPs >= len(self._coeffsBuffer):
+                buffer = np.empty((2 * len(self._coeffsBuffer),) + self._coeffsBuffer.shape[1:],
+                                  dtype=self._coeffsBuffer.dtype)
+                buffer[:self._numCoeffsTPs] = self.coeffs
+                self._coeffsBuffer = buffer
+
+        self._coeffsBuffer[self._numCoeffsTPs] = inCoeffs
+        self._numCoeffsTPs += 1
+        self.coeffs = self._coeffsBuffer[:self._numCoeffsTPs]
 
     def updateScanParams(self, scanParDict):
         self.scanParDict = scanParDict
@@ -59,37 +70,50 @@ class ReconObj:
         reconstructed and reassigned images of ALL the bases given to the
         reconstructor"""
         if self.coeffs is not None:
-            datasets = np.shape(self.coeffs)[0]
-            bases = np.shape(self.coeffs)[1]
-            self.reconstructed = np.array([
-                [self.coeffsToImage(self.coeffs[ds][b], self.scanParDict) for b in range(0, bases)]
-                for ds in range(0, datasets)
-            ])
+            self.reconstructed = self.coeffsToImage(self.coeffs, self.scanParDict)
             self.__logger.debug(f'Shape of reconstructed: {np.shape(self.reconstructed)}')
         else:
             self.__logger.error('Cannot update images without coefficients')
 
-    def addGridOfCoeffs(self, im, coeffs, t, s, r0, c0, pr, pc):
-        # self.__logger.debug(f'Timepoint: {t}')
-        # self.__logger.debug(f'shape if im: {im.shape}')
-        # self.__logger.debug(f'shape if coeffts[i]: {coeffs.shape}')
-        # self.__logger.debug(f'r0: {r0}')
-        # self.__logger.debug(f'c0: {c0}')
-        # self.__logger.debug(f'pr: {pr}')
-        # self.__logger.debug(f'pc: {pc}')
-        im[t, s, r0::pr, c0::pc] = coeffs
-
     def coeffsToImage(self, coeffs, scanParDict):
-        """Takes the 4d matrix of coefficients from the signal extraction and
-        reshapes into images according to given parameters"""
-        frames = np.shape(coeffs)[0]
+        """Takes the matrix of coefficients from the signal extraction and
+        reshapes it into images according to given parameters. The last three
+        dimensions of coeffs are (frames, rows, cols); any leading dimensions
+        (e.g. datasets and bases) are kept in front of the (timepoints,
+        slices, rows, cols) dimensions of the returned images."""
+        coeffs = np.asarray(coeffs)
+        frames, rows, cols = np.shape(coeffs)[-3:]
+        leadingShape = np.shape(coeffs)[:-3]
+        timepoints, slices, sqRows, sqCols, t, s, r, c = self._getIndexMap(frames, scanParDict)
+
+        # Pixel (k, l) of the grid of frame i ends up at row k * sqRows + r[i] and column
+        # l * sqCols + c[i], so with the rows split into (rows, sqRows) and the columns into
+        # (cols, sqCols), all frames can be placed by a single scatter
+        im = np.zeros(leadingShape + (timepoints, slices, rows, sqRows, cols, sqCols),
+                      dtype=np.float32)
+        leading = (slice(None),) * len(leadingShape)
+        im[leading + (t, s, slice(None), r, slice(None), c)] = np.moveaxis(
+            coeffs, -3, 0
+        )
+        return im.reshape(leadingShape + (timepoints, slices, rows * sqRows, cols * sqCols))
+
+    def _getIndexMap(self, frames, scanParDict):
+        """ Returns the image dimensions and, for each frame, the timepoint,
+        slice, row and column of the images that its coefficients are placed
+        at. The mapping is cached until the scan parameters or the number of
+        frames change. """
+        key = (frames, tuple(int(step) for step in scanParDict['steps']),
+               tuple(scanParDict['dimensions']), tuple(scanParDict['directions']),
+               bool(scanParDict['unidirectional']))
+        if key == self._indexMapKey:
+            return self._indexMap
+
         dim0Side = int(scanParDict['steps'][0])
         dim1Side = int(scanParDict['steps'][1])
         dim2Side = int(scanParDict['steps'][2])
         dim3Side = int(scanParDict['steps'][3])  # Always timepoints
         if not frames == dim0Side * dim1Side * dim2Side * dim3Side:
             self.__logger.error('Wrong dimensional data')
-            pass
 
         timepoints = int(
             scanParDict['steps'][scanParDict['dimensions'].index(self.timepoints_text)]
@@ -98,75 +122,44 @@ class ReconObj:
         sqRows = int(scanParDict['steps'][scanParDict['dimensions'].index(self.u_d_text)])
         sqCols = int(scanParDict['steps'][scanParDict['dimensions'].index(self.r_l_text)])
 
-        im = np.zeros(
-            [timepoints, slices, sqRows * np.shape(coeffs)[1], sqCols * np.shape(coeffs)[2]],
-            dtype=np.float32
-        )
-        for i in np.arange(np.shape(coeffs)[0]):
-
-            t = int(np.floor(i / (frames / dim3Side)))
-
-            slow = int(np.mod(i, frames / timepoints) / (dim0Side * dim1Side))
-            mid = int(np.mod(i, dim0Side * dim1Side) / dim0Side)
-            fast = np.mod(i, dim0Side)
-
-            if not scanParDict['unidirectional']:
-                oddMidStep = np.mod(mid, 2)
-                fast = (1 - oddMidStep) * fast + oddMidStep * (dim1Side - 1 - fast)
-
-            neg = (int(scanParDict['directions'][0] == 'neg'),
-                   int(scanParDict['directions'][1] == 'neg'),
-                   int(scanParDict['directions'][2] == 'neg'))
-
-            """Adjust for positive or negative direction"""
-            fast = (1 - neg[0]) * fast + neg[0] * (dim0Side - 1 - fast)
-            mid = (1 - neg[1]) * mid + neg[1] * (dim1Side - 1 - mid)
-            slow = (1 - neg[2]) * slow + neg[2] * (dim2Side - 1 - slow)
-
-            """Place dimensions in correct row/col/slice"""
-            if scanParDict['dimensions'][0] == self.r_l_text:
-                if scanParDict['dimensions'][1] == self.u_d_text:
-                    c = fast
-                    pc = dim0Side
-                    r = mid
-                    pr = dim1Side
-                    s = slow
-                else:
-                    c = fast
-                    pc = dim0Side
-                    r = slow
-                    pr = dim2Side
-                    s = mid
-            elif scanParDict['dimensions'][0] == self.u_d_text:
-                if scanParDict['dimensions'][1] == self.r_l_text:
-                    c = mid
-                    pc = dim1Side
-                    r = fast
-                    pr = dim0Side
-                    s = slow
-                else:
-                    c = slow
-                    pc = dim2Side
-                    r = fast
-                    pr = dim0Side
-                    s = mid
+        i = np.arange(frames)
+        t = np.floor(i / (frames / dim3Side)).astype(np.intp)
+        slow = (np.mod(i, frames / timepoints) / (dim0Side * dim1Side)).astype(np.intp)
+        mid = np.mod(i, dim0Side * dim1Side) // dim0Side
+        fast = np.mod(i, dim0Side)
+
+        if not scanParDict['unidirectional']:
+            oddMidStep = np.mod(mid, 2) == 1
+            fast = np.where(oddMidStep, dim0Side - 1 - fast, fast)
+
+        """Adjust for positive or negative direction"""
+        if scanParDict['directions'][0] == 'neg':
+            fast = dim0Side - 1 - fast
+        if scanParDict['directions'][1] == 'neg':
+            mid = dim1Side - 1 - mid
+        if scanParDict['directions'][2] == 'neg':
+            slow = dim2Side - 1 - slow
+
+        """Place dimensions in correct row/col/slice"""
+        if scanParDict['dimensions'][0] == self.r_l_text:
+            if scanParDict['dimensions'][1] == self.u_d_text:
+                c, r, s = fast, mid, slow
+            else:
+                c, r, s = fast, slow, mid
+        elif scanParDict['dimensions'][0] == self.u_d_text:
+            if scanParDict['dimensions'][1] == self.r_l_text:
+                c, r, s = mid, fast, slow
             else:
-                if scanParDict['dimensions'][1] == self.r_l_text:
-                    c = mid
-                    pc = dim1Side
-                    r = slow
-                    pr = dim2Side
-                    s = fast
-                else:
-                    c = slow
-                    pc = dim2Side
-                    r = mid
-                    pr = dim1Side
-                    s = fast
-
-            self.addGridOfCoeffs(im, coeffs[i], t, s, r, c, pr, pc)
-
-        return im
+                c, r, s = slow, fast, mid
+        else:
+            if scanParDict['dimensions'][1] == self.r_l_text:
+                c, r, s = mid, slow, fast
+            else:
+                c, r, s = slow, mid, fast
+
+        self._indexMap = (timepoints, slices, sqRows, sqCols, t, s, r, c)
+        self._indexMapKey = key
+        return self._indexMap
 
 
 # Copyright (C) 2020-2021 ImSwitch developers
@@ -5,6 +5,7 @@ import time
 import numpy as np
 
 from imswitch.imcommon.model import dirtools, initLogger
+from .NumpySignalExtractor import NumpySignalExtractor
 
 
 class SignalExtractor:
@@ -13,20 +14,45 @@ class SignalExtractor:
     bases).
     """
 
-    def __init__(self):
+    backends = ['dll', 'numpy']
+    """ dll uses GPU_acc_recon.dll and is only available on Windows; numpy
+    uses NumpySignalExtractor and runs on the CPU on any operating system. """
+
+    dllChunkSize = 1024
+    """ Maximum number of frames passed to the DLL at once. """
+
+    def __init__(self, backend=None):
+        """ If backend is None, the DLL is used if it can be loaded and NumPy
+        otherwise. """
         self.__logger = initLogger(self)
 
+        if backend is not None and backend not in self.backends:
+            raise ValueError(f'Backend must be one of {self.backends}; {backend} given')
+
+        self.ReconstructionDLL = None
+        if backend in [None, 'dll']:
+            try:
+                self.ReconstructionDLL = self._loadDLL()
+            except Exception as e:
+                if backend == 'dll':
+                    raise
+                self.__logger.info(f'Reconstruction DLL not available ({e}), using the NumPy'
+                                   f' backend')
+
+        self.backend = 'dll' if self.ReconstructionDLL is not None else 'numpy'
+        self._numpyExtractor = NumpySignalExtractor()
+
+    @staticmethod
+    def _loadDLL():
         if os.name != 'nt':
-            raise RuntimeError('This module does unfortunately currently not support non-Windows'
-                               ' operating systems.')
+            raise RuntimeError('The reconstruction DLL is only available on Windows')
 
-        # TODO: Support non-Windows OS
         # This is needed by the DLL containing CUDA code.
         # ctypes.cdll.LoadLibrary(os.environ['CUDA_PATH_V9_0'] + '\\bin\\cudart64_90.dll')
         ctypes.cdll.LoadLibrary(
             os.path.join(dirtools.DataFileDirs.Libs, 'cudart64_90.dll')
         )
-        self.ReconstructionDLL = ctypes.cdll.LoadLibrary(
+        return ctypes.cdll.LoadLibrary(
             os.path.join(dirtools.DataFileDirs.Libs, 'GPU_acc_recon.dll')
         )
 
@@ -71,8 +97,19 @@ class SignalExtractor:
         Output is a 4D matrix where first dimension is base and last three
         are frame and pixel coordinates."""
 
-        self.__logger.debug(f'Max in data: {data.max()}')
-        dataPtrArray = self.make3dPtrArray(data)
+        if dev not in ['cpu', 'gpu']:
+            raise ValueError(f'Device must be either "cpu" or "gpu"; {dev} given')
+
+        if self.backend == 'numpy':
+            if dev == 'gpu':
+                self.__logger.warning('GPU extraction requires the reconstruction DLL,'
+                                      ' extracting on the CPU instead')
+            t = time.time()
+            resCoeffs = self._numpyExtractor.extractSignal(data, sigmas, pattern)
+            elapsed = time.time() - t
+            self.__logger.debug(f'Signal extraction performed in {elapsed} seconds')
+            return resCoeffs
+
         p = ctypes.c_float * 4
         # Minus one due to different (1 or 0) indexing in C/Matlab
         cPattern = p(pattern[0], pattern[1], pattern[2], pattern[3])
@@ -84,7 +121,7 @@ class SignalExtractor:
         cGridCols = ctypes.c_int(0)
         cImRows = ctypes.c_int(data.shape[1])
         cImCols = ctypes.c_int(data.shape[2])
-        cImSlices = ctypes.c_int(data.shape[0])
+        numFrames = data.shape[0]
 
         self.ReconstructionDLL.calc_coeff_grid_size(
             cImRows, cImCols,
@@ -93,22 +130,25 @@ class SignalExtractor:
         )
         self.__logger.debug('Coeff grid calculated')
 
-        resCoeffs = np.zeros(dtype=np.float32, shape=(cNumBases.value, cImSlices.value,
+        resCoeffs = np.zeros(dtype=np.float32, shape=(cNumBases.value, numFrames,
                                                       cGridRows.value, cGridCols.value))
-        resPtr = self.make4dPtrArray(resCoeffs)
         t = time.time()
 
         if dev == 'cpu':
             extractionFunction = self.ReconstructionDLL.extract_signal_CPU
-        elif dev == 'gpu':
-            extractionFunction = self.ReconstructionDLL.extract_signal_GPU
         else:
-            raise ValueError(f'Device must be either "cpu" or "gpu"; {dev} given')
+            extractionFunction = self.ReconstructionDLL.extract_signal_GPU
 
-        extractionFunction(cImRows, cImCols,
-                           cImSlices, ctypes.byref(cPattern),
-                           cNumBases, ctypes.byref(cSigmas),
-                           ctypes.byref(dataPtrArray), ctypes.byref(resPtr))
+        # The data may be lazily read from a file, so it is passed to the DLL in chunks of frames
+        for start in range(0, numFrames, self.dllChunkSize):
+            stop = min(start + self.dllChunkSize, numFrames)
+            frames = np.ascontiguousarray(data[start:stop])  # Must outlive the pointers
+            dataPtrArray = self.make3dPtrArray(frames)
+            resPtr = self.make4dPtrArray(resCoeffs[:, start:stop])
+            extractionFunction(cImRows, cImCols,
+                               ctypes.c_int(stop - start), ctypes.byref(cPattern),
+                               cNumBases, ctypes.byref(cSigmas),
+                               ctypes.byref(dataPtrArray), ctypes.byref(resPtr))
 
         elapsed = time.time() - t
         self.__logger.debug(f'Signal extraction performed in {elapsed} seconds')
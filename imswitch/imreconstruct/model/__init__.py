@@ -1,4 +1,5 @@
-from .DataObj import DataObj
+from .DataObj import DataObj, ScaledFrames
+from .NumpySignalExtractor import NumpySignalExtractor
 from .PatternFinder import PatternFinder
 from .ReconObj import ReconObj
 from .SignalExtractor import SignalExtractor
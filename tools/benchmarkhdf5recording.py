@@ -0,0 +1,79 @@
+""" Compares HDF5 write throughput of the per-chunk resize path used for open
+ended recordings with the preallocated, chunk-aligned path used when the
+number of frames is known, on a synthetic 2048x2048 uint16 stream. """
+
+import argparse
+import os
+import tempfile
+import time
+
+import h5py
+import numpy as np
+
+from imswitch.imcontrol.model.managers.RecordingManager import PreallocatedHDF5Dataset
+
+
+def generateChunks(numFrames, framesPerChunk, shape):
+    rng = np.random.default_rng(0)
+    # Reuse a small pool of random frames so that generating data doesn't dominate the timing
+    pool = rng.integers(0, 4096, size=(8, *shape), dtype=np.uint16)
+    for start in range(0, numFrames, framesPerChunk):
+        n = min(framesPerChunk, numFrames - start)
+        yield start, pool[np.arange(start, start + n) % len(pool)]
+
+
+def writeResize(path, numFrames, framesPerChunk, shape):
+    with h5py.File(path, 'w') as file:
+        dataset = file.create_dataset('data', (1, *shape), maxshape=(None, *shape), dtype='i2')
+        for it, frames in generateChunks(numFrames, framesPerChunk, shape):
+            n = len(frames)
+            dataset.resize(n + it, axis=0)
+            dataset[it:it + n, :, :] = frames
+
+
+def writePreallocated(path, numFrames, framesPerChunk, shape, compression):
+    with h5py.File(path, 'w') as file:
+        dataset = PreallocatedHDF5Dataset(file, 'data', numFrames, {}, compression=compression)
+        for it, frames in generateChunks(numFrames, framesPerChunk, shape):
+            dataset.write(it, frames)
+        dataset.close(shape)
+
+
+def benchmark(name, func, path, numBytes):
+    start = time.perf_counter()
+    func(path)
+    elapsed = time.perf_counter() - start
+    fileSizeMB = os.path.getsize(path) / 1024 ** 2
+    print(f'{name:<28} {numBytes / 1024 ** 2 / elapsed:8.1f} MB/s'
+          f'   ({elapsed:.2f} s, {fileSizeMB:.0f} MB on disk)')
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--chunk', type=int, default=3,
+                        help='number of frames returned per getChunk call')
+    parser.add_argument('--size', type=int, default=2048)
+    parser.add_argument('--dir', default=None, help='directory to write the test files to')
+    args = parser.parse_args()
+
+    shape = (args.size, args.size)
+    numBytes = args.frames * args.size * args.size * 2
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        path = os.path.join(directory, 'benchmark.hdf5')
+        print(f'{args.frames} frames of {args.size}x{args.size} uint16,'
+              f' {args.chunk} frames per chunk')
+        benchmark('resize per chunk (i2)',
+                  lambda p: writeResize(p, args.frames, args.chunk, shape), path, numBytes)
+        benchmark('preallocated',
+                  lambda p: writePreallocated(p, args.frames, args.chunk, shape, None),
+                  path, numBytes)
+        for compression in ['lzf', 'blosc-lz4']:
+            try:
+                benchmark(f'preallocated + {compression}',
+                          lambda p: writePreallocated(p, args.frames, args.chunk, shape,
+                                                      compression),
+                          path, numBytes)
+            except ValueError as e:
+                print(f'preallocated + {compression}: skipped ({e})')
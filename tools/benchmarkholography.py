@@ -0,0 +1,61 @@
+""" Compares the live reconstruction throughput of rebuilding the propagation
+kernel with full complex FFTs for every frame, as HoloController used to, with
+that of HolographyEngine, on synthetic uint16 holograms. Also measures the
+throughput of refocusing one hologram at many distances with
+reconstructStack. """
+
+import argparse
+import time
+
+import numpy as np
+
+from imswitch.imcontrol.model import HolographyEngine
+
+wavelength = 0.488
+pixelsize = 3.45
+NA = 0.3
+dz = 40e3
+
+
+def reconstructPerFrame(image):
+    amplitude = np.sqrt(image.astype(np.float64))
+    fy = np.fft.fftfreq(image.shape[0], d=pixelsize)[:, np.newaxis]
+    fx = np.fft.fftfreq(image.shape[1], d=pixelsize)[np.newaxis, :]
+    frequencySquared = fy ** 2 + fx ** 2
+    kz = 2 * np.pi * np.sqrt(np.maximum(1 / wavelength ** 2 - frequencySquared, 0))
+    kernel = np.where(frequencySquared <= (NA / wavelength) ** 2, np.exp(1j * kz * dz), 0)
+    return abs(np.fft.ifft2(np.fft.fft2(amplitude) * kernel))
+
+
+def benchmark(name, func, frames, duration, framesPerCall=1):
+    func(frames[0])  # Warm up (kernels, buffers)
+    numComputed = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        func(frames[numComputed % len(frames)])
+        numComputed += 1
+    elapsed = time.perf_counter() - start
+    print(f'  {name:<36} {numComputed * framesPerCall / elapsed:8.1f} planes/s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[512, 1024, 2048])
+    parser.add_argument('--planes', type=int, default=16,
+                        help='number of planes to refocus each hologram at in stack mode')
+    parser.add_argument('--duration', type=float, default=3.0,
+                        help='time in seconds to run each benchmark for')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    dzs = np.linspace(0, 2 * dz, args.planes)
+    for size in args.sizes:
+        frames = rng.integers(0, 4096, size=(4, size, size), dtype=np.uint16)
+        engine = HolographyEngine(wavelength, pixelsize, NA)
+        print(f'{size}x{size} ({engine.backend} backend)')
+        benchmark('kernel rebuilt per frame', reconstructPerFrame, frames, args.duration)
+        benchmark('HolographyEngine.reconstruct', lambda f: engine.reconstruct(f, dz), frames,
+                  args.duration)
+        benchmark(f'HolographyEngine.reconstructStack ({args.planes})',
+                  lambda f: engine.reconstructStack(f, dzs), frames, args.duration,
+                  framesPerCall=args.planes)
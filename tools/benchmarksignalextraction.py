@@ -0,0 +1,80 @@
+""" Measures the throughput of the NumPy signal extraction backend of
+imreconstruct against the size of the dataset, on synthetic RESOLFT data: a
+grid of Gaussian spots of random amplitudes on a constant background. Checks
+that the known amplitudes are recovered, and, where the reconstruction DLL is
+available (Windows), compares the coefficients with those of the DLL. """
+
+import argparse
+import time
+
+import numpy as np
+
+from imswitch.imreconstruct.model import NumpySignalExtractor, SignalExtractor
+
+pattern = [3.0, 3.0, 8.0, 8.0]  # Row offset, column offset, row period, column period
+sigma = 1.3
+background = 10.0
+sigmas = [sigma, 9999 / 2.355]  # Signal and constant background
+
+
+def makeData(numFrames, size, rng):
+    gridRows, gridCols = NumpySignalExtractor.calcCoeffGridSize(size, size, pattern)
+    amplitudes = rng.uniform(50, 500, size=(numFrames, gridRows, gridCols)).astype(np.float32)
+    rowCentres = pattern[0] + pattern[2] * np.arange(gridRows)
+    colCentres = pattern[1] + pattern[3] * np.arange(gridCols)
+    pixels = np.arange(size)
+    rowSpots = np.exp(-(pixels[np.newaxis] - rowCentres[:, np.newaxis]) ** 2 / (2 * sigma ** 2))
+    colSpots = np.exp(-(pixels[np.newaxis] - colCentres[:, np.newaxis]) ** 2 / (2 * sigma ** 2))
+    data = rowSpots.T.astype(np.float32) @ amplitudes @ colSpots.astype(np.float32)
+    return data + background, amplitudes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[128, 256, 512])
+    parser.add_argument('--frames', type=int, nargs='+', default=[100, 400])
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of threads (default: number of CPUs)')
+    parser.add_argument('--chunk-size', type=int, default=64,
+                        help='number of frames processed at once by each thread')
+    args = parser.parse_args()
+
+    try:
+        dllExtractor = SignalExtractor(backend='dll')
+    except Exception:
+        dllExtractor = None
+
+    extractor = NumpySignalExtractor(chunkSize=args.chunk_size, numWorkers=args.workers)
+    rng = np.random.default_rng(0)
+    for size in args.sizes:
+        for numFrames in args.frames:
+            data, amplitudes = makeData(numFrames, size, rng)
+            start = time.perf_counter()
+            coeffs = extractor.extractSignal(data, sigmas, pattern)
+            elapsed = time.perf_counter() - start
+            error = np.abs(coeffs[0] - amplitudes).max() / amplitudes.max()
+            line = (f'{numFrames:5d} x {size}x{size}: {elapsed:7.3f} s,'
+                    f' {numFrames / elapsed:8.1f} frames/s, max relative error {error:.1e}')
+
+            if dllExtractor is not None:
+                dllCoeffs = dllExtractor.extractSignal(data, sigmas, pattern, 'cpu')
+                difference = np.abs(coeffs - dllCoeffs).max() / np.abs(dllCoeffs).max()
+                line += f', max relative difference to DLL {difference:.1e}'
+            print(line)
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,71 @@
+""" Compares the SIM reconstruction throughput of calling napari-sim-processor
+synchronously for each stack, as SIMController used to, with that of
+SIMReconstructionService's process pool, on stacks from simulateSIMStack. """
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+from napari_sim_processor.processors.convSimProcessor import ConvSimProcessor
+
+from imswitch.imcontrol.model import SIMCalibration, SIMParameters, SIMReconstructionService
+from imswitch.imcontrol.model.SIMReconstructionService import simulateSIMStack
+
+
+def calibrate(stack, parameters):
+    processor = ConvSimProcessor()
+    processor.debug = False
+    for name in ['wavelength', 'NA', 'n', 'magnification', 'pixelsize', 'alpha', 'beta', 'w',
+                 'eta', 'usePhases']:
+        setattr(processor, name, getattr(parameters, name))
+    start = time.perf_counter()
+    processor.calibrate(stack, True)
+    print(f'  calibration: {time.perf_counter() - start:.2f} s')
+    return processor
+
+
+def benchmarkSynchronous(processor, stacks):
+    start = time.perf_counter()
+    for stack in stacks:
+        processor.reconstruct_rfftw(stack)
+    print(f'  {"synchronous":<24} {len(stacks) / (time.perf_counter() - start):8.1f} stacks/s')
+
+
+def benchmarkService(calibration, stacks, numWorkers, cacheDirectory):
+    service = SIMReconstructionService(cacheDirectory, numWorkers=numWorkers,
+                                       maxQueuedStacks=len(stacks))
+    service.setCalibration(calibration)
+    service.submit(stacks[0])  # Warm up: start the worker processes
+    while service.numQueuedStacks > 0:
+        time.sleep(0.01)
+
+    start = time.perf_counter()
+    for stack in stacks:
+        service.submit(stack)
+    while service.numQueuedStacks > 0:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    service.shutdown(wait=True)
+    print(f'  {f"service, {numWorkers} processes":<24} {len(stacks) / elapsed:8.1f} stacks/s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=512)
+    parser.add_argument('--stacks', type=int, default=20)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    args = parser.parse_args()
+
+    parameters = SIMParameters(wavelength=0.57, NA=1.05, n=1.33, magnification=60,
+                               pixelsize=6.5)
+    # Camera-like uint16 frames, as the service receives them from the live view
+    stacks = [(simulateSIMStack(args.size, args.size, seed=i) * 4000).astype(np.uint16)
+              for i in range(args.stacks)]
+    print(f'{args.stacks} stacks of 9 {args.size}x{args.size} frames')
+    processor = calibrate(stacks[0], parameters)
+    benchmarkSynchronous(processor, stacks)
+    with tempfile.TemporaryDirectory() as cacheDirectory:
+        for numWorkers in args.workers:
+            benchmarkService(SIMCalibration.fromProcessor(processor, parameters), stacks,
+                             numWorkers, cacheDirectory)
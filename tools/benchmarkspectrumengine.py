@@ -0,0 +1,43 @@
+""" Compares the live spectrum throughput of the full complex FFT that
+FFTController used to compute with that of SpectrumEngine, on synthetic uint16
+frames of 512, 1024 and 2048 pixels square. """
+
+import argparse
+import time
+
+import numpy as np
+
+from imswitch.imcontrol.model import SpectrumEngine
+
+
+def computeFullFFT(image):
+    return np.fft.fftshift(np.log10(abs(np.fft.fft2(image))))
+
+
+def benchmark(name, func, frames, duration):
+    func(frames[0])  # Warm up (plans, buffers)
+    numComputed = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        func(frames[numComputed % len(frames)])
+        numComputed += 1
+    elapsed = time.perf_counter() - start
+    print(f'  {name:<28} {numComputed / elapsed:8.1f} frames/s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[512, 1024, 2048])
+    parser.add_argument('--duration', type=float, default=3.0,
+                        help='time in seconds to run each benchmark for')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for size in args.sizes:
+        frames = rng.integers(0, 4096, size=(4, size, size), dtype=np.uint16)
+        engine = SpectrumEngine()
+        print(f'{size}x{size} ({engine.backend} backend)')
+        benchmark('numpy fft2 + fftshift', computeFullFFT, frames, args.duration)
+        benchmark('SpectrumEngine', engine.compute, frames, args.duration)
+        engine.decimation = 2
+        benchmark('SpectrumEngine, decimation 2', engine.compute, frames, args.duration)